@@ -0,0 +1,172 @@
+# admission.py - Admission control for the inbound lead webhook
+#
+# Zapier and website forms can fire thousands of leads in a burst. Taking
+# all of them at once starves the event loop, and with it the Vapi
+# assistant-request calls that have to be answered within seconds. Instead
+# /webhooks/inbound answers 429 + Retry-After (Zapier retries those) when:
+#   - the agency exceeds its token bucket (steady rate + burst),
+#   - too many inbound requests are already being processed,
+#   - too many inbound calls are already waiting in the dial queue to
+#     call new leads promptly (campaign backlog doesn't count - inbound
+#     jumps it),
+#   - the event loop is lagging (measured by a ticker task).
+# Inbound DB work runs on its own small thread pool, so the default pool
+# stays free for assistant-request lookups (reserved headroom).
+
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+LAG_TICK_SECONDS = 0.1
+MAX_TRACKED_AGENCIES = 10000
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Takes one token. Returns 0 on success, else seconds until one is available."""
+        # `now` may predate a bucket created under the same lock
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class AdmissionController:
+    def __init__(self, agency_rate: float = 5.0, agency_burst: float = 50.0,
+                 max_in_flight: int = 64, max_dial_backlog: int = 500,
+                 max_loop_lag: float = 0.25, inbound_threads: int = 8):
+        self.agency_rate = agency_rate
+        self.agency_burst = agency_burst
+        self.max_in_flight = max_in_flight
+        self.max_dial_backlog = max_dial_backlog
+        self.max_loop_lag = max_loop_lag
+        self.inbound_threads = inbound_threads
+        self.in_flight = 0
+        self.loop_lag = 0.0
+        self.backlog = lambda: 0  # set by the app (inbound jobs in the dial queue)
+        self._buckets = OrderedDict()  # agency_id -> TokenBucket
+        self._lock = threading.Lock()
+        self._executor = None
+        self._lag_task = None
+
+        metrics.gauge("event_loop_lag_seconds", lambda: round(self.loop_lag, 4))
+        metrics.gauge("inbound_in_flight", lambda: self.in_flight)
+
+    def configure(self, settings):
+        self.agency_rate = settings.inbound_rate_per_agency
+        self.agency_burst = settings.inbound_burst_per_agency
+        self.max_in_flight = settings.inbound_max_in_flight
+        self.max_dial_backlog = settings.inbound_max_dial_backlog
+        self.max_loop_lag = settings.inbound_max_loop_lag_seconds
+        with self._lock:
+            self._buckets.clear()
+
+    # --- checks ---
+
+    def _bucket_wait(self, agency_id: str) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(agency_id)
+            if bucket is None:
+                bucket = self._buckets[agency_id] = TokenBucket(self.agency_rate, self.agency_burst)
+                while len(self._buckets) > MAX_TRACKED_AGENCIES:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(agency_id)
+            return bucket.take(now)
+
+    def admit(self, agency_id: str):
+        """
+        Raises Rejected if the request should be turned away. On success the
+        caller must call leave() when done.
+        """
+        if self.loop_lag > self.max_loop_lag:
+            raise self._reject("loop_lag", 2.0)
+        if self.in_flight >= self.max_in_flight:
+            raise self._reject("in_flight", 1.0)
+        backlog = self.backlog()
+        if backlog >= self.max_dial_backlog:
+            raise self._reject("dial_backlog", 30.0)
+        wait = self._bucket_wait(agency_id)
+        if wait > 0:
+            raise self._reject("agency_rate", wait)
+        self.in_flight += 1
+        metrics.inc("inbound_admission", result="admitted")
+
+    def leave(self):
+        self.in_flight = max(0, self.in_flight - 1)
+
+    def _reject(self, reason: str, retry_after: float) -> Rejected:
+        metrics.inc("inbound_admission", result="rejected", reason=reason)
+        return Rejected(reason, retry_after)
+
+    # --- inbound thread pool ---
+
+    async def run(self, func, *args):
+        """Runs blocking inbound work on the inbound pool (not the default one)."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.inbound_threads, thread_name_prefix="inbound")
+        # Like asyncio.to_thread: the caller's context (profiling sections) goes along
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: context.run(func, *args))
+
+    # --- event loop lag ---
+
+    async def _measure_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_TICK_SECONDS)
+            lag = max(0.0, loop.time() - start - LAG_TICK_SECONDS)
+            # Fast attack, slow decay: one long stall matters immediately
+            self.loop_lag = lag if lag > self.loop_lag else self.loop_lag * 0.8 + lag * 0.2
+            if lag > self.max_loop_lag:
+                metrics.observe("event_loop_stall_seconds", lag)
+
+    def start(self):
+        """Starts the lag ticker on the running loop (app startup)."""
+        self.loop_lag = 0.0
+        self.in_flight = 0
+        self._lag_task = asyncio.get_running_loop().create_task(self._measure_lag())
+
+    async def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            try:
+                await self._lag_task
+            except asyncio.CancelledError:
+                pass
+            self._lag_task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+admission = AdmissionController()
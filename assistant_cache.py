@@ -0,0 +1,95 @@
+# assistant_cache.py - Cache for resolved assistant-request configs
+#
+# Vapi can send several assistant-requests for the same call, and calls to
+# the same customer number often arrive together. Resolved configs are cached
+# per call id for a short TTL, and concurrent misses for the same number
+# share one in-flight lookup (single-flight) instead of each hitting the DB.
+
+import asyncio
+import time
+from collections import OrderedDict
+
+from metrics import metrics
+
+
+class AssistantConfigCache:
+    def __init__(self, ttl_seconds: float = 120.0, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # call_id -> (expires_at, config)
+        self._in_flight = {}  # phone_number -> asyncio.Future
+
+        metrics.gauge("assistant_cache_size", lambda: len(self._entries))
+        metrics.gauge("assistant_cache_in_flight", lambda: len(self._in_flight))
+
+    def _get(self, call_id: str):
+        entry = self._entries.get(call_id)
+        if entry is None:
+            return None
+        expires_at, config = entry
+        if expires_at < time.monotonic():
+            del self._entries[call_id]
+            return None
+        self._entries.move_to_end(call_id)
+        return config
+
+    def _put(self, call_id: str, config: dict):
+        self._entries[call_id] = (time.monotonic() + self.ttl_seconds, config)
+        self._entries.move_to_end(call_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_build(self, call_id: str | None, phone_number: str | None, build):
+        """
+        Returns the cached config for `call_id`, or awaits `build(phone_number)`
+        (a coroutine function). Concurrent misses for the same phone number
+        share one build; if its leader is cancelled, a waiter takes over.
+        """
+        if call_id:
+            config = self._get(call_id)
+            if config is not None:
+                metrics.inc("assistant_cache_requests", result="hit")
+                return config
+
+        flight_key = phone_number or call_id
+        while True:
+            future = self._in_flight.get(flight_key) if flight_key else None
+            if future is None:
+                break
+            metrics.inc("assistant_cache_requests", result="coalesced")
+            # wait() only raises if we are cancelled, and never cancels the
+            # shared future for the other waiters
+            await asyncio.wait((future,))
+            if not future.cancelled():
+                config = future.result()
+                break
+            # The leader was cancelled (its request went away), not us:
+            # look again - join a newer flight or lead one ourselves
+            metrics.inc("assistant_cache_requests", result="leader_cancelled")
+
+        if future is None:
+            metrics.inc("assistant_cache_requests", result="miss")
+            future = asyncio.get_running_loop().create_future()
+            if flight_key:
+                self._in_flight[flight_key] = future
+            try:
+                config = await build(phone_number)
+                future.set_result(config)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                future.set_exception(e)
+                # Nobody else may be waiting; don't leave "never retrieved" noise
+                future.exception()
+                raise
+            finally:
+                if flight_key and self._in_flight.get(flight_key) is future:
+                    del self._in_flight[flight_key]
+
+        if call_id:
+            self._put(call_id, config)
+        return config
+
+    def clear(self):
+        self._entries.clear()
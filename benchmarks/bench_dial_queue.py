@@ -0,0 +1,93 @@
+# benchmarks/bench_dial_queue.py - Inbound wait time under campaign load
+#
+# Fills the dial queue with a large campaign, then feeds inbound leads in at
+# a steady rate while a fixed pool of workers "dials" (sleeps). Reports the
+# queue wait per priority class for the priority queue and for plain FIFO
+# (all head starts zero), which is how dials were served before.
+#
+#   python -m benchmarks.bench_dial_queue --campaign 2000 --inbound 200
+
+import argparse
+import random
+import threading
+import time
+
+from dialer import EXPEDITED, PRIORITY_HEADSTART, DialJob, DialQueue
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def simulate(headstart: dict, expedited: frozenset, args) -> dict:
+    queue = DialQueue(headstart, expedited)
+    waits = {}
+    lock = threading.Lock()
+
+    def make_job(priority: str, key: str) -> DialJob:
+        job = DialJob(priority=priority, agency_id="a1", key=key, run=None)
+
+        def run():
+            wait = time.monotonic() - job.ready_at
+            with lock:
+                waits.setdefault(priority, []).append(wait)
+            time.sleep(args.dial_ms / 1000)
+
+        job.run = run
+        return job
+
+    for i in range(args.campaign):
+        queue.put(make_job("queued_night" if i % 5 == 0 else "new", f"lead:{i}"))
+
+    def worker():
+        while True:
+            job = queue.get(timeout=0.5)
+            if job is None:
+                return
+            job.run()
+            queue.done(job)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.workers)]
+    for t in threads:
+        t.start()
+
+    rng = random.Random(3)
+    for i in range(args.inbound):
+        queue.put(make_job("inbound", f"inbound:{i}"))
+        if i % 10 == 0:
+            queue.put(make_job("retry", f"retry:{i}"))
+        time.sleep(rng.expovariate(1000 / args.inbound_interval_ms))
+
+    for t in threads:
+        t.join()
+    return waits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--campaign", type=int, default=2000, help="campaign leads queued up front")
+    parser.add_argument("--inbound", type=int, default=200, help="inbound leads arriving during the campaign")
+    parser.add_argument("--inbound-interval-ms", type=float, default=25.0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--dial-ms", type=float, default=10.0, help="simulated dial duration")
+    args = parser.parse_args()
+
+    modes = {
+        "priority": (PRIORITY_HEADSTART, EXPEDITED),
+        "fifo": (dict.fromkeys(PRIORITY_HEADSTART, 0.0), frozenset()),
+    }
+    print(f"{'mode':<10} {'class':<14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for mode, (headstart, expedited) in modes.items():
+        waits = simulate(headstart, expedited, args)
+        for priority in PRIORITY_HEADSTART:
+            values = waits.get(priority, [])
+            print(f"{mode:<10} {priority:<14} {len(values):>6} "
+                  f"{percentile(values, 0.5) * 1000:>9.1f} {percentile(values, 0.95) * 1000:>9.1f} "
+                  f"{max(values, default=0) * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
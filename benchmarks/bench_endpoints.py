@@ -0,0 +1,313 @@
+# benchmarks/bench_endpoints.py - Load test for the FastAPI endpoints
+#
+# Runs the real app (uvicorn, real HTTP) against FakeSupabase and stub
+# Vapi/frontend servers, then reports throughput and p50/p95/p99 latency
+# per endpoint. Results are written to benchmarks/results/<commit>.json so
+# runs can be compared across commits:
+#
+#   python -m benchmarks.bench_endpoints
+#   python -m benchmarks.bench_endpoints --db-latency 0.02 --vapi-latency 0.3
+#   python -m benchmarks.bench_endpoints --compare 80653c0
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import httpx
+import uvicorn
+
+from benchmarks.fakes import FakeSupabase, StubServer, vapi_call_body
+from benchmarks.workloads import random_phone, vapi_call_events, zapier_burst
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+OFFICE_TIMEZONES = ["Europe/Luxembourg", "America/New_York", "America/Los_Angeles", "Asia/Tokyo", "Australia/Sydney", "Pacific/Honolulu"]
+
+
+# --- setup ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _open_timezone() -> str:
+    """A timezone where it is currently office hours, so inbound leads dial."""
+    from zoneinfo import ZoneInfo
+    for tz in OFFICE_TIMEZONES:
+        if 8 <= datetime.now(ZoneInfo(tz)).hour < 21:
+            return tz
+    return OFFICE_TIMEZONES[0]
+
+
+def seed_database(db: FakeSupabase, rng: random.Random, agencies: int, leads_per_agency: int) -> list:
+    timezone = _open_timezone()
+    agency_ids = [f"agency-{i}" for i in range(agencies)]
+    db.seed("agencies", [
+        {"id": agency_id, "subscription_status": "active", "timezone": timezone, "fub_api_key": None}
+        for agency_id in agency_ids
+    ])
+    db.seed("leads", [
+        {
+            "id": f"lead-{agency_id}-{i}",
+            "agency_id": agency_id,
+            "name": rng.choice(["Anna", "Luc", "Marie"]),
+            "phone_number": random_phone(rng),
+            "address": f"{i} Rue de la Gare",
+            "status": rng.choice(["new", "new", "queued_night"]),
+        }
+        for agency_id in agency_ids for i in range(leads_per_agency)
+    ])
+    db.seed("call_retries", [])
+    return agency_ids
+
+
+class ServerThread:
+    def __init__(self, app, port, log_level="critical"):
+        # Background tasks still queued for a worker thread are cancelled at
+        # shutdown; keep uvicorn quiet about that unless --verbose.
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level=log_level, timeout_graceful_shutdown=5)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=15)
+
+
+# --- load generation ---
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}  # label -> [(latency_seconds, status_code)]
+
+    def add(self, label, latency, status):
+        self.samples.setdefault(label, []).append((latency, status))
+
+
+async def _timed_post(client, recorder, label, url, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.post(url, **kwargs)
+        status = response.status_code
+    except httpx.HTTPError:
+        status = 599
+    recorder.add(label, time.perf_counter() - start, status)
+
+
+async def run_inbound(client, recorder, rng, agency_ids, total, concurrency, burst_size):
+    """Zapier-style bursts: `burst_size` leads at once, spread over agencies."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(body):
+        async with semaphore:
+            await _timed_post(client, recorder, "POST /webhooks/inbound/{agency_id}", f"/webhooks/inbound/{rng.choice(agency_ids)}", json=body)
+
+    sent = 0
+    while sent < total:
+        burst = zapier_burst(rng, min(burst_size, total - sent))
+        await asyncio.gather(*(one(body) for body in burst))
+        sent += len(burst)
+
+
+async def run_vapi_events(client, recorder, rng, agency_ids, calls, concurrency, turns):
+    """Concurrent calls, each replaying its event stream in order."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_call():
+        events = vapi_call_events(rng, random_phone(rng), rng.choice(agency_ids), turns=turns)
+        for event_type, body in events:
+            async with semaphore:
+                await _timed_post(client, recorder, f"POST /assistant-request [{event_type}]", "/assistant-request", content=json.dumps(body), headers={"Content-Type": "application/json"})
+
+    await asyncio.gather(*(one_call() for _ in range(calls)))
+
+
+async def run_campaigns(client, recorder, rng, agency_ids, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await _timed_post(client, recorder, "POST /start-campaign", "/start-campaign", json={"agency_id": rng.choice(agency_ids)})
+
+    await asyncio.gather(*(one() for _ in range(total)))
+
+
+# --- reporting ---
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest rank
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct * len(sorted_values) / 100) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder: Recorder, wall_times: dict) -> dict:
+    results = {}
+    for label, samples in sorted(recorder.samples.items()):
+        latencies = sorted(s[0] for s in samples)
+        errors = sum(1 for s in samples if s[1] >= 400)
+        scenario = "vapi" if "assistant-request" in label else ("inbound" if "inbound" in label else "campaign")
+        wall = wall_times.get(scenario) or 1e-9
+        results[label] = {
+            "count": len(samples),
+            "errors": errors,
+            "throughput_rps": round(len(samples) / wall, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        }
+    return results
+
+
+def print_table(results: dict, baseline: dict | None = None):
+    header = f"{'endpoint':<58} {'count':>6} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for label, r in results.items():
+        line = f"{label:<58} {r['count']:>6} {r['errors']:>5} {r['throughput_rps']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}"
+        print(line)
+        if baseline and label in baseline:
+            b = baseline[label]
+
+            def delta(key):
+                return f"{(r[key] - b[key]) / b[key] * 100:+.1f}%" if b[key] else "n/a"
+            print(f"{'  vs baseline':<58} {'':>6} {'':>5} {delta('throughput_rps'):>9} {delta('p50_ms'):>9} {delta('p95_ms'):>9} {delta('p99_ms'):>9}")
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.check_output(["git", *args], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return ""
+
+
+def save_results(results: dict, params: dict, output: str | None) -> str:
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    dirty = bool(_git("status", "--porcelain", "--untracked-files=no"))
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = output or os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "commit": commit,
+            "dirty": dirty,
+            "recorded_at": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "params": params,
+            "results": results,
+        }, f, indent=2)
+    return path
+
+
+def load_baseline(ref: str) -> dict | None:
+    candidates = [ref, os.path.join(RESULTS_DIR, ref), os.path.join(RESULTS_DIR, f"{ref}.json")]
+    for path in candidates:
+        if os.path.isfile(path):
+            with open(path) as f:
+                return json.load(f)["results"]
+    print(f"⚠️ No stored results for '{ref}' in {RESULTS_DIR}")
+    return None
+
+
+# --- entry point ---
+
+async def drive(base_url, args, rng, agency_ids):
+    recorder = Recorder()
+    wall_times = {}
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        scenarios = args.scenarios.split(",")
+        if "inbound" in scenarios:
+            start = time.perf_counter()
+            await run_inbound(client, recorder, rng, agency_ids, args.inbound, args.concurrency, args.burst)
+            wall_times["inbound"] = time.perf_counter() - start
+        if "vapi" in scenarios:
+            start = time.perf_counter()
+            await run_vapi_events(client, recorder, rng, agency_ids, args.calls, args.concurrency, args.turns)
+            wall_times["vapi"] = time.perf_counter() - start
+        if "campaign" in scenarios:
+            start = time.perf_counter()
+            await run_campaigns(client, recorder, rng, agency_ids, args.campaigns, args.concurrency)
+            wall_times["campaign"] = time.perf_counter() - start
+    return recorder, wall_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenarios", default="inbound,vapi,campaign")
+    parser.add_argument("--inbound", type=int, default=300, help="inbound leads to send")
+    parser.add_argument("--burst", type=int, default=50, help="Zapier burst size")
+    parser.add_argument("--calls", type=int, default=20, help="simulated Vapi calls")
+    parser.add_argument("--turns", type=int, default=20, help="conversation turns per call")
+    parser.add_argument("--campaigns", type=int, default=50, help="start-campaign requests")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--agencies", type=int, default=20)
+    parser.add_argument("--leads-per-agency", type=int, default=200)
+    parser.add_argument("--db-latency", type=float, default=0.005, help="seconds added to every fake DB query")
+    parser.add_argument("--vapi-latency", type=float, default=0.2, help="seconds for stub Vapi responses")
+    parser.add_argument("--frontend-latency", type=float, default=0.05, help="seconds for stub frontend webhook")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform extra latency for stubs")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="commit or results file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show app output")
+    args = parser.parse_args()
+
+    import main as backend
+    from config import Settings
+
+    rng = random.Random(args.seed)
+    db = FakeSupabase(latency=args.db_latency)
+    agency_ids = seed_database(db, rng, args.agencies, args.leads_per_agency)
+
+    with StubServer(body=vapi_call_body, latency=args.vapi_latency, jitter=args.jitter) as vapi, \
+            StubServer(body={"status": "ok"}, latency=args.frontend_latency, jitter=args.jitter) as frontend:
+        settings = Settings(
+            supabase_url="http://fake-supabase",
+            supabase_key="fake-service-role-key",
+            vapi_api_key="bench-key",
+            vapi_phone_number_id="pn-bench",
+            vapi_base_url=vapi.url,
+            frontend_base_url=frontend.url,
+            environment="benchmark",
+            shutdown_grace_seconds=5,
+        )
+        app = backend.create_app(settings, db)
+        port = _free_port()
+
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet, ServerThread(app, port, log_level="warning" if args.verbose else "critical"):
+            recorder, wall_times = asyncio.run(drive(f"http://127.0.0.1:{port}", args, rng, agency_ids))
+
+        upstream = {"vapi_requests": sum(vapi.requests.values()), "frontend_requests": sum(frontend.requests.values()), "frontend_bytes": frontend.bytes_received, "db_queries": db.query_count}
+
+    results = summarize(recorder, wall_times)
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "compare", "verbose")}
+    params["upstream"] = upstream
+    baseline = load_baseline(args.compare) if args.compare else None
+    print_table(results, baseline)
+    print(f"\nupstream: {upstream}")
+    print(f"📁 Results saved to {save_results(results, params, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# benchmarks/bench_export.py - Streaming lead export: memory and time to first byte
+#
+# Serves the real app (uvicorn) against a FakeSupabase whose `leads` table
+# is synthesized from the row index (a 1M-row table would otherwise take
+# gigabytes of dicts in this process) and answers keyset pages in O(page),
+# like the (agency_id, id) index does in Postgres. For each export size it
+# streams GET /leads/export/{agency} over real HTTP and reports time to
+# first byte, total time, rows/second, bytes and the server process's
+# resident memory growth while streaming.
+#
+#   python -m benchmarks.bench_export --rows 10000 100000 1000000
+
+import argparse
+import gzip
+import threading
+import time
+
+import requests
+
+from benchmarks.bench_endpoints import ServerThread
+from benchmarks.fakes import FakeQuery, FakeResponse, FakeSupabase
+from config import Settings
+
+AGENCY_ID = "agency-export"
+STATUSES = ("new", "called", "no_answer", "queued_night", "appointment_booked")
+
+
+def lead_id(i: int) -> str:
+    return f"00000000-0000-4000-8000-{i:012d}"
+
+
+def lead_row(i: int) -> dict:
+    return {
+        "id": lead_id(i),
+        "agency_id": AGENCY_ID,
+        "name": f"Lead {i}",
+        "phone_number": f"+35262{i % 1000000:06d}",
+        "address": f"{i % 200} Rue de la Gare, Luxembourg",
+        "status": STATUSES[i % len(STATUSES)],
+        "asking_price": str(250000 + i % 500 * 1000),
+        "preferred_language": "fr" if i % 3 else "en",
+        "created_at": "2026-03-01T09:00:00+00:00",
+        "updated_at": None,
+    }
+
+
+class SyntheticLeads(FakeQuery):
+    """Keyset pages of `rows` generated leads (eq/gt/order/limit only)."""
+
+    def __init__(self, db, table, rows):
+        super().__init__(db, table)
+        self._rows = rows
+        self._after = None
+        self._agency = None
+
+    def eq(self, column, value):
+        if column == "agency_id":
+            self._agency = value
+        return self
+
+    def gt(self, column, value):
+        self._after = value
+        return self
+
+    def execute(self):
+        if self._db.latency:
+            time.sleep(self._db.latency)
+        if self._agency != AGENCY_ID:
+            return FakeResponse([])
+        start = int(self._after[-12:]) + 1 if self._after else 0
+        end = min(self._rows, start + (self._limit or self._rows))
+        return FakeResponse([lead_row(i) for i in range(start, end)])
+
+
+class ExportDB(FakeSupabase):
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.lead_rows = 0
+        self.seed("agencies", [{"id": AGENCY_ID, "subscription_status": "active"}])
+
+    def table(self, name):
+        if name == "leads":
+            return SyntheticLeads(self, name, self.lead_rows)
+        return super().table(name)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096 / 2**20
+
+
+class PeakRSS:
+    def __init__(self):
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.02):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self):
+        self.peak = rss_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def export(port: int, file_format: str, compressed: bool) -> dict:
+    url = f"http://127.0.0.1:{port}/leads/export/{AGENCY_ID}?format={file_format}&gzip={str(compressed).lower()}"
+    start = time.perf_counter()
+    first_byte = None
+    received = 0
+    lines = 0
+    inflate = gzip.zlib.decompressobj(31) if compressed else None
+    with requests.get(url, stream=True, timeout=600) as response:
+        response.raise_for_status()
+        chunked = response.headers.get("transfer-encoding") == "chunked"
+        for chunk in response.iter_content(chunk_size=None):
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            received += len(chunk)
+            lines += (inflate.decompress(chunk) if inflate else chunk).count(b"\n")
+    return {
+        "ttfb": first_byte, "seconds": time.perf_counter() - start,
+        "bytes": received, "lines": lines, "chunked": chunked,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--formats", nargs="+", default=["csv", "ndjson", "csv.gz"])
+    parser.add_argument("--db-latency", type=float, default=0.005, help="seconds per page query")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    import main as app_main
+    db = ExportDB(latency=args.db_latency)
+    app = app_main.create_app(Settings(supabase_url="http://fake-supabase", supabase_key="fake"), db)
+
+    print(f"{'rows':>9} {'format':<7} {'ttfb':>7} {'total':>7} {'rows/s':>9} {'MB':>7} {'rss +MB':>8}  chunked")
+    with ServerThread(app, args.port):
+        for rows in args.rows:
+            db.lead_rows = rows
+            for name in args.formats:
+                file_format, _, suffix = name.partition(".")
+                base = rss_mb()
+                with PeakRSS() as rss:
+                    result = export(args.port, file_format, suffix == "gz")
+                expected = rows + (file_format == "csv")
+                assert result["lines"] == expected, f"{result['lines']} lines, expected {expected}"
+                print(f"{rows:>9} {name:<7} {result['ttfb'] * 1000:6.1f}ms {result['seconds']:6.2f}s "
+                      f"{rows / result['seconds']:>9.0f} {result['bytes'] / 2**20:7.1f} {rss.peak - base:8.1f}  {result['chunked']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/bench_fairness.py - Small-agency wait times during a big campaign
+#
+# One enterprise agency queues a large campaign up front; small (starter)
+# agencies start short campaigns while it is running. Worker threads "dial"
+# by sleeping. Compares:
+#   - fair:   per-agency deficit round robin with tier weights and caps
+#   - shared: every job in one queue regardless of agency (the old behavior)
+# and reports per-lead wait and campaign completion time for the small
+# agencies, plus the big agency's share of dials.
+#
+#   python -m benchmarks.bench_fairness --big 4000 --small-agencies 9
+
+import argparse
+import random
+import threading
+import time
+
+from dialer import TIER_SHARES, DialJob, DialQueue
+from benchmarks.bench_dial_queue import percentile
+
+
+def simulate(fair: bool, args) -> dict:
+    queue = DialQueue()
+    lock = threading.Lock()
+    waits = {}  # agency -> [wait seconds]
+    finished = {}  # agency -> last dial start
+    submitted = {}  # agency -> campaign submit time
+
+    def submit(agency: str, tier: str, count: int):
+        weight, cap = TIER_SHARES[tier]
+        submitted[agency] = time.monotonic()
+        for i in range(count):
+            job = DialJob(priority="new", agency_id=agency if fair else "shared", key=f"{agency}:{i}", run=None)
+            job.run = agency  # stash the real agency for reporting
+            if fair:
+                queue.put(job, weight=weight, cap=cap)
+            else:
+                queue.put(job)
+
+    def worker():
+        while True:
+            job = queue.get(timeout=0.5)
+            if job is None:
+                return
+            agency = job.run
+            now = time.monotonic()
+            with lock:
+                waits.setdefault(agency, []).append(now - job.ready_at)
+                finished[agency] = now
+            time.sleep(args.dial_ms / 1000)
+            queue.done(job)
+
+    submit("big", "enterprise", args.big)
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.workers)]
+    for t in threads:
+        t.start()
+
+    rng = random.Random(5)
+    for n in range(args.small_agencies):
+        time.sleep(rng.uniform(0, args.stagger_ms / 1000))
+        submit(f"small-{n}", "starter", args.small_leads)
+
+    for t in threads:
+        t.join()
+
+    small = [a for a in waits if a != "big"]
+    small_waits = [w for a in small for w in waits[a]]
+    completion = [finished[a] - submitted[a] for a in small]
+    return {
+        "small_p50": percentile(small_waits, 0.5),
+        "small_p95": percentile(small_waits, 0.95),
+        "small_max": max(small_waits, default=0),
+        "small_completion_max": max(completion, default=0),
+        "big_p50": percentile(waits.get("big", []), 0.5),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--big", type=int, default=4000, help="leads in the large campaign")
+    parser.add_argument("--small-agencies", type=int, default=9)
+    parser.add_argument("--small-leads", type=int, default=20)
+    parser.add_argument("--stagger-ms", type=float, default=200.0, help="max gap between small campaigns")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--dial-ms", type=float, default=5.0, help="simulated dial duration")
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'small p50':>10} {'small p95':>10} {'small max':>10} {'small done':>11} {'big p50':>9}  (seconds)")
+    for mode in ("fair", "shared"):
+        r = simulate(mode == "fair", args)
+        print(f"{mode:<8} {r['small_p50']:>10.3f} {r['small_p95']:>10.3f} {r['small_max']:>10.3f} "
+              f"{r['small_completion_max']:>11.3f} {r['big_p50']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
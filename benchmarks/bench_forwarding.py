@@ -0,0 +1,72 @@
+# benchmarks/bench_forwarding.py - CPU/allocation cost of relaying Vapi events
+#
+# Compares the old Server URL path for a forwarded end-of-call-report
+# (json.loads -> len(str(payload)) for logging -> json.dumps for requests'
+# json=) with the raw passthrough (peek_event_type on the bytes, forward the
+# body unchanged). No network involved - this isolates per-event CPU.
+#
+#   python -m benchmarks.bench_forwarding --turns 400 --iterations 500
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from benchmarks.workloads import large_end_of_call_report
+from vapi_events import FORWARDED_EVENTS, peek_event_type
+
+
+def legacy_path(body: bytes) -> bytes:
+    payload = json.loads(body)
+    event_type = payload.get('type') or payload.get('event')
+    message = payload.get('message', {})
+    message_type = message.get('type') if message else None
+    assert (event_type or message_type) in FORWARDED_EVENTS
+    _ = len(str(payload))  # debug log payload_size
+    _ = "call" in str(payload) or "callId" in str(payload)  # debug log has_call_data
+    return json.dumps(payload).encode()  # requests.post(json=payload)
+
+
+def raw_path(body: bytes) -> bytes:
+    event_type = peek_event_type(body)
+    assert event_type in FORWARDED_EVENTS
+    _ = len(body)
+    return body
+
+
+def measure(func, body: bytes, iterations: int) -> dict:
+    func(body)  # warm up
+    start = time.process_time()
+    for _ in range(iterations):
+        func(body)
+    cpu = (time.process_time() - start) / iterations
+
+    tracemalloc.start()
+    func(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_us_per_event": round(cpu * 1e6, 1), "peak_alloc_kb": round(peak / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=400, help="conversation turns in the report")
+    parser.add_argument("--iterations", type=int, default=300)
+    args = parser.parse_args()
+
+    report = large_end_of_call_report(random.Random(7), turns=args.turns)
+    body = json.dumps(report).encode()
+    print(f"end-of-call-report: {len(body) / 1024:.1f} KB ({args.turns} turns)")
+
+    legacy = measure(legacy_path, body, args.iterations)
+    raw = measure(raw_path, body, args.iterations)
+    print(f"{'path':<10} {'cpu us/event':>14} {'peak alloc KB':>15}")
+    print(f"{'legacy':<10} {legacy['cpu_us_per_event']:>14} {legacy['peak_alloc_kb']:>15}")
+    print(f"{'raw':<10} {raw['cpu_us_per_event']:>14} {raw['peak_alloc_kb']:>15}")
+    if raw["cpu_us_per_event"]:
+        print(f"speedup: {legacy['cpu_us_per_event'] / raw['cpu_us_per_event']:.0f}x CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/bench_phone.py - Throughput of E.164 normalization
+#
+# Imports normalize every row and Vapi lookups normalize every call, so this
+# measures numbers/minute for a realistic mix of formats:
+#   - cold: distinct numbers, every non-E.164 one goes through the slow path
+#   - warm: a spreadsheet-like stream where numbers repeat (LRU hits)
+#
+#   python -m benchmarks.bench_phone --count 1000000
+
+import argparse
+import random
+import time
+
+from phone import _normalize_slow, cache_info, normalize_many, normalize_phone
+
+
+def phone_mix(rng: random.Random, count: int) -> list:
+    out = []
+    for _ in range(count):
+        d = f"{rng.randrange(10 ** 6):06d}"
+        out.append(rng.choice((
+            f"+352621{d}",
+            f"+352 621 {d[:3]} {d[3:]}",
+            f"00352621{d}",
+            f"621{d}",
+            f"+33 (0)6 {d[:2]} {d[2:4]} {d[4:]} 12",
+            f"06 {d[:2]} {d[2:4]} {d[4:]} 12",
+            f"(415) 55{d[0]}-{d[1:5]}",
+            f"+1 415-55{d[0]}-{d[1:5]} ext 12",
+        )))
+    return out
+
+
+def run(label: str, func, numbers: list):
+    start = time.perf_counter()
+    result = func(numbers)
+    elapsed = time.perf_counter() - start
+    valid = sum(1 for n in result if n)
+    per_minute = len(numbers) / elapsed * 60
+    print(f"{label:<28} {elapsed:>8.2f}s {per_minute / 1e6:>10.1f}M/min  valid={valid}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--distinct", type=int, default=50_000, help="distinct numbers in the warm stream")
+    parser.add_argument("--region", default="LU")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    cold = phone_mix(rng, args.count)
+    pool = phone_mix(rng, args.distinct)
+    warm = [rng.choice(pool) for _ in range(args.count)]
+
+    print(f"{'workload':<28} {'time':>9} {'throughput':>13}")
+    _normalize_slow.cache_clear()
+    run("per-number, cold", lambda ns: [normalize_phone(n, args.region) for n in ns], cold)
+    _normalize_slow.cache_clear()
+    run("batch, cold", lambda ns: normalize_many(ns, args.region), cold)
+    run("batch, warm (repeats)", lambda ns: normalize_many(ns, args.region), warm)
+    print(cache_info())
+
+
+if __name__ == "__main__":
+    main()
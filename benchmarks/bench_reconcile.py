@@ -0,0 +1,88 @@
+# benchmarks/bench_reconcile.py - Draining a backlog of calls with lost reports
+#
+# Seeds FakeSupabase with `--calls` call_logs rows stuck in_progress (and
+# their leads stuck 'calling') and a VapiStub that knows how each call
+# really ended (mostly no-answer/answered, some voicemail/busy/errors, a
+# few still live, a few unknown to Vapi), then runs one CallReconciler
+# pass and reports calls/second, peak concurrent Vapi lookups and the
+# resulting lead/call states.
+#
+#   python -m benchmarks.bench_reconcile --calls 3000 --vapi-latency 0.2 --rps 50
+
+import argparse
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import db
+from benchmarks.fakes import FakeSupabase, VapiStub
+from config import Settings
+from reconcile import CallReconciler
+
+REASONS = (
+    ('customer-did-not-answer', 40), ('customer-ended-call', 30), ('voicemail', 10),
+    ('customer-busy', 8), ('pipeline-error-openai-llm-failed', 4), (None, 5), ('unknown', 3),
+)
+
+
+def seed(rng: random.Random, count: int) -> tuple:
+    fake = FakeSupabase()
+    stale = (datetime.now(timezone.utc) - timedelta(hours=2)).isoformat()
+    calls, logs, leads = {}, [], []
+    reasons, weights = zip(*REASONS)
+    for i in range(count):
+        call_id, lead_id = str(uuid.uuid4()), str(uuid.UUID(int=i))
+        reason = rng.choices(reasons, weights)[0]
+        if reason is None:
+            calls[call_id] = {"id": call_id, "status": "in-progress"}
+        elif reason != 'unknown':
+            calls[call_id] = {
+                "id": call_id, "status": "ended", "endedReason": reason,
+                "startedAt": "2026-03-02T10:00:00.000Z", "endedAt": "2026-03-02T10:01:30.000Z",
+                "artifact": {"transcript": "AI: Hello\nUser: Hi"}, "analysis": {"summary": "Short call."},
+            }
+        logs.append({"id": str(uuid.UUID(int=10 ** 9 + i)), "vapi_call_id": call_id, "agency_id": f"agency-{i % 5}",
+                     "lead_id": lead_id, "status": "in_progress", "updated_at": stale})
+        leads.append({"id": lead_id, "agency_id": f"agency-{i % 5}", "status": "calling", "updated_at": stale})
+    fake.seed("call_logs", logs)
+    fake.seed("leads", leads)
+    fake.seed("call_retries", [])
+    fake.seed("agencies", [])
+    return fake, calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=3000)
+    parser.add_argument("--vapi-latency", type=float, default=0.2)
+    parser.add_argument("--rps", type=float, default=50.0, help="Vapi lookups per second")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fail-first", type=int, default=20, help="initial 429s from Vapi")
+    args = parser.parse_args()
+
+    fake, calls = seed(random.Random(5), args.calls)
+    db.set_supabase(fake)
+    with VapiStub(latency=args.vapi_latency, fail_first=args.fail_first, calls=calls) as vapi:
+        reconciler = CallReconciler()
+        reconciler.configure(Settings(
+            vapi_api_key="key", vapi_base_url=vapi.url,
+            vapi_reconcile_concurrency=args.concurrency, vapi_reconcile_requests_per_second=args.rps,
+        ))
+        start = time.perf_counter()
+        report = reconciler.run()
+        elapsed = time.perf_counter() - start
+        print(f"{args.calls} stale calls in {elapsed:.1f}s ({args.calls / elapsed:.1f} calls/s, "
+              f"limit {args.rps:g}/s), peak {vapi.peak_in_flight} concurrent lookups, {vapi.lookups} lookups")
+    print("report:", {k: v for k, v in report.items() if k != "outcomes"})
+    print("call outcomes:", report["outcomes"])
+    print("call_logs:", dict(Counter(row["status"] for row in fake.tables["call_logs"])))
+    print("leads:", dict(Counter(row["status"] for row in fake.tables["leads"])))
+    print("retries created:", len(fake.tables["call_retries"]))
+    db.set_supabase(fake)
+    print("second pass:", {k: v for k, v in reconciler.run().items() if k in ("checked", "repaired")})
+
+
+if __name__ == "__main__":
+    main()
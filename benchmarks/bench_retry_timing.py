@@ -0,0 +1,98 @@
+# benchmarks/bench_retry_timing.py - Retry slot selection: quality and cost
+#
+# Builds an agency whose leads answer mostly at lunch and in the early
+# evening (and barely on weekday mornings), then for a set of pending
+# retries created at random times compares:
+#   - fixed:  the frontend's delay (scheduled_at as inserted)
+#   - slotted: RetryTimer's best office hour in the retry window
+# by expected connect probability, and measures slot selection for
+# `--retries` retries (CPU only) and a slot_pending() pass over
+# `--db-rows` call_retries rows in FakeSupabase.
+#
+#   python -m benchmarks.bench_retry_timing --retries 100000 --db-rows 10000
+
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import db
+import retry_timing
+from benchmarks.fakes import FakeSupabase
+from retry_timing import AnswerHistogram, RetryTimer, ZoneInfo, hour_of_week, is_office_hour
+
+TZ = ZoneInfo("Europe/Luxembourg")
+
+
+def true_answer_rate(local: datetime) -> float:
+    if not is_office_hour(local.hour):
+        return 0.05
+    if local.weekday() >= 5:
+        return 0.45 if local.hour < 13 else 0.25
+    if 12 <= local.hour < 14 or 17 <= local.hour < 20:
+        return 0.55
+    return 0.15
+
+
+def training_histogram(rng: random.Random, calls: int, start: datetime) -> AnswerHistogram:
+    histogram = AnswerHistogram(TZ)
+    for _ in range(calls):
+        moment = start + timedelta(minutes=rng.randrange(60 * 24 * 60))
+        histogram.record(moment, rng.random() < true_answer_rate(moment.astimezone(TZ)))
+    return histogram
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--retries", type=int, default=100000, help="retries slotted in memory")
+    parser.add_argument("--db-rows", type=int, default=10000, help="call_retries rows for slot_pending()")
+    parser.add_argument("--history", type=int, default=5000, help="past calls in the histogram")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    now = datetime(2026, 3, 2, 9, tzinfo=timezone.utc)
+    histogram = training_histogram(rng, args.history, now - timedelta(days=60))
+    start = time.perf_counter()
+    best = histogram.best_offsets()
+    print(f"table build: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+    earliest = [now + timedelta(minutes=rng.randrange(60 * 24 * 7)) for _ in range(args.retries)]
+    start = time.perf_counter()
+    slots = [histogram.slot(moment, best) for moment in earliest]
+    elapsed = time.perf_counter() - start
+    print(f"slotting {args.retries} retries: {elapsed * 1000:.0f}ms ({elapsed / args.retries * 1e6:.2f}us/retry)")
+
+    fixed = sum(true_answer_rate(m.astimezone(TZ)) for m in earliest) / len(earliest)
+    slotted = sum(true_answer_rate(m.astimezone(TZ)) for m in slots) / len(slots)
+    delay = sum((s - e).total_seconds() for s, e in zip(slots, earliest)) / len(slots) / 3600
+    print(f"expected connect rate: fixed {fixed:.1%}  slotted {slotted:.1%}  (mean extra wait {delay:.1f}h)")
+
+    by_hour = {}
+    for moment in slots:
+        hour = hour_of_week(moment.astimezone(TZ)) % 24
+        by_hour[hour] = by_hour.get(hour, 0) + 1
+    print("slotted local hours:", " ".join(f"{h}h:{n}" for h, n in sorted(by_hour.items())))
+
+    fake = FakeSupabase()
+    db.set_supabase(fake)
+    fake.seed("call_retries", [{
+        "id": str(uuid.UUID(int=i)),
+        "agency_id": "agency-1",
+        "status": "pending",
+        "slotted_at": None,
+        "scheduled_at": (datetime.now(timezone.utc) + timedelta(minutes=rng.randrange(60 * 24 * 7))).isoformat(),
+    } for i in range(args.db_rows)])
+    timer = RetryTimer()
+    timer.timezone_of = lambda agency_id: "Europe/Luxembourg"
+    timer._histograms[("agency-1", "Europe/Luxembourg")] = histogram
+    start = time.perf_counter()
+    slotted_rows = timer.slot_pending("agency-1")
+    elapsed = time.perf_counter() - start
+    print(f"slot_pending: {slotted_rows} rows in {elapsed:.2f}s "
+          f"(page size {retry_timing.SLOT_PAGE_SIZE}, fake DB scans included)")
+    print(f"second pass: {timer.slot_pending('agency-1')} rows (each retry is timed once)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# benchmarks/bench_schedules.py - Campaign scheduler: cost per fire and between fires
+#
+# Builds `--schedules` agency schedules (random timezones, weekdays,
+# windows and daily caps) and measures:
+#   - building the heap from scratch (startup / reload),
+#   - a simulated week on a fake clock: every fire the heap produces, with a
+#     fake dialer that drains instantly and a fake lead supply. Checks that
+#     every feed happened inside its window and no agency went over its cap,
+#   - idle CPU of the real scheduler thread over `--idle-seconds` with no
+#     window open, against polling every schedule once a second.
+#
+#   python -m benchmarks.bench_schedules --schedules 10000
+
+import argparse
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import db
+from benchmarks.fakes import FakeSupabase
+from schedules import CampaignScheduler, Schedule, ZoneInfo
+
+TIMEZONES = ("Europe/Luxembourg", "Europe/London", "America/New_York", "America/Los_Angeles",
+             "Asia/Tokyo", "Australia/Sydney", "Asia/Kolkata", "America/Sao_Paulo")
+
+
+def schedule_row(rng: random.Random, days: list | None = None) -> dict:
+    start = rng.randrange(8 * 60, 18 * 60, 30)
+    end = min(21 * 60, start + rng.choice([60, 120, 240]))
+    return {
+        'id': str(uuid.uuid4()),
+        'agency_id': str(uuid.uuid4()),
+        'days': days or sorted(rng.sample(range(1, 8), rng.randint(1, 5))),
+        'start_time': f"{start // 60:02d}:{start % 60:02d}",
+        'end_time': f"{end // 60:02d}:{end % 60:02d}",
+        'daily_cap': rng.choice([20, 50, 200]),
+        'timezone': rng.choice(TIMEZONES),
+    }
+
+
+def simulate_week(rows: list, start: float) -> dict:
+    scheduler = CampaignScheduler()
+    leads = {row['agency_id']: 400 for row in rows}
+    dialed = {}  # (agency, local date) -> dials
+    outside = 0
+    schedules = {row['agency_id']: Schedule(row, row['timezone']) for row in rows}
+
+    def feed(agency_id, limit, window_opened):
+        nonlocal outside
+        now = scheduler.clock()
+        schedule = schedules[agency_id]
+        window = schedule.window(now)
+        if window is None or not window[0] <= now < window[1]:
+            outside += 1
+        n = min(limit, leads[agency_id])
+        leads[agency_id] -= n
+        key = (agency_id, window[2] if window else None)
+        dialed[key] = dialed.get(key, 0) + n
+        return n
+
+    scheduler.feed = feed
+    scheduler.slots = lambda agency_id: 5
+    clock = [start]
+    scheduler.clock = lambda: clock[0]
+    scheduler.set_schedules([Schedule(row, row['timezone']) for row in rows], start)
+
+    end = start + 7 * 86400
+    fires = 0
+    cpu = time.process_time()
+    while True:
+        next_fire = scheduler.next_fire()
+        if next_fire is None or next_fire >= end:
+            break
+        clock[0] = next_fire
+        fires += scheduler.run_due(next_fire)
+    cpu = time.process_time() - cpu
+    caps = {row['agency_id']: row['daily_cap'] for row in rows}
+    over = sum(1 for (agency_id, _), n in dialed.items() if n > caps[agency_id])
+    return {"fires": fires, "cpu": cpu, "dials": sum(dialed.values()), "outside": outside, "over_cap": over}
+
+
+def thread_cpu(thread: threading.Thread) -> float:
+    with open(f"/proc/self/task/{thread.native_id}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / 100.0  # utime + stime, clock ticks
+
+
+def idle_cost(rows: list, seconds: float) -> tuple:
+    """Scheduler thread CPU with no window open, vs a 1s poll over every schedule."""
+    fake = FakeSupabase()
+    fake.seed("campaign_schedules", [{**row, 'enabled': True} for row in rows])
+    db.set_supabase(fake)
+    scheduler = CampaignScheduler()
+    scheduler.feed = lambda agency_id, limit, window_opened: 0
+    scheduler.refresh_seconds = 3600
+    scheduler.start()
+    while scheduler.next_fire() is None:
+        time.sleep(0.05)
+    base = thread_cpu(scheduler._thread)
+    time.sleep(seconds)
+    heap_cpu = thread_cpu(scheduler._thread) - base
+    scheduler.stop()
+
+    schedules = [Schedule(row, row['timezone']) for row in rows]
+    stop = threading.Event()
+
+    def poll():
+        while not stop.wait(1.0):
+            now = time.time()
+            for schedule in schedules:
+                window = schedule.window(now)
+                if window is not None and window[0] <= now:
+                    pass
+
+    poller = threading.Thread(target=poll, daemon=True)
+    poller.start()
+    time.sleep(0.1)
+    base = thread_cpu(poller)
+    time.sleep(seconds)
+    poll_cpu = thread_cpu(poller) - base
+    stop.set()
+    poller.join()
+    return heap_cpu, poll_cpu
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--schedules", type=int, default=10000)
+    parser.add_argument("--idle-seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    rows = [schedule_row(rng) for _ in range(args.schedules)]
+    db.set_supabase(FakeSupabase())  # daily counts are written back
+
+    start = time.perf_counter()
+    scheduler = CampaignScheduler()
+    scheduler.set_schedules([Schedule(row, row['timezone']) for row in rows])
+    print(f"heap build ({args.schedules} schedules): {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    week = simulate_week(rows, datetime(2026, 3, 2, tzinfo=timezone.utc).timestamp())
+    print(f"simulated week: {week['fires']} fires, {week['dials']} dials queued, "
+          f"{week['cpu'] * 1e6 / max(1, week['fires']):.1f}us CPU per fire, "
+          f"{week['outside']} feeds outside a window, {week['over_cap']} agency-days over cap")
+
+    # Only windows on a weekday three days from now: nothing fires while idle
+    closed_day = (datetime.now(ZoneInfo(TIMEZONES[0])) + timedelta(days=3)).isoweekday()
+    idle_rows = [schedule_row(rng, days=[closed_day]) for _ in range(args.schedules)]
+    heap_cpu, poll_cpu = idle_cost(idle_rows, args.idle_seconds)
+    print(f"idle CPU over {args.idle_seconds:.0f}s: heap scheduler {heap_cpu * 1000:.0f}ms, "
+          f"1s poll of every schedule {poll_cpu * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# benchmarks/bench_suppression.py - Do-not-call lists: memory and cost per check
+#
+# Builds a NumberSet of `--numbers` synthetic E.164 numbers (ascending, as
+# the startup load reads them) in a few country ranges and measures:
+#   - memory: NumberSet.nbytes and process RSS growth, against a Python set
+#     of ints and of E.164 strings (measured on 1M, extrapolated),
+#   - lookup latency for listed and unlisted numbers (the per-dial check),
+#   - apply() of single changes below the compaction threshold, and the
+#     merge of a 100k-number bulk add.
+#
+#   python -m benchmarks.bench_suppression --numbers 10000000
+#   python -m benchmarks.bench_suppression --numbers 30000000
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from suppression import COMPACT_AT, NumberSet, SortedNumbers
+
+# (first, last) E.164 digits: US/CA, FR mobile, UK mobile, DE mobile
+RANGES = ((12012000000, 19899999999), (33600000000, 33799999999),
+          (447000000000, 447999999999), (4915000000000, 4917999999999))
+SAMPLE = 100000
+
+
+def rss() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096
+
+
+def generate(rng: random.Random, count: int):
+    """`count` ascending numbers spread over RANGES."""
+    share = count // len(RANGES)
+    for first, last in RANGES:
+        gap = (last - first) // share
+        number = first
+        for _ in range(share):
+            number += rng.randrange(1, 2 * gap)
+            yield number
+
+
+def build(count: int) -> tuple:
+    rng = random.Random(7)
+    every = max(1, count // SAMPLE)
+    builder = SortedNumbers()
+    hits = []
+    for i, number in enumerate(generate(rng, count)):
+        builder.append(number)
+        if i % every == 0:
+            hits.append(number)
+    return builder.build(), hits
+
+
+def python_sets(count: int) -> tuple:
+    """Bytes per number of a set of ints and a set of E.164 strings."""
+    numbers = list(generate(random.Random(7), count))
+    sizes = []
+    for convert in (int, lambda n: f"+{n}"):
+        tracemalloc.start()
+        values = set(map(convert, numbers))
+        sizes.append(tracemalloc.get_traced_memory()[0] / len(values))
+        tracemalloc.stop()
+        del values
+    return tuple(sizes)
+
+
+def per_lookup(numbers: NumberSet, probes: list) -> tuple:
+    start = time.perf_counter()
+    found = sum(1 for number in probes if number in numbers)
+    return (time.perf_counter() - start) * 1e9 / len(probes), found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--numbers", type=int, default=10000000)
+    args = parser.parse_args()
+
+    base = rss()
+    start = time.perf_counter()
+    numbers, hits = build(args.numbers)
+    print(f"build ({len(numbers)} numbers): {time.perf_counter() - start:.1f}s, "
+          f"nbytes {numbers.nbytes / 2**20:.0f}MB ({numbers.nbytes / len(numbers):.1f}B/number), "
+          f"RSS +{(rss() - base) / 2**20:.0f}MB")
+
+    int_bytes, str_bytes = python_sets(1000000)
+    print(f"python set, extrapolated to {len(numbers)}: ints {int_bytes * len(numbers) / 2**20:.0f}MB "
+          f"({int_bytes:.0f}B/number), E.164 strings {str_bytes * len(numbers) / 2**20:.0f}MB ({str_bytes:.0f}B/number)")
+
+    rng = random.Random(3)
+    misses = [rng.randrange(first, last) for first, last in rng.choices(RANGES, k=SAMPLE)]
+    hit_ns, found = per_lookup(numbers, hits)
+    miss_ns, false_hits = per_lookup(numbers, misses)
+    print(f"lookup: listed {hit_ns:.0f}ns ({found}/{len(hits)} found), "
+          f"unlisted {miss_ns:.0f}ns ({false_hits} of {len(misses)} random numbers listed)")
+
+    changes = [rng.randrange(first, last) for first, last in rng.choices(RANGES, k=COMPACT_AT)]
+    start = time.perf_counter()
+    for number in changes:
+        numbers.apply(adds=[number])
+    print(f"apply one number (up to {COMPACT_AT} pending): {(time.perf_counter() - start) * 1e6 / len(changes):.0f}us")
+    hit_ns, _ = per_lookup(numbers, hits)
+    print(f"lookup with {COMPACT_AT} pending changes: {hit_ns:.0f}ns")
+
+    bulk = [rng.randrange(first, last) for first, last in rng.choices(RANGES, k=100000)]
+    start = time.perf_counter()
+    numbers.apply(adds=bulk)
+    merged = time.perf_counter() - start
+    assert all(number in numbers for number in bulk) and all(number in numbers for number in changes)
+    print(f"bulk add of {len(bulk)} numbers (merged into the arrays): {merged:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
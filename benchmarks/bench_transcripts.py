@@ -0,0 +1,98 @@
+# benchmarks/bench_transcripts.py - Memory and CPU of live transcript assembly
+#
+# Simulates concurrent calls whose conversation-update events resend the
+# whole conversation so far (Vapi's behavior). Compares:
+#   - rebuild:     keep the latest parsed messages array per call and render
+#                  the transcript from it on every event (the naive approach)
+#   - incremental: TranscriptAssembler, storing only the new messages
+# and reports time per event and memory per active call (tracemalloc).
+#
+#   python -m benchmarks.bench_transcripts --calls 200 --turns 60
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from transcripts import TranscriptAssembler
+
+WORDS = ("property", "viewing", "tomorrow", "price", "garden", "agent", "offer",
+         "kitchen", "neighbourhood", "available", "great", "thanks", "perhaps")
+
+
+def make_events(rng: random.Random, call_id: str, turns: int) -> list:
+    """conversation-update bodies with a growing messages array."""
+    messages = [{"role": "system", "message": "You are Thavon, a real estate agent. " * 20}]
+    events = []
+    for turn in range(turns):
+        role = "bot" if turn % 2 == 0 else "user"
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))
+        messages.append({"role": role, "message": text, "time": 1.7e12 + turn, "secondsFromStart": turn * 4.2})
+        events.append(json.dumps({"message": {
+            "type": "conversation-update",
+            "messages": messages,
+            "call": {"id": call_id},
+        }}).encode())
+    return events
+
+
+def render(messages: list) -> str:
+    return "\n".join(f"{m['role']}: {m['message']}" for m in messages if m.get("role") != "system")
+
+
+def run_rebuild(streams: list) -> tuple:
+    latest = {}
+    start = time.perf_counter()
+    for events in zip(*streams):
+        for body in events:
+            message = json.loads(body)["message"]
+            latest[message["call"]["id"]] = message["messages"]
+            render(message["messages"])
+    elapsed = time.perf_counter() - start
+    return elapsed, latest
+
+
+def run_incremental(streams: list) -> tuple:
+    assembler = TranscriptAssembler()
+    start = time.perf_counter()
+    for events in zip(*streams):
+        for body in events:
+            message = json.loads(body)["message"]
+            assembler.add_conversation(message["call"]["id"], message["messages"])
+    elapsed = time.perf_counter() - start
+    return elapsed, assembler
+
+
+def measure(label: str, func, streams: list, events: int, calls: int):
+    tracemalloc.start()
+    elapsed, state = func(streams)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<12} {elapsed / events * 1e6:>9.1f}us/event {current / calls / 1024:>10.1f}KB/call")
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200, help="concurrent active calls")
+    parser.add_argument("--turns", type=int, default=60, help="utterances per call")
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    streams = [make_events(rng, f"call-{i}", args.turns) for i in range(args.calls)]
+    events = args.calls * args.turns
+    print(f"{args.calls} calls x {args.turns} conversation-updates = {events} events")
+
+    measure("rebuild", run_rebuild, streams, events, args.calls)
+    assembler = measure("incremental", run_incremental, streams, events, args.calls)
+    print(f"assembler estimate: {assembler.bytes / args.calls / 1024:.1f}KB/call")
+
+    start = time.perf_counter()
+    for i in range(args.calls):
+        assembler.pop(f"call-{i}")
+    print(f"final transcripts: {(time.perf_counter() - start) / args.calls * 1e6:.1f}us/call (no reparse)")
+
+
+if __name__ == "__main__":
+    main()
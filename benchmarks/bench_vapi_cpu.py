@@ -0,0 +1,112 @@
+# benchmarks/bench_vapi_cpu.py - Event loop CPU per Vapi event / inbound lead
+#
+# Drives the real app in-process through ASGI (no HTTP server, lifespan
+# running) against FakeSupabase and a stub frontend webhook, and measures
+# the CPU time the event loop thread spends per request: body parsing,
+# routing, handler logic and response encoding. Work handed to threads
+# (Supabase lookups, webhook forwarding) is not counted - it doesn't block
+# the loop.
+#
+#   python -m benchmarks.bench_vapi_cpu --iterations 2000
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.fakes import FakeSupabase, StubServer
+from benchmarks.workloads import large_end_of_call_report, vapi_call_events
+from config import Settings
+
+AGENCY_ID = "agency-bench"
+PHONE = "+352621000000"
+
+
+def events() -> dict:
+    rng = random.Random(3)
+    call = dict(vapi_call_events(rng, PHONE, AGENCY_ID, turns=4))
+    function_call = {"message": {
+        "type": "function-call", "call": call["assistant-request"]["message"]["call"],
+        "functionCall": {"name": "bookAppointment", "parameters": {"time": "Friday 2pm"}},
+    }}
+    # Event type past the peek window: routed by parsing the envelope
+    late_type = {"padding": "x" * 5000, **call["assistant-request"]}
+    return {
+        "assistant-request": json.dumps(call["assistant-request"]).encode(),
+        "assistant-request (late type)": json.dumps(late_type).encode(),
+        "function-call": json.dumps(function_call).encode(),
+        "end-of-call-report (400 turns)": json.dumps(large_end_of_call_report(rng)).encode(),
+    }
+
+
+async def request(app, path: str, body: bytes) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 1234), "server": ("127.0.0.1", 80),
+    }
+    sent = False
+    status = 0
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.sleep(3600)
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def run(app, iterations: int) -> list:
+    rows = []
+    bodies = events()
+    cases = [(name, "/assistant-request", body) for name, body in bodies.items()]
+    lead = json.dumps({"first_name": "Anna", "phone_number": "+352 621 123 456", "Address": "1 Rue de la Gare"}).encode()
+    cases.append(("inbound lead", f"/webhooks/inbound/{AGENCY_ID}", lead))
+    async with app.router.lifespan_context(app):
+        for name, path, body in cases:
+            for _ in range(20):  # warm up (assistant config cache, imports)
+                await request(app, path, body)
+            cpu = wall = 0.0
+            for _ in range(iterations):
+                start_cpu, start_wall = time.thread_time(), time.perf_counter()
+                status = await request(app, path, body)
+                cpu += time.thread_time() - start_cpu
+                wall += time.perf_counter() - start_wall
+            rows.append((name, len(body), status, cpu / iterations, wall / iterations))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    import main as app_main
+    # The inbound webhook would otherwise schedule a dial per request
+    app_main.is_within_office_hours = lambda agency_id: False
+    db = FakeSupabase()
+    db.seed("agencies", [{"id": AGENCY_ID, "subscription_status": "active", "timezone": "Europe/Luxembourg"}])
+    db.seed("leads", [{"id": "lead-1", "agency_id": AGENCY_ID, "name": "Anna", "phone_number": PHONE, "address": "1 Rue de la Gare", "status": "new"}])
+    with StubServer(body={"status": "ok"}) as frontend:
+        settings = Settings(supabase_url="http://fake-supabase", supabase_key="fake", frontend_base_url=frontend.url,
+                            inbound_rate_per_agency=1e9, inbound_burst_per_agency=1e9)
+        app = app_main.create_app(settings, db)
+        rows = asyncio.run(run(app, args.iterations))
+
+    print(f"\n{'request':<32} {'bytes':>8} {'status':>6} {'loop CPU':>10} {'wall':>10}")
+    for name, size, status, cpu, wall in rows:
+        print(f"{name:<32} {size:>8} {status:>6} {cpu * 1e6:8.1f}us {wall * 1e6:8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
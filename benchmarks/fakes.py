@@ -0,0 +1,457 @@
+# benchmarks/fakes.py - Local stand-ins for Supabase, Vapi, the frontend and FUB
+#
+# FakeSupabase implements the subset of the supabase-py query builder the
+# backend uses (select/insert/update/upsert/delete + eq/in_/lte/...) and its
+# RPCs (_rpc_<name>), backed by plain dicts, with optional unique (partial)
+# indexes that raise like PostgREST (code 23505). StubServer is a threaded
+# HTTP server that answers every POST/GET with a canned JSON body after a
+# configurable delay; OpenAIStub
+# answers chat completions (single and batched summaries), TwilioStub
+# accepts Messages.json sends, recording when each sender number was used,
+# and VapiStub serves GET /call/{id} from a dict of call objects.
+
+import json
+import random
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeAPIError(Exception):
+    """Mimics postgrest.exceptions.APIError (only .code and .message)."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class FakeQuery:
+    """Chainable query against one in-memory table."""
+
+    def __init__(self, db, table):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._values = None
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._range = None
+        self._single = False
+        self._maybe_single = False
+        self._on_conflict = None
+
+    # --- operations ---
+    def select(self, *columns, count=None):
+        self._op = "select"
+        return self
+
+    def insert(self, values, **kwargs):
+        self._op = "insert"
+        self._values = values
+        return self
+
+    def upsert(self, values, on_conflict=None, **kwargs):
+        self._op = "upsert"
+        self._values = values
+        self._on_conflict = on_conflict
+        return self
+
+    def update(self, values, **kwargs):
+        self._op = "update"
+        self._values = values
+        return self
+
+    def delete(self, **kwargs):
+        self._op = "delete"
+        return self
+
+    # --- filters ---
+    def _filter(self, fn):
+        self._filters.append(fn)
+        return self
+
+    def eq(self, column, value):
+        return self._filter(lambda row: row.get(column) == value)
+
+    def neq(self, column, value):
+        return self._filter(lambda row: row.get(column) != value)
+
+    def in_(self, column, values):
+        values = set(values)
+        return self._filter(lambda row: row.get(column) in values)
+
+    def lt(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) < value)
+
+    def lte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) <= value)
+
+    def gt(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) > value)
+
+    def gte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) >= value)
+
+    def is_(self, column, value):
+        expected = None if value in (None, "null") else value
+        return self._filter(lambda row: row.get(column) is expected or row.get(column) == expected)
+
+    def order(self, column, desc=False, **kwargs):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def maybe_single(self):
+        self._maybe_single = True
+        return self
+
+    # --- execution ---
+    def _matches(self, row):
+        return all(fn(row) for fn in self._filters)
+
+    def execute(self):
+        if self._db.latency:
+            time.sleep(self._db.latency)
+        with self._db.lock:
+            rows = self._db.tables.setdefault(self._table, [])
+            if self._op == "insert":
+                return FakeResponse(self._db._insert(self._table, self._values))
+            if self._op == "upsert":
+                return FakeResponse(self._db._upsert(self._table, self._values, self._on_conflict))
+            if self._op == "update":
+                matched = [row for row in rows if self._matches(row)]
+                self._db._check_unique(self._table, [{**row, **self._values} for row in matched], matched)
+                for row in matched:
+                    row.update(self._values)
+                return FakeResponse([dict(row) for row in matched])
+            if self._op == "delete":
+                matched = [row for row in rows if self._matches(row)]
+                self._db.tables[self._table] = [row for row in rows if not self._matches(row)]
+                return FakeResponse([dict(row) for row in matched])
+
+            result = [row for row in rows if self._matches(row)]
+            for column, desc in reversed(self._order):
+                result.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            if self._range:
+                result = result[self._range[0]:self._range[1] + 1]
+            if self._limit is not None:
+                result = result[:self._limit]
+            result = [dict(row) for row in result]
+
+        if self._single:
+            if len(result) != 1:
+                raise Exception(f"JSON object requested, multiple (or no) rows returned ({len(result)})")
+            return FakeResponse(result[0])
+        if self._maybe_single:
+            return FakeResponse(result[0] if result else None)
+        return FakeResponse(result, count=len(result))
+
+
+class _FakeCall:
+    """supabase.rpc(...) - runs a FakeSupabase method on execute()."""
+
+    def __init__(self, db, function, params):
+        self._db = db
+        self._function = function
+        self._params = params
+
+    def execute(self):
+        if self._db.latency:
+            time.sleep(self._db.latency)
+        with self._db.lock:
+            return FakeResponse(self._function(**self._params))
+
+
+class FakeSupabase:
+    """In-memory Supabase client. `latency` (seconds) is added to every query."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.tables = {}
+        self.query_count = 0
+        self.unique_indexes = {}  # table -> [(columns, where)]
+
+    def table(self, name):
+        self.query_count += 1
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        function = getattr(self, f"_rpc_{name}", None)
+        if function is None:
+            raise NotImplementedError(f"FakeSupabase has no RPC '{name}'")
+        return _FakeCall(self, function, params or {})
+
+    def _rpc_flush_call_events(self, events):
+        # migrations/create_flush_call_events.sql
+        rows = self.tables.setdefault("call_logs", [])
+        by_id = {row.get("vapi_call_id"): row for row in rows}
+        written = 0
+        for event in events:
+            existing = by_id.get(event["vapi_call_id"])
+            if existing is None:
+                self._insert("call_logs", event)
+                by_id[event["vapi_call_id"]] = rows[-1]
+                written += 1
+            elif existing.get("status") in ("queued", "ringing", "in_progress"):
+                existing.update(event)
+                written += 1
+        return written
+
+    def add_unique_index(self, table, columns, where=None):
+        """Like CREATE UNIQUE INDEX ON table(columns) WHERE where(row)."""
+        self.unique_indexes.setdefault(table, []).append((tuple(columns), where))
+
+    def _check_unique(self, table, new_rows, replaced=()):
+        """Raises a 23505 FakeAPIError if `new_rows` (replacing `replaced`) break an index."""
+        for columns, where in self.unique_indexes.get(table, ()):
+            seen = set()
+            others = [row for row in self.tables.get(table, []) if not any(row is old for old in replaced)]
+            for row in others + list(new_rows):
+                if where is not None and not where(row):
+                    continue
+                key = tuple(row.get(column) for column in columns)
+                if key in seen:
+                    raise FakeAPIError("23505", f"duplicate key value violates unique constraint on {table}{columns}")
+                seen.add(key)
+
+    def _insert(self, table, values):
+        values = values if isinstance(values, list) else [values]
+        self._check_unique(table, values)
+        inserted = []
+        for value in values:
+            row = {"id": str(uuid.uuid4()), **value}
+            self.tables[table].append(row)
+            inserted.append(dict(row))
+        return inserted
+
+    def _upsert(self, table, values, on_conflict):
+        values = values if isinstance(values, list) else [values]
+        keys = (on_conflict or "id").split(",")
+        rows = self.tables[table]
+        result = []
+        for value in values:
+            existing = next((row for row in rows if all(row.get(k) == value.get(k) for k in keys)), None)
+            if existing is not None:
+                existing.update(value)
+                result.append(dict(existing))
+            else:
+                result.extend(self._insert(table, value))
+        return result
+
+    def seed(self, table, rows):
+        with self.lock:
+            self.tables.setdefault(table, []).extend(rows)
+
+
+class StubServer:
+    """
+    Threaded HTTP server answering every request with `body` after `latency`
+    seconds (plus uniform `jitter`). Records request counts per path.
+    """
+
+    def __init__(self, body=None, status=200, latency=0.0, jitter=0.0, host="127.0.0.1", port=0):
+        self.body = body if body is not None else {"ok": True}
+        self.status = status
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = {}
+        self.bytes_received = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._counter_lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = b""
+                if length:
+                    raw = self.rfile.read(length)
+                    stub.bytes_received += length
+                stub.requests[self.path] = stub.requests.get(self.path, 0) + 1
+                with stub._counter_lock:
+                    stub.in_flight += 1
+                    stub.peak_in_flight = max(stub.peak_in_flight, stub.in_flight)
+                delay = stub.latency + (random.uniform(0, stub.jitter) if stub.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                status, body, headers = stub.respond(self.path, raw)
+                with stub._counter_lock:
+                    stub.in_flight -= 1
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_POST = do_GET = do_PUT = _respond
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def respond(self, path: str, raw: bytes) -> tuple:
+        """(status, JSON body, extra headers) for one request."""
+        body = self.body(path) if callable(self.body) else self.body
+        return self.status, body, {}
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def vapi_call_body(path):
+    """Vapi /call/phone response with a fresh call id."""
+    return {"id": str(uuid.uuid4()), "status": "queued"}
+
+
+class OpenAIStub(StubServer):
+    """
+    Local stand-in for the OpenAI chat completions API. Answers each request
+    with a canned summary (a JSON list of them for batched requests) and can
+    rate-limit the first `fail_first` requests with 429 + Retry-After.
+    """
+
+    def __init__(self, latency=0.0, fail_first=0, **kwargs):
+        super().__init__(latency=latency, **kwargs)
+        self.fail_first = fail_first
+        self.completions = 0
+        self.calls_summarized = 0
+        self._lock = threading.Lock()
+
+    def respond(self, path, raw):
+        with self._lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return 429, {"error": {"message": "Rate limit reached", "type": "rate_limit"}}, {"Retry-After": "0"}
+            self.completions += 1
+        request = json.loads(raw or b"{}")
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        if request.get("response_format", {}).get("type") == "json_object":
+            count = prompt.count("### Call ")
+            content = json.dumps({"summaries": [f"Stub summary {i + 1}." for i in range(count)]})
+        else:
+            count = 1
+            content = f"Stub summary of {len(prompt)} chars."
+        with self._lock:
+            self.calls_summarized += count
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 20, "total_tokens": len(prompt) // 4 + 20},
+        }, {}
+
+
+class TwilioStub(StubServer):
+    """
+    Local stand-in for Twilio's Messages API. Accepts every send (a queued
+    message resource) and records send times per From number so tests can
+    check per-number rates; can rate-limit the first `fail_first` sends
+    with Twilio's 429 error.
+    """
+
+    def __init__(self, latency=0.0, fail_first=0, **kwargs):
+        super().__init__(latency=latency, **kwargs)
+        self.fail_first = fail_first
+        self.messages = []  # (to, from, body)
+        self.sent_at = {}  # From number -> [monotonic times]
+        self._lock = threading.Lock()
+
+    def respond(self, path, raw):
+        if not path.endswith("/Messages.json"):
+            return 404, {"code": 20404, "message": "The requested resource was not found", "status": 404}, {}
+        form = {key: values[0] for key, values in parse_qs(raw.decode()).items()}
+        with self._lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return 429, {"code": 20429, "message": "Too Many Requests", "status": 429}, {}
+            self.messages.append((form.get("To"), form.get("From"), form.get("Body")))
+            self.sent_at.setdefault(form.get("From"), []).append(time.monotonic())
+        account_sid = path.split("/Accounts/")[-1].split("/")[0]
+        return 201, {
+            "sid": f"SM{uuid.uuid4().hex}",
+            "account_sid": account_sid,
+            "to": form.get("To"),
+            "from": form.get("From"),
+            "body": form.get("Body"),
+            "status": "queued",
+            "num_segments": "1",
+            "direction": "outbound-api",
+            "date_created": time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime()),
+            "error_code": None,
+            "error_message": None,
+        }, {}
+
+
+class VapiStub(StubServer):
+    """
+    Local stand-in for Vapi's call API. POST /call/phone creates a queued
+    call; GET /call/{id} returns `calls[id]` (404 if unknown). Can
+    rate-limit the first `fail_first` requests with 429 + Retry-After, and
+    tracks peak concurrent requests.
+    """
+
+    def __init__(self, latency=0.0, fail_first=0, calls=None, **kwargs):
+        super().__init__(latency=latency, **kwargs)
+        self.fail_first = fail_first
+        self.calls = calls if calls is not None else {}
+        self.lookups = 0
+        self._lock = threading.Lock()
+
+    def respond(self, path, raw):
+        with self._lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return 429, {"message": "Too Many Requests"}, {"Retry-After": "1"}
+        if raw or path.rstrip("/").endswith("/call/phone"):
+            call = {**vapi_call_body(path), **json.loads(raw or b"{}")}
+            self.calls[call["id"]] = call
+            return 201, call, {}
+        with self._lock:
+            self.lookups += 1
+        call = self.calls.get(path.rstrip("/").rsplit("/", 1)[-1])
+        if call is None:
+            return 404, {"message": "Call not found", "error": "Not Found", "statusCode": 404}, {}
+        return 200, call, {}
@@ -0,0 +1,114 @@
+# benchmarks/workloads.py - Synthetic traffic for the benchmark harness
+#
+# vapi_call_events() reproduces what Vapi sends to the Server URL over the
+# life of one call: an assistant-request, status updates, many speech and
+# transcript updates, conversation updates carrying the growing message
+# array, and a large end-of-call-report. zapier_burst() produces inbound
+# lead bodies in the shapes Zapier and website forms actually send.
+
+import random
+import uuid
+
+FIRST_NAMES = ["Anna", "Luc", "Marie", "Tom", "Sophie", "Paul", "Lena", "Marc", "Julia", "Noah"]
+STREETS = ["Rue de la Gare", "Avenue Monterey", "Grand-Rue", "Boulevard Royal", "Rue du Fort"]
+LINES = [
+    "Hi, yes this is {name}.",
+    "I listed the house myself last month.",
+    "We have had a few viewings but no offers yet.",
+    "What commission would you charge?",
+    "Thursday afternoon could work for a viewing.",
+    "Can you send me the details by email?",
+    "We are not in a hurry to sell.",
+    "The asking price is negotiable.",
+]
+
+
+def random_phone(rng: random.Random) -> str:
+    # Mix of formats seen in the wild - E.164, national, spaced, dashed
+    digits = "".join(rng.choice("0123456789") for _ in range(6))
+    return rng.choice([
+        f"+352621{digits}",
+        f"+1415{digits}1",
+        f"(415) 55{digits[:1]}-{digits[1:5]}",
+        f"0621 {digits[:3]} {digits[3:]}",
+        f"+33 6 {digits[:2]} {digits[2:4]} {digits[4:]} 12",
+    ])
+
+
+def zapier_burst(rng: random.Random, size: int) -> list:
+    """Inbound lead bodies as Zapier/website forms send them."""
+    bodies = []
+    for _ in range(size):
+        name = rng.choice(FIRST_NAMES)
+        phone = random_phone(rng)
+        address = f"{rng.randint(1, 200)} {rng.choice(STREETS)}"
+        shape = rng.random()
+        if shape < 0.5:
+            body = {"name": name, "phone": phone, "address": address, "language": rng.choice(["en", "fr", "de"])}
+        elif shape < 0.8:
+            body = {"first_name": name, "phone_number": phone, "Address": address}
+        else:
+            body = {"Name": name, "Phone": phone, "preferred_language": "fr"}
+        bodies.append(body)
+    return bodies
+
+
+def _call_object(call_id: str, phone: str, status: str, agency_id: str) -> dict:
+    return {
+        "id": call_id,
+        "orgId": "org-bench",
+        "type": "outboundPhoneCall",
+        "status": status,
+        "customer": {"number": phone},
+        "phoneNumberId": "pn-bench",
+        "metadata": {"agency_id": agency_id, "lead_id": None, "is_inbound": False},
+    }
+
+
+def vapi_call_events(rng: random.Random, phone: str, agency_id: str, turns: int = 30) -> list:
+    """
+    Ordered (event_type, body) pairs for one call. Bodies are dicts; the
+    end-of-call-report carries the full transcript and message array.
+    """
+    call_id = str(uuid.uuid4())
+    name = rng.choice(FIRST_NAMES)
+    events = []
+
+    def message(msg_type, status="in-progress", **extra):
+        return {"message": {"type": msg_type, "timestamp": 0, "call": _call_object(call_id, phone, status, agency_id), **extra}}
+
+    events.append(("assistant-request", message("assistant-request", status="ringing")))
+    events.append(("status-update", message("status-update", status="ringing")))
+    events.append(("status-update", message("status-update", status="in-progress")))
+
+    transcript_lines = []
+    messages = []
+    for turn in range(turns):
+        role = "assistant" if turn % 2 == 0 else "user"
+        text = rng.choice(LINES).format(name=name)
+        events.append(("speech-update", message("speech-update", role=role, status="started")))
+        events.append(("transcript-update", message("transcript", role=role, transcriptType="partial", transcript=text[: len(text) // 2])))
+        events.append(("transcript-update", message("transcript", role=role, transcriptType="final", transcript=text)))
+        transcript_lines.append(f"{'AI' if role == 'assistant' else 'User'}: {text}")
+        messages.append({"role": "bot" if role == "assistant" else "user", "message": text, "time": turn, "secondsFromStart": turn * 3.2})
+        events.append(("conversation-update", message("conversation-update", messages=list(messages))))
+        events.append(("speech-update", message("speech-update", role=role, status="stopped")))
+
+    events.append(("status-update", message("status-update", status="ended")))
+    events.append(("end-of-call-report", message(
+        "end-of-call-report",
+        status="ended",
+        endedReason="customer-ended-call",
+        transcript="\n".join(transcript_lines),
+        summary="",
+        recordingUrl=f"https://storage.vapi.ai/{call_id}.wav",
+        durationSeconds=round(turns * 3.2, 1),
+        messages=messages,
+        artifact={"messages": messages, "transcript": "\n".join(transcript_lines)},
+    )))
+    return events
+
+
+def large_end_of_call_report(rng: random.Random, turns: int = 400) -> dict:
+    """A single end-of-call-report with a long transcript (tens of KB)."""
+    return vapi_call_events(rng, "+352621000000", "agency-bench", turns=turns)[-1][1]
@@ -0,0 +1,217 @@
+# call_events.py - Write-behind buffer for live call status and transcripts
+#
+# Vapi sends a status-update, transcript-update or conversation-update for
+# every state change and utterance of every call, and writing each one to
+# call_logs meant thousands of tiny upserts per minute during a campaign.
+# Instead events are merged per call id in memory (latest status, transcript
+# so far) and the calls that changed are written with one batched upsert
+# (the flush_call_events function) when FLUSH_SECONDS have passed or `flush_size` calls are waiting, and
+# everything is flushed on shutdown.
+#
+# Transcript text is assembled incrementally by transcripts.py (only the
+# new lines of each transcript/conversation update are kept).
+#
+# The end-of-call-report stays authoritative: the frontend writes the final
+# row from it. end_call() drops the call's buffered state (waiting for any
+# flush in progress) before the report is forwarded, and later events for
+# that call are ignored here. A flush on another replica, or one racing
+# the frontend's write, can't land on top of the final state either:
+# flush_call_events only updates rows whose status is still live.
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from db import supabase
+from metrics import metrics
+from transcripts import TranscriptAssembler
+
+FLUSH_SECONDS = 2.0
+FLUSH_SIZE = 200
+# Calls that go quiet this long without an end-of-call-report are dropped
+IDLE_EVICT_SECONDS = 3600.0
+ENDED_MEMORY = 10000  # ended call ids remembered to ignore late events
+
+# Vapi call status -> call_logs.status while the call is live. 'ended' is
+# left to the end-of-call-report (it carries the real outcome).
+LIVE_STATUSES = {
+    'scheduled': 'queued',
+    'queued': 'queued',
+    'ringing': 'ringing',
+    'in-progress': 'in_progress',
+    'forwarding': 'in_progress',
+}
+
+
+class _Call:
+    __slots__ = ("agency_id", "lead_id", "status", "dirty", "seen_at")
+
+    def __init__(self, agency_id: str, lead_id: str | None):
+        self.agency_id = agency_id
+        self.lead_id = lead_id
+        self.status = 'in_progress'
+        self.dirty = False
+        self.seen_at = time.monotonic()
+
+
+def _call_of(message: dict) -> dict:
+    return message.get('call') or {}
+
+
+class CallEventBuffer:
+    def __init__(self, flush_seconds: float = FLUSH_SECONDS, flush_size: int = FLUSH_SIZE):
+        self.flush_seconds = flush_seconds
+        self.flush_size = flush_size
+        self._calls = {}  # vapi call id -> _Call
+        self.transcripts = TranscriptAssembler()
+        self._dirty = 0
+        self._ended = OrderedDict()  # vapi call id -> None (bounded)
+        self._lock = threading.Lock()  # guards the maps
+        self._flush_lock = threading.Lock()  # held while a batch is written
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        metrics.gauge("call_events_buffered", lambda: len(self._calls))
+
+    def record(self, payload: dict) -> bool:
+        """
+        Merges a status/transcript/conversation event into its call's buffered state.
+        Returns False if it can't be stored here (no call id or agency in
+        the call metadata) - the caller should forward it instead.
+        """
+        message = payload.get('message') or payload
+        call = _call_of(message)
+        call_id = call.get('id')
+        metadata = call.get('metadata') or {}
+        agency_id = metadata.get('agency_id')
+        if not call_id or not agency_id:
+            return False
+
+        with self._lock:
+            if call_id in self._ended:
+                metrics.inc("call_events", result="late")
+                return True
+
+        changed = False
+        if message.get('type') == 'conversation-update':
+            messages = message.get('messages') or message.get('conversation')
+            changed = self.transcripts.add_conversation(call_id, messages) > 0
+        elif message.get('transcript'):
+            changed = self.transcripts.add_utterance(
+                call_id, message.get('role'), message.get('transcript'),
+                final=message.get('transcriptType', 'final') == 'final',
+            )
+
+        with self._lock:
+            state = self._calls.get(call_id)
+            if state is None:
+                state = self._calls[call_id] = _Call(agency_id, metadata.get('lead_id'))
+            state.seen_at = time.monotonic()
+            status = LIVE_STATUSES.get(message.get('status') or '')
+            if status and status != state.status:
+                state.status = status
+                changed = True
+            if changed and not state.dirty:
+                state.dirty = True
+                self._dirty += 1
+            dirty = self._dirty
+        metrics.inc("call_events", result="merged" if changed else "unchanged")
+        if dirty >= self.flush_size:
+            self._wake.set()
+        return True
+
+    def end_call(self, call_id: str | None) -> str | None:
+        """
+        Drops a call's buffered state on its end-of-call-report and returns
+        its assembled transcript. Blocks until any flush in progress has
+        been written, so the report lands last.
+        """
+        if not call_id:
+            return None
+        with self._flush_lock, self._lock:
+            state = self._calls.pop(call_id, None)
+            if state is not None and state.dirty:
+                self._dirty -= 1
+            self._ended[call_id] = None
+            while len(self._ended) > ENDED_MEMORY:
+                self._ended.popitem(last=False)
+        return self.transcripts.pop(call_id)
+
+    def flush(self) -> int:
+        """
+        Writes every changed call in one batched upsert (rows that already
+        have a final status are skipped). Returns how many were sent.
+        """
+        with self._flush_lock:
+            now = time.monotonic()
+            stamp = datetime.now(timezone.utc).isoformat()
+            with self._lock:
+                rows = []
+                for call_id, state in list(self._calls.items()):
+                    if state.dirty:
+                        state.dirty = False
+                        rows.append({
+                            'vapi_call_id': call_id,
+                            'agency_id': state.agency_id,
+                            'lead_id': state.lead_id,
+                            'status': state.status,
+                            'transcript': self.transcripts.text(call_id),
+                            'updated_at': stamp,
+                        })
+                    elif now - state.seen_at > IDLE_EVICT_SECONDS:
+                        del self._calls[call_id]
+                self._dirty = 0
+            self.transcripts.evict_idle(IDLE_EVICT_SECONDS)
+            if not rows:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                written = supabase.rpc('flush_call_events', {'events': rows}).execute().data
+            except Exception as e:
+                print(f"❌ Error flushing {len(rows)} call updates: {e}")
+                metrics.inc("call_events_flush_errors")
+                self._requeue(rows)
+                return 0
+            metrics.observe("call_events_flush_seconds", time.perf_counter() - start)
+            metrics.inc("call_events_rows_written", len(rows))
+            if isinstance(written, int) and written < len(rows):
+                # Final row already written (end-of-call-report) - left alone
+                metrics.inc("call_events_rows_final", len(rows) - written)
+            return len(rows)
+
+    def _requeue(self, rows: list):
+        # Mark them dirty again so the next flush retries (unless ended since)
+        with self._lock:
+            for row in rows:
+                state = self._calls.get(row['vapi_call_id'])
+                if state is not None and not state.dirty:
+                    state.dirty = True
+                    self._dirty += 1
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="call-events", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> int:
+        """Stops the flusher and writes whatever is still buffered."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.flush()
+
+
+call_events = CallEventBuffer()
@@ -0,0 +1,219 @@
+# config.py - Runtime configuration
+#
+# All environment variables are read here, once, the first time something
+# asks for settings (not at import time). Tests and benchmarks can call
+# configure() with their own Settings before creating the app.
+
+import os
+from dataclasses import dataclass, field
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    # Support both NEXT_PUBLIC_SUPABASE_URL (Next.js convention) and SUPABASE_URL (standard)
+    supabase_url: str | None = None
+    supabase_key: str | None = None  # Service Role Key for secure backend calls
+
+    # NOTE: Vapi uses different key types:
+    # - Private/Secret Key: For account management (may not work for API calls)
+    # - Public Key: For making phone calls via API
+    vapi_api_key: str | None = None
+    vapi_public_key: str | None = None
+    vapi_phone_number_id: str | None = None
+    vapi_base_url: str = "https://api.vapi.ai"
+
+    frontend_base_url: str = "https://app.thavon.io"
+    environment: str = "development"
+
+    # Agent debug log (NDJSON). Disabled unless DEBUG_LOG_PATH is set.
+    debug_log_path: str | None = None
+
+    shutdown_grace_seconds: float = 25.0
+
+    # How long a resolved assistant-request config is reused for the same call
+    assistant_cache_ttl_seconds: float = 120.0
+
+    # Largest accepted lead import upload (CSV/XLSX)
+    lead_import_max_bytes: int = 200 * 1024 * 1024
+
+    # Caller-ID slots whose end-of-call-report never arrives are freed after this
+    call_slot_timeout_seconds: float = 1800.0
+
+    # Worker threads serving the priority dial queue
+    dialer_workers: int = 16
+
+    # Upper bound for the adaptive Vapi create-call concurrency limit
+    vapi_max_concurrency: int = 32
+
+    # Inbound webhook admission control (429 + Retry-After beyond these)
+    inbound_rate_per_agency: float = 5.0  # leads/second, steady state
+    inbound_burst_per_agency: float = 50.0
+    inbound_max_in_flight: int = 64
+    inbound_max_dial_backlog: int = 500  # inbound calls waiting to be dialed
+    inbound_max_loop_lag_seconds: float = 0.25
+
+    # Call summaries (OpenAI). Without a key the transcript opening is used.
+    openai_api_key: str | None = None
+    openai_base_url: str | None = None
+    summary_model: str = "gpt-4o-mini"
+    summary_max_concurrency: int = 4
+    summary_max_input_tokens: int = 3000
+
+    # Lead follow-ups (SMS/WhatsApp). Disabled without account SID + token.
+    twilio_account_sid: str | None = None
+    twilio_auth_token: str | None = None
+    twilio_sms_number: str | None = None
+    twilio_whatsapp_number: str | None = None
+    twilio_base_url: str | None = None  # tests: benchmarks.fakes.TwilioStub
+    twilio_messages_per_second: float = 1.0  # per sender number
+    notification_senders: int = 4
+
+    # Stale-call reconciliation against Vapi (lost end-of-call-reports)
+    vapi_reconcile_interval_seconds: float = 300.0  # 0 disables the periodic pass
+    vapi_reconcile_stale_seconds: float = 1800.0
+    vapi_reconcile_concurrency: int = 16
+    vapi_reconcile_requests_per_second: float = 20.0
+
+    # Agency sharding across replicas (leases in Postgres, see shards.py)
+    sharding_enabled: bool = False
+    node_id: str | None = None  # default: RAILWAY_REPLICA_ID or host-pid
+    shard_heartbeat_seconds: float = 3.0
+    shard_lease_seconds: float = 15.0
+
+    # Admin-only profiling endpoints (/debug/*, X-Profile-Token); unset = off
+    admin_token: str | None = None
+    slow_callback_seconds: float = 0.25  # event loop stalls reported with a stack
+
+    # Scheduled campaigns: how often an open window tops up the dial queue,
+    # how often schedules are re-read (0 disables the scheduler)
+    campaign_schedule_feed_seconds: float = 30.0
+    campaign_schedule_refresh_seconds: float = 60.0
+
+    # Do-not-call lists (suppression.py): how often changes made through other
+    # replicas are picked up, largest accepted number file
+    suppression_sync_seconds: float = 30.0
+    suppression_upload_max_bytes: int = 1024 * 1024 * 1024
+
+    # Live call status/transcript write-behind: flush interval and batch size
+    call_event_flush_seconds: float = 2.0
+    call_event_flush_size: int = 200
+
+    allowed_origins: tuple = field(default=(
+        "https://app.thavon.io",
+        "https://thavon.io",
+        "http://localhost:3000",  # Only for local development
+    ))
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            supabase_url=os.environ.get("NEXT_PUBLIC_SUPABASE_URL") or os.environ.get("SUPABASE_URL"),
+            supabase_key=os.environ.get("SUPABASE_SERVICE_ROLE_KEY"),
+            vapi_api_key=os.environ.get("VAPI_API_KEY"),
+            vapi_public_key=os.environ.get("VAPI_PUBLIC_KEY"),
+            vapi_phone_number_id=os.environ.get("VAPI_PHONE_NUMBER_ID"),
+            vapi_base_url=os.environ.get("VAPI_BASE_URL", "https://api.vapi.ai").rstrip('/'),
+            frontend_base_url=os.environ.get("NEXT_PUBLIC_BASE_URL", "https://app.thavon.io"),
+            environment=os.environ.get("ENVIRONMENT", "development"),
+            debug_log_path=os.environ.get("DEBUG_LOG_PATH") or None,
+            shutdown_grace_seconds=_env_float("SHUTDOWN_GRACE_SECONDS", 25.0),
+            assistant_cache_ttl_seconds=_env_float("ASSISTANT_CACHE_TTL_SECONDS", 120.0),
+            lead_import_max_bytes=int(_env_float("LEAD_IMPORT_MAX_BYTES", 200 * 1024 * 1024)),
+            call_slot_timeout_seconds=_env_float("CALL_SLOT_TIMEOUT_SECONDS", 1800.0),
+            dialer_workers=int(_env_float("DIALER_WORKERS", 16)),
+            vapi_max_concurrency=int(_env_float("VAPI_MAX_CONCURRENCY", 32)),
+            inbound_rate_per_agency=_env_float("INBOUND_RATE_PER_AGENCY", 5.0),
+            inbound_burst_per_agency=_env_float("INBOUND_BURST_PER_AGENCY", 50.0),
+            inbound_max_in_flight=int(_env_float("INBOUND_MAX_IN_FLIGHT", 64)),
+            inbound_max_dial_backlog=int(_env_float("INBOUND_MAX_DIAL_BACKLOG", 500)),
+            inbound_max_loop_lag_seconds=_env_float("INBOUND_MAX_LOOP_LAG_SECONDS", 0.25),
+            openai_api_key=os.environ.get("OPENAI_API_KEY") or None,
+            openai_base_url=os.environ.get("OPENAI_BASE_URL") or None,
+            summary_model=os.environ.get("SUMMARY_MODEL", "gpt-4o-mini"),
+            summary_max_concurrency=int(_env_float("SUMMARY_MAX_CONCURRENCY", 4)),
+            summary_max_input_tokens=int(_env_float("SUMMARY_MAX_INPUT_TOKENS", 3000)),
+            twilio_account_sid=os.environ.get("TWILIO_ACCOUNT_SID") or None,
+            twilio_auth_token=os.environ.get("TWILIO_AUTH_TOKEN") or None,
+            twilio_sms_number=os.environ.get("TWILIO_PHONE_NUMBER") or None,
+            twilio_whatsapp_number=os.environ.get("TWILIO_WHATSAPP_NUMBER") or None,
+            twilio_base_url=os.environ.get("TWILIO_BASE_URL") or None,
+            twilio_messages_per_second=_env_float("TWILIO_MESSAGES_PER_SECOND", 1.0),
+            notification_senders=int(_env_float("NOTIFICATION_SENDERS", 4)),
+            vapi_reconcile_interval_seconds=_env_float("VAPI_RECONCILE_INTERVAL_SECONDS", 300.0),
+            vapi_reconcile_stale_seconds=_env_float("VAPI_RECONCILE_STALE_SECONDS", 1800.0),
+            vapi_reconcile_concurrency=int(_env_float("VAPI_RECONCILE_CONCURRENCY", 16)),
+            vapi_reconcile_requests_per_second=_env_float("VAPI_RECONCILE_REQUESTS_PER_SECOND", 20.0),
+            sharding_enabled=_env_bool("SHARDING_ENABLED"),
+            node_id=os.environ.get("NODE_ID") or None,
+            shard_heartbeat_seconds=_env_float("SHARD_HEARTBEAT_SECONDS", 3.0),
+            shard_lease_seconds=_env_float("SHARD_LEASE_SECONDS", 15.0),
+            admin_token=os.environ.get("ADMIN_TOKEN") or None,
+            slow_callback_seconds=_env_float("SLOW_CALLBACK_SECONDS", 0.25),
+            campaign_schedule_feed_seconds=_env_float("CAMPAIGN_SCHEDULE_FEED_SECONDS", 30.0),
+            campaign_schedule_refresh_seconds=_env_float("CAMPAIGN_SCHEDULE_REFRESH_SECONDS", 60.0),
+            suppression_sync_seconds=_env_float("SUPPRESSION_SYNC_SECONDS", 30.0),
+            suppression_upload_max_bytes=int(_env_float("SUPPRESSION_UPLOAD_MAX_BYTES", 1024 * 1024 * 1024)),
+            call_event_flush_seconds=_env_float("CALL_EVENT_FLUSH_SECONDS", 2.0),
+            call_event_flush_size=int(_env_float("CALL_EVENT_FLUSH_SIZE", 200)),
+        )
+
+    @property
+    def vapi_keys(self) -> list:
+        """Keys to try in order (public key first, then API key)."""
+        keys = []
+        if self.vapi_public_key:
+            keys.append(("VAPI_PUBLIC_KEY", self.vapi_public_key))
+        if self.vapi_api_key and self.vapi_api_key != self.vapi_public_key:
+            keys.append(("VAPI_API_KEY", self.vapi_api_key))
+        return keys
+
+    @property
+    def phone_number_id(self) -> str:
+        return self.vapi_phone_number_id or "YOUR_TWILIO_PHONE_ID_FROM_VAPI"
+
+    @property
+    def frontend_webhook_url(self) -> str:
+        # Remove trailing slash if present to avoid double slashes
+        base_url = self.frontend_base_url.rstrip('/')
+        # Ensure we're using the correct domain
+        if 'thavon.vercel.app' in base_url:
+            base_url = 'https://app.thavon.io'
+        return f"{base_url}/api/webhooks/vapi"
+
+    @property
+    def cors_origins(self) -> list:
+        origins = list(self.allowed_origins)
+        # Allow all origins outside production
+        if self.environment != "production":
+            origins.append("*")
+        return origins
+
+
+_settings: Settings | None = None
+
+
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        _settings = Settings.from_env()
+    return _settings
+
+
+def configure(settings: Settings | None):
+    """Overrides the active settings (None re-reads the environment lazily)."""
+    global _settings
+    _settings = settings
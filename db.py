@@ -0,0 +1,52 @@
+# db.py - Lazily created Supabase client
+#
+# Importing this module does not import the supabase SDK or open any
+# connection. The client is built on first use, so workers start fast and
+# tests can install an in-memory fake with set_supabase().
+
+import threading
+
+from config import get_settings
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_supabase():
+    """Returns the shared Supabase client, creating it on first use."""
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            settings = get_settings()
+            if not settings.supabase_url:
+                error_msg = "SUPABASE_URL is required. Please set NEXT_PUBLIC_SUPABASE_URL or SUPABASE_URL environment variable in Railway."
+                print(f"❌ FATAL ERROR: {error_msg}")
+                raise ValueError(error_msg)
+            if not settings.supabase_key:
+                error_msg = "SUPABASE_SERVICE_ROLE_KEY is required. Please set this environment variable in Railway."
+                print(f"❌ FATAL ERROR: {error_msg}")
+                raise ValueError(error_msg)
+
+            from supabase import create_client
+            _client = create_client(settings.supabase_url, settings.supabase_key)
+    return _client
+
+
+def set_supabase(client):
+    """Installs a client (e.g. a local fake). None resets to lazy creation."""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+class _LazySupabase:
+    """Module-level stand-in so call sites can keep using `supabase.table(...)`."""
+
+    def __getattr__(self, name):
+        return getattr(get_supabase(), name)
+
+
+supabase = _LazySupabase()
@@ -0,0 +1,57 @@
+# diagnostics.py - Agent debug log
+#
+# Writes NDJSON entries in the same shape the Cursor debug session reads
+# ({sessionId, runId, hypothesisId, location, message, data, timestamp}).
+# Logging is off unless DEBUG_LOG_PATH is set, and then the file is opened
+# once and kept open instead of being reopened for every entry.
+
+import json
+import threading
+import time
+
+from config import get_settings
+from profiling import section
+
+_log_file = None
+_log_lock = threading.Lock()
+
+
+def debug_log_enabled() -> bool:
+    return get_settings().debug_log_path is not None
+
+
+def debug_log(run_id: str, hypothesis_id: str, location: str, message: str, data: dict | None = None):
+    """Appends one debug entry. Never raises."""
+    global _log_file
+    log_path = get_settings().debug_log_path
+    if not log_path:
+        return
+    try:
+        with section("debug_log"):
+            log_entry = {
+                "sessionId": "debug-session",
+                "runId": run_id,
+                "hypothesisId": hypothesis_id,
+                "location": location,
+                "message": message,
+                "data": data or {},
+                "timestamp": int(time.time() * 1000)
+            }
+            line = json.dumps(log_entry, default=str) + "\n"
+            with _log_lock:
+                if _log_file is None:
+                    _log_file = open(log_path, "a", buffering=1)
+                _log_file.write(line)
+    except Exception as e:
+        print(f"⚠️ Log write failed: {e}")
+
+
+def close_debug_log():
+    global _log_file
+    with _log_lock:
+        if _log_file is not None:
+            try:
+                _log_file.close()
+            except Exception:
+                pass
+            _log_file = None
@@ -0,0 +1,411 @@
+# dialer.py - One priority queue for every outbound dial
+#
+# Inbound speed-to-lead calls, retries and campaign leads used to run in
+# separate background tasks competing for the same threads, so a big
+# campaign could hold up a lead who filled in a form seconds ago. Now they
+# are all DialJobs on one queue served by a fixed pool of dialer workers.
+#
+# Within an agency, ordering is earliest-deadline-first: a job's key is the
+# time it became ready plus a per-class head start (inbound 0s, retry 2 min,
+# queued_night 5 min, new 10 min). Waiting campaign leads age into higher
+# bands, so low classes can't starve. The key never changes after enqueue,
+# which keeps put/get at O(log n) with a plain heapq.
+#
+# Across agencies, capacity is shared by deficit round robin: each agency
+# with queued work gets `weight` dials per round (weight from its
+# subscription tier) and never more than `cap` calls in flight, so one
+# agency's 20k-lead campaign can't lock out everyone else. Inbound jobs are
+# expedited: they skip the round robin and the cap (they are few and the
+# whole point is calling within seconds).
+#
+# Jobs can be delayed (inbound waits 30s before dialing); those sit in a
+# separate heap keyed by ready time. On shutdown every queued job is handed
+# to its on_drop callback so the lead goes back to a resumable DB state.
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from db import supabase
+from lifecycle import tracker
+from metrics import metrics
+
+# Seconds of head start per class (lower = served sooner)
+PRIORITY_HEADSTART = {
+    "inbound": 0.0,
+    "retry": 120.0,
+    "queued_night": 300.0,
+    "new": 600.0,
+}
+EXPEDITED = frozenset(["inbound"])
+
+# subscription_tier -> (DRR weight, max calls in flight)
+TIER_SHARES = {
+    "starter": (1.0, 2),
+    "standard": (2.0, 5),
+    "pro": (4.0, 10),
+    "enterprise": (8.0, 25),
+}
+DEFAULT_TIER = "standard"
+TIER_CACHE_SECONDS = 300.0
+
+
+@dataclass
+class DialJob:
+    priority: str  # key of PRIORITY_HEADSTART
+    agency_id: str
+    key: str  # dedupe key, e.g. "lead:<id>" - a job is queued at most once
+    run: object  # callable doing the dial
+    on_drop: object = None  # callable run instead if the job is never dialed
+    ready_at: float = 0.0
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class _AgencyState:
+    __slots__ = ("heap", "weight", "cap", "deficit", "turn", "in_flight", "served")
+
+    def __init__(self, weight: float, cap: int | None):
+        self.heap = []  # (deadline, seq, job)
+        self.weight = weight
+        self.cap = cap
+        self.deficit = 0.0
+        self.turn = False  # quantum already granted for the current visit
+        self.in_flight = 0
+        self.served = 0  # dials since the agency last became backlogged
+
+
+class DialQueue:
+    def __init__(self, headstart: dict | None = None, expedited: frozenset = EXPEDITED):
+        self.headstart = headstart or PRIORITY_HEADSTART
+        self.expedited = expedited
+        self._cond = threading.Condition()
+        self._urgent = []  # expedited jobs, (deadline, seq, job)
+        self._agencies = {}  # agency_id -> _AgencyState
+        self._active = deque()  # agency ids with queued (non-expedited) jobs
+        self._delayed = []  # (ready_at, seq, job)
+        self._keys = set()
+        self._seq = itertools.count()
+        self.closed = False
+
+    def put(self, job: DialJob, delay: float = 0.0, weight: float = 1.0, cap: int | None = None) -> bool:
+        """
+        Queues a job (after `delay` seconds) with its agency's fair-share
+        `weight` and in-flight `cap` (None = unlimited). False if the queue
+        is closed or the job is already queued.
+        """
+        now = time.monotonic()
+        job.ready_at = now + delay
+        with self._cond:
+            if self.closed or job.key in self._keys:
+                return False
+            self._keys.add(job.key)
+            state = self._agencies.get(job.agency_id)
+            if state is None:
+                state = self._agencies[job.agency_id] = _AgencyState(weight, cap)
+            else:
+                state.weight, state.cap = weight, cap
+            if delay > 0:
+                heapq.heappush(self._delayed, (job.ready_at, next(self._seq), job))
+            else:
+                self._push_ready(job)
+            self._cond.notify()
+        return True
+
+    def _push_ready(self, job: DialJob):
+        deadline = job.ready_at + self.headstart.get(job.priority, max(self.headstart.values()))
+        entry = (deadline, next(self._seq), job)
+        if job.priority in self.expedited:
+            heapq.heappush(self._urgent, entry)
+            return
+        state = self._agencies[job.agency_id]
+        if not state.heap:
+            self._active.append(job.agency_id)
+            state.served = 0
+        heapq.heappush(state.heap, entry)
+
+    def _promote_due(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, job = heapq.heappop(self._delayed)
+            self._push_ready(job)
+
+    def _next_fair(self) -> DialJob | None:
+        """Deficit round robin over backlogged agencies below their cap."""
+        active = self._active
+        for _ in range(3 * len(active)):
+            state = self._agencies[active[0]]
+            if state.cap is not None and state.in_flight >= state.cap:
+                state.turn = False
+                active.rotate(-1)
+                continue
+            if state.deficit < 1:
+                if state.turn:
+                    # Quantum used up - next agency's turn
+                    state.turn = False
+                    active.rotate(-1)
+                    continue
+                state.deficit += state.weight
+                state.turn = True
+                if state.deficit < 1:
+                    continue
+            state.deficit -= 1
+            _, _, job = heapq.heappop(state.heap)
+            if not state.heap:
+                # Idle agencies don't bank credit
+                active.popleft()
+                state.deficit = 0.0
+                state.turn = False
+            return job
+        return None
+
+    def get(self, timeout: float | None = None) -> DialJob | None:
+        """
+        Next job to dial; None on timeout or once the queue is closed.
+        Call done(job) when the dial finishes.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self.closed:
+                now = time.monotonic()
+                self._promote_due(now)
+                job = None
+                if self._urgent:
+                    _, _, job = heapq.heappop(self._urgent)
+                elif self._active:
+                    job = self._next_fair()
+                if job is not None:
+                    self._keys.discard(job.key)
+                    state = self._agencies[job.agency_id]
+                    state.in_flight += 1
+                    state.served += 1
+                    metrics.observe("dial_queue_wait_seconds", now - job.ready_at, priority=job.priority)
+                    return job
+
+                waits = []
+                if self._delayed:
+                    waits.append(self._delayed[0][0] - now)
+                if end is not None:
+                    if now >= end:
+                        return None
+                    waits.append(end - now)
+                # Woken by put(), done() or close()
+                self._cond.wait(min(waits) if waits else None)
+        return None
+
+    def done(self, job: DialJob):
+        """Marks a job returned by get() as finished (frees its in-flight slot)."""
+        with self._cond:
+            state = self._agencies.get(job.agency_id)
+            if state is None:
+                return
+            state.in_flight = max(0, state.in_flight - 1)
+            self._cond.notify()
+
+    def close(self) -> list:
+        """Stops the queue and returns every job still waiting in it."""
+        with self._cond:
+            self.closed = True
+            entries = self._urgent + self._delayed
+            for state in self._agencies.values():
+                entries += state.heap
+                state.heap = []
+            self._urgent.clear()
+            self._delayed.clear()
+            self._active.clear()
+            self._keys.clear()
+            self._cond.notify_all()
+        return [job for _, _, job in entries]
+
+    def pending(self, agency_id: str) -> int:
+        """An agency's queued (ready or delayed) plus in-flight jobs."""
+        with self._cond:
+            state = self._agencies.get(agency_id)
+            if state is None:
+                return 0
+            waiting = sum(1 for _, _, job in self._urgent + self._delayed if job.agency_id == agency_id)
+            return len(state.heap) + state.in_flight + waiting
+
+    def remove_agency(self, agency_id: str) -> list:
+        """Takes every queued job of one agency out of the queue and returns them."""
+        with self._cond:
+            removed = []
+            state = self._agencies.get(agency_id)
+            if state is not None and state.heap:
+                removed += state.heap
+                state.heap = []
+                state.deficit = 0.0
+                state.turn = False
+                self._active = deque(a for a in self._active if a != agency_id)
+            for name in ("_urgent", "_delayed"):
+                entries = getattr(self, name)
+                mine = [entry for entry in entries if entry[2].agency_id == agency_id]
+                if mine:
+                    removed += mine
+                    kept = [entry for entry in entries if entry[2].agency_id != agency_id]
+                    heapq.heapify(kept)
+                    setattr(self, name, kept)
+            for _, _, job in removed:
+                self._keys.discard(job.key)
+        return [job for _, _, job in removed]
+
+    def __len__(self) -> int:
+        # Every queued job (ready, delayed or per-agency) holds its key
+        return len(self._keys)
+
+    def expedited_backlog(self) -> int:
+        """Expedited (inbound) jobs waiting, including delayed ones. O(1)."""
+        return len(self._urgent) + len(self._delayed)
+
+    def depth(self) -> dict:
+        with self._cond:
+            counts = dict.fromkeys(self.headstart, 0)
+            entries = self._urgent + self._delayed
+            for state in self._agencies.values():
+                entries += state.heap
+            for _, _, job in entries:
+                counts[job.priority] = counts.get(job.priority, 0) + 1
+        return counts
+
+    def fairness(self) -> dict:
+        """
+        Per-agency backlog/in-flight and Jain's fairness index over dials per
+        unit weight among backlogged agencies (1.0 = perfectly weighted).
+        """
+        with self._cond:
+            agencies = {
+                agency_id: {
+                    "queued": len(state.heap),
+                    "in_flight": state.in_flight,
+                    "weight": state.weight,
+                    "cap": state.cap,
+                    "served": state.served,
+                }
+                for agency_id, state in self._agencies.items()
+                if state.heap or state.in_flight
+            }
+            shares = [self._agencies[a].served / self._agencies[a].weight for a in self._active]
+        total = sum(shares)
+        squares = sum(s * s for s in shares)
+        index = (total * total) / (len(shares) * squares) if squares else 1.0
+        return {"jain_index": round(index, 3), "backlogged": len(shares), "agencies": agencies}
+
+
+# --- agency fair shares ---
+
+_tier_cache = {}  # agency_id -> (expires_at, (weight, cap))
+_tier_lock = threading.Lock()
+
+
+def remember_tier(agency_id: str, tier: str | None) -> tuple:
+    """
+    Caches an agency's shares from a tier the caller already read, so
+    submit() from the event loop (inbound webhook) never queries the DB.
+    """
+    shares = TIER_SHARES.get(tier or DEFAULT_TIER, TIER_SHARES[DEFAULT_TIER])
+    with _tier_lock:
+        _tier_cache[agency_id] = (time.monotonic() + TIER_CACHE_SECONDS, shares)
+    return shares
+
+
+def agency_shares(agency_id: str) -> tuple:
+    """(weight, in-flight cap) for an agency, from its subscription tier (cached)."""
+    with _tier_lock:
+        cached = _tier_cache.get(agency_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    tier = DEFAULT_TIER
+    try:
+        response = supabase.table('agencies').select('subscription_tier').eq('id', agency_id).single().execute()
+        tier = (response.data or {}).get('subscription_tier') or DEFAULT_TIER
+    except Exception as e:
+        print(f"⚠️ Could not read subscription tier for Agency {agency_id}: {e}, using '{DEFAULT_TIER}'")
+    return remember_tier(agency_id, tier)
+
+
+def _drop(job: DialJob):
+    metrics.inc("dial_jobs_dropped", priority=job.priority)
+    if job.on_drop is None:
+        return
+    try:
+        job.on_drop()
+    except Exception as e:
+        print(f"❌ Error releasing undialed job {job.key}: {e}")
+
+
+class Dialer:
+    """Fixed pool of worker threads draining a DialQueue."""
+
+    def __init__(self, shares=agency_shares):
+        self.queue = DialQueue()
+        self.shares = shares
+        # agency id -> may this node dial for it (shards.may_dial when sharded)
+        self.may_dial = lambda agency_id: True
+        self._threads = []
+        metrics.gauge("dial_queue_depth", lambda: self.queue.depth())
+        metrics.gauge("dial_fairness", lambda: self.queue.fairness())
+
+    def start(self, workers: int):
+        if self.queue.closed:
+            # Restart after stop() (tests create several apps per process);
+            # the old workers exit on their closed queue.
+            self.queue = DialQueue(self.queue.headstart, self.queue.expedited)
+            self._threads = []
+        for i in range(len(self._threads), workers):
+            thread = threading.Thread(target=self._work, args=(self.queue,), name=f"dialer-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job: DialJob, delay: float = 0.0) -> bool:
+        """Queues a dial. False if it can't be queued (shutdown or duplicate)."""
+        if not tracker.accepting:
+            return False
+        weight, cap = self.shares(job.agency_id)
+        queued = self.queue.put(job, delay, weight=weight, cap=cap)
+        if queued:
+            metrics.inc("dial_jobs_queued", priority=job.priority)
+        return queued
+
+    def _work(self, queue: DialQueue):
+        while True:
+            job = queue.get()
+            if job is None:
+                return
+            try:
+                if not self.may_dial(job.agency_id):
+                    # Agency lease lost (another node may own it now)
+                    metrics.inc("dial_jobs_fenced", priority=job.priority)
+                    _drop(job)
+                    continue
+                # Don't start dials this process can't finish - hand them back
+                task = tracker.track("dial", job.run) if not tracker.stopping.is_set() else None
+                if task is None:
+                    _drop(job)
+                    continue
+                task()
+                metrics.inc("dial_jobs_run", priority=job.priority)
+            except Exception as e:
+                print(f"❌ Dial job {job.key} failed: {e}")
+            finally:
+                queue.done(job)
+
+    def drop_agency(self, agency_id: str) -> int:
+        """Releases every queued dial of an agency (handing it to another node). Returns how many."""
+        jobs = self.queue.remove_agency(agency_id)
+        for job in jobs:
+            _drop(job)
+        return len(jobs)
+
+    def stop(self) -> int:
+        """Closes the queue and releases every job that never ran. Returns how many."""
+        jobs = self.queue.close()
+        for job in jobs:
+            _drop(job)
+        if jobs:
+            print(f"   -> ↩️ Shutdown: released {len(jobs)} queued dials")
+        return len(jobs)
+
+
+dialer = Dialer()
@@ -0,0 +1,130 @@
+# exports.py - Streaming CSV/NDJSON export of an agency's leads and call logs
+#
+# Exports can run to hundreds of thousands of rows, so nothing is built in
+# memory: rows are read in keyset pages (ORDER BY id, id > last id - an
+# index range scan per page, unlike OFFSET, which rescans everything before
+# it) and every page is encoded and sent as soon as it arrives. The next
+# page is fetched while the current one is being written to the client.
+# Memory stays at about two pages whatever the export size, and the header
+# line goes out before the first query returns.
+# With gzip the stream is compressed on the fly and flushed after each page.
+
+import asyncio
+import csv
+import io
+import json
+import time
+import zlib
+
+from db import supabase
+from metrics import metrics
+
+# table -> (columns, page size). call_logs pages are smaller: transcripts.
+EXPORTS = {
+    'leads': ((
+        'id', 'name', 'phone_number', 'address', 'status', 'asking_price',
+        'preferred_language', 'created_at', 'updated_at',
+    ), 2000),
+    'call_logs': ((
+        'id', 'lead_id', 'vapi_call_id', 'status', 'duration_seconds', 'language',
+        'summary', 'transcript', 'recording_url', 'metadata', 'created_at', 'updated_at',
+    ), 500),
+}
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+GZIP_LEVEL = 6
+
+
+def fetch_page(table: str, agency_id: str, after: str | None, page_size: int) -> list:
+    """One keyset page of an agency's rows, ordered by id."""
+    columns, _ = EXPORTS[table]
+    query = supabase.table(table).select(', '.join(columns)).eq('agency_id', agency_id)
+    if after is not None:
+        query = query.gt('id', after)
+    return query.order('id').limit(page_size).execute().data or []
+
+
+async def pages(table: str, agency_id: str, page_size: int | None = None):
+    """Yields the agency's rows page by page, fetching one page ahead."""
+    page_size = page_size or EXPORTS[table][1]
+    fetch = asyncio.create_task(asyncio.to_thread(fetch_page, table, agency_id, None, page_size))
+    try:
+        while True:
+            rows = await fetch
+            if len(rows) == page_size:
+                fetch = asyncio.create_task(asyncio.to_thread(fetch_page, table, agency_id, rows[-1]['id'], page_size))
+            else:
+                fetch = None
+            if rows:
+                yield rows
+            if fetch is None:
+                return
+    finally:
+        if fetch is not None and not fetch.done():
+            fetch.cancel()
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(',', ':'))
+    return value
+
+
+def encode_csv(rows: list, columns: tuple) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerows([_csv_value(row.get(column)) for column in columns] for row in rows)
+    return out.getvalue().encode()
+
+
+def encode_ndjson(rows: list, columns: tuple) -> bytes:
+    return ''.join(
+        json.dumps({column: row.get(column) for column in columns}, separators=(',', ':'), default=str) + '\n'
+        for row in rows
+    ).encode()
+
+
+def header(file_format: str, columns: tuple) -> bytes:
+    if file_format != 'csv':
+        return b''
+    out = io.StringIO()
+    csv.writer(out).writerow(columns)
+    return out.getvalue().encode()
+
+
+async def stream_export(table: str, agency_id: str, file_format: str = 'csv', gzip: bool = False):
+    """Async iterator of the export's bytes (for a StreamingResponse)."""
+    columns, _ = EXPORTS[table]
+    encode = encode_csv if file_format == 'csv' else encode_ndjson
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31) if gzip else None
+    start = time.perf_counter()
+    exported = 0
+    finished = False
+
+    def emit(data: bytes) -> bytes:
+        if compressor is None:
+            return data
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    try:
+        first = header(file_format, columns)
+        if first:
+            yield emit(first)
+        async for rows in pages(table, agency_id):
+            exported += len(rows)
+            # Encoding a page takes milliseconds - keep it off the event loop
+            yield await asyncio.to_thread(lambda: emit(encode(rows, columns)))
+        if compressor is not None:
+            yield compressor.flush()
+        finished = True
+    finally:
+        metrics.inc("export_rows", exported, table=table, format=file_format)
+        metrics.observe("export_seconds", time.perf_counter() - start, table=table)
+        if finished:
+            print(f"📤 Exported {exported} {table} rows for Agency {agency_id} ({file_format}{', gzip' if gzip else ''})")
+        else:
+            metrics.inc("exports_aborted", table=table)
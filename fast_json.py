@@ -0,0 +1,33 @@
+# fast_json.py - JSON encoding/decoding for the hot endpoints
+#
+# orjson serializes our response dicts several times faster than the
+# stdlib json module Starlette's JSONResponse uses. It's optional: without
+# it everything falls back to json with the same output. Handlers on the
+# Vapi/inbound paths return FastJSONResponse directly, which also skips
+# FastAPI's jsonable_encoder pass over plain dicts.
+
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
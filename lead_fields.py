@@ -0,0 +1,50 @@
+# lead_fields.py - Map incoming lead payloads to our `leads` columns
+#
+# Zapier, website forms and spreadsheets all name fields differently. The
+# inbound webhook and the bulk importer share this mapping so a lead looks
+# the same in the database no matter how it arrived.
+
+from pydantic import BaseModel, ConfigDict
+
+
+def extract_lead_fields(data: dict) -> dict:
+    """
+    Returns {name, phone, address, language} from a loosely-keyed payload.
+    `phone` is None when the payload has no phone number.
+    """
+    # Map common field names (Zapier sends different keys sometimes)
+    name = data.get('name') or data.get('first_name') or data.get('Name') or "New Lead"
+    phone = data.get('phone') or data.get('phone_number') or data.get('Phone')
+    address = data.get('address') or data.get('Address') or "your inquiry"
+    language = data.get('language') or data.get('preferred_language') or 'en'  # NEW: Language support
+
+    return {
+        "name": str(name).strip() or "New Lead",
+        "phone": str(phone).strip() if phone not in (None, "") else None,
+        "address": str(address).strip() or "your inquiry",
+        "language": str(language).strip().lower() or 'en',
+    }
+
+
+class InboundLead(BaseModel):
+    """Inbound webhook body: the field names Zapier and website forms use (others ignored)."""
+    model_config = ConfigDict(extra='ignore', coerce_numbers_to_str=True)
+
+    name: str | None = None
+    first_name: str | None = None
+    Name: str | None = None
+    phone: str | None = None
+    phone_number: str | None = None
+    Phone: str | None = None
+    address: str | None = None
+    Address: str | None = None
+    language: str | None = None
+    preferred_language: str | None = None
+
+    def fields(self) -> dict:
+        return extract_lead_fields(self.model_dump(exclude_none=True))
+
+
+def normalize_header(header) -> str:
+    """Spreadsheet column header -> payload key ('Phone Number' -> 'phone_number')."""
+    return "_".join(str(header or "").strip().lower().split())
@@ -0,0 +1,246 @@
+# lead_import.py - Streaming CSV/XLSX lead import
+#
+# Agencies onboard with spreadsheets of tens of thousands of FSBO leads.
+# The upload is spooled to a temp file chunk by chunk (never held in memory),
+# then parsed row by row in a background task:
+#   - fields are mapped exactly like the inbound webhook (lead_fields) and
+#     phone numbers normalized to E.164 a batch at a time (phone),
+#   - duplicates are skipped: within the batch being built in memory, and
+#     against the agency's leads in the DB (which by then include the
+#     file's earlier batches) - memory stays bounded by the batch size,
+#   - rows are written to `leads` in large batched inserts.
+# Progress is kept on an ImportJob and served by GET /leads/import/{job_id}.
+
+import csv
+import os
+import tempfile
+import threading
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+from db import supabase
+from lead_fields import extract_lead_fields, normalize_header
+from lifecycle import tracker
+from metrics import metrics
+from phone import DEFAULT_REGION, normalize_many
+
+BATCH_SIZE = 1000
+# Phones per duplicate lookup - an in_() filter goes in the GET query string
+LOOKUP_CHUNK = 200
+MAX_JOBS_KEPT = 100
+XLSX_MAGIC = b"PK\x03\x04"
+
+
+@dataclass
+class ImportJob:
+    id: str
+    agency_id: str
+    file_format: str
+    region: str | None = DEFAULT_REGION  # country used to read national phone numbers (None: unknown)
+    status: str = "queued"  # queued, running, completed, failed, interrupted
+    bytes_received: int = 0
+    rows_read: int = 0
+    inserted: int = 0
+    duplicates_in_file: int = 0  # repeated within one insert batch
+    duplicates_existing: int = 0  # already a lead (including earlier batches of this file)
+    invalid: int = 0
+    error: str | None = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    finished_at: str | None = None
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def create_job(agency_id: str, file_format: str, region: str | None = DEFAULT_REGION) -> ImportJob:
+    job = ImportJob(id=str(uuid.uuid4()), agency_id=agency_id, file_format=file_format, region=region)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        # Forget the oldest finished jobs
+        while len(_jobs) > MAX_JOBS_KEPT:
+            oldest = next((k for k, j in _jobs.items() if j.finished_at), None)
+            if oldest is None:
+                break
+            del _jobs[oldest]
+    return job
+
+
+def get_job(job_id: str) -> ImportJob | None:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+# --- upload spooling ---
+
+async def spool_upload(stream, max_bytes: int) -> tuple:
+    """
+    Writes an async byte stream to a temp file. Returns (path, size, format)
+    where format is 'xlsx' (zip magic) or 'csv'. Raises ValueError when the
+    upload exceeds `max_bytes`.
+    """
+    handle = tempfile.NamedTemporaryFile(prefix="lead-import-", delete=False)
+    size = 0
+    head = b""
+    try:
+        async for chunk in stream:
+            if not chunk:
+                continue
+            if len(head) < 4:
+                head += chunk[:4]
+            size += len(chunk)
+            if size > max_bytes:
+                raise ValueError(f"Upload exceeds {max_bytes // (1024 * 1024)} MB limit")
+            handle.write(chunk)
+    except BaseException:
+        handle.close()
+        os.unlink(handle.name)
+        raise
+    handle.close()
+    return handle.name, size, "xlsx" if head.startswith(XLSX_MAGIC) else "csv"
+
+
+# --- row readers (generators, one row dict at a time) ---
+
+def iter_csv_rows(path: str):
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        sample = f.read(8192)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = next(reader, None)
+        if not header:
+            return
+        keys = [normalize_header(h) for h in header]
+        for values in reader:
+            if not any(values):
+                continue
+            yield dict(zip(keys, values))
+
+
+def iter_xlsx_rows(path: str):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("XLSX import requires the 'openpyxl' package. Upload a CSV instead.")
+
+    # read_only streams rows from the zip instead of building the whole sheet
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            return
+        keys = [normalize_header(h) for h in header]
+        for values in rows:
+            if not values or not any(v not in (None, "") for v in values):
+                continue
+            yield {k: v for k, v in zip(keys, values) if v is not None}
+    finally:
+        workbook.close()
+
+
+# --- import pipeline ---
+
+def _existing_phones(agency_id: str, phones: list) -> set:
+    """
+    The agency's leads already stored with one of these E.164 numbers. Rows
+    saved before numbers were normalized (e.g. '0621 123 456') don't match:
+    re-importing such a person creates a second lead for them.
+    """
+    existing = set()
+    for i in range(0, len(phones), LOOKUP_CHUNK):
+        response = supabase.table('leads').select('phone_number').eq('agency_id', agency_id) \
+            .in_('phone_number', phones[i:i + LOOKUP_CHUNK]).execute()
+        existing.update(row['phone_number'] for row in (response.data or []))
+    return existing
+
+
+def _flush(job: ImportJob, batch: list):
+    phones = [row['phone_number'] for row in batch]
+    existing = _existing_phones(job.agency_id, phones)
+    rows = [row for row in batch if row['phone_number'] not in existing]
+    job.duplicates_existing += len(batch) - len(rows)
+    if rows:
+        supabase.table('leads').insert(rows).execute()
+        job.inserted += len(rows)
+        metrics.inc("lead_import_rows_inserted", len(rows))
+
+
+def _build_rows(job: ImportJob, chunk: list, seen_phones: set) -> list:
+    """Maps a chunk of raw rows to lead rows, normalizing all phones in one pass."""
+    fields = [extract_lead_fields(data) for data in chunk]
+    phones = normalize_many([f["phone"] for f in fields], job.region)
+    rows = []
+    for data, f, phone in zip(chunk, fields, phones):
+        if not phone:
+            job.invalid += 1
+            continue
+        # Dedupe on E.164 so "+352 621..." and "00352621..." collapse
+        if phone in seen_phones:
+            job.duplicates_in_file += 1
+            continue
+        seen_phones.add(phone)
+        rows.append({
+            "agency_id": job.agency_id,
+            "name": f["name"],
+            "phone_number": phone,
+            "address": f["address"],
+            "status": "new",
+            "asking_price": str(data.get('asking_price') or data.get('price') or "0"),
+            "preferred_language": f["language"],
+        })
+    return rows
+
+
+def run_import(job: ImportJob, path: str):
+    """Parses the spooled file and inserts leads in batches. Runs in a worker thread."""
+    job.status = "running"
+    seen_phones = set()  # phones in the batch not flushed yet
+    chunk = []
+    batch = []
+    try:
+        rows = iter_xlsx_rows(path) if job.file_format == "xlsx" else iter_csv_rows(path)
+        for data in rows:
+            job.rows_read += 1
+            chunk.append(data)
+            if len(chunk) < BATCH_SIZE:
+                continue
+            batch.extend(_build_rows(job, chunk, seen_phones))
+            chunk = []
+            if len(batch) >= BATCH_SIZE:
+                _flush(job, batch)
+                batch = []
+                # Earlier rows are in the DB now; _flush catches repeats of them
+                seen_phones.clear()
+                print(f"   -> 📥 Import {job.id}: {job.rows_read} rows read, {job.inserted} inserted")
+                # Everything flushed so far is committed; re-uploading the
+                # file later skips those rows as existing duplicates.
+                if tracker.stopping.is_set():
+                    job.status = "interrupted"
+                    job.error = "Server shut down during import - re-upload the file to resume"
+                    return
+
+        batch.extend(_build_rows(job, chunk, seen_phones))
+        if batch:
+            _flush(job, batch)
+        job.status = "completed"
+        print(f"✅ Import {job.id} complete: {job.inserted} inserted, {job.duplicates_in_file + job.duplicates_existing} duplicates, {job.invalid} invalid")
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)[:500]
+        print(f"❌ Lead import {job.id} failed: {e}")
+    finally:
+        job.finished_at = datetime.now().isoformat()
+        metrics.inc("lead_import_jobs", status=job.status)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,182 @@
+# lead_state.py - Lead status state machine
+#
+# A lead's status decides whether we may dial the person right now. Every
+# status write the backend makes goes through transition(): a conditional
+# update (UPDATE leads SET status = <to> WHERE id IN (...) AND status IN
+# (<from>)) that returns the rows it actually moved. Postgres applies it
+# atomically per row, so when two campaign starts, a retry and a shutdown
+# release race for the same lead exactly one of them wins. A dial is only
+# placed for a lead this process claimed into a dialing state.
+#
+#   new, queued_night --claim--> calling --(call ends)--> outcome
+#   no_answer, callback, voicemail --retry claim--> calling
+#   calling --(not dialed / create-call failed)--> status it was claimed from
+#   (inserted) calling_inbound --(not dialed / create-call failed)--> queued_night
+#   (inserted on a non-owner node, shards.py) queued_inbound --owner claim--> calling_inbound
+#   calling --(stale claim)--> new; calling_inbound, queued_inbound --(stale claim)--> queued_night
+#   calling, calling_inbound --(report lost, reconcile.py)--> outcome
+#   any status but an outcome --(number on a DNC list, suppression.py)--> do_not_call
+#   new, queued_night, calling, retryable --(number can't be read as E.164)--> invalid_number
+#
+# At most one lead per (agency, phone number) can be in a dialing state:
+# idx_leads_active_dial (a unique partial index) refuses a second one, so
+# two inserts or claims for the same person can't both win.
+#
+# Outcomes (called, no_answer, callback, voicemail, appointment_booked, ...)
+# are written by the frontend's Vapi webhook when the call ends; if its
+# end-of-call-report never arrives, reconcile.py writes them from Vapi's API.
+
+from datetime import datetime, timedelta, timezone
+
+from db import supabase
+from metrics import metrics
+
+NEW = 'new'
+QUEUED_NIGHT = 'queued_night'
+CALLING = 'calling'
+CALLING_INBOUND = 'calling_inbound'
+QUEUED_INBOUND = 'queued_inbound'  # waiting for the agency's owner node
+DO_NOT_CALL = 'do_not_call'  # number suppressed when we were about to dial it
+INVALID_NUMBER = 'invalid_number'  # number not valid in the agency's region - never dialable
+
+# A dial is in progress (or queued in some process) - nobody else may dial
+DIALING = (CALLING, CALLING_INBOUND, QUEUED_INBOUND)
+# Call outcomes a pending call_retries row may dial again
+RETRYABLE = ('no_answer', 'callback', 'voicemail')
+# Where a finished call leaves its lead
+OUTCOMES = ('called', *RETRYABLE)
+
+TRANSITIONS = {
+    NEW: {CALLING, QUEUED_NIGHT, DO_NOT_CALL, INVALID_NUMBER},
+    QUEUED_NIGHT: {CALLING, NEW, DO_NOT_CALL, INVALID_NUMBER},
+    CALLING: {NEW, QUEUED_NIGHT, DO_NOT_CALL, INVALID_NUMBER, *OUTCOMES},
+    CALLING_INBOUND: {QUEUED_NIGHT, DO_NOT_CALL, *OUTCOMES},
+    QUEUED_INBOUND: {CALLING_INBOUND, QUEUED_NIGHT, DO_NOT_CALL},
+    **{status: {CALLING, DO_NOT_CALL, INVALID_NUMBER} for status in RETRYABLE},
+}
+
+# A lead still in a dialing state after this long lost its process (crash,
+# call ended 'failed' so the webhook left the status alone, owner node never
+# picked it up) and may be claimed again. Longer than any call (see
+# number_pool slot timeout).
+STALE_CLAIM_SECONDS = 3600
+
+# Where recover_stale() puts leads stuck in each dialing state. Inbound
+# leads go to queued_night so the next campaign calls them first.
+STALE_RECOVERY = {CALLING: NEW, CALLING_INBOUND: QUEUED_NIGHT, QUEUED_INBOUND: QUEUED_NIGHT}
+
+# Postgres unique_violation (PostgREST's APIError.code)
+UNIQUE_VIOLATION = '23505'
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def is_unique_violation(error: Exception) -> bool:
+    """True if a write lost to idx_leads_active_dial (the number is already being dialed)."""
+    return getattr(error, 'code', None) == UNIQUE_VIOLATION
+
+
+def _update(lead_ids: list, from_status: str, to_status: str, conditions: dict) -> list:
+    query = supabase.table('leads').update({'status': to_status, 'updated_at': _now()})
+    query = query.in_('id', lead_ids).eq('status', from_status)
+    for column, value in conditions.items():
+        query = query.eq(column, value)
+    return [row['id'] for row in (query.execute().data or [])]
+
+
+def transition(lead_ids: list, from_status: str, to_status: str, **conditions) -> list:
+    """
+    Moves the leads still in `from_status` to `to_status` in one conditional
+    update. Returns the ids that moved; the others were changed by someone
+    else in the meantime, or (moving into a dialing state) have a number
+    another lead is being dialed on. `conditions` are extra equality filters.
+    """
+    if to_status not in TRANSITIONS.get(from_status, ()):
+        raise ValueError(f"Invalid lead transition {from_status} -> {to_status}")
+    lead_ids = [lead_id for lead_id in lead_ids if lead_id]
+    if not lead_ids:
+        return []
+
+    try:
+        moved = _update(lead_ids, from_status, to_status, conditions)
+    except Exception as e:
+        if not is_unique_violation(e):
+            raise
+        # One of them has a number that is being dialed and the whole
+        # statement failed - move them one by one, that one loses
+        moved = []
+        for lead_id in lead_ids if len(lead_ids) > 1 else ():
+            try:
+                moved += _update([lead_id], from_status, to_status, conditions)
+            except Exception as e:
+                if not is_unique_violation(e):
+                    raise
+
+    name = f"{from_status}->{to_status}"
+    if moved:
+        metrics.inc("lead_transitions", len(moved), transition=name, result="moved")
+    if len(moved) < len(lead_ids):
+        metrics.inc("lead_transitions", len(lead_ids) - len(moved), transition=name, result="lost")
+    return moved
+
+
+def claim(leads: list, to_status: str = CALLING) -> list:
+    """
+    Claims leads for dialing, one conditional update per current status.
+    Returns the leads this caller won (each with its 'claimed_from' status,
+    needed to release it); the rest are being dialed by someone else.
+    """
+    by_status = {}
+    for lead in leads:
+        by_status.setdefault(lead.get('status'), []).append(lead)
+
+    claimed = []
+    for status, group in by_status.items():
+        if to_status not in TRANSITIONS.get(status, ()):
+            continue
+        won = set(transition([lead.get('id') for lead in group], status, to_status))
+        claimed += [{**lead, 'claimed_from': status} for lead in group if lead.get('id') in won]
+    return claimed
+
+
+def release(leads: list) -> list:
+    """
+    Hands claimed leads that were never dialed back to the status they were
+    claimed from (one update per status). Returns the ids released.
+    """
+    by_status = {}
+    for lead in leads:
+        by_status.setdefault(lead.get('claimed_from') or NEW, []).append(lead.get('id'))
+    released = []
+    for status, lead_ids in by_status.items():
+        released += transition(lead_ids, CALLING, status)
+    return released
+
+
+def recover_stale(agency_id: str) -> int:
+    """
+    Returns leads stuck in a dialing state for longer than any call to the
+    queue they can be claimed from again (STALE_RECOVERY). Returns how many.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=STALE_CLAIM_SECONDS)).isoformat()
+    total = 0
+    for from_status, to_status in STALE_RECOVERY.items():
+        response = supabase.table('leads').update({'status': to_status, 'updated_at': _now()}) \
+            .eq('agency_id', agency_id).eq('status', from_status).lt('updated_at', cutoff).execute()
+        recovered = len(response.data or [])
+        if recovered:
+            metrics.inc("lead_transitions", recovered, transition=f"{from_status}->{to_status}", result="recovered")
+        total += recovered
+    return total
+
+
+def active_dial(agency_id: str, phone: str) -> bool:
+    """
+    True if some lead of the agency with this number is being dialed. A
+    cheap early exit - concurrent inserts are settled by idx_leads_active_dial.
+    """
+    response = supabase.table('leads').select('id').eq('agency_id', agency_id) \
+        .eq('phone_number', phone).in_('status', list(DIALING)).limit(1).execute()
+    return bool(response.data)
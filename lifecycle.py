@@ -0,0 +1,119 @@
+# lifecycle.py - Graceful shutdown for background work
+#
+# Background work (dialer jobs, process_call_retries, lead imports) runs in
+# worker threads and only lives in process memory.
+# On a Railway deploy the old container gets SIGTERM, so we need to:
+#   1. stop accepting new background work,
+#   2. wake sleeping tasks so they can hand their work back to the DB,
+#   3. wait (up to a deadline) for whatever is mid-dial to finish.
+#
+# Tasks cooperate by checking `tracker.stopping` between units of work and
+# by using `tracker.sleep()` instead of `time.sleep()`.
+
+import os
+import signal
+import threading
+import time
+
+
+class TaskTracker:
+    """Tracks in-flight background tasks and coordinates shutdown."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._in_flight = {}  # task name -> number of running instances
+        self.accepting = True
+        self.stopping = threading.Event()
+
+    def track(self, name: str, func, *args, **kwargs):
+        """
+        Wraps `func` so it is counted as in-flight while it runs.
+        Returns None if we are shutting down (caller must not schedule it).
+        """
+        if not self.accepting:
+            return None
+
+        with self._cond:
+            self._in_flight[name] = self._in_flight.get(name, 0) + 1
+
+        def run():
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._cond:
+                    self._in_flight[name] -= 1
+                    if self._in_flight[name] <= 0:
+                        del self._in_flight[name]
+                    self._cond.notify_all()
+
+        return run
+
+    def sleep(self, seconds: float) -> bool:
+        """
+        Interruptible sleep. Returns True if the full delay elapsed,
+        False if shutdown started while we were waiting.
+        """
+        return not self.stopping.wait(seconds)
+
+    def reset(self):
+        """Accepts work again (app startup, e.g. a fresh app in tests)."""
+        self.stopping.clear()
+        self.accepting = True
+
+    def begin_shutdown(self):
+        """Stops accepting new work and wakes sleeping tasks. Idempotent."""
+        if self.stopping.is_set():
+            return
+        self.accepting = False
+        self.stopping.set()
+        print(f"🛑 Shutdown requested - in-flight tasks: {self.snapshot()}")
+
+    def wait_idle(self, timeout: float) -> bool:
+        """
+        Blocks until no tasks are in flight or the deadline passes.
+        Keep `timeout` below the platform's SIGTERM -> SIGKILL window.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return dict(self._in_flight)
+
+
+tracker = TaskTracker()
+
+
+def install_signal_handlers():
+    """
+    Chains onto the server's SIGTERM/SIGINT handlers so tasks start draining
+    as soon as the signal arrives. Uvicorn only runs the lifespan shutdown
+    after all requests (including their background tasks) are done, which
+    is too late to wake a 30-second delayed call.
+    """
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            previous = signal.getsignal(sig)
+        except (ValueError, OSError):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            tracker.begin_shutdown()
+            if callable(previous):
+                previous(signum, frame)
+            elif previous == signal.SIG_DFL:
+                signal.signal(signum, previous)
+                os.kill(os.getpid(), signum)
+
+        try:
+            signal.signal(sig, handler)
+        except ValueError:
+            # Not in the main thread (e.g. some test runners) - rely on the
+            # lifespan shutdown hook instead.
+            return
@@ -1,161 +1,77 @@
 # main.py content (Updated to include FUB Fulfillment)
+#
+# Importing this module has no side effects beyond building the FastAPI app:
+# env vars are read lazily through config.get_settings(), the Supabase client
+# is created on first use (db.get_supabase) and the debug log is off unless
+# DEBUG_LOG_PATH is set. Use create_app() to build an app with custom
+# settings or a fake Supabase client.
 
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Body, Request
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, Depends, FastAPI, BackgroundTasks, Header, HTTPException, Body, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
 import requests
-from supabase import create_client, Client
+import asyncio
+import hmac
 import json
 import os
+import threading
 import time # For mocking delay
 from datetime import datetime
+from functools import partial
 try:
     from zoneinfo import ZoneInfo  # Python 3.9+
 except ImportError:
     from backports.zoneinfo import ZoneInfo  # Fallback for older Python
 
-# --- ENVIRONMENT VARIABLES (Ensure these are set on Railway) ---
-# NOTE: Vapi uses different key types:
-# - Private/Secret Key: For account management (may not work for API calls)
-# - Public Key: For making phone calls via API
-# Try both if available
-VAPI_API_KEY = os.environ.get("VAPI_API_KEY")  # Primary key (could be either type)
-VAPI_PUBLIC_KEY = os.environ.get("VAPI_PUBLIC_KEY")  # Explicit public key (optional)
-VAPI_Private_Key = VAPI_PUBLIC_KEY or VAPI_API_KEY  # Try public key first, fallback to VAPI_API_KEY
-
-# Define log path early for startup logging
-# Use environment variable if set (for Railway), otherwise use local path
-log_path = os.environ.get("DEBUG_LOG_PATH", "/Users/florianrosnay/Desktop/thavon-complete/.cursor/debug.log")
-
-# #region agent log - Environment variable check at startup
-try:
-    with open(log_path, "a") as f:
-        log_entry = {
-            "sessionId": "debug-session",
-            "runId": "startup",
-            "hypothesisId": "S",
-            "location": "main.py:startup:env_check",
-            "message": "Environment variables check at startup",
-            "data": {
-                "VAPI_API_KEY_exists": VAPI_Private_Key is not None,
-                "VAPI_API_KEY_length": len(VAPI_Private_Key) if VAPI_Private_Key else 0,
-                "VAPI_API_KEY_prefix": VAPI_Private_Key[:15] + "***" if VAPI_Private_Key and len(VAPI_Private_Key) > 15 else "missing",
-                "VAPI_PHONE_NUMBER_ID": os.environ.get("VAPI_PHONE_NUMBER_ID") is not None,
-                "VAPI_PHONE_NUMBER_ID_length": len(os.environ.get("VAPI_PHONE_NUMBER_ID", "")) if os.environ.get("VAPI_PHONE_NUMBER_ID") else 0,
-            },
-            "timestamp": int(time.time() * 1000)
-        }
-        f.write(json.dumps(log_entry) + "\n")
-except Exception as e:
-    pass
-# #endregion 
-# Support both NEXT_PUBLIC_SUPABASE_URL (Next.js convention) and SUPABASE_URL (standard)
-SUPABASE_URL = os.environ.get("NEXT_PUBLIC_SUPABASE_URL") or os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") # We use the Service Role Key for secure backend calls
-
-# #region agent log
-try:
-    with open(log_path, "a") as f:
-        import json
-        log_entry = {
-            "sessionId": "debug-session",
-            "runId": "init",
-            "hypothesisId": "A",
-            "location": "main.py:14-15",
-            "message": "Environment variables check",
-            "data": {
-                "NEXT_PUBLIC_SUPABASE_URL_set": SUPABASE_URL is not None,
-                "NEXT_PUBLIC_SUPABASE_URL_value": SUPABASE_URL[:20] + "..." if SUPABASE_URL and len(SUPABASE_URL) > 20 else SUPABASE_URL,
-                "SUPABASE_SERVICE_ROLE_KEY_set": SUPABASE_KEY is not None,
-                "SUPABASE_SERVICE_ROLE_KEY_length": len(SUPABASE_KEY) if SUPABASE_KEY else 0,
-                "all_env_keys": [k for k in os.environ.keys() if "SUPABASE" in k or "VAPI" in k]
-            },
-            "timestamp": int(time.time() * 1000)
-        }
-        f.write(json.dumps(log_entry) + "\n")
-except Exception as e:
-    pass
-# #endregion
-
-# --- INITIALIZATION ---
-app = FastAPI()
-
-# #region agent log
-try:
-    with open(log_path, "a") as f:
-        log_entry = {
-            "sessionId": "debug-session",
-            "runId": "init",
-            "hypothesisId": "B",
-            "location": "main.py:19",
-            "message": "Before create_client call",
-            "data": {
-                "SUPABASE_URL_type": type(SUPABASE_URL).__name__,
-                "SUPABASE_URL_is_none": SUPABASE_URL is None,
-                "SUPABASE_URL_empty": SUPABASE_URL == "" if SUPABASE_URL else True,
-                "SUPABASE_KEY_is_none": SUPABASE_KEY is None
-            },
-            "timestamp": int(time.time() * 1000)
-        }
-        f.write(json.dumps(log_entry) + "\n")
-except Exception as e:
-    pass
-# #endregion
-
-# Validate environment variables before creating client
-if not SUPABASE_URL:
-    error_msg = "SUPABASE_URL is required. Please set NEXT_PUBLIC_SUPABASE_URL or SUPABASE_URL environment variable in Railway."
-    print(f"❌ FATAL ERROR: {error_msg}")
-    # #region agent log
-    try:
-        with open(log_path, "a") as f:
-            log_entry = {
-                "sessionId": "debug-session",
-                "runId": "init",
-                "hypothesisId": "C",
-                "location": "main.py:validation",
-                "message": "SUPABASE_URL validation failed",
-                "data": {"error": error_msg},
-                "timestamp": int(time.time() * 1000)
-            }
-            f.write(json.dumps(log_entry) + "\n")
-    except Exception as e:
-        pass
-    # #endregion
-    raise ValueError(error_msg)
-
-if not SUPABASE_KEY:
-    error_msg = "SUPABASE_SERVICE_ROLE_KEY is required. Please set this environment variable in Railway."
-    print(f"❌ FATAL ERROR: {error_msg}")
-    raise ValueError(error_msg)
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# --- FIX CORS (ALLOW VERCEL TO TALK TO RAILWAY) ---
-from fastapi.middleware.cors import CORSMiddleware
+from admission import Rejected, admission
+from assistant_cache import AssistantConfigCache
+from call_events import call_events
+from config import Settings, configure, get_settings
+from db import set_supabase, supabase
+from lead_fields import InboundLead
+from lead_import import create_job, get_job, run_import, spool_upload
+from dialer import DialJob, dialer, remember_tier
+import lead_state
+from diagnostics import close_debug_log, debug_log, debug_log_enabled
+from exports import FORMATS, stream_export
+import fast_json
+from fast_json import FastJSONResponse
+from lifecycle import tracker, install_signal_handlers
+from metrics import metrics
+from notifications import NO_ANSWER_REASONS, notification_worker
+from number_pool import number_pool
+from phone import lookup_variants, normalize_phone, region_for_timezone
+from profiling import Busy, ProfileMiddleware, loop_monitor, request_profiles, sampler, section, section_folded
+from reconcile import LIVE_LOG_STATUSES, call_reconciler
+from retry_timing import is_office_hour, retry_timer
+from schedules import campaign_scheduler, validate as validate_schedule
+from shards import shards
+from summaries import SummaryJob, summary_worker
+from suppression import suppression
+from vapi_limiter import parse_retry_after, vapi_limiter
+from vapi_events import BUFFERED_EVENTS, FORWARDED_EVENTS, KNOWN_EVENTS, peek_event_type
+from vapi_models import AssistantRequest, EndOfCallReport, Envelope, FunctionCallMessage, parse_message
 
-# SECURITY: Restrict CORS to specific origins
-allowed_origins = [
-    "https://app.thavon.io",
-    "https://thavon.io",
-    "http://localhost:3000",  # Only for local development
-]
-
-# Allow all origins in development if NEXT_PUBLIC_BASE_URL is not set
-if os.environ.get("ENVIRONMENT") != "production":
-    allowed_origins.append("*")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=allowed_origins,
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE"],
-    allow_headers=["Content-Type", "Authorization", "X-Webhook-Signature"],
-)
+router = APIRouter()
 
 # --- DATA MODELS ---
 class CampaignRequest(BaseModel):
     agency_id: str
 
+class SuppressionRequest(BaseModel):
+    phone_number: str
+    reason: str | None = None
+
+class CampaignScheduleRequest(BaseModel):
+    days: list[int]  # ISO weekdays, 1 = Monday ... 7 = Sunday
+    start_time: str  # HH:MM, agency's local time
+    end_time: str
+    daily_cap: int
+    timezone: str | None = None  # default: the agency's timezone
+
 # --- OFFICE HOURS HELPERS ---
 
 def get_agency_timezone(agency_id: str) -> str:
@@ -171,6 +87,10 @@ def get_agency_timezone(agency_id: str) -> str:
         print(f"Error fetching agency timezone: {e}, defaulting to Europe/Luxembourg")
         return 'Europe/Luxembourg'
 
+def get_agency_region(agency_id: str) -> str | None:
+    """Country the agency's national-format numbers are read in (from its timezone), None if unknown."""
+    return region_for_timezone(get_agency_timezone(agency_id))
+
 def is_within_office_hours(agency_id: str) -> bool:
     """
     Checks if the current time is within office hours (8:00 AM - 9:00 PM)
@@ -181,10 +101,10 @@ def is_within_office_hours(agency_id: str) -> bool:
         tz = ZoneInfo(timezone_str)
         now = datetime.now(tz)
         current_hour = now.hour
-        
+
         # Office hours: 8:00 AM (8) to 9:00 PM (21)
-        is_office_hours = 8 <= current_hour < 21
-        
+        is_office_hours = is_office_hour(current_hour)
+
         print(f"⏰ Office Hours Check for Agency {agency_id}: {now.strftime('%Y-%m-%d %H:%M:%S %Z')} - {'✅ OPEN' if is_office_hours else '❌ CLOSED'}")
         return is_office_hours
     except Exception as e:
@@ -205,14 +125,14 @@ def get_agency_fub_key(agency_id: str) -> str | None:
 def push_to_followup_boss(fub_key: str, lead_name: str, lead_phone: str, summary: str):
     """Mocks sending a POST request to the Follow Up Boss API."""
     print(f"   -> FUB FULFILLMENT: Pushing Note to FUB for {lead_name}...")
-    
+
     # --- FUB API PAYLOAD (Standard FUB Event API v1) ---
     # This is where you would build the real API call
     headers = {
         "Authorization": f"Basic {fub_key}:", # FUB uses Basic Auth with API Key as username
         "Content-Type": "application/json"
     }
-    
+
     payload = {
         "eventName": "Thavon AI Call Completed",
         "eventTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
@@ -224,574 +144,380 @@ def push_to_followup_boss(fub_key: str, lead_name: str, lead_phone: str, summary
         "note": summary,
         "source": "Thavon AI Voice Platform"
     }
-    
+
     # In a real environment, you would use requests.post here
     # response = requests.post("https://api.followupboss.com/v1/events", headers=headers, json=payload)
     # print(f"   -> FUB API Status: {response.status_code}")
-    
+
     # MOCKING SUCCESSFUL PUSH
     print(f"   -> FUB MOCK SUCCESS: Note for {lead_name} created.")
 
 
 # --- VAPI CALLER (Existing Logic) ---
 
+def _masked_payload(payload: dict) -> dict:
+    """Copy of a Vapi payload that is safe to write to the debug log."""
+    safe_payload = json.loads(json.dumps(payload))
+    if "customer" in safe_payload and "number" in safe_payload["customer"]:
+        safe_payload["customer"]["number"] = safe_payload["customer"]["number"][:5] + "***"  # Mask phone
+    if "phoneNumberId" in safe_payload:
+        safe_payload["phoneNumberId"] = safe_payload["phoneNumberId"][:10] + "***" if len(safe_payload["phoneNumberId"]) > 10 else "***"
+    return safe_payload
+
+# 429s are retried after Retry-After (the limiter holds new requests until then)
+VAPI_THROTTLE_RETRIES = 2
+VAPI_LIMITER_WAIT_SECONDS = 60
+
+def _post_vapi_call(url: str, headers: dict, payload: dict):
+    """POST to Vapi through the adaptive concurrency limiter."""
+    for attempt in range(VAPI_THROTTLE_RETRIES + 1):
+        if not vapi_limiter.acquire(timeout=VAPI_LIMITER_WAIT_SECONDS):
+            raise requests.exceptions.RequestException("Timed out waiting for Vapi capacity")
+        start = time.monotonic()
+        try:
+            response = requests.post(url, headers=headers, json=payload, timeout=30)
+        except requests.exceptions.RequestException:
+            vapi_limiter.release(time.monotonic() - start, None)
+            raise
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        vapi_limiter.release(time.monotonic() - start, response.status_code, retry_after)
+        metrics.observe("vapi_create_call_seconds", time.monotonic() - start)
+        if response.status_code != 429 or attempt == VAPI_THROTTLE_RETRIES:
+            return response
+        print(f"   -> ⏳ Vapi rate limited (429), retrying (attempt {attempt + 2})")
+        if retry_after is None:
+            tracker.sleep(2 ** attempt)
+    return response
+
+@section("trigger_vapi_call")
 def trigger_vapi_call(payload):
-    """Executes the Vapi API Call in the background."""
-    # #region agent log
-    try:
-        with open(log_path, "a") as f:
-            log_entry = {
-                "sessionId": "debug-session",
-                "runId": "call-debug",
-                "hypothesisId": "A",
-                "location": "main.py:trigger_vapi_call:entry",
-                "message": "trigger_vapi_call called",
-                "data": {
-                    "customer_name": payload.get('customer', {}).get('name', 'unknown'),
-                    "has_vapi_key": VAPI_Private_Key is not None,
-                    "vapi_key_length": len(VAPI_Private_Key) if VAPI_Private_Key else 0,
-                    "payload_keys": list(payload.keys()),
-                },
-                "timestamp": int(time.time() * 1000)
-            }
-            f.write(json.dumps(log_entry) + "\n")
-    except Exception as e:
-        pass
-    # #endregion
-    
+    """
+    Executes the Vapi API Call in the background.
+    Returns the Vapi call id on success ('unknown' if Vapi didn't send one), False on failure.
+    """
+    settings = get_settings()
+    vapi_url = f"{settings.vapi_base_url}/call/phone"
+    debug_log("call-debug", "A", "main.py:trigger_vapi_call:entry", "trigger_vapi_call called", {
+        "customer_name": payload.get('customer', {}).get('name', 'unknown'),
+        "has_vapi_key": bool(settings.vapi_keys),
+        "payload_keys": list(payload.keys()),
+    })
+
     print(f"   -> VAPI CALLER: Executing call for {payload['customer']['name']}")
     try:
-        # #region agent log
-        try:
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "call-debug",
-                    "hypothesisId": "B",
-                    "location": "main.py:trigger_vapi_call:before_api_call",
-                    "message": "Before Vapi API call",
-                    "data": {
-                        "vapi_key_set": VAPI_Private_Key is not None,
-                        "phone_number_id": payload.get('phoneNumberId', 'missing'),
-                        "api_url": "https://api.vapi.ai/call/phone",
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except Exception as e:
-            pass
-        # #endregion
-        
         # Build list of keys to try (public key first, then API key)
-        keys_to_try = []
-        if VAPI_PUBLIC_KEY:
-            keys_to_try.append(("VAPI_PUBLIC_KEY", VAPI_PUBLIC_KEY))
-        if VAPI_API_KEY and VAPI_API_KEY != VAPI_PUBLIC_KEY:
-            keys_to_try.append(("VAPI_API_KEY", VAPI_API_KEY))
-        if not keys_to_try:
-            # Fallback to VAPI_Private_Key if nothing else available
-            if VAPI_Private_Key:
-                keys_to_try.append(("VAPI_Private_Key", VAPI_Private_Key))
-        
+        keys_to_try = settings.vapi_keys
+
         if not keys_to_try:
-            # #region agent log
-            try:
-                with open(log_path, "a") as f:
-                    log_entry = {
-                        "sessionId": "debug-session",
-                        "runId": "call-debug",
-                        "hypothesisId": "C",
-                        "location": "main.py:trigger_vapi_call:no_key",
-                        "message": "No VAPI keys configured",
-                        "data": {
-                            "VAPI_API_KEY_exists": VAPI_API_KEY is not None,
-                            "VAPI_PUBLIC_KEY_exists": VAPI_PUBLIC_KEY is not None,
-                        },
-                        "timestamp": int(time.time() * 1000)
-                    }
-                    f.write(json.dumps(log_entry) + "\n")
-            except Exception as e:
-                pass
-            # #endregion
+            debug_log("call-debug", "C", "main.py:trigger_vapi_call:no_key", "No VAPI keys configured", {
+                "VAPI_API_KEY_exists": settings.vapi_api_key is not None,
+                "VAPI_PUBLIC_KEY_exists": settings.vapi_public_key is not None,
+            })
             print("❌ No VAPI_API_KEY or VAPI_PUBLIC_KEY configured")
             return False
-        
-        # #region agent log
-        try:
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "call-debug",
-                    "hypothesisId": "K",
-                    "location": "main.py:trigger_vapi_call:key_check",
-                    "message": "VAPI key check - will try multiple keys",
-                    "data": {
-                        "keys_to_try": [k[0] for k in keys_to_try],
-                        "VAPI_API_KEY_exists": VAPI_API_KEY is not None,
-                        "VAPI_PUBLIC_KEY_exists": VAPI_PUBLIC_KEY is not None,
-                        "payload_structure": {
-                            "has_phoneNumberId": "phoneNumberId" in payload,
-                            "has_customer": "customer" in payload,
-                            "has_assistant": "assistant" in payload,
-                            "assistant_has_model": "model" in payload.get("assistant", {}),
-                            "assistant_has_functions": "functions" in payload.get("assistant", {}),
-                            "assistant_has_firstMessage": "firstMessage" in payload.get("assistant", {}),
-                            "assistant_model_provider": payload.get("assistant", {}).get("model", {}).get("provider", "missing"),
-                            "assistant_model_name": payload.get("assistant", {}).get("model", {}).get("model", "missing"),
-                        }
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except Exception as e:
-            pass
-        # #endregion
-        
+
         # Try each key type until one works
         last_error = None
         response = None
         successful_key = None
         for key_name, key_value in keys_to_try:
             headers = { "Authorization": f"Bearer {key_value}", "Content-Type": "application/json" }
-            
-            # #region agent log
-            try:
-                # Create a safe copy of payload for logging (remove sensitive data)
-                safe_payload = json.loads(json.dumps(payload))
-                if "customer" in safe_payload and "number" in safe_payload["customer"]:
-                    safe_payload["customer"]["number"] = safe_payload["customer"]["number"][:5] + "***"  # Mask phone
-                if "phoneNumberId" in safe_payload:
-                    safe_payload["phoneNumberId"] = safe_payload["phoneNumberId"][:10] + "***" if len(safe_payload["phoneNumberId"]) > 10 else "***"
-                
-                with open(log_path, "a") as f:
-                    log_entry = {
-                        "sessionId": "debug-session",
-                        "runId": "call-debug",
-                        "hypothesisId": "P",
-                        "location": "main.py:trigger_vapi_call:api_request",
-                        "message": f"Making Vapi API request with {key_name}",
-                        "data": {
-                            "url": "https://api.vapi.ai/call/phone",
-                            "key_type": key_name,
-                            "key_prefix": key_value[:15] + "***" if key_value and len(key_value) > 15 else "too_short",
-                            "payload_structure": safe_payload,
-                            "payload_keys": list(payload.keys()),
-                            "header_auth_prefix": headers["Authorization"][:25] + "***",
-                            "has_phoneNumberId": "phoneNumberId" in payload,
-                            "assistant_keys": list(payload.get("assistant", {}).keys()),
-                            "assistant_model": payload.get("assistant", {}).get("model", {}),
-                            "assistant_has_functions": "functions" in payload.get("assistant", {}),
-                            "assistant_has_firstMessage": "firstMessage" in payload.get("assistant", {}),
-                        },
-                        "timestamp": int(time.time() * 1000)
-                    }
-                    f.write(json.dumps(log_entry) + "\n")
-            except Exception as e:
-                try:
-                    with open(log_path, "a") as f:
-                        log_entry = {
-                            "sessionId": "debug-session",
-                            "runId": "call-debug",
-                            "hypothesisId": "P_ERROR",
-                            "location": "main.py:trigger_vapi_call:api_request:log_error",
-                            "message": "Error logging request",
-                            "data": {"error": str(e)},
-                            "timestamp": int(time.time() * 1000)
-                        }
-                        f.write(json.dumps(log_entry) + "\n")
-                except:
-                    pass
-            # #endregion
-            
+
+            if debug_log_enabled():
+                debug_log("call-debug", "P", "main.py:trigger_vapi_call:api_request", f"Making Vapi API request with {key_name}", {
+                    "url": vapi_url,
+                    "key_type": key_name,
+                    "payload_structure": _masked_payload(payload),
+                    "assistant_keys": list(payload.get("assistant", {}).keys()),
+                })
+
             # Make actual Vapi API call
             try:
-                response = requests.post("https://api.vapi.ai/call/phone", headers=headers, json=payload, timeout=30)
-                
+                with section("vapi_http"):
+                    response = _post_vapi_call(vapi_url, headers, payload)
+
                 # If successful, break out of loop
                 if response.status_code in [200, 201]:
                     successful_key = key_name
                     break
-                    
+
                 # If 401 and we have more keys to try, continue
                 if response.status_code == 401 and len(keys_to_try) > 1:
                     last_error = response
-                    # #region agent log
-                    try:
-                        with open(log_path, "a") as f:
-                            log_entry = {
-                                "sessionId": "debug-session",
-                                "runId": "call-debug",
-                                "hypothesisId": "T",
-                                "location": "main.py:trigger_vapi_call:key_retry",
-                                "message": f"401 with {key_name}, trying next key",
-                                "data": {
-                                    "key_type": key_name,
-                                    "status_code": response.status_code,
-                                    "error_message": response.text[:200] if response.text else "",
-                                },
-                                "timestamp": int(time.time() * 1000)
-                            }
-                            f.write(json.dumps(log_entry) + "\n")
-                    except:
-                        pass
-                    # #endregion
+                    debug_log("call-debug", "T", "main.py:trigger_vapi_call:key_retry", f"401 with {key_name}, trying next key", {
+                        "key_type": key_name,
+                        "status_code": response.status_code,
+                        "error_message": response.text[:200] if response.text else "",
+                    })
                     continue
                 else:
                     # Not 401 or no more keys, use this response
                     break
-                    
+
             except requests.exceptions.RequestException as req_e:
-                # #region agent log
-                try:
-                    with open(log_path, "a") as f:
-                        log_entry = {
-                            "sessionId": "debug-session",
-                            "runId": "call-debug",
-                            "hypothesisId": "Q",
-                            "location": "main.py:trigger_vapi_call:request_exception",
-                            "message": f"Request exception with {key_name}",
-                            "data": {
-                                "key_type": key_name,
-                                "error_type": type(req_e).__name__,
-                                "error_message": str(req_e)[:500],
-                            },
-                            "timestamp": int(time.time() * 1000)
-                        }
-                        f.write(json.dumps(log_entry) + "\n")
-                except:
-                    pass
-                # #endregion
+                debug_log("call-debug", "Q", "main.py:trigger_vapi_call:request_exception", f"Request exception with {key_name}", {
+                    "key_type": key_name,
+                    "error_type": type(req_e).__name__,
+                    "error_message": str(req_e)[:500],
+                })
                 last_error = req_e
                 if len(keys_to_try) > 1:
                     continue  # Try next key
                 else:
                     raise  # No more keys, raise exception
-        
+
         # Check if we have a response (if all keys failed with exceptions, response might be None)
         if response is None:
-            # #region agent log
-            try:
-                with open(log_path, "a") as f:
-                    log_entry = {
-                        "sessionId": "debug-session",
-                        "runId": "call-debug",
-                        "hypothesisId": "U",
-                        "location": "main.py:trigger_vapi_call:no_response",
-                        "message": "No response after trying all keys",
-                        "data": {
-                            "keys_tried": [k[0] for k in keys_to_try],
-                            "last_error_type": type(last_error).__name__ if last_error else "none",
-                            "last_error_message": str(last_error)[:500] if last_error else "none",
-                        },
-                        "timestamp": int(time.time() * 1000)
-                    }
-                    f.write(json.dumps(log_entry) + "\n")
-            except:
-                pass
-            # #endregion
+            debug_log("call-debug", "U", "main.py:trigger_vapi_call:no_response", "No response after trying all keys", {
+                "keys_tried": [k[0] for k in keys_to_try],
+                "last_error_type": type(last_error).__name__ if last_error else "none",
+                "last_error_message": str(last_error)[:500] if last_error else "none",
+            })
             print("❌ Vapi API call failed: No response after trying all keys")
             if last_error:
                 print(f"   -> Last error: {last_error}")
             return False
-        
-        # #region agent log
-        try:
-            response_text = response.text if response.text else "empty"
-            response_json = {}
-            response_headers = dict(response.headers) if hasattr(response, 'headers') else {}
-            try:
-                response_json = response.json() if response_text != "empty" else {}
-            except:
-                pass
-            
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "call-debug",
-                    "hypothesisId": "R",
-                    "location": "main.py:trigger_vapi_call:api_response",
-                    "message": "Vapi API response received - full details",
-                    "data": {
-                        "status_code": response.status_code,
-                        "response_text": response_text[:1000],  # Increased to see full error
-                        "response_json": response_json,
-                        "response_headers": {k: v for k, v in response_headers.items() if k.lower() not in ['authorization', 'cookie']},
-                        "success": response.status_code in [200, 201],
-                        "is_401": response.status_code == 401,
-                        "is_400": response.status_code == 400,
-                        "is_403": response.status_code == 403,
-                        "error_message": response_json.get("message", "") if isinstance(response_json, dict) else "",
-                        "error_type": response_json.get("error", "") if isinstance(response_json, dict) else "",
-                        "successful_key": successful_key,
-                        "keys_tried": [k[0] for k in keys_to_try],
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except Exception as e:
-            try:
-                with open(log_path, "a") as f:
-                    log_entry = {
-                        "sessionId": "debug-session",
-                        "runId": "call-debug",
-                        "hypothesisId": "R_ERROR",
-                        "location": "main.py:trigger_vapi_call:api_response:log_error",
-                        "message": "Error logging response",
-                        "data": {"error": str(e)},
-                        "timestamp": int(time.time() * 1000)
-                    }
-                    f.write(json.dumps(log_entry) + "\n")
-            except:
-                pass
-        # #endregion
-        
+
+        debug_log("call-debug", "R", "main.py:trigger_vapi_call:api_response", "Vapi API response received - full details", {
+            "status_code": response.status_code,
+            "response_text": response.text[:1000] if response.text else "empty",
+            "success": response.status_code in [200, 201],
+            "successful_key": successful_key,
+            "keys_tried": [k[0] for k in keys_to_try],
+        })
+
         print(f"   -> Vapi API Response: {response.status_code}")
         if successful_key:
             print(f"   -> ✅ Successful key: {successful_key}")
-        
+
         if response.status_code in [200, 201]:
             response_data = response.json() if response.text else {}
             call_id = response_data.get('id', 'unknown')
             print(f"   -> ✅ Call initiated: {call_id}")
-            # #region agent log
-            try:
-                with open(log_path, "a") as f:
-                    log_entry = {
-                        "sessionId": "debug-session",
-                        "runId": "call-debug",
-                        "hypothesisId": "SUCCESS",
-                        "location": "main.py:trigger_vapi_call:success",
-                        "message": "Vapi call successfully initiated",
-                        "data": {
-                            "call_id": call_id,
-                            "successful_key": successful_key,
-                            "status_code": response.status_code,
-                        },
-                        "timestamp": int(time.time() * 1000)
-                    }
-                    f.write(json.dumps(log_entry) + "\n")
-            except:
-                pass
-            # #endregion
-            return True
+            debug_log("call-debug", "SUCCESS", "main.py:trigger_vapi_call:success", "Vapi call successfully initiated", {
+                "call_id": call_id,
+                "successful_key": successful_key,
+                "status_code": response.status_code,
+            })
+            return call_id
         else:
             error_msg = response.text[:500] if response.text else "No error message"
             print(f"   -> ❌ Vapi API Error: {response.status_code} - {error_msg}")
             if not successful_key:
                 print(f"   -> ⚠️ All keys failed. Keys tried: {[k[0] for k in keys_to_try]}")
-            
-            # #region agent log
-            try:
-                error_json = {}
-                try:
-                    error_json = response.json() if response.text else {}
-                except:
-                    pass
-                
-                with open(log_path, "a") as f:
-                    log_entry = {
-                        "sessionId": "debug-session",
-                        "runId": "call-debug",
-                        "hypothesisId": "M",
-                        "location": "main.py:trigger_vapi_call:api_error",
-                        "message": "Vapi API returned error",
-                        "data": {
-                            "status_code": response.status_code,
-                            "error_message": error_msg,
-                            "error_json": error_json,
-                            "is_auth_error": response.status_code == 401,
-                            "suggests_wrong_key_type": "private key" in error_msg.lower() or "public key" in error_msg.lower(),
-                        },
-                        "timestamp": int(time.time() * 1000)
-                    }
-                    f.write(json.dumps(log_entry) + "\n")
-            except Exception as e:
-                pass
-            # #endregion
-            
+
+            debug_log("call-debug", "M", "main.py:trigger_vapi_call:api_error", "Vapi API returned error", {
+                "status_code": response.status_code,
+                "error_message": error_msg,
+                "is_auth_error": response.status_code == 401,
+                "suggests_wrong_key_type": "private key" in error_msg.lower() or "public key" in error_msg.lower(),
+            })
+
             return False
-            
+
     except requests.exceptions.RequestException as e:
-        # #region agent log
-        try:
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "call-debug",
-                    "hypothesisId": "F",
-                    "location": "main.py:trigger_vapi_call:exception",
-                    "message": "Vapi API request exception",
-                    "data": {
-                        "error_type": type(e).__name__,
-                        "error_message": str(e)[:200],
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except Exception as e2:
-            pass
-        # #endregion
+        debug_log("call-debug", "F", "main.py:trigger_vapi_call:exception", "Vapi API request exception", {
+            "error_type": type(e).__name__,
+            "error_message": str(e)[:200],
+        })
         print(f"❌ Vapi Call Failed: {e}")
         return False
     except Exception as e:
-        # #region agent log
-        try:
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "call-debug",
-                    "hypothesisId": "G",
-                    "location": "main.py:trigger_vapi_call:general_exception",
-                    "message": "General exception in trigger_vapi_call",
-                    "data": {
-                        "error_type": type(e).__name__,
-                        "error_message": str(e)[:200],
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except Exception as e2:
-            pass
-        # #endregion
+        debug_log("call-debug", "G", "main.py:trigger_vapi_call:general_exception", "General exception in trigger_vapi_call", {
+            "error_type": type(e).__name__,
+            "error_message": str(e)[:200],
+        })
         print(f"❌ Vapi Call Failed: {e}")
         return False
 
+# How long a dial waits for a free caller-ID slot before giving up
+DIAL_SLOT_WAIT_SECONDS = 300
+INBOUND_SLOT_WAIT_SECONDS = 60
+
+def place_call(payload: dict, agency_id: str, wait_seconds: float):
+    """
+    Dials from a caller-ID pool number with a free slot (local presence
+    preferred). Returns the call id, False if the dial failed, or None if no
+    slot freed up within `wait_seconds` (nothing was dialed).
+    """
+    lease = number_pool.acquire(agency_id, payload.get("customer", {}).get("number"), timeout=wait_seconds)
+    if lease is None:
+        print(f"   -> ⏳ No free caller-ID slot for Agency {agency_id}")
+        return None
+    if not lease.pooled and not get_settings().vapi_phone_number_id:
+        print(f"   -> ⚠️ WARNING: No caller-ID pool and VAPI_PHONE_NUMBER_ID not set, call may fail")
+    payload["phoneNumberId"] = lease.phone_number_id
+
+    call_id = False
+    try:
+        call_id = trigger_vapi_call(payload)
+    finally:
+        if call_id and call_id != 'unknown':
+            number_pool.bind(lease, call_id)
+        elif not call_id:
+            number_pool.release(lease)
+        # 'unknown': no id to match the end-of-call-report, the slot times out
+    return call_id
+
 
-def process_outbound_calls(leads: list):
-    """Iterates through leads and triggers a call for each."""
+def release_unstarted_leads(leads: list):
+    """
+    Hands claimed leads we never dialed (shutdown, no caller-ID slot, failed
+    create-call) back to the status they were claimed from, so the next
+    campaign picks them up again (queued_night ones first).
+    """
+    try:
+        released = lead_state.release(leads)
+        if released:
+            print(f"   -> ↩️ Returned {len(released)} undialed leads to their queue")
+    except Exception as e:
+        print(f"❌ Error releasing undialed leads: {e}")
+
+def release_inbound_lead(lead_id: str | None):
+    """Re-queues an inbound lead whose call was never placed (shutdown, no slot, create-call failed)."""
+    if not lead_id:
+        return
+    try:
+        if lead_state.transition([lead_id], lead_state.CALLING_INBOUND, lead_state.QUEUED_NIGHT):
+            print(f"   -> ↩️ Inbound lead {lead_id} not dialed, queued for the next campaign")
+    except Exception as e:
+        print(f"❌ Error re-queueing inbound lead {lead_id}: {e}")
+
+def do_not_call(phone: str | None, agency_id: str, lead_id: str | None, from_status: str) -> bool:
+    """
+    True if the number is on the global or the agency's suppression list
+    (suppression.py); the lead, if any, is then moved to do_not_call.
+    """
+    if not phone or not suppression.is_suppressed(phone, agency_id):
+        return False
+    print(f"   -> 🚫 {phone[:6]}*** is on a do-not-call list - not dialing")
+    metrics.inc("dials_suppressed", status=from_status)
+    if lead_id:
+        lead_state.transition([lead_id], from_status, lead_state.DO_NOT_CALL)
+    return True
+
+def screen_dial_leads(leads: list, agency_id: str) -> list:
+    """
+    The leads that may be dialed, with phone_number in E.164 read in the
+    agency's region (kept in 'region' for the dial). Numbers that can't be
+    read move to invalid_number, suppressed ones to do_not_call - both are
+    terminal, so they never come back into a campaign batch.
+    """
+    region = get_agency_region(agency_id)
+    dialable = []
     for lead in leads:
-        lead_name = lead.get('name')
-        lead_phone = lead.get('phone_number')
-        agency_id = lead.get('agency_id')
-        lead_id = lead.get('id')
-        
-        print(f"   -> Dialing: {lead_name} ({lead_phone})")
-        
-        # #region agent log
-        try:
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "call-debug",
-                    "hypothesisId": "H",
-                    "location": "main.py:process_outbound_calls:building_payload",
-                    "message": "Building Vapi payload for outbound call",
-                    "data": {
-                        "lead_name": lead_name,
-                        "lead_phone": lead_phone,
-                        "agency_id": agency_id,
-                        "vapi_phone_number_id": os.environ.get("VAPI_PHONE_NUMBER_ID"),
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except Exception as e:
-            pass
-        # #endregion
-        
-        # 1. BUILD VAPI PAYLOAD
-        phone_number_id = os.environ.get("VAPI_PHONE_NUMBER_ID")
-        if not phone_number_id:
-            print(f"   -> ⚠️ WARNING: VAPI_PHONE_NUMBER_ID not set, call may fail")
-            # #region agent log
-            try:
-                with open(log_path, "a") as f:
-                    log_entry = {
-                        "sessionId": "debug-session",
-                        "runId": "call-debug",
-                        "hypothesisId": "N",
-                        "location": "main.py:process_outbound_calls:missing_phone_id",
-                        "message": "VAPI_PHONE_NUMBER_ID not set",
-                        "data": {},
-                        "timestamp": int(time.time() * 1000)
-                    }
-                    f.write(json.dumps(log_entry) + "\n")
-            except Exception as e:
-                pass
-            # #endregion
-        
-        # #region agent log
-        try:
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "call-debug",
-                    "hypothesisId": "O",
-                    "location": "main.py:process_outbound_calls:payload_complete",
-                    "message": "Vapi payload built",
-                    "data": {
-                        "has_phone_number_id": phone_number_id is not None,
-                        "phone_number_id_length": len(phone_number_id) if phone_number_id else 0,
-                        "payload_keys": list(["phoneNumberId", "customer", "assistant"]),  # Removed metadata and webhookUrl (causes 400)
-                        "webhook_url": f"{os.environ.get('NEXT_PUBLIC_BASE_URL', 'https://app.thavon.io')}/api/webhooks/vapi",
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except Exception as e:
-            pass
-        # #endregion
-        
-        # Build payload - SIMPLIFIED to match working version
-        # NOTE: webhookUrl causes 400 error - "property webhookUrl should not exist"
-        # webhookUrl must be configured in Vapi dashboard settings, not in the payload
-        # BUT metadata is REQUIRED for webhook processing - it contains agency_id and lead_id
-        vapi_payload = {
-            "phoneNumberId": phone_number_id or "YOUR_TWILIO_PHONE_ID_FROM_VAPI",
-            "customer": { 
-                "number": str(lead_phone), 
-                "name": lead_name 
-            },
-            "assistant": {
-                "firstMessage": f"Hi {lead_name}, this is the real estate team calling about your property. Do you have a minute?",
-                "model": {
-                    "provider": "openai",
-                    "model": "gpt-4o",
-                    "systemPrompt": f"You are a Senior Agent calling {lead_name} about their property. Your goal is to book an appointment for a viewing. Be friendly and professional.",
-                    "functions": [
-                        {
-                            "name": "bookAppointment",
-                            "description": "Book an appointment when the lead agrees to a viewing",
-                            "parameters": {
-                                "type": "object",
-                                "properties": {
-                                    "time": {"type": "string", "description": "Appointment time (e.g., 'Tomorrow at 2pm', 'Friday at 10am')"},
-                                    "notes": {"type": "string", "description": "Any notes about the appointment"}
-                                },
-                                "required": ["time"]
-                            }
+        phone = normalize_phone(lead.get('phone_number'), region)
+        if not phone:
+            print(f"   -> ⚠️ Not dialing {lead.get('name')}: invalid phone number {lead.get('phone_number')!r} (region {region or 'unknown'})")
+            metrics.inc("dials_invalid_number", status=lead.get('status'))
+            lead_state.transition([lead.get('id')], lead.get('status'), lead_state.INVALID_NUMBER)
+            lead['status'] = lead_state.INVALID_NUMBER
+            continue
+        if do_not_call(phone, agency_id, lead.get('id'), lead.get('status')):
+            lead['status'] = lead_state.DO_NOT_CALL
+            continue
+        dialable.append({**lead, 'phone_number': phone, 'region': region})
+    return dialable
+
+def queue_outbound_calls(leads: list) -> int:
+    """
+    Queues a campaign dial per claimed lead (see lead_state.claim). Leads
+    that can't be queued are released.
+    """
+    queued = 0
+    for lead in leads:
+        job = DialJob(
+            priority='queued_night' if lead.get('claimed_from') == lead_state.QUEUED_NIGHT else 'new',
+            agency_id=lead.get('agency_id'),
+            key=f"lead:{lead.get('id')}",
+            run=partial(dial_lead, lead),
+            on_drop=partial(release_unstarted_leads, [lead]),
+        )
+        if dialer.submit(job):
+            queued += 1
+        else:
+            release_unstarted_leads([lead])
+    return queued
+
+def dial_lead(lead: dict):
+    """Dials one campaign lead (runs on a dialer worker)."""
+    settings = get_settings()
+    lead_name = lead.get('name')
+    agency_id = lead.get('agency_id')
+    lead_id = lead.get('id')
+    lead_phone = normalize_phone(lead.get('phone_number'), lead.get('region') or get_agency_region(agency_id))
+
+    if not lead_phone:
+        print(f"   -> ⚠️ Skipping {lead_name}: invalid phone number {lead.get('phone_number')!r}")
+        lead_state.transition([lead_id], lead_state.CALLING, lead_state.INVALID_NUMBER)
+        return
+    # The lists may have changed since the lead was queued
+    if do_not_call(lead_phone, agency_id, lead_id, lead_state.CALLING):
+        return
+
+    print(f"   -> Dialing: {lead_name} ({lead_phone})")
+
+    debug_log("call-debug", "H", "main.py:dial_lead:building_payload", "Building Vapi payload for outbound call", {
+        "lead_name": lead_name,
+        "lead_phone": lead_phone,
+        "agency_id": agency_id,
+        "vapi_phone_number_id": settings.vapi_phone_number_id,
+    })
+
+    # 1. BUILD VAPI PAYLOAD
+    # Build payload - SIMPLIFIED to match working version
+    # NOTE: webhookUrl causes 400 error - "property webhookUrl should not exist"
+    # webhookUrl must be configured in Vapi dashboard settings, not in the payload
+    # BUT metadata is REQUIRED for webhook processing - it contains agency_id and lead_id
+    vapi_payload = {
+        "phoneNumberId": settings.phone_number_id,
+        "customer": {
+            "number": lead_phone,
+            "name": lead_name
+        },
+        "assistant": {
+            "firstMessage": f"Hi {lead_name}, this is the real estate team calling about your property. Do you have a minute?",
+            "model": {
+                "provider": "openai",
+                "model": "gpt-4o",
+                "systemPrompt": f"You are a Senior Agent calling {lead_name} about their property. Your goal is to book an appointment for a viewing. Be friendly and professional.",
+                "functions": [
+                    {
+                        "name": "bookAppointment",
+                        "description": "Book an appointment when the lead agrees to a viewing",
+                        "parameters": {
+                            "type": "object",
+                            "properties": {
+                                "time": {"type": "string", "description": "Appointment time (e.g., 'Tomorrow at 2pm', 'Friday at 10am')"},
+                                "notes": {"type": "string", "description": "Any notes about the appointment"}
+                            },
+                            "required": ["time"]
                         }
-                    ]
-                },
-                "voice": { 
-                    "provider": "cartesia", 
-                    "voiceId": "248be419-c632-4f23-adf1-5324ed7dbf1d",
-                    "model": "sonic-english"
-                }
+                    }
+                ]
             },
-            "metadata": {
-                "agency_id": str(agency_id),
-                "lead_id": str(lead_id) if lead_id else None,
-                "is_inbound": False
+            "voice": {
+                "provider": "cartesia",
+                "voiceId": "248be419-c632-4f23-adf1-5324ed7dbf1d",
+                "model": "sonic-english"
             }
+        },
+        "metadata": {
+            "agency_id": str(agency_id),
+            "lead_id": str(lead_id) if lead_id else None,
+            "is_inbound": False
         }
-        
-        # 2. TRIGGER THE CALL
-        call_success = trigger_vapi_call(vapi_payload)
-        
-        # 3. MOCK POST-CALL PROCESSING & FULFILLMENT (NEW INTEGRATION POINT)
-        if call_success:
-            # This data would normally come from Vapi's end-of-call webhook
-            mock_summary = f"Thavon AI called {lead_name}. Handled objection on commission. Booked a tentative appointment."
-            
-            fub_key = get_agency_fub_key(agency_id)
-            if fub_key:
-                push_to_followup_boss(fub_key, lead_name, lead_phone, mock_summary)
-            else:
-                print(f"   -> FUB CHECK: No FUB Key found for Agency {agency_id}. Skipping fulfillment.")
-        
-        # Small delay to simulate calling time
-        time.sleep(1)
+    }
+
+    # 2. TRIGGER THE CALL (waits for a free caller-ID slot)
+    call_success = place_call(vapi_payload, agency_id, wait_seconds=DIAL_SLOT_WAIT_SECONDS)
+    if not call_success:
+        # Not dialed (no slot, shutdown) or Vapi refused - hand the claim back
+        release_unstarted_leads([lead])
+        return
+
+    # 3. FULFILLMENT happens when the call ends: the end-of-call-report's
+    # transcript is summarized and pushed to FUB (see finish_call)
 
 
 # --- CALL RETRY LOGIC (NEW) ---
@@ -799,100 +525,252 @@ def process_outbound_calls(leads: list):
 def process_call_retries(agency_id: str):
     """
     Processes pending call retries for unanswered calls.
-    Checks the call_retries table for scheduled retries and triggers calls.
+    Checks the call_retries table for scheduled retries and queues their calls.
     """
     try:
+        # Newly scheduled retries move to the hours this agency's leads answer
+        try:
+            slotted = retry_timer.slot_pending(agency_id)
+            if slotted:
+                print(f"   -> 📅 Timed {slotted} new call retries by answer rate")
+        except Exception as e:
+            print(f"⚠️ Could not time call retries: {e}")
+
         # Get pending retries that are due (scheduled_at <= now)
         now = datetime.now().isoformat()
         retries_response = supabase.table('call_retries').select('*, leads:lead_id(*), call_logs:call_id(*)').eq('agency_id', agency_id).eq('status', 'pending').lte('scheduled_at', now).limit(10).execute()
-        
+
         retries = retries_response.data or []
-        
+
         if not retries:
             print("   -> No pending retries to process")
             return
-        
+
         print(f"   -> Processing {len(retries)} call retries...")
-        
+
+        # Claim the leads in one go: a lead that is being dialed (campaign,
+        # inbound, another retry run) keeps its retry pending for the next
+        # run; a lead that moved on (booked, called back) cancels it.
+        by_lead = {}
         for retry in retries:
             lead = retry.get('leads')
-            if not lead:
-                print(f"   -> ⚠️ Retry {retry['id']}: Lead not found, skipping")
+            if lead and lead.get('id') not in by_lead:
+                by_lead[lead['id']] = retry
+        retryable = [retry['leads'] for retry in by_lead.values() if retry['leads'].get('status') in lead_state.RETRYABLE]
+        # Invalid and suppressed numbers get a terminal status; their retries are cancelled below
+        claimed = {lead['id']: lead for lead in lead_state.claim(screen_dial_leads(retryable, agency_id))}
+
+        cancelled = [
+            retry['id'] for retry in by_lead.values()
+            if retry['leads'].get('status') not in lead_state.RETRYABLE + lead_state.DIALING
+        ]
+        if cancelled:
+            supabase.table('call_retries').update({'status': 'cancelled'}).in_('id', cancelled).eq('status', 'pending').execute()
+            print(f"   -> Cancelled {len(cancelled)} retries (lead no longer needs a call)")
+
+        # Unprocessed retries stay 'pending', so nothing else needs releasing
+        # if they are dropped on shutdown - the next run picks them up again.
+        for lead_id, retry in by_lead.items():
+            if lead_id not in claimed:
                 continue
-            
-            lead_name = lead.get('name')
-            lead_phone = lead.get('phone_number')
-            lead_id = lead.get('id')
-            
-            print(f"   -> Retrying call to {lead_name} ({lead_phone}) - Attempt {retry['retry_count']}")
-            
-            # Build Vapi payload for retry
-            vapi_payload = {
-                "phoneNumberId": os.environ.get("VAPI_PHONE_NUMBER_ID", "YOUR_TWILIO_PHONE_ID_FROM_VAPI"),
-                "customer": { "number": lead_phone, "name": lead_name },
-                "assistant": {
-                    "model": { 
-                        "provider": "groq", 
-                        "model": "llama-3-70b-versatile" 
-                    },
-                    "systemPrompt": f"You are a Senior Agent calling {lead_name} about their property. This is a follow-up call. Book an appointment.",
-                    "voice": { 
-                        "provider": "cartesia", 
-                        "voiceId": "248be419-c632-4f23-adf1-5324ed7dbf1d" 
-                    },
-                },
-                "metadata": {
-                    "agency_id": agency_id,
-                    "lead_id": lead_id,
-                    "is_retry": True,
-                    "retry_count": retry['retry_count']
-                }
-            }
-            
-            # Trigger the call
-            call_success = trigger_vapi_call(vapi_payload)
-            
-            if call_success:
-                # Mark retry as completed
-                supabase.table('call_retries').update({
-                    'status': 'completed',
-                    'completed_at': datetime.now().isoformat()
-                }).eq('id', retry['id']).execute()
-                print(f"   -> ✅ Retry call initiated for {lead_name}")
-            else:
-                # Mark retry as failed
-                supabase.table('call_retries').update({
-                    'status': 'failed'
-                }).eq('id', retry['id']).execute()
-                print(f"   -> ❌ Retry call failed for {lead_name}")
-            
-            # Small delay between retries
-            time.sleep(2)
-            
+            retry = {**retry, 'leads': claimed[lead_id]}
+            job = DialJob(
+                priority='retry',
+                agency_id=agency_id,
+                key=f"retry:{retry['id']}",
+                run=partial(dial_retry, retry, agency_id),
+                on_drop=partial(release_unstarted_leads, [claimed[lead_id]]),
+            )
+            if not dialer.submit(job):
+                release_unstarted_leads([claimed[lead_id]])
+
     except Exception as e:
         print(f"❌ Error processing call retries: {e}")
 
+def dial_retry(retry: dict, agency_id: str):
+    """Dials one pending retry whose lead is claimed (runs on a dialer worker)."""
+    lead = retry.get('leads')
+    if not lead:
+        print(f"   -> ⚠️ Retry {retry['id']}: Lead not found, skipping")
+        return
+
+    lead_name = lead.get('name')
+    lead_phone = normalize_phone(lead.get('phone_number'), lead.get('region') or get_agency_region(agency_id))
+    lead_id = lead.get('id')
+
+    if not lead_phone:
+        print(f"   -> ⚠️ Retry {retry['id']}: invalid phone number, marking failed")
+        lead_state.transition([lead_id], lead_state.CALLING, lead_state.INVALID_NUMBER)
+        supabase.table('call_retries').update({'status': 'failed'}).eq('id', retry['id']).execute()
+        return
+    if do_not_call(lead_phone, agency_id, lead_id, lead_state.CALLING):
+        supabase.table('call_retries').update({'status': 'cancelled'}).eq('id', retry['id']).execute()
+        return
+
+    print(f"   -> Retrying call to {lead_name} ({lead_phone}) - Attempt {retry['retry_count']}")
+
+    # Build Vapi payload for retry
+    vapi_payload = {
+        "phoneNumberId": get_settings().phone_number_id,
+        "customer": { "number": lead_phone, "name": lead_name },
+        "assistant": {
+            "model": {
+                "provider": "groq",
+                "model": "llama-3-70b-versatile"
+            },
+            "systemPrompt": f"You are a Senior Agent calling {lead_name} about their property. This is a follow-up call. Book an appointment.",
+            "voice": {
+                "provider": "cartesia",
+                "voiceId": "248be419-c632-4f23-adf1-5324ed7dbf1d"
+            },
+        },
+        "metadata": {
+            "agency_id": agency_id,
+            "lead_id": lead_id,
+            "is_retry": True,
+            "retry_count": retry['retry_count']
+        }
+    }
+
+    # Trigger the call
+    call_success = place_call(vapi_payload, agency_id, wait_seconds=DIAL_SLOT_WAIT_SECONDS)
+
+    if not call_success:
+        release_unstarted_leads([lead])
+    if call_success is None:
+        # No caller-ID slot - leave it pending for the next run
+        print(f"   -> ⏳ Retry for {lead_name} left pending (no free caller-ID slot)")
+        return
+    if call_success:
+        # Mark retry as completed
+        supabase.table('call_retries').update({
+            'status': 'completed',
+            'completed_at': datetime.now().isoformat()
+        }).eq('id', retry['id']).execute()
+        print(f"   -> ✅ Retry call initiated for {lead_name}")
+    else:
+        # Mark retry as failed
+        supabase.table('call_retries').update({
+            'status': 'failed'
+        }).eq('id', retry['id']).execute()
+        print(f"   -> ❌ Retry call failed for {lead_name}")
+
 
 # --- API ENDPOINTS ---
 
+def require_admin(x_admin_token: str | None = Header(default=None)):
+    """ADMIN_TOKEN in X-Admin-Token; without ADMIN_TOKEN these endpoints don't exist."""
+    token = get_settings().admin_token
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
 # --- INBOUND ENGINE (SPEED-TO-LEAD) ---
-@app.post("/webhooks/inbound/{agency_id}")
-async def handle_inbound_lead(agency_id: str, request: Request, background_tasks: BackgroundTasks):
+
+# Inbound leads are called this long after they come in (as per requirements)
+INBOUND_DELAY_SECONDS = 30
+
+def inbound_call_payload(agency_id: str, lead_id: str | None, name: str, phone: str, address: str, language: str) -> dict:
+    """Vapi payload for a speed-to-lead call (its own script, not the campaign one)."""
+    inbound_prompt = f"""
+    # IDENTITY
+    You are the AI assistant for a top real estate agency.
+    You are calling {name} immediately because they just requested information about {address} on our website.
+
+    # GOAL
+    Confirm they made the request and ask if they are looking to buy or sell.
+    Your goal is to get a live agent on the line if they are serious.
+
+    # LANGUAGE
+    Speak in {language} if the lead prefers it. Adjust your communication style accordingly.
+
+    # OPENER
+    "Hi {name}, this is Thavon calling from the real estate team. I saw you just requested an estimate for {address}. Do you have a minute?"
+    """
+
+    return {
+        "phoneNumberId": get_settings().phone_number_id,
+        "customer": { "number": phone, "name": name },
+        "assistant": {
+            "firstMessage": f"Hi {name}, this is the real estate team calling about your request. Do you have a minute?",
+            "model": {
+                "provider": "openai",
+                "model": "gpt-4o",
+                "systemPrompt": inbound_prompt
+            },
+            "voice": {
+                "provider": "cartesia",
+                "voiceId": "248be419-c632-4f23-adf1-5324ed7dbf1d",
+                "model": "sonic-english"
+            }
+        },
+        "metadata": {
+            "agency_id": str(agency_id),
+            "lead_id": str(lead_id) if lead_id else None,
+            "is_inbound": True
+        }
+        # NOTE: webhookUrl causes 400 error - must be configured in Vapi dashboard settings
+    }
+
+def schedule_inbound_call(agency_id: str, lead_id: str | None, call_payload: dict, delay: float) -> bool:
+    """
+    Queues the dial of a 'calling_inbound' lead after `delay` seconds. Inbound
+    jobs jump ahead of any campaign dials waiting in the queue. False (lead
+    re-queued for the next campaign) if it can't be queued.
+    """
+    def inbound_call():
+        if do_not_call(call_payload["customer"]["number"], agency_id, lead_id, lead_state.CALLING_INBOUND):
+            return
+        if not place_call(call_payload, agency_id, wait_seconds=INBOUND_SLOT_WAIT_SECONDS):
+            # Not dialed (no slot) or Vapi refused - queue it for the next campaign
+            release_inbound_lead(lead_id)
+
+    job = DialJob(
+        priority='inbound',
+        agency_id=agency_id,
+        key=f"lead:{lead_id}",
+        run=inbound_call,
+        on_drop=partial(release_inbound_lead, lead_id),
+    )
+    if not dialer.submit(job, delay=delay):
+        release_inbound_lead(lead_id)
+        return False
+    return True
+
+@router.post("/webhooks/inbound/{agency_id}")
+@section("webhooks_inbound")
+async def handle_inbound_lead(agency_id: str, request: Request):
     """
     Receives a lead from Zapier/Website and calls them IMMEDIATELY.
+    Answers 429 + Retry-After when overloaded (Zapier retries those).
     """
+    # 0. Admission control - shed load before doing any work
+    try:
+        admission.admit(agency_id)
+    except Rejected as e:
+        print(f"⏳ Inbound lead for Agency {agency_id} rejected: {e.reason}")
+        raise HTTPException(status_code=429, detail=f"Too many requests ({e.reason}), retry later", headers={"Retry-After": e.retry_after_header})
+    try:
+        return await _handle_inbound_lead(agency_id, request)
+    finally:
+        admission.leave()
+
+async def _handle_inbound_lead(agency_id: str, request: Request):
     # 1. Parse Data
     try:
-        data = await request.json()
-    except:
+        with section("parse_json"):
+            lead = InboundLead.model_validate_json(await request.body())
+    except ValidationError:
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
     # Map common field names (Zapier sends different keys sometimes)
-    name = data.get('name') or data.get('first_name') or data.get('Name') or "New Lead"
-    phone = data.get('phone') or data.get('phone_number') or data.get('Phone')
-    address = data.get('address') or data.get('Address') or "your inquiry"
-    language = data.get('language') or data.get('preferred_language') or 'en'  # NEW: Language support
-    
+    fields = lead.fields()
+    name = fields["name"]
+    phone = fields["phone"]
+    address = fields["address"]
+    language = fields["language"]  # NEW: Language support
+
     if not phone:
         return {"status": "ignored", "reason": "No phone number provided"}
 
@@ -900,27 +778,79 @@ async def handle_inbound_lead(agency_id: str, request: Request, background_tasks
 
     # 2. Check Subscription (Security)
     # We query Supabase to make sure this agency is active
-    agency = supabase.table('agencies').select('subscription_status').eq('id', agency_id).single().execute()
-    
+    # (blocking DB calls run on the inbound thread pool, off the event loop)
+    with section("supabase"):
+        agency = await admission.run(lambda: supabase.table('agencies').select('subscription_status, subscription_tier, timezone').eq('id', agency_id).single().execute())
+
     if not agency.data or agency.data['subscription_status'] != 'active':
         print("❌ Call blocked: Inactive subscription")
         return {"status": "error", "message": "Subscription inactive"}
+    # The dialer's fair share comes from the tier - cached here so
+    # schedule_inbound_call doesn't query it on the event loop
+    remember_tier(agency_id, agency.data.get('subscription_tier'))
+
+    # Store E.164 so Vapi's customer.number matches the lead on lookup.
+    # National numbers are read in the agency's own country.
+    phone = normalize_phone(phone, region_for_timezone(agency.data.get('timezone')))
+    if not phone:
+        return {"status": "ignored", "reason": "Invalid phone number"}
+
+    # Opted out / on a DNC list: keep the lead for the agency, never dial it
+    # (in memory once the lists are loaded, a table lookup until then)
+    if suppression.ready:
+        suppressed = suppression.is_suppressed(phone, agency_id)
+    else:
+        with section("supabase"):
+            suppressed = await admission.run(suppression.is_suppressed, phone, agency_id)
+    if suppressed:
+        print(f"   -> 🚫 Inbound lead {name}: number is on a do-not-call list")
+        metrics.inc("dials_suppressed", status="inbound")
+        with section("supabase"):
+            await admission.run(lambda: supabase.table('leads').insert({
+                "agency_id": agency_id, "name": name, "phone_number": phone, "address": address,
+                "status": lead_state.DO_NOT_CALL, "asking_price": "0", "preferred_language": language,
+            }).execute())
+        return {"status": "ignored", "reason": "Number is on a do-not-call list"}
 
     # 3. Check Office Hours
-    is_office_hours = is_within_office_hours(agency_id)
-    
-    # 4. Save Lead to Database with appropriate status
-    lead_status = "calling_inbound" if is_office_hours else "queued_night"
+    # While shutting down we still save the lead, but queue it instead of
+    # scheduling a call this process would never get to make.
+    with section("supabase"):
+        is_office_hours = await admission.run(is_within_office_hours, agency_id) and tracker.accepting
+
+    # Zapier retries and double form posts: don't dial someone we're already calling
+    with section("supabase"):
+        dialing = await admission.run(lead_state.active_dial, agency_id, phone)
+    if dialing:
+        print(f"   -> ⏭️ Inbound lead {name}: a call to this number is already in progress")
+        return {"status": "ignored", "reason": "Call already in progress for this number"}
+
+    # 4. Save Lead to Database with appropriate status. Only the node that
+    # owns the agency dials it (shards.py); any other node hands it over.
+    if not is_office_hours:
+        lead_status = lead_state.QUEUED_NIGHT
+    elif shards.owns(agency_id):
+        lead_status = lead_state.CALLING_INBOUND
+    else:
+        lead_status = lead_state.QUEUED_INBOUND
     lead_data = {
         "agency_id": agency_id,
         "name": name,
-        "phone_number": str(phone),
+        "phone_number": phone,
         "address": address,
         "status": lead_status,
         "asking_price": "0", # Not relevant for inbound usually
         "preferred_language": language  # NEW: Store language preference
     }
-    lead_insert = supabase.table('leads').insert(lead_data).execute()
+    try:
+        with section("supabase"):
+            lead_insert = await admission.run(lambda: supabase.table('leads').insert(lead_data).execute())
+    except Exception as e:
+        # A concurrent re-submission inserted its dialing lead first
+        if not lead_state.is_unique_violation(e):
+            raise
+        print(f"   -> ⏭️ Inbound lead {name}: a call to this number is already in progress")
+        return {"status": "ignored", "reason": "Call already in progress for this number"}
     lead_id = lead_insert.data[0]['id'] if lead_insert.data else None
 
     # 5. TRIGGER THE CALL (Only if within office hours)
@@ -928,59 +858,21 @@ async def handle_inbound_lead(agency_id: str, request: Request, background_tasks
         print(f"🌙 Outside office hours - Lead {name} queued for next business day")
         return {"status": "queued", "lead": name, "message": "Lead saved and queued for next business day"}
 
-    # We use a DIFFERENT script for inbound.
-    inbound_prompt = f"""
-    # IDENTITY
-    You are the AI assistant for a top real estate agency. 
-    You are calling {name} immediately because they just requested information about {address} on our website.
-    
-    # GOAL
-    Confirm they made the request and ask if they are looking to buy or sell. 
-    Your goal is to get a live agent on the line if they are serious.
-    
-    # LANGUAGE
-    Speak in {language} if the lead prefers it. Adjust your communication style accordingly.
-    
-    # OPENER
-    "Hi {name}, this is Thavon calling from the real estate team. I saw you just requested an estimate for {address}. Do you have a minute?"
-    """
+    if lead_status == lead_state.QUEUED_INBOUND:
+        print(f"   -> 🧭 Agency {agency_id} is dialed by node {shards.owner_of(agency_id)}, lead handed over")
+        metrics.inc("shard_handoffs", kind="inbound")
+        return {"status": "calling", "lead": name, "message": "Call will be initiated in 30 seconds"}
 
-    call_payload = {
-        "phoneNumberId": os.environ.get("VAPI_PHONE_NUMBER_ID", "YOUR_TWILIO_PHONE_ID_FROM_VAPI"), 
-        "customer": { "number": str(phone), "name": name },
-        "assistant": {
-            "firstMessage": f"Hi {name}, this is the real estate team calling about your request. Do you have a minute?",
-            "model": {
-                "provider": "openai",
-                "model": "gpt-4o",
-                "systemPrompt": inbound_prompt
-            },
-            "voice": { 
-                "provider": "cartesia", 
-                "voiceId": "248be419-c632-4f23-adf1-5324ed7dbf1d",
-                "model": "sonic-english"
-            }
-        },
-        "metadata": {
-            "agency_id": str(agency_id),
-            "lead_id": str(lead_id) if lead_id else None,
-            "is_inbound": True
-        }
-        # NOTE: webhookUrl causes 400 error - must be configured in Vapi dashboard settings
-    }
-
-    # 6. Execute Call (in background so we reply to Zapier instantly)
-    # Add a 30-second delay before calling (as per requirements)
-    def delayed_call():
-        time.sleep(30)  # Wait 30 seconds before calling
-        trigger_vapi_call(call_payload)
-    
-    background_tasks.add_task(delayed_call)
+    # 6. Execute Call (queued so we reply to Zapier instantly)
+    call_payload = inbound_call_payload(agency_id, lead_id, name, phone, address, language)
+    if not schedule_inbound_call(agency_id, lead_id, call_payload, delay=INBOUND_DELAY_SECONDS):
+        return {"status": "queued", "lead": name, "message": "Lead saved and queued for next business day"}
 
     return {"status": "calling", "lead": name, "message": "Call will be initiated in 30 seconds"}
 
 # --- VAPI SERVER URL ENDPOINT (Handles ALL Vapi events) ---
-@app.post("/assistant-request")
+@router.post("/assistant-request")
+@section("assistant_request")
 async def assistant_request(request: Request):
     """
     Vapi Server URL endpoint - handles ALL event types:
@@ -992,178 +884,114 @@ async def assistant_request(request: Request):
     - hang: Hang notifications
     """
     try:
-        payload = await request.json()
-        
-        # #region agent log
-        try:
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "vapi-server-url",
-                    "hypothesisId": "VAPI_EVENT",
-                    "location": "main.py:assistant_request:entry",
-                    "message": "Vapi Server URL endpoint called",
-                    "data": {
-                        "payload_keys": list(payload.keys()) if payload else [],
-                        "payload_type": payload.get('type') or payload.get('event') or payload.get('message', {}).get('type'),
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except:
-            pass
-        # #endregion
-        
-        # Determine event type
-        event_type = payload.get('type') or payload.get('event')
-        message = payload.get('message', {})
-        message_type = message.get('type') if message else None
-        
-        # #region agent log
-        try:
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "event-routing",
-                    "hypothesisId": "H1",
-                    "location": "main.py:assistant_request:event-detection",
-                    "message": "Event type detection",
-                    "data": {
-                        "event_type": event_type,
-                        "message_type": message_type,
-                        "payload_type": payload.get('type'),
-                        "payload_event": payload.get('event'),
-                        "payload_keys": list(payload.keys()) if payload else [],
-                        "message_keys": list(message.keys()) if message else [],
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except:
-            pass
-        # #endregion
-        
-        # Handle different event types
-        if message_type == 'assistant-request' or event_type == 'assistant-request':
-            # ASSISTANT REQUEST: Return dynamic assistant configuration
-            return await handle_assistant_request(payload, message)
-        # Check if event should be forwarded
-        # Vapi may send event type in either payload.type, payload.event, or message.type
-        webhook_events = ['status-update', 'call-status-update', 'end-of-call-report', 'transcript-update', 'function-call', 'hang', 'speech-update', 'conversation-update', 'assistant.started']
-        # Check both event_type and message_type
-        should_forward = (event_type in webhook_events) or (message_type in webhook_events)
-        
-        # Debug print to Railway logs (always visible)
-        print(f"🔍 DEBUG: event_type={repr(event_type)}, message_type={repr(message_type)}, should_forward={should_forward}")
-        print(f"🔍 DEBUG: event_type in webhook_events = {event_type in webhook_events if event_type else False}")
-        
-        # #region agent log
-        try:
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "event-routing",
-                    "hypothesisId": "H1",
-                    "location": "main.py:assistant_request:condition-check",
-                    "message": "Checking if event should be forwarded",
-                    "data": {
-                        "event_type": event_type,
-                        "event_type_repr": repr(event_type),
-                        "event_type_in_list": event_type in webhook_events,
-                        "should_forward": should_forward,
-                        "webhook_events": webhook_events,
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except Exception as log_err:
-            # If log file write fails, at least print to Railway logs
-            print(f"⚠️ Log write failed: {log_err}")
-        # #endregion
-        
-        if should_forward:
-            # WEBHOOK EVENTS: Forward to frontend webhook endpoint
-            # #region agent log
-            try:
-                with open(log_path, "a") as f:
-                    log_entry = {
-                        "sessionId": "debug-session",
-                        "runId": "event-routing",
-                        "hypothesisId": "H1",
-                        "location": "main.py:assistant_request:forwarding",
-                        "message": "Routing webhook event to frontend",
-                        "data": {
-                            "event_type": event_type,
-                            "message_type": message_type,
-                            "has_call_data": "call" in str(payload) or "callId" in str(payload),
-                        },
-                        "timestamp": int(time.time() * 1000)
-                    }
-                    f.write(json.dumps(log_entry) + "\n")
-            except:
-                pass
-            # #endregion
-            return await forward_to_webhook(payload, event_type or message_type)
+        # Read the raw body once. Forwarded events are relayed byte-for-byte
+        # (keeps the Vapi signature valid); only events we handle get parsed,
+        # into typed models (vapi_models) holding just the fields we use.
+        body = await request.body()
+        peeked_type = peek_event_type(body)
+        if peeked_type is not None:
+            event_type = peeked_type
         else:
-            # Unknown event type - log and acknowledge
-            actual_event = event_type or message_type
-            # #region agent log
+            with section("parse_json"):
+                event_type = Envelope.model_validate_json(body).event_type
+
+        debug_log("event-routing", "H1", "main.py:assistant_request:event-detection", "Event type detection", {
+            "event_type": event_type,
+            "peeked_type": peeked_type,
+            "payload_size": len(body),
+        })
+
+        if event_type == 'end-of-call-report':
+            await end_call(body)
+        elif event_type == 'function-call':
             try:
-                with open(log_path, "a") as f:
-                    log_entry = {
-                        "sessionId": "debug-session",
-                        "runId": "event-routing",
-                        "hypothesisId": "H1",
-                        "location": "main.py:assistant_request:unknown",
-                        "message": "Unknown event type - NOT forwarding",
-                        "data": {
-                            "event_type": event_type,
-                            "message_type": message_type,
-                            "actual_event": actual_event,
-                            "payload_keys": list(payload.keys()) if payload else [],
-                        },
-                        "timestamp": int(time.time() * 1000)
-                    }
-                    f.write(json.dumps(log_entry) + "\n")
-            except Exception as log_err:
-                print(f"⚠️ Log write failed: {log_err}")
-            # #endregion
-            print(f"⚠️ Unknown Vapi event type: {actual_event}")
-            print(f"🔍 DEBUG: event_type={repr(event_type)}, message_type={repr(message_type)}")
-            print(f"🔍 DEBUG: payload keys: {list(payload.keys()) if payload else []}")
-            if message:
-                print(f"🔍 DEBUG: message keys: {list(message.keys())}")
-            return {"status": "acknowledged"}
-            
+                function_called(parse_message(body, FunctionCallMessage))
+            except ValidationError as e:
+                # Still forwarded below - only our confirmation SMS is skipped
+                print(f"⚠️ Unreadable function-call event: {e.error_count()} invalid fields")
+
+        if event_type in BUFFERED_EVENTS and call_events.record(fast_json.loads(body)):
+            # Merged into call_logs by the write-behind flusher
+            metrics.inc("vapi_events", event=event_type, route="buffered")
+            return FastJSONResponse({"status": "acknowledged"})
+
+        if event_type in FORWARDED_EVENTS:
+            metrics.inc("vapi_events", event=event_type, route="forward_raw" if peeked_type else "forward_parsed")
+            return FastJSONResponse(await forward_to_webhook(body, event_type, request.headers.get("x-vapi-signature")))
+
+        if event_type == 'assistant-request':
+            # ASSISTANT REQUEST: Return dynamic assistant configuration
+            metrics.inc("vapi_events", event="assistant-request", route="handled")
+            return FastJSONResponse(await handle_assistant_request(parse_message(body, AssistantRequest)))
+
+        if event_type is not None and event_type in KNOWN_EVENTS:
+            # Known Vapi event we neither handle nor forward
+            metrics.inc("vapi_events", event=event_type, route="ignored")
+            return FastJSONResponse({"status": "acknowledged"})
+
+        # Unknown event type - log and acknowledge
+        debug_log("event-routing", "H1", "main.py:assistant_request:unknown", "Unknown event type - NOT forwarding", {
+            "event_type": event_type,
+        })
+        print(f"⚠️ Unknown Vapi event type: {event_type}")
+        return FastJSONResponse({"status": "acknowledged"})
+
     except Exception as e:
         print(f"❌ Server URL endpoint error: {e}")
         # Return a default response to prevent Vapi from retrying
-        return {"status": "error", "message": str(e)[:200]}
+        return FastJSONResponse({"status": "error", "message": str(e)[:200]})
 
-async def handle_assistant_request(payload: dict, message: dict):
-    """Handle assistant-request events - return dynamic assistant configuration"""
-    call = message.get('call', {})
-    customer = call.get('customer', {})
-    phone_number = customer.get('number')
-    
-    print(f"🔍 Assistant Request - Looking up Phone Number: {phone_number}")
-    
-    # Database lookup for lead information
-    lead_name = "there"
-    address = "your property"
-    
-    if phone_number:
-        try:
-            response = supabase.table('leads').select("*").eq('phone_number', phone_number).execute()
-            if response.data and len(response.data) > 0:
-                lead = response.data[0]
-                lead_name = lead.get('name', "there")
-                address = lead.get('address', "the property")
-                print(f"✅ FOUND LEAD: {lead_name} at {address}")
-        except Exception as e:
-            print(f"❌ Database Error: {e}")
-    
-    # Build the assistant configuration
+async def end_call(body: bytes):
+    """end-of-call-report: parsed once per call, before it is forwarded."""
+    try:
+        report = parse_message(body, EndOfCallReport)
+    except ValidationError:
+        return
+    await finish_call(report)
+
+async def finish_call(report: EndOfCallReport):
+    """
+    Frees the call's caller-ID slot, drops its buffered live state and
+    queues its AI summary. Runs before the report is forwarded.
+    """
+    call = report.call
+    number_pool.release_call(call.id)
+    # Waits for a flush in progress, so the final row is written last
+    transcript = await asyncio.to_thread(call_events.end_call, call.id)
+    transcript = transcript or report.transcript or report.artifact.transcript
+
+    metadata, customer = call.metadata, call.customer
+    await asyncio.to_thread(retry_timer.record, metadata.agency_id, report.ended_reason, report.started_at)
+    if report.ended_reason in NO_ANSWER_REASONS:
+        notification_worker.notify('no_answer', metadata.lead_id, customer.number, customer.name)
+    if not transcript or not metadata.agency_id or not customer.number:
+        return
+    summary_worker.submit(SummaryJob(
+        call_id=call.id,
+        transcript=transcript,
+        on_done=partial(deliver_summary, metadata.agency_id, customer.name, customer.number),
+    ))
+
+def function_called(message: FunctionCallMessage):
+    """function-call: confirms a booked viewing to the lead (the call itself is forwarded)."""
+    if message.function_call.name != 'bookAppointment':
+        return
+    customer = message.call.customer
+    notification_worker.notify(
+        'appointment_booked', message.call.metadata.lead_id,
+        customer.number, customer.name, time=message.function_call.parameters.get('time'),
+    )
+
+def deliver_summary(agency_id: str, lead_name: str | None, lead_phone: str, summary: str):
+    """Hands a finished call's summary to the agency's CRM (runs in a worker thread)."""
+    fub_key = get_agency_fub_key(agency_id)
+    if fub_key:
+        push_to_followup_boss(fub_key, lead_name, lead_phone, summary)
+    else:
+        print(f"   -> FUB CHECK: No FUB Key found for Agency {agency_id}. Skipping fulfillment.")
+
+def build_assistant_config(lead_name: str, address: str) -> dict:
+    """Assistant configuration returned to Vapi for an assistant-request."""
     system_prompt = f"""
 You are Thavon, a Real Estate Agent.
 You are speaking to {lead_name}.
@@ -1174,9 +1002,8 @@ TONE: Friendly, professional, concise.
 
 If they ask "What do you want?": Say "I saw your listing for {address} and wanted to see if you are open to working with buyers."
 """
-    
-    # Return assistant configuration to Vapi
-    assistant_config = {
+
+    return {
         "assistant": {
             "firstMessage": f"Hello {lead_name}, it's Thavon calling about {address}. Do you have a minute?",
             "model": {
@@ -1191,209 +1018,622 @@ If they ask "What do you want?": Say "I saw your listing for {address} and wante
             }
         }
     }
-    
-    # #region agent log
+
+def resolve_assistant_config(phone_number: str | None) -> dict:
+    """
+    Looks up the lead by phone number and builds its assistant config.
+    Database errors propagate so a failed lookup is never cached.
+    """
+    # Database lookup for lead information (Vapi reports E.164, so the
+    # default region only matters for rows stored before normalization)
+    lead_name = "there"
+    address = "your property"
+
+    if phone_number:
+        # Leads saved before normalization may still hold the raw format
+        with section("supabase"):
+            response = supabase.table('leads').select("*").in_('phone_number', lookup_variants(phone_number)).execute()
+        if response.data and len(response.data) > 0:
+            lead = response.data[0]
+            lead_name = lead.get('name', "there")
+            address = lead.get('address', "the property")
+            print(f"✅ FOUND LEAD: {lead_name} at {address}")
+
+    return build_assistant_config(lead_name, address)
+
+assistant_cache = AssistantConfigCache()
+
+async def handle_assistant_request(message: AssistantRequest):
+    """Handle assistant-request events - return dynamic assistant configuration"""
+    call_id = message.call.id
+    phone_number = normalize_phone(message.call.customer.number) or message.call.customer.number
+
+    print(f"🔍 Assistant Request - Looking up Phone Number: {phone_number}")
+
+    async def resolve(number):
+        # Sync Supabase client - keep it off the event loop
+        return await asyncio.to_thread(resolve_assistant_config, number)
+
     try:
-        with open(log_path, "a") as f:
-            log_entry = {
-                "sessionId": "debug-session",
-                "runId": "assistant-request",
-                "hypothesisId": "AR_SUCCESS",
-                "location": "main.py:handle_assistant_request:response",
-                "message": "Returning assistant configuration",
-                "data": {
-                    "lead_name": lead_name,
-                    "address": address,
-                    "phone_number": phone_number,
-                },
-                "timestamp": int(time.time() * 1000)
-            }
-            f.write(json.dumps(log_entry) + "\n")
-    except:
-        pass
-    # #endregion
-    
+        assistant_config = await assistant_cache.get_or_build(call_id, phone_number, resolve)
+    except Exception as e:
+        print(f"❌ Database Error: {e}")
+        assistant_config = build_assistant_config("there", "your property")
+
+    debug_log("assistant-request", "AR_SUCCESS", "main.py:handle_assistant_request:response", "Returning assistant configuration", {
+        "call_id": call_id,
+        "phone_number": phone_number,
+    })
+
     return assistant_config
 
-async def forward_to_webhook(payload: dict, event_type: str):
-    """Forward webhook events to the frontend webhook endpoint"""
-    # Get base URL and ensure it's correct
-    webhook_url = os.environ.get('NEXT_PUBLIC_BASE_URL', 'https://app.thavon.io')
-    # Remove trailing slash if present to avoid double slashes
-    webhook_url = webhook_url.rstrip('/')
-    # Ensure we're using the correct domain
-    if 'thavon.vercel.app' in webhook_url:
-        webhook_url = 'https://app.thavon.io'
-    frontend_webhook = f"{webhook_url}/api/webhooks/vapi"
-    
-    # #region agent log
-    try:
-        with open(log_path, "a") as f:
-            log_entry = {
-                "sessionId": "debug-session",
-                "runId": "webhook-forward",
-                "hypothesisId": "H5",
-                "location": "main.py:forward_to_webhook:entry",
-                "message": "Attempting to forward webhook",
-                "data": {
-                    "event_type": event_type,
-                    "frontend_url": frontend_webhook,
-                    "payload_size": len(str(payload)),
-                },
-                "timestamp": int(time.time() * 1000)
-            }
-            f.write(json.dumps(log_entry) + "\n")
-    except:
-        pass
-    # #endregion
-    
-    print(f"📤 Forwarding {event_type} event to frontend webhook: {frontend_webhook}")
-    
+# Pooled connection to the frontend webhook (keep-alive across events)
+_webhook_session = requests.Session()
+
+def _post_to_webhook(url: str, body: bytes, headers: dict):
+    return _webhook_session.post(url, data=body, headers=headers, timeout=10)
+
+async def forward_to_webhook(body: bytes, event_type: str, signature: str | None = None):
+    """Forward webhook events (original request bytes) to the frontend webhook endpoint"""
+    frontend_webhook = get_settings().frontend_webhook_url
+
+    print(f"📤 Forwarding {event_type} event to frontend webhook: {frontend_webhook} ({len(body)} bytes)")
+
+    headers = {"Content-Type": "application/json"}
+    if signature:
+        headers["x-vapi-signature"] = signature
+
     try:
-        # Forward the event to the frontend webhook endpoint
-        response = requests.post(
-            frontend_webhook,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        # #region agent log
-        try:
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "webhook-forward",
-                    "hypothesisId": "H5",
-                    "location": "main.py:forward_to_webhook:response",
-                    "message": f"Frontend webhook response received",
-                    "data": {
-                        "event_type": event_type,
-                        "status_code": response.status_code,
-                        "response_text": response.text[:500] if response.text else None,
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except:
-            pass
-        # #endregion
-        
+        # Forward the event to the frontend webhook endpoint (off the event loop)
+        with section("forward_http"):
+            response = await asyncio.to_thread(_post_to_webhook, frontend_webhook, body, headers)
+
+        debug_log("webhook-forward", "H5", "main.py:forward_to_webhook:response", "Frontend webhook response received", {
+            "event_type": event_type,
+            "payload_size": len(body),
+            "status_code": response.status_code,
+            "response_text": response.text[:500] if response.text else None,
+        })
+
         if response.status_code in [200, 201]:
             print(f"✅ Successfully forwarded {event_type} to frontend")
         else:
             print(f"⚠️ Frontend webhook returned {response.status_code}: {response.text[:200]}")
-        
+
         return {"status": "forwarded", "event_type": event_type}
-        
+
     except Exception as e:
         print(f"❌ Error forwarding to frontend webhook: {e}")
-        # #region agent log
-        try:
-            with open(log_path, "a") as f:
-                log_entry = {
-                    "sessionId": "debug-session",
-                    "runId": "webhook-forward-error",
-                    "hypothesisId": "H5",
-                    "location": "main.py:forward_to_webhook:error",
-                    "message": "Exception during webhook forwarding",
-                    "data": {
-                        "event_type": event_type,
-                        "error_type": type(e).__name__,
-                        "error": str(e)[:500],
-                    },
-                    "timestamp": int(time.time() * 1000)
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except:
-            pass
-        # #endregion
+        debug_log("webhook-forward-error", "H5", "main.py:forward_to_webhook:error", "Exception during webhook forwarding", {
+            "event_type": event_type,
+            "error_type": type(e).__name__,
+            "error": str(e)[:500],
+        })
         # Still return success to Vapi so it doesn't retry
         return {"status": "acknowledged", "note": "forwarding_failed"}
 
-@app.post("/start-campaign")
+# --- BULK LEAD IMPORT (CSV / XLSX) ---
+@router.post("/leads/import/{agency_id}", status_code=202)
+async def import_leads(agency_id: str, request: Request, background_tasks: BackgroundTasks):
+    """
+    Accepts a raw CSV or XLSX upload (request body, e.g. `curl --data-binary @leads.csv`).
+    The body is streamed to disk, then imported in the background.
+    Poll GET /leads/import/status/{job_id} for progress.
+    """
+    if not tracker.accepting:
+        raise HTTPException(status_code=503, detail="Server is shutting down, retry shortly", headers={"Retry-After": "30"})
+
+    agency = await asyncio.to_thread(lambda: supabase.table('agencies').select('subscription_status, timezone').eq('id', agency_id).single().execute())
+    if not agency.data or agency.data['subscription_status'] != 'active':
+        raise HTTPException(status_code=403, detail="Subscription inactive")
+
+    try:
+        path, size, file_format = await spool_upload(request.stream(), get_settings().lead_import_max_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if size == 0:
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail="Empty upload")
+
+    job = create_job(agency_id, file_format, region_for_timezone(agency.data.get('timezone')))
+    job.bytes_received = size
+    task = tracker.track("lead_import", run_import, job, path)
+    if task is None:
+        os.unlink(path)
+        raise HTTPException(status_code=503, detail="Server is shutting down, retry shortly", headers={"Retry-After": "30"})
+    background_tasks.add_task(task)
+
+    print(f"📥 Lead import {job.id} queued for Agency {agency_id} ({file_format}, {size} bytes)")
+    return {"status": "queued", "job_id": job.id, "format": file_format, "bytes": size}
+
+@router.get("/leads/import/status/{job_id}")
+def import_status(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.as_dict()
+
+# --- EXPORTS (CSV / NDJSON, streamed) ---
+# Admin only: an export holds every lead's name and number, transcripts
+# and recording URLs.
+
+async def export_response(table: str, agency_id: str, file_format: str, gzip: bool):
+    if file_format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{file_format}' (csv or ndjson)")
+    agency = await asyncio.to_thread(lambda: supabase.table('agencies').select('subscription_status').eq('id', agency_id).maybe_single().execute())
+    if not agency or not agency.data or agency.data['subscription_status'] != 'active':
+        raise HTTPException(status_code=403, detail="Subscription inactive")
+
+    media_type, extension = FORMATS[file_format]
+    filename = f"{table}-{agency_id}.{extension}"
+    if gzip:
+        media_type, filename = "application/gzip", filename + ".gz"
+    return StreamingResponse(
+        stream_export(table, agency_id, file_format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/leads/export/{agency_id}", dependencies=[Depends(require_admin)])
+async def export_leads(agency_id: str, format: str = "csv", gzip: bool = False):
+    """Streams all of the agency's leads (chunked; `gzip=true` for a .gz file)."""
+    return await export_response('leads', agency_id, format, gzip)
+
+@router.get("/call-logs/export/{agency_id}", dependencies=[Depends(require_admin)])
+async def export_call_logs(agency_id: str, format: str = "csv", gzip: bool = False):
+    """Streams all of the agency's call logs, transcripts included."""
+    return await export_response('call_logs', agency_id, format, gzip)
+
+@router.post("/start-campaign")
 async def start_campaign(request: CampaignRequest, background_tasks: BackgroundTasks):
     """
     Fetches leads ONLY for the specific agency requesting the campaign.
     Prioritizes queued_night leads (from outside office hours) before new leads.
     Also processes call retries.
     """
-    # #region agent log
-    try:
-        with open(log_path, "a") as f:
-            log_entry = {
-                "sessionId": "debug-session",
-                "runId": "call-debug",
-                "hypothesisId": "I",
-                "location": "main.py:start_campaign:entry",
-                "message": "start_campaign endpoint called",
-                "data": {
-                    "agency_id": request.agency_id,
-                    "has_vapi_key": VAPI_Private_Key is not None,
-                    "vapi_phone_number_id": os.environ.get("VAPI_PHONE_NUMBER_ID"),
-                },
-                "timestamp": int(time.time() * 1000)
-            }
-            f.write(json.dumps(log_entry) + "\n")
-    except Exception as e:
-        pass
-    # #endregion
-    
     agency_id = request.agency_id
-    
-    # 1. Process call retries first (unanswered calls)
-    background_tasks.add_task(process_call_retries, agency_id)
-    
-    # 2. Get Queued Night Leads First (Priority - from outside office hours)
-    queued_response = supabase.table('leads').select("*").eq('status', 'queued_night').eq('agency_id', agency_id).limit(5).execute()
+
+    debug_log("call-debug", "I", "main.py:start_campaign:entry", "start_campaign endpoint called", {
+        "agency_id": agency_id,
+    })
+
+    # Don't start work this process can't finish - the next instance will
+    if not tracker.accepting:
+        raise HTTPException(status_code=503, detail="Server is shutting down, retry shortly", headers={"Retry-After": "30"})
+
+    # Another node owns this agency's dialing - it runs the campaign
+    if not shards.owns(agency_id):
+        await asyncio.to_thread(shards.request_campaign, agency_id)
+        owner = shards.owner_of(agency_id)
+        print(f"🧭 Campaign for Agency {agency_id} handed to node {owner}")
+        return {"message": f"Campaign handed to the node dialing for your agency ({owner}).", "owner": owner}
+
+    result = queue_campaign(agency_id)
+    if result is None:
+        raise HTTPException(status_code=503, detail="Server is shutting down, retry shortly", headers={"Retry-After": "30"})
+
+    # 1. Process call retries (unanswered calls). Only tracked once the
+    # campaign is queued: a task FastAPI never runs would hold up shutdown.
+    retries_task = tracker.track("process_call_retries", process_call_retries, agency_id)
+    if retries_task:
+        background_tasks.add_task(retries_task)
+    return result
+
+# Leads per /start-campaign (scheduled campaigns feed continuously, see schedules.py)
+CAMPAIGN_BATCH = 5
+
+def claim_campaign_leads(agency_id: str, limit: int = CAMPAIGN_BATCH) -> list:
+    """The agency's next `limit` campaign leads (queued_night first), claimed for dialing."""
+    # 3. Get Queued Night Leads First (Priority - from outside office hours)
+    queued_response = supabase.table('leads').select("*").eq('status', 'queued_night').eq('agency_id', agency_id).limit(limit).execute()
     queued_leads = queued_response.data or []
-    
-    # 3. Get New Leads (if we haven't reached the limit)
-    remaining_slots = 5 - len(queued_leads)
+
+    # 4. Get New Leads (if we haven't reached the limit)
+    remaining_slots = limit - len(queued_leads)
     new_leads = []
     if remaining_slots > 0:
         new_response = supabase.table('leads').select("*").eq('status', 'new').eq('agency_id', agency_id).limit(remaining_slots).execute()
         new_leads = new_response.data or []
-    
-    # 4. Combine leads (queued_night first, then new)
-    leads = queued_leads + new_leads
-    
+
+    # Invalid and suppressed numbers never get claimed (terminal statuses,
+    # so they can't keep taking the batch's slots)
+    leads = screen_dial_leads(queued_leads + new_leads, agency_id)
+
+    # 5. Claim them for dialing (queued_night first, then new). A concurrent
+    # campaign start or retry run that selected the same leads loses the
+    # claim and skips them, so nobody is dialed twice.
+    return lead_state.claim(leads)
+
+def queue_campaign(agency_id: str) -> dict | None:
+    """
+    Claims the agency's next campaign leads (queued_night first) and queues
+    their dials. None if nothing could be queued because we're shutting down.
+    """
+    # 2. Leads left 'calling' by a process that died get back in line
+    lead_state.recover_stale(agency_id)
+
+    leads = claim_campaign_leads(agency_id)
+
     if not leads:
         return {"message": "No leads found for your agency."}
-    
-    # 5. Update queued_night leads to 'new' status so they're processed
-    if queued_leads:
-        lead_ids = [lead['id'] for lead in queued_leads]
-        supabase.table('leads').update({'status': 'new'}).in_('id', lead_ids).execute()
-        print(f"📞 Processing {len(queued_leads)} queued night leads + {len(new_leads)} new leads")
-    
-    # #region agent log
+
+    queued_count = sum(1 for lead in leads if lead['claimed_from'] == lead_state.QUEUED_NIGHT)
+    new_count = len(leads) - queued_count
+    if queued_count:
+        print(f"📞 Processing {queued_count} queued night leads + {new_count} new leads")
+
+    debug_log("call-debug", "J", "main.py:start_campaign:before_background_task", "About to start background task for calls", {
+        "leads_count": len(leads),
+        "queued_count": queued_count,
+        "new_count": new_count,
+    })
+
+    # 6. Queue the calls (dialer workers serve them by priority)
+    if queue_outbound_calls(leads) == 0 and not tracker.accepting:
+        return None
+
+    return {"message": f"Started calling {len(leads)} leads ({queued_count} queued + {new_count} new). Processing retries in background."}
+
+def feed_scheduled_campaign(agency_id: str, limit: int, window_opened: bool) -> int:
+    """
+    Queues up to `limit` campaign dials for an agency whose schedule window
+    is open (schedules.py). The first feed of a window also runs the
+    agency's due retries. Returns how many dials were queued.
+    """
+    if window_opened:
+        print(f"🗓️ Campaign window opened for Agency {agency_id}")
+        lead_state.recover_stale(agency_id)
+        process_call_retries(agency_id)
+    if limit <= 0:
+        return 0
+    return queue_outbound_calls(claim_campaign_leads(agency_id, limit))
+
+def run_handed_off_campaign(agency_id: str):
+    """A /start-campaign another node received, run here (shards.py heartbeat)."""
+    def campaign():
+        process_call_retries(agency_id)
+        result = queue_campaign(agency_id)
+        print(f"🧭 Handed-over campaign for Agency {agency_id}: {(result or {}).get('message', 'shutting down')}")
+
+    task = tracker.track("handed_off_campaign", campaign)
+    if task:
+        threading.Thread(target=task, name="handed-off-campaign", daemon=True).start()
+
+def owner_tick(agency_ids: set):
+    """Work other nodes handed to this one, every shard heartbeat."""
     try:
-        with open(log_path, "a") as f:
-            log_entry = {
-                "sessionId": "debug-session",
-                "runId": "call-debug",
-                "hypothesisId": "J",
-                "location": "main.py:start_campaign:before_background_task",
-                "message": "About to start background task for calls",
-                "data": {
-                    "leads_count": len(leads),
-                    "queued_count": len(queued_leads),
-                    "new_count": len(new_leads),
-                },
-                "timestamp": int(time.time() * 1000)
-            }
-            f.write(json.dumps(log_entry) + "\n")
+        pick_up_inbound_leads(agency_ids)
+    except Exception as e:
+        print(f"❌ Error picking up handed-over inbound leads: {e}")
+    try:
+        release_ended_calls()
     except Exception as e:
-        pass
-    # #endregion
-    
-    # 6. Loop and Call in the background
-    background_tasks.add_task(process_outbound_calls, leads)
-    
-    return {"message": f"Started calling {len(leads)} leads ({len(queued_leads)} queued + {len(new_leads)} new). Processing retries in background."}
+        print(f"❌ Error releasing caller-ID slots of ended calls: {e}")
+
+def pick_up_inbound_leads(agency_ids: set):
+    """Dials inbound leads that non-owner nodes saved as queued_inbound."""
+    if not agency_ids:
+        return
+    # Only our agencies' leads (oldest first): other shards' backlog can't
+    # fill the page and starve ours
+    owned = sorted(agency_ids)
+    rows = []
+    for i in range(0, len(owned), 200):
+        rows += supabase.table('leads').select('*').eq('status', lead_state.QUEUED_INBOUND) \
+            .in_('agency_id', owned[i:i + 200]).order('created_at').limit(500).execute().data or []
+    for lead in lead_state.claim(rows, to_status=lead_state.CALLING_INBOUND):
+        # Keep the 30s from when the lead came in, not from the handover
+        waited = 0.0
+        if lead.get('created_at'):
+            try:
+                created_at = datetime.fromisoformat(lead['created_at'].replace('Z', '+00:00'))
+                waited = (datetime.now(created_at.tzinfo) - created_at).total_seconds()
+            except ValueError:
+                pass
+        payload = inbound_call_payload(
+            lead['agency_id'], lead['id'], lead.get('name'), lead.get('phone_number'),
+            lead.get('address'), lead.get('preferred_language') or 'en',
+        )
+        if schedule_inbound_call(lead['agency_id'], lead['id'], payload, delay=max(0.0, INBOUND_DELAY_SECONDS - waited)):
+            metrics.inc("shard_handoffs_run", kind="inbound")
+
+def release_ended_calls():
+    """
+    Frees caller-ID slots of calls dialed here whose end-of-call-report was
+    delivered to another replica (it can't release our in-process slots).
+    """
+    call_ids = number_pool.bound_calls()
+    for i in range(0, len(call_ids), 200):
+        rows = supabase.table('call_logs').select('vapi_call_id, status').in_('vapi_call_id', call_ids[i:i + 200]).execute().data or []
+        for row in rows:
+            if row.get('status') not in LIVE_LOG_STATUSES:
+                number_pool.release_call(row['vapi_call_id'])
+
+# --- CAMPAIGN SCHEDULES ---
+
+@router.get("/campaign-schedules/{agency_id}")
+def list_campaign_schedules(agency_id: str):
+    """The agency's schedules, with next fire time and today's dial count where loaded here."""
+    rows = supabase.table('campaign_schedules').select('*').eq('agency_id', agency_id).order('created_at').execute().data or []
+    loaded = {entry['id']: entry for entry in campaign_scheduler.snapshot(agency_id)}
+    return {"schedules": [{**row, **loaded.get(str(row['id']), {})} for row in rows]}
+
+@router.post("/campaign-schedules/{agency_id}", status_code=201)
+def create_campaign_schedule(agency_id: str, request: CampaignScheduleRequest):
+    """Adds a recurring campaign window (days, local start/end time, daily dial cap)."""
+    try:
+        values = validate_schedule(request.days, request.start_time, request.end_time, request.daily_cap, request.timezone)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    row = supabase.table('campaign_schedules').insert({**values, 'agency_id': agency_id, 'enabled': True}).execute().data
+    campaign_scheduler.reload()
+    return row[0] if row else values
+
+@router.delete("/campaign-schedules/{agency_id}/{schedule_id}")
+def delete_campaign_schedule(agency_id: str, schedule_id: str):
+    deleted = supabase.table('campaign_schedules').delete().eq('id', schedule_id).eq('agency_id', agency_id).execute().data
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    campaign_scheduler.reload()
+    return {"status": "deleted", "id": schedule_id}
 
 # Add a simple health check endpoint
-@app.get("/")
+@router.get("/")
 def health_check():
     return {"status": "ok", "message": "Thavon Python Backend is healthy."}
+
+@router.get("/metrics")
+def get_metrics():
+    """In-process counters and gauges (cache effectiveness, queue depths...)."""
+    return metrics.snapshot()
+
+@router.post("/calls/reconcile", dependencies=[Depends(require_admin)])
+async def reconcile_calls(agency_id: str | None = None):
+    """
+    Checks calls stuck in a live status (lost end-of-call-report) against
+    Vapi now and repairs them, for one agency or (no agency_id) all of them.
+    Admin only: a pass spends the Vapi API rate limit and writes call logs
+    and leads. Returns how many were checked and repaired.
+    """
+    return await asyncio.to_thread(call_reconciler.run, agency_id)
+
+@router.get("/phone-numbers/utilization", dependencies=[Depends(require_admin)])
+def phone_number_utilization():
+    """Caller-ID pool slots in use per number (every agency's numbers - admin only)."""
+    return number_pool.snapshot()
+
+# --- PROFILING (ADMIN) ---
+# Folded stack output loads into flamegraph.pl / inferno / speedscope.
+
+@router.get("/debug/profile", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def sample_profile(seconds: float = 10.0, interval: float = 0.005):
+    """Wall-clock stack samples of every thread for `seconds` (folded, counts = samples)."""
+    try:
+        return await asyncio.to_thread(sampler.sample, seconds, max(0.001, interval))
+    except Busy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/debug/profiles", dependencies=[Depends(require_admin)])
+def list_request_profiles():
+    """Requests profiled with X-Profile-Token (most recent last)."""
+    return request_profiles.recent()
+
+@router.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+def get_request_profile(profile_id: str, format: str = "folded"):
+    """One request's cProfile: format=folded (us), text (top functions) or pstats (binary)."""
+    rendered = request_profiles.render(profile_id, format)
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "pstats":
+        return Response(rendered, media_type="application/octet-stream",
+                        headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'})
+    return PlainTextResponse(rendered)
+
+@router.get("/debug/loop", dependencies=[Depends(require_admin)])
+def event_loop_report():
+    """Event loop lag percentiles and the stacks of recent slow callbacks."""
+    return loop_monitor.snapshot()
+
+@router.get("/debug/sections", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+def section_report(reset: bool = False):
+    """Self time (us) per nested section path, e.g. webhooks_inbound;supabase."""
+    return section_folded(reset)
+
+
+# --- DO-NOT-CALL / OPT-OUT SUPPRESSION ---
+# Admin only, agency lists included: removing a number makes the dialer
+# call it again, and the check endpoint would reveal who opted out.
+
+def suppression_region(agency_id: str | None, region: str | None) -> str | None:
+    # Global lists only read national numbers when the admin names the country
+    if region:
+        return region.upper()
+    return get_agency_region(agency_id) if agency_id else None
+
+def add_suppression(agency_id: str | None, request: SuppressionRequest, region: str | None) -> dict:
+    phone = normalize_phone(request.phone_number, suppression_region(agency_id, region))
+    if not phone:
+        raise HTTPException(status_code=400, detail="Invalid phone number")
+    suppression.add([phone], agency_id, source="manual", reason=request.reason)
+    print(f"🚫 {phone[:6]}*** suppressed ({'Agency ' + agency_id if agency_id else 'global list'})")
+    return {"status": "suppressed", "phone_number": phone}
+
+def remove_suppression(agency_id: str | None, phone_number: str, region: str | None) -> dict:
+    phone = normalize_phone(phone_number, suppression_region(agency_id, region))
+    if not phone or not suppression.remove(phone, agency_id):
+        raise HTTPException(status_code=404, detail="Number is not suppressed")
+    return {"status": "removed", "phone_number": phone}
+
+async def upload_suppressions(agency_id: str | None, request: Request, background_tasks: BackgroundTasks,
+                              region: str | None, source: str) -> dict:
+    """Spools a numbers file (one per line or first CSV column) and suppresses them in the background."""
+    if not tracker.accepting:
+        raise HTTPException(status_code=503, detail="Server is shutting down, retry shortly", headers={"Retry-After": "30"})
+    try:
+        path, size, file_format = await spool_upload(request.stream(), get_settings().suppression_upload_max_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if size == 0 or file_format != "csv":
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail="Upload a CSV or plain text file of phone numbers")
+
+    job = suppression.create_job(agency_id, await asyncio.to_thread(suppression_region, agency_id, region), source)
+    job.bytes_received = size
+    task = tracker.track("suppression_upload", suppression.run_bulk_load, job, path)
+    if task is None:
+        os.unlink(path)
+        raise HTTPException(status_code=503, detail="Server is shutting down, retry shortly", headers={"Retry-After": "30"})
+    background_tasks.add_task(task)
+    print(f"🚫 Suppression upload {job.id} queued ({'Agency ' + agency_id if agency_id else 'global list'}, {size} bytes)")
+    return {"status": "queued", "job_id": job.id, "bytes": size}
+
+@router.post("/suppression/global", dependencies=[Depends(require_admin)])
+def suppress_globally(request: SuppressionRequest, region: str | None = None):
+    return add_suppression(None, request, region)
+
+@router.delete("/suppression/global/{phone_number}", dependencies=[Depends(require_admin)])
+def unsuppress_globally(phone_number: str, region: str | None = None):
+    return remove_suppression(None, phone_number, region)
+
+@router.post("/suppression/global/bulk", status_code=202, dependencies=[Depends(require_admin)])
+async def upload_global_suppressions(request: Request, background_tasks: BackgroundTasks, region: str | None = None,
+                                     source: str = "dnc_registry"):
+    """Bulk-loads a DNC registry file into the global list (`region`: country of national numbers)."""
+    return await upload_suppressions(None, request, background_tasks, region, source)
+
+@router.get("/suppression/jobs/{job_id}", dependencies=[Depends(require_admin)])
+def suppression_upload_status(job_id: str):
+    job = suppression.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job.as_dict()
+
+@router.get("/suppression/check", dependencies=[Depends(require_admin)])
+def check_suppression(phone: str, agency_id: str | None = None, region: str | None = None):
+    """Whether a number may be dialed for an agency."""
+    normalized = normalize_phone(phone, suppression_region(agency_id, region))
+    if not normalized:
+        raise HTTPException(status_code=400, detail="Invalid phone number")
+    return {"phone_number": normalized, "suppressed": suppression.is_suppressed(normalized, agency_id)}
+
+@router.post("/suppression/{agency_id}", dependencies=[Depends(require_admin)])
+def suppress_for_agency(agency_id: str, request: SuppressionRequest, region: str | None = None):
+    """Opts a number out of the agency's calls."""
+    return add_suppression(agency_id, request, region)
+
+@router.delete("/suppression/{agency_id}/{phone_number}", dependencies=[Depends(require_admin)])
+def unsuppress_for_agency(agency_id: str, phone_number: str, region: str | None = None):
+    return remove_suppression(agency_id, phone_number, region)
+
+@router.post("/suppression/{agency_id}/bulk", status_code=202, dependencies=[Depends(require_admin)])
+async def upload_agency_suppressions(agency_id: str, request: Request, background_tasks: BackgroundTasks,
+                                     region: str | None = None, source: str = "upload"):
+    """Bulk-loads an agency's opt-out list. Poll GET /suppression/jobs/{job_id}."""
+    return await upload_suppressions(agency_id, request, background_tasks, region, source)
+
+
+# --- APPLICATION FACTORY ---
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup/shutdown hooks (graceful drain of background tasks)."""
+    settings = get_settings()
+    tracker.reset()
+    install_signal_handlers()
+    assistant_cache.ttl_seconds = settings.assistant_cache_ttl_seconds
+    number_pool.slot_timeout_seconds = settings.call_slot_timeout_seconds
+    vapi_limiter.configure(settings.vapi_max_concurrency)
+    admission.configure(settings)
+    admission.backlog = lambda: dialer.queue.expedited_backlog()
+    retry_timer.timezone_of = get_agency_timezone
+    admission.start()
+    loop_monitor.start(settings.slow_callback_seconds)
+    dialer.start(settings.dialer_workers)
+    shards.configure(settings)
+    shards.on_campaign = run_handed_off_campaign
+    shards.on_tick = owner_tick
+    shards.pending = lambda agency_id: dialer.queue.pending(agency_id)
+    shards.drop = dialer.drop_agency
+    dialer.may_dial = shards.may_dial
+    shards.start()
+    suppression.configure(settings)
+    suppression.start()
+    campaign_scheduler.configure(settings)
+    campaign_scheduler.feed = feed_scheduled_campaign
+    campaign_scheduler.owns = shards.owns
+    campaign_scheduler.pending = lambda agency_id: dialer.queue.pending(agency_id)
+    campaign_scheduler.slots = lambda agency_id: dialer.shares(agency_id)[1] or settings.dialer_workers
+    campaign_scheduler.start()
+    call_events.flush_seconds = settings.call_event_flush_seconds
+    call_events.flush_size = settings.call_event_flush_size
+    call_events.start()
+    summary_worker.configure(settings)
+    summary_worker.start()
+    notification_worker.configure(settings)
+    notification_worker.start()
+    call_reconciler.configure(settings)
+    call_reconciler.start()
+    debug_log("startup", "S", "main.py:lifespan:env_check", "Environment variables check at startup", {
+        "SUPABASE_URL_set": settings.supabase_url is not None,
+        "SUPABASE_SERVICE_ROLE_KEY_set": settings.supabase_key is not None,
+        "vapi_keys": [k[0] for k in settings.vapi_keys],
+        "VAPI_PHONE_NUMBER_ID_set": settings.vapi_phone_number_id is not None,
+    })
+
+    yield
+
+    # Stop new background work and wait for in-flight tasks to hand off
+    tracker.begin_shutdown()
+    await asyncio.to_thread(campaign_scheduler.stop)
+    await asyncio.to_thread(dialer.stop)
+    await asyncio.to_thread(call_reconciler.stop)
+    await asyncio.to_thread(suppression.stop)
+    drained = await asyncio.to_thread(tracker.wait_idle, settings.shutdown_grace_seconds)
+    if drained:
+        print("✅ All background tasks finished before shutdown")
+    else:
+        print(f"⚠️ Shutdown deadline reached with tasks still running: {tracker.snapshot()}")
+    # Hand this node's agencies to the others right away
+    await asyncio.to_thread(shards.stop)
+    await admission.stop()
+    await loop_monitor.stop()
+    await summary_worker.stop(timeout=min(10.0, settings.shutdown_grace_seconds))
+    dropped = await asyncio.to_thread(notification_worker.stop, min(10.0, settings.shutdown_grace_seconds))
+    if dropped:
+        print(f"⚠️ Shutdown: {dropped} lead follow-up messages not sent")
+    flushed = await asyncio.to_thread(call_events.stop)
+    if flushed:
+        print(f"   -> 💾 Shutdown: flushed {flushed} buffered call updates")
+    close_debug_log()
+
+
+def create_app(settings: Settings | None = None, supabase_client=None) -> FastAPI:
+    """
+    Builds the FastAPI app. Pass `settings` and/or `supabase_client` to run
+    against local fakes (tests, benchmarks) instead of the environment.
+    """
+    if settings is not None:
+        configure(settings)
+    if supabase_client is not None:
+        set_supabase(supabase_client)
+
+    app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+    # --- FIX CORS (ALLOW VERCEL TO TALK TO RAILWAY) ---
+    # SECURITY: Restrict CORS to specific origins (all origins outside production)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=get_settings().cors_origins,
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "PUT", "DELETE"],
+        allow_headers=["Content-Type", "Authorization", "X-Webhook-Signature"],
+    )
+
+    # Per-request cProfile for requests carrying X-Profile-Token
+    app.add_middleware(ProfileMiddleware, token=lambda: get_settings().admin_token)
+
+    app.include_router(router)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,7 @@
+-- Streaming exports (exports.py)
+-- Leads and call logs are exported in keyset pages:
+--   WHERE agency_id = $1 AND id > $last ORDER BY id LIMIT $page
+-- which these indexes turn into one index range scan per page.
+
+CREATE INDEX IF NOT EXISTS idx_leads_agency_id_id ON leads(agency_id, id);
+CREATE INDEX IF NOT EXISTS idx_call_logs_agency_id_id ON call_logs(agency_id, id);
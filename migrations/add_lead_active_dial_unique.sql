@@ -0,0 +1,20 @@
+-- At most one lead per (agency, phone number) in a dialing state
+-- The inbound webhook checks for a call in progress before inserting its
+-- lead, but two concurrent re-submissions (Zapier retries, double form
+-- posts) can both pass the check. This index makes the second insert or
+-- claim fail with unique_violation (23505), which the backend treats as
+-- "already being dialed" (lead_state.is_unique_violation).
+
+-- Duplicates already in a dialing state go back in line (keeps the newest)
+UPDATE leads SET status = 'queued_night', updated_at = NOW()
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY agency_id, phone_number ORDER BY updated_at DESC, id) AS n
+        FROM leads
+        WHERE status IN ('calling', 'calling_inbound', 'queued_inbound')
+    ) active
+    WHERE n > 1
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leads_active_dial ON leads(agency_id, phone_number)
+WHERE status IN ('calling', 'calling_inbound', 'queued_inbound');
@@ -0,0 +1,15 @@
+-- Support atomic lead claims before dialing (see lead_state.py)
+-- The backend moves a lead to 'calling' with a conditional update
+-- (WHERE id IN (...) AND status = <expected>) before every campaign or retry
+-- dial, and recovers claims older than an hour by updated_at.
+
+ALTER TABLE leads
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+
+-- Campaign selection and stale-claim recovery filter by agency and status
+CREATE INDEX IF NOT EXISTS idx_leads_agency_status ON leads(agency_id, status);
+
+-- Inbound checks for a call already in progress to the same number
+CREATE INDEX IF NOT EXISTS idx_leads_agency_phone ON leads(agency_id, phone_number);
+
+COMMENT ON COLUMN leads.status IS 'new, queued_night, calling (claimed by the dialer), calling_inbound, or a call outcome set by the Vapi webhook (called, no_answer, callback, voicemail, appointment_booked, ...)';
@@ -0,0 +1,7 @@
+-- Leads whose phone number can't be read in the agency's region
+-- The dialer normalizes every number with the agency's region (from its
+-- timezone) before claiming it; numbers that stay invalid move to the
+-- terminal status 'invalid_number' instead of going back to 'new', where
+-- they would be selected again on every campaign batch.
+
+COMMENT ON COLUMN leads.status IS 'new, queued_night, queued_inbound (handed to the owning replica), calling (claimed by the dialer), calling_inbound, do_not_call (number suppressed, never dialed), invalid_number (not a valid number in the agency''s region, never dialed), or a call outcome set by the Vapi webhook (called, no_answer, callback, voicemail, appointment_booked, ...)';
@@ -0,0 +1,12 @@
+-- Allow live call states in call_logs.status
+-- The backend's write-behind buffer (call_events.py) upserts status-update
+-- and transcript-update events while a call is running, before the
+-- end-of-call-report sets the final outcome.
+
+ALTER TABLE call_logs DROP CONSTRAINT IF EXISTS call_logs_status_check;
+
+ALTER TABLE call_logs
+ADD CONSTRAINT call_logs_status_check
+CHECK (status IN ('queued', 'ringing', 'in_progress', 'completed', 'no_answer', 'busy', 'failed', 'cancelled'));
+
+COMMENT ON COLUMN call_logs.status IS 'queued, ringing, in_progress while the call is live; completed, no_answer, busy, failed or cancelled once it ended';
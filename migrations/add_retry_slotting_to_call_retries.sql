@@ -0,0 +1,14 @@
+-- Answer-rate-aware retry timing
+-- The backend (retry_timing.py) moves each new pending call_retries row to
+-- the office hour with the best answer rate for its agency, once, and
+-- records when it did so here.
+
+ALTER TABLE call_retries
+ADD COLUMN IF NOT EXISTS slotted_at TIMESTAMPTZ;
+
+COMMENT ON COLUMN call_retries.slotted_at IS 'When the backend picked this retry''s scheduled_at from answer-rate history (NULL = not yet)';
+
+-- Keyset scan of the retries still to be timed
+CREATE INDEX IF NOT EXISTS idx_call_retries_unslotted
+ON call_retries(agency_id, id)
+WHERE status = 'pending' AND slotted_at IS NULL;
@@ -0,0 +1,9 @@
+-- Add subscription tier to agencies for fair dial scheduling
+-- The dialer shares Vapi capacity between agencies by tier weight and caps
+-- how many calls each agency can have in flight (see dialer.py TIER_SHARES)
+
+ALTER TABLE agencies
+ADD COLUMN IF NOT EXISTS subscription_tier TEXT NOT NULL DEFAULT 'standard'
+CHECK (subscription_tier IN ('starter', 'standard', 'pro', 'enterprise'));
+
+COMMENT ON COLUMN agencies.subscription_tier IS 'Plan tier: sets the agency''s dialer weight and concurrent call cap (starter, standard, pro, enterprise)';
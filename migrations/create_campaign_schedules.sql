@@ -0,0 +1,29 @@
+-- Recurring campaign schedules per agency
+-- While a schedule's window is open the backend keeps the agency's dial
+-- queue topped up, up to daily_cap dials per local day (schedules.py).
+
+CREATE TABLE IF NOT EXISTS campaign_schedules (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    agency_id UUID NOT NULL REFERENCES agencies(id) ON DELETE CASCADE,
+    days SMALLINT[] NOT NULL,
+    start_time TIME NOT NULL,
+    end_time TIME NOT NULL,
+    daily_cap INTEGER NOT NULL CHECK (daily_cap > 0),
+    timezone TEXT,
+    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+    dialed_on DATE,
+    dialed_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CHECK (start_time < end_time),
+    CHECK (days <@ ARRAY[1, 2, 3, 4, 5, 6, 7]::SMALLINT[])
+);
+
+COMMENT ON COLUMN campaign_schedules.days IS 'ISO weekdays the window is open (1 = Monday ... 7 = Sunday)';
+COMMENT ON COLUMN campaign_schedules.start_time IS 'Window start, local time in timezone (within office hours 08:00-21:00)';
+COMMENT ON COLUMN campaign_schedules.timezone IS 'IANA timezone; NULL = the agency''s timezone';
+COMMENT ON COLUMN campaign_schedules.dialed_count IS 'Dials queued on dialed_on (local date), counted against daily_cap';
+
+-- Agency listing; the scheduler loads every enabled schedule
+CREATE INDEX IF NOT EXISTS idx_campaign_schedules_agency ON campaign_schedules(agency_id);
+CREATE INDEX IF NOT EXISTS idx_campaign_schedules_enabled ON campaign_schedules(id) WHERE enabled;
@@ -0,0 +1,32 @@
+-- Agency sharding across backend replicas
+-- Each replica heartbeats into dialer_nodes; an agency is dialed only by the
+-- node holding its agency_leases row (shards.py). Leases expire when their
+-- owner stops renewing them, so a crashed node's agencies fail over.
+
+CREATE TABLE IF NOT EXISTS dialer_nodes (
+    node_id TEXT PRIMARY KEY,
+    heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS agency_leases (
+    agency_id UUID PRIMARY KEY REFERENCES agencies(id) ON DELETE CASCADE,
+    node_id TEXT,
+    expires_at TIMESTAMPTZ,
+    campaign_requested_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON COLUMN agency_leases.node_id IS 'Replica dialing this agency (NULL = free)';
+COMMENT ON COLUMN agency_leases.campaign_requested_at IS 'Set when /start-campaign reached a replica that does not own the agency; the owner runs the campaign and clears it';
+
+-- Renewal of a node's leases, live-node lookup
+CREATE INDEX IF NOT EXISTS idx_agency_leases_node ON agency_leases(node_id);
+CREATE INDEX IF NOT EXISTS idx_dialer_nodes_heartbeat ON dialer_nodes(heartbeat_at);
+
+-- Inbound leads saved by a non-owner, picked up by the owner
+CREATE INDEX IF NOT EXISTS idx_leads_queued_inbound
+ON leads(agency_id)
+WHERE status = 'queued_inbound';
+
+COMMENT ON COLUMN leads.status IS 'new, queued_night, queued_inbound (handed to the owning replica), calling (claimed by the dialer), calling_inbound, or a call outcome set by the Vapi webhook (called, no_answer, callback, voicemail, appointment_booked, ...)';
@@ -0,0 +1,27 @@
+-- Batched write of live call state that never overwrites a finished call
+-- call_events.py flushes the buffered status/transcript of many calls at
+-- once. A plain upsert could land after the frontend (or another replica)
+-- wrote the call's final row from its end-of-call-report and set it back
+-- to 'in_progress'; here a row whose status is no longer live is left as is.
+-- Returns the number of rows inserted or updated.
+
+CREATE OR REPLACE FUNCTION flush_call_events(events JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH written AS (
+        INSERT INTO call_logs (vapi_call_id, agency_id, lead_id, status, transcript, updated_at)
+        SELECT e.vapi_call_id, e.agency_id, e.lead_id, e.status, e.transcript, e.updated_at
+        FROM jsonb_to_recordset(events)
+            AS e(vapi_call_id TEXT, agency_id UUID, lead_id UUID, status TEXT, transcript TEXT, updated_at TIMESTAMPTZ)
+        ON CONFLICT (vapi_call_id) DO UPDATE
+        SET status = EXCLUDED.status,
+            transcript = EXCLUDED.transcript,
+            updated_at = EXCLUDED.updated_at
+        WHERE call_logs.status IN ('queued', 'ringing', 'in_progress')
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM written;
+$$;
+
+GRANT EXECUTE ON FUNCTION flush_call_events(JSONB) TO service_role;
@@ -0,0 +1,39 @@
+-- Caller-ID pool: Vapi phone numbers the dialer can call from
+-- agency_id NULL = shared (global) number used by agencies without their own
+-- max_concurrent = simultaneous calls the number/carrier allows
+
+CREATE TABLE IF NOT EXISTS phone_numbers (
+  id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+  agency_id UUID REFERENCES agencies(id) ON DELETE CASCADE,
+  vapi_phone_number_id TEXT NOT NULL UNIQUE, -- ID from the Vapi dashboard
+  number TEXT NOT NULL, -- E.164, used for local-presence (area code) matching
+  max_concurrent INTEGER NOT NULL DEFAULT 1 CHECK (max_concurrent >= 1),
+  active BOOLEAN NOT NULL DEFAULT TRUE,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_phone_numbers_agency_id ON phone_numbers(agency_id);
+CREATE INDEX IF NOT EXISTS idx_phone_numbers_active ON phone_numbers(active);
+
+COMMENT ON TABLE phone_numbers IS 'Caller-ID pool for outbound dials; rows with agency_id NULL are shared by all agencies';
+
+-- Enable RLS
+ALTER TABLE phone_numbers ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Agencies can view their own phone numbers" ON phone_numbers;
+DROP POLICY IF EXISTS "Service role has full access" ON phone_numbers;
+
+CREATE POLICY "Agencies can view their own phone numbers"
+  ON phone_numbers FOR SELECT
+  USING (
+    agency_id IN (
+      SELECT agency_id FROM agency_members
+      WHERE user_id = auth.uid()
+    )
+  );
+
+CREATE POLICY "Service role has full access"
+  ON phone_numbers FOR ALL
+  USING (true)
+  WITH CHECK (true);
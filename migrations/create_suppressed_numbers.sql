@@ -0,0 +1,29 @@
+-- Do-not-call / opt-out suppression lists
+-- agency_id NULL = the global list (national DNC registries), applied to
+-- every agency. Each replica keeps every live row in memory (suppression.py)
+-- and checks it before each dial; removals are soft (removed_at) so other
+-- replicas see them through the updated_at sync.
+
+CREATE TABLE IF NOT EXISTS suppressed_numbers (
+    id BIGSERIAL PRIMARY KEY,
+    agency_id UUID REFERENCES agencies(id) ON DELETE CASCADE,
+    phone_number TEXT NOT NULL,
+    number BIGINT NOT NULL,
+    source TEXT NOT NULL DEFAULT 'manual',
+    reason TEXT,
+    removed_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CHECK (number = substr(phone_number, 2)::BIGINT),
+    UNIQUE NULLS NOT DISTINCT (agency_id, number)
+);
+
+COMMENT ON COLUMN suppressed_numbers.agency_id IS 'NULL = global list (admin only)';
+COMMENT ON COLUMN suppressed_numbers.number IS 'E.164 digits as an integer (phone_number without the +)';
+COMMENT ON COLUMN suppressed_numbers.source IS 'manual, upload, dnc_registry, inbound opt-out...';
+
+-- Startup load (live rows by number) and the incremental sync (changes since a cursor)
+CREATE INDEX IF NOT EXISTS idx_suppressed_numbers_live ON suppressed_numbers(number, id) WHERE removed_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_suppressed_numbers_updated ON suppressed_numbers(updated_at, id);
+
+COMMENT ON COLUMN leads.status IS 'new, queued_night, queued_inbound (handed to the owning replica), calling (claimed by the dialer), calling_inbound, do_not_call (number suppressed, never dialed), or a call outcome set by the Vapi webhook (called, no_answer, callback, voicemail, appointment_booked, ...)';
@@ -0,0 +1,261 @@
+# notifications.py - SMS/WhatsApp follow-ups to leads via Twilio
+#
+# Call outcomes (no answer, appointment booked) queue a follow-up message to
+# the lead. A single dispatcher thread drains the queue in batches and hands
+# each message to a small sender pool sharing one pooled Twilio client
+# (keep-alive connections instead of a TLS handshake per message):
+#   - every sender number has a token bucket (TWILIO_MESSAGES_PER_SECOND),
+#     so a campaign's worth of no-answers can't exceed Twilio's per-number
+#     limit and get queued or filtered on their side,
+#   - each lead gets a given kind of message at most once per
+#     DEDUPE_SECONDS (repeated reports, retries of the same lead),
+#   - 429s and 5xx are retried with backoff; other errors are dropped.
+# Without Twilio credentials notify() is a no-op. Tests point
+# TWILIO_BASE_URL at benchmarks.fakes.TwilioStub.
+
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+from admission import TokenBucket
+from metrics import metrics
+
+BATCH_SIZE = 50
+DEDUPE_SECONDS = 24 * 3600.0
+DEDUPE_MAX_KEYS = 100000
+MAX_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 2.0
+
+# Vapi endedReason values that mean we never spoke to the lead
+NO_ANSWER_REASONS = frozenset(['customer-did-not-answer', 'customer-busy', 'voicemail'])
+
+TEMPLATES = {
+    'no_answer': (
+        "Hi {name}, we just tried to call you about your property. "
+        "We'll try again soon - or reply here with a time that suits you."
+    ),
+    'appointment_booked': (
+        "Hi {name}, your viewing is booked for {time}. "
+        "Reply to this message if you need to change it."
+    ),
+}
+# WhatsApp for confirmations when a WhatsApp sender is configured, SMS otherwise
+PREFERRED_CHANNEL = {
+    'no_answer': 'sms',
+    'appointment_booked': 'whatsapp',
+}
+
+
+@dataclass
+class Notification:
+    kind: str  # key of TEMPLATES
+    to: str  # E.164
+    body: str
+    channel: str  # 'sms' or 'whatsapp'
+    key: str  # dedupe key
+    attempts: int = 0
+    not_before: float = 0.0
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class NotificationWorker:
+    def __init__(self, messages_per_second: float = 1.0, senders: int = 4):
+        self.messages_per_second = messages_per_second
+        self.senders = senders
+        self.client = None
+        self.from_numbers = {}  # channel -> sender address
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._recent = OrderedDict()  # dedupe key -> expires_at
+        self._buckets = {}  # sender address -> TokenBucket
+        self._executor = None
+        self._thread = None
+        self._deadline = None  # set by stop(): drain until then
+
+        metrics.gauge("notification_queue_depth", lambda: len(self._queue))
+
+    def configure(self, settings):
+        self.client = None
+        self.from_numbers = {}
+        if not (settings.twilio_account_sid and settings.twilio_auth_token):
+            return
+        # One client, one pooled HTTP session for every message
+        self.client = Client(
+            settings.twilio_account_sid, settings.twilio_auth_token,
+            http_client=TwilioHttpClient(pool_connections=True, timeout=10),
+        )
+        if settings.twilio_base_url:
+            self.client.api.base_url = settings.twilio_base_url.rstrip('/')
+        if settings.twilio_sms_number:
+            self.from_numbers['sms'] = settings.twilio_sms_number
+        if settings.twilio_whatsapp_number:
+            number = settings.twilio_whatsapp_number
+            self.from_numbers['whatsapp'] = number if number.startswith('whatsapp:') else f"whatsapp:{number}"
+        self.messages_per_second = settings.twilio_messages_per_second
+        self.senders = settings.notification_senders
+        self._buckets = {}
+
+    # --- queueing ---
+
+    def notify(self, kind: str, lead_key: str, phone: str | None, name: str | None = None, **fields) -> bool:
+        """
+        Queues a follow-up to a lead. False if it isn't sent: no Twilio
+        setup, no number, or the lead already got this kind of message.
+        """
+        if self.client is None or not phone or kind not in TEMPLATES:
+            return False
+        channel = PREFERRED_CHANNEL[kind]
+        if channel not in self.from_numbers:
+            channel = 'sms' if 'sms' in self.from_numbers else 'whatsapp'
+        if channel not in self.from_numbers:
+            return False
+
+        key = f"{kind}:{lead_key or phone}"
+        now = time.monotonic()
+        with self._cond:
+            expires_at = self._recent.get(key)
+            if expires_at is not None and expires_at > now:
+                metrics.inc("notifications", kind=kind, result="deduped")
+                return False
+            self._recent[key] = now + DEDUPE_SECONDS
+            self._recent.move_to_end(key)
+            while len(self._recent) > DEDUPE_MAX_KEYS:
+                self._recent.popitem(last=False)
+
+            body = TEMPLATES[kind].format(name=name or "there", time=fields.get('time') or "the agreed time")
+            to = f"whatsapp:{phone}" if channel == 'whatsapp' else phone
+            self._queue.append(Notification(kind, to, body, channel, key))
+            self._cond.notify()
+        metrics.inc("notifications", kind=kind, result="queued")
+        return True
+
+    # --- sending ---
+
+    def _throttle(self, sender: str) -> float:
+        bucket = self._buckets.get(sender)
+        if bucket is None:
+            bucket = self._buckets[sender] = TokenBucket(self.messages_per_second, max(1.0, self.messages_per_second))
+        return bucket.take(time.monotonic())
+
+    def _send(self, note: Notification):
+        sender = self.from_numbers[note.channel]
+        start = time.perf_counter()
+        try:
+            self.client.messages.create(to=note.to, from_=sender, body=note.body)
+        except TwilioRestException as e:
+            metrics.inc("notification_errors", status=e.status, channel=note.channel)
+            if (e.status == 429 or e.status >= 500) and note.attempts + 1 < MAX_ATTEMPTS:
+                self._retry(note)
+                return
+            print(f"❌ Twilio rejected {note.kind} {note.channel} to {note.to[-4:]}: {e.status} {e.msg}")
+            self._forget(note)
+            return
+        except Exception as e:
+            metrics.inc("notification_errors", status="connection", channel=note.channel)
+            if note.attempts + 1 < MAX_ATTEMPTS:
+                self._retry(note)
+                return
+            print(f"❌ Error sending {note.kind} {note.channel}: {e}")
+            self._forget(note)
+            return
+        metrics.observe("notification_send_seconds", time.perf_counter() - start, channel=note.channel)
+        metrics.observe("notification_latency_seconds", time.monotonic() - note.enqueued_at, kind=note.kind)
+        metrics.inc("notifications_sent", channel=note.channel, kind=note.kind)
+
+    def _retry(self, note: Notification):
+        note.attempts += 1
+        note.not_before = time.monotonic() + RETRY_BASE_SECONDS * 2 ** note.attempts
+        with self._cond:
+            self._queue.append(note)
+            self._cond.notify()
+
+    def _forget(self, note: Notification):
+        # A failed message may be sent again by a later outcome
+        with self._cond:
+            self._recent.pop(note.key, None)
+
+    def _past_deadline(self) -> bool:
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+    def _pause(self, seconds: float):
+        """Sleeps, but not past stop()'s deadline (stop() wakes us to check)."""
+        with self._cond:
+            if self._deadline is not None:
+                seconds = min(seconds, self._deadline - time.monotonic())
+            if seconds > 0:
+                self._cond.wait(seconds)
+
+    def _next_batch(self) -> list | None:
+        """Up to BATCH_SIZE due messages; None once stopped and drained (or out of time)."""
+        with self._cond:
+            while not self._queue:
+                if self._deadline is not None:
+                    return None
+                self._cond.wait()
+            if self._past_deadline():
+                return None
+            now = time.monotonic()
+            batch, later = [], []
+            while self._queue and len(batch) < BATCH_SIZE:
+                note = self._queue.popleft()
+                (batch if note.not_before <= now else later).append(note)
+            self._queue.extend(later)
+            if not batch:
+                # Only retries waiting out their backoff
+                self._cond.wait(min(note.not_before for note in later) - now)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            futures = []
+            for i, note in enumerate(batch):
+                sender = self.from_numbers[note.channel]
+                while (delay := self._throttle(sender)) > 0 and not self._past_deadline():
+                    metrics.observe("notification_throttle_seconds", delay)
+                    self._pause(delay)
+                if self._past_deadline():
+                    # Out of shutdown time - stop() counts the rest as dropped
+                    with self._cond:
+                        self._queue.extendleft(reversed(batch[i:]))
+                    break
+                futures.append(self._executor.submit(self._send, note))
+            wait(futures)
+            metrics.inc("notification_batches")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._deadline = None
+        self._executor = ThreadPoolExecutor(max_workers=self.senders, thread_name_prefix="notify")
+        self._thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float) -> int:
+        """Sends what fits in `timeout`; returns how many messages were dropped."""
+        with self._cond:
+            self._deadline = time.monotonic() + timeout
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout + 10)  # + one batch of Twilio requests in flight
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        with self._cond:
+            dropped = len(self._queue)
+            self._queue.clear()
+        if dropped:
+            metrics.inc("notifications_dropped", dropped)
+        return dropped
+
+
+notification_worker = NotificationWorker()
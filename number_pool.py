@@ -0,0 +1,231 @@
+# number_pool.py - Caller-ID pool with per-number concurrency slots
+#
+# Dialing everything from one VAPI_PHONE_NUMBER_ID caps concurrency at what
+# that number allows and burns its reputation. Numbers live in the
+# `phone_numbers` table (per agency, or shared when agency_id is NULL), each
+# with `max_concurrent` slots. A dial leases a free slot, preferring the
+# number that shares the most leading digits with the customer (local
+# presence); the slot is bound to the Vapi call id and released when the
+# end-of-call-report arrives.
+#
+# Slots are tracked in-process. Leases whose end-of-call-report never shows
+# up are reclaimed after `slot_timeout_seconds`.
+
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+
+from config import get_settings
+from db import supabase
+from lifecycle import tracker
+from metrics import metrics
+
+REFRESH_SECONDS = 60.0
+# Longest prefix compared for local presence: '+' + up to 5 digits covers
+# NANP area codes (+1415) and most European area/mobile prefixes (+33 1, +352 6).
+LOCAL_PRESENCE_CHARS = 6
+
+
+@dataclass
+class PoolNumber:
+    vapi_phone_number_id: str
+    number: str
+    agency_id: str | None
+    max_concurrent: int
+    in_use: int = 0
+
+    @property
+    def free(self) -> int:
+        return self.max_concurrent - self.in_use
+
+
+@dataclass
+class Lease:
+    phone_number_id: str
+    pooled: bool = True  # False = fallback VAPI_PHONE_NUMBER_ID, not slot-limited
+    key: str = ""
+    acquired_at: float = field(default_factory=time.monotonic)
+
+
+def _shared_prefix(a: str, b: str) -> int:
+    n = 0
+    for x, y in zip(a[:LOCAL_PRESENCE_CHARS], b[:LOCAL_PRESENCE_CHARS]):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class NumberPool:
+    def __init__(self, slot_timeout_seconds: float = 1800.0):
+        self.slot_timeout_seconds = slot_timeout_seconds
+        self._cond = threading.Condition()
+        self._numbers = {}  # vapi_phone_number_id -> PoolNumber
+        self._leases = {}  # call id (or provisional key) -> Lease
+        self._loaded_at = None
+        self._refreshing = False
+        self._keys = itertools.count()
+
+        metrics.gauge("phone_pool_slots_total", lambda: sum(n.max_concurrent for n in self._numbers.values()))
+        metrics.gauge("phone_pool_slots_in_use", lambda: sum(n.in_use for n in self._numbers.values()))
+
+    # --- pool contents ---
+
+    def load(self, rows: list):
+        """Replaces the configured numbers, keeping slot counts of numbers still present."""
+        with self._cond:
+            numbers = {}
+            for row in rows:
+                number_id = row.get('vapi_phone_number_id')
+                if not number_id:
+                    continue
+                previous = self._numbers.get(number_id)
+                numbers[number_id] = PoolNumber(
+                    vapi_phone_number_id=number_id,
+                    number=row.get('number') or "",
+                    agency_id=row.get('agency_id'),
+                    max_concurrent=max(1, int(row.get('max_concurrent') or 1)),
+                    in_use=previous.in_use if previous else 0,
+                )
+            # Leases on removed numbers still release cleanly (they just stop counting)
+            self._numbers = numbers
+            self._loaded_at = time.monotonic()
+            self._cond.notify_all()
+
+    def refresh(self, force: bool = False):
+        with self._cond:
+            stale = self._loaded_at is None or time.monotonic() - self._loaded_at > REFRESH_SECONDS
+            if not (force or stale) or self._refreshing:
+                return
+            self._refreshing = True
+        try:
+            response = supabase.table('phone_numbers').select('vapi_phone_number_id, number, agency_id, max_concurrent').eq('active', True).execute()
+            self.load(response.data or [])
+        except Exception as e:
+            print(f"⚠️ Could not load phone number pool: {e}")
+            with self._cond:
+                # Retry on the next acquire instead of hammering the DB
+                self._loaded_at = time.monotonic() - REFRESH_SECONDS + 5
+        finally:
+            with self._cond:
+                self._refreshing = False
+
+    # --- leasing ---
+
+    def _candidates(self, agency_id: str | None) -> list:
+        own = [n for n in self._numbers.values() if n.agency_id is not None and str(n.agency_id) == str(agency_id)]
+        return own or [n for n in self._numbers.values() if n.agency_id is None]
+
+    def _pick(self, candidates: list, customer_number: str | None, local_presence: bool) -> PoolNumber | None:
+        free = [n for n in candidates if n.free > 0]
+        if not free:
+            return None
+        if local_presence and customer_number:
+            return max(free, key=lambda n: (_shared_prefix(n.number, customer_number), n.free / n.max_concurrent))
+        return max(free, key=lambda n: n.free / n.max_concurrent)
+
+    def _reap_expired(self):
+        cutoff = time.monotonic() - self.slot_timeout_seconds
+        for key, lease in list(self._leases.items()):
+            if lease.acquired_at < cutoff:
+                print(f"⚠️ Reclaiming caller-ID slot held by {key} (no end-of-call-report)")
+                self._release(key)
+                metrics.inc("phone_pool_slots_reclaimed")
+
+    def acquire(self, agency_id: str | None, customer_number: str | None = None,
+                timeout: float = 0.0, local_presence: bool = True) -> Lease | None:
+        """
+        Leases a caller-ID slot for a dial. Waits up to `timeout` seconds for
+        a free slot; returns None if none freed up (or on shutdown). Agencies
+        without any pool numbers fall back to VAPI_PHONE_NUMBER_ID.
+        """
+        self.refresh()
+        deadline = time.monotonic() + timeout
+        start = time.monotonic()
+        with self._cond:
+            self._reap_expired()
+            candidates = self._candidates(agency_id)
+            if not candidates:
+                return Lease(phone_number_id=get_settings().phone_number_id, pooled=False)
+
+            while True:
+                chosen = self._pick(candidates, customer_number, local_presence)
+                if chosen is not None:
+                    chosen.in_use += 1
+                    lease = Lease(phone_number_id=chosen.vapi_phone_number_id, key=f"lease-{next(self._keys)}")
+                    self._leases[lease.key] = lease
+                    metrics.observe("phone_pool_wait_seconds", time.monotonic() - start)
+                    return lease
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or tracker.stopping.is_set():
+                    metrics.inc("phone_pool_exhausted")
+                    return None
+                self._cond.wait(min(remaining, 1.0))
+                # The pool may have been reloaded while waiting
+                candidates = self._candidates(agency_id)
+
+    def bind(self, lease: Lease, call_id: str):
+        """Keys the lease by the Vapi call id so end-of-call-report can release it."""
+        if not lease.pooled:
+            return
+        with self._cond:
+            if self._leases.pop(lease.key, None) is None:
+                return
+            lease.key = call_id
+            self._leases[call_id] = lease
+
+    def release(self, lease: Lease):
+        """Returns a slot whose dial never started."""
+        if not lease.pooled:
+            return
+        with self._cond:
+            self._release(lease.key)
+
+    def bound_calls(self) -> list:
+        """Vapi call ids holding a slot (dials started, no end-of-call-report yet)."""
+        with self._cond:
+            return [key for key, lease in self._leases.items() if not key.startswith("lease-")]
+
+    def release_call(self, call_id: str | None) -> bool:
+        if not call_id:
+            return False
+        with self._cond:
+            return self._release(call_id)
+
+    def _release(self, key: str) -> bool:
+        lease = self._leases.pop(key, None)
+        if lease is None:
+            return False
+        # Look the number up again - the pool may have been reloaded since
+        number = self._numbers.get(lease.phone_number_id)
+        if number is not None:
+            number.in_use = max(0, number.in_use - 1)
+        self._cond.notify_all()
+        return True
+
+    # --- reporting ---
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            numbers = [{
+                "phone_number_id": n.vapi_phone_number_id[:8] + "***",
+                "number": n.number,
+                "agency_id": n.agency_id,
+                "in_use": n.in_use,
+                "max_concurrent": n.max_concurrent,
+            } for n in self._numbers.values()]
+            active_calls = len(self._leases)
+        total = sum(n["max_concurrent"] for n in numbers)
+        in_use = sum(n["in_use"] for n in numbers)
+        return {
+            "slots_total": total,
+            "slots_in_use": in_use,
+            "utilization": round(in_use / total, 3) if total else 0.0,
+            "active_calls": active_calls,
+            "numbers": numbers,
+        }
+
+
+number_pool = NumberPool()
@@ -0,0 +1,186 @@
+# phone.py - E.164 phone number normalization
+#
+# Leads arrive as "+352 621 123 456", "0621123456", "(415) 555-0134",
+# "0033 6 12 34 56 78"... while Vapi always reports customer.number in E.164.
+# Every number is normalized on the way in (inbound webhook, imports) and on
+# lookup so the same person always maps to the same string.
+#
+# Fast path: strip separators with str.translate and accept anything that is
+# already E.164 via one compiled regex - no cache, no allocation beyond the
+# stripped string. Slow path (international 00 prefix, national formats with
+# trunk prefixes) is memoized with an LRU cache.
+
+import re
+from functools import lru_cache
+
+# Separators and decoration people type into phone fields (incl. NBSP and
+# unicode dashes). Parentheses are kept so "+33 (0)6 ..." misses the fast
+# path and gets its trunk 0 dropped.
+_STRIP = str.maketrans("", "", " -.\u00a0\u2011\u2012\u2013\u2014/\t\r\n'\"")
+_E164 = re.compile(r"\+[1-9]\d{6,14}")
+_EXTENSION = re.compile(r"(?:ext\.?|extension|x|#)\s*\d{1,6}\s*$", re.IGNORECASE)
+_DIGITS = re.compile(r"\d+")
+
+# region -> (country code, trunk prefix dropped in national format, valid national lengths)
+COUNTRY_RULES = {
+    "LU": ("352", "", range(6, 12)),
+    "FR": ("33", "0", range(9, 10)),
+    "BE": ("32", "0", range(8, 10)),
+    "DE": ("49", "0", range(6, 14)),
+    "NL": ("31", "0", range(9, 10)),
+    "CH": ("41", "0", range(9, 10)),
+    "AT": ("43", "0", range(6, 14)),
+    "GB": ("44", "0", range(9, 11)),
+    "IE": ("353", "0", range(7, 10)),
+    "ES": ("34", "", range(9, 10)),
+    "PT": ("351", "", range(9, 10)),
+    "IT": ("39", "", range(6, 12)),  # Italian numbers keep their leading 0
+    "US": ("1", "1", range(10, 11)),
+    "CA": ("1", "1", range(10, 11)),
+    "AU": ("61", "0", range(9, 10)),
+}
+
+# IANA timezone -> region, so an agency's numbers default to its own country.
+# Only zones we can map to one numbering plan: America/* also covers Mexico,
+# Brazil, ... so the NANP zones are listed one by one.
+_TIMEZONE_REGIONS = {
+    "Europe/Luxembourg": "LU", "Europe/Paris": "FR", "Europe/Brussels": "BE",
+    "Europe/Berlin": "DE", "Europe/Amsterdam": "NL", "Europe/Zurich": "CH",
+    "Europe/Vienna": "AT", "Europe/London": "GB", "Europe/Dublin": "IE",
+    "Europe/Madrid": "ES", "Europe/Lisbon": "PT", "Europe/Rome": "IT",
+    **{f"America/{city}": "US" for city in (
+        "New_York", "Chicago", "Denver", "Phoenix", "Los_Angeles", "Anchorage", "Juneau",
+        "Sitka", "Yakutat", "Nome", "Metlakatla", "Adak", "Boise", "Detroit", "Menominee",
+        "Puerto_Rico",
+    )},
+    "Pacific/Honolulu": "US",
+    **{f"America/{city}": "CA" for city in (
+        "Toronto", "Vancouver", "Edmonton", "Winnipeg", "Halifax", "St_Johns", "Regina",
+        "Moncton", "Glace_Bay", "Goose_Bay", "Whitehorse", "Dawson", "Dawson_Creek",
+        "Fort_Nelson", "Creston", "Iqaluit", "Rankin_Inlet", "Resolute", "Cambridge_Bay",
+        "Inuvik", "Swift_Current", "Atikokan", "Blanc-Sablon",
+    )},
+}
+_TIMEZONE_PREFIX_REGIONS = (
+    ("America/Indiana/", "US"), ("America/Kentucky/", "US"), ("America/North_Dakota/", "US"),
+    ("US/", "US"), ("Canada/", "CA"), ("Australia/", "AU"),
+)
+
+# Agencies without a timezone are Luxembourg ones (see get_agency_timezone)
+DEFAULT_REGION = "LU"
+
+
+def region_for_timezone(timezone: str | None) -> str | None:
+    """
+    The region an agency's national-format numbers are read in. None for a
+    timezone we can't place in one country: only numbers written with '+'
+    or '00' are read then, rather than guessing someone else's number.
+    """
+    if not timezone:
+        return DEFAULT_REGION
+    region = _TIMEZONE_REGIONS.get(timezone)
+    if region:
+        return region
+    for prefix, region in _TIMEZONE_PREFIX_REGIONS:
+        if timezone.startswith(prefix):
+            return region
+    return None
+
+
+def normalize_phone(raw, region: str | None = DEFAULT_REGION) -> str | None:
+    """
+    Returns the E.164 form of `raw` (e.g. '+352621123456'), or None if it
+    can't be a valid number. National numbers are read in `region` (never
+    with region None).
+    """
+    if raw is None:
+        return None
+    text = raw if isinstance(raw, str) else str(raw)
+    stripped = text.translate(_STRIP)
+
+    # Fast path - already E.164 once separators are gone
+    if _E164.fullmatch(stripped):
+        return stripped
+    return _normalize_slow(text, region)
+
+
+@lru_cache(maxsize=200_000)
+def _normalize_slow(text: str, region: str | None) -> str | None:
+    text = _EXTENSION.sub("", text.strip())
+    plus = text.lstrip().startswith("+")
+    digits = "".join(_DIGITS.findall(text))
+    if not digits:
+        return None
+
+    if plus:
+        candidate = "+" + digits
+    elif digits.startswith("00"):
+        # International dialing prefix (Europe)
+        candidate = "+" + digits[2:]
+    elif digits.startswith("011") and region in ("US", "CA"):
+        # International dialing prefix (North America)
+        candidate = "+" + digits[3:]
+    else:
+        rules = COUNTRY_RULES.get(region)
+        if rules is None:
+            return None
+        country_code, trunk, lengths = rules
+        national = digits
+        if trunk and national.startswith(trunk) and len(national) - len(trunk) in lengths:
+            national = national[len(trunk):]
+        elif national.startswith(country_code) and len(national) - len(country_code) in lengths:
+            # Country code typed without '+' or '00'
+            national = national[len(country_code):]
+            if trunk and national.startswith(trunk) and len(national) - len(trunk) in lengths:
+                national = national[len(trunk):]
+        if len(national) not in lengths:
+            return None
+        if national.startswith("0") and region != "IT":
+            return None
+        candidate = "+" + country_code + national
+
+    # "+33 (0)6..." style - drop the trunk 0 written after the country code
+    for country_code, trunk, lengths in COUNTRY_RULES.values():
+        if trunk == "0" and candidate.startswith("+" + country_code + "0"):
+            national = candidate[len(country_code) + 2:]
+            if len(national) in lengths:
+                candidate = "+" + country_code + national
+            break
+
+    return candidate if _E164.fullmatch(candidate) else None
+
+
+def normalize_many(raws, region: str | None = DEFAULT_REGION) -> list:
+    """Batch form of normalize_phone for imports (same order, None for invalid)."""
+    strip = _STRIP
+    fullmatch = _E164.fullmatch
+    slow = _normalize_slow
+    out = []
+    append = out.append
+    for raw in raws:
+        if raw is None:
+            append(None)
+            continue
+        text = raw if isinstance(raw, str) else str(raw)
+        stripped = text.translate(strip)
+        append(stripped if fullmatch(stripped) else slow(text, region))
+    return out
+
+
+def lookup_variants(raw, region: str | None = DEFAULT_REGION) -> list:
+    """
+    Values to match against leads.phone_number: the normalized number plus
+    the raw string, so rows stored before normalization still match.
+    National numbers are read in `region`.
+    """
+    variants = []
+    normalized = normalize_phone(raw, region)
+    if normalized:
+        variants.append(normalized)
+    if raw and str(raw) not in variants:
+        variants.append(str(raw))
+    return variants
+
+
+def cache_info():
+    return _normalize_slow.cache_info()
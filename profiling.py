@@ -0,0 +1,391 @@
+# profiling.py - On-demand profiling of the live process (admin only)
+#
+# Answers "where does the time in /assistant-request or /webhooks/inbound
+# go - JSON parsing, the sync Supabase calls, debug log writes or upstream
+# HTTP?" without redeploying:
+#   - sampler: wall-clock stack samples of every thread for N seconds
+#     (sys._current_frames, no tracing overhead outside a run),
+#   - ProfileMiddleware: a request carrying X-Profile-Token (the admin
+#     token) runs under cProfile; the result is kept (last KEEP_PROFILES)
+#     under the id returned in X-Profile-Id. cProfile sees the event loop
+#     thread only, so it covers whatever the loop ran meanwhile, not the
+#     work handed to thread pools (the sampler does),
+#   - loop_monitor: a heartbeat task on the event loop watched by a thread;
+#     when the loop doesn't come back within SLOW_CALLBACK_SECONDS the
+#     watchdog grabs the loop thread's stack, i.e. the callback blocking it,
+#   - section(name): times a named part of a function (context manager or
+#     decorator) into metrics and a table of nested sections.
+# Stack output is in folded format ("frame;frame;frame count" per line),
+# which flamegraph.pl, inferno and speedscope load directly.
+
+import asyncio
+import contextvars
+import cProfile
+import functools
+import hmac
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+
+from metrics import metrics
+
+SAMPLE_INTERVAL = 0.005
+MAX_SAMPLE_SECONDS = 120.0
+MAX_DEPTH = 128
+KEEP_PROFILES = 20
+WATCH_INTERVAL = 0.05
+SLOW_CALLBACK_SECONDS = 0.25
+KEEP_SLOW_CALLBACKS = 50
+LAG_WINDOW = 1200  # recent heartbeat lags kept for percentiles (~1 min)
+MAX_SECTION_PATHS = 1000
+
+
+class Busy(Exception):
+    """Another profile of the same kind is already running."""
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _folded_stack(frame, root: str) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(root)
+    return ";".join(reversed(labels))
+
+
+def _folded_text(counts) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()) if count > 0)
+
+
+# --- sampling profiler ---
+
+class Sampler:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def sample(self, seconds: float, interval: float = SAMPLE_INTERVAL) -> str:
+        """
+        Samples every thread's stack each `interval` for `seconds`. Returns
+        folded stacks rooted at the thread name, counted in samples.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise Busy("a sampling profile is already running")
+        try:
+            me = threading.get_ident()
+            counts = Counter()
+            deadline = time.monotonic() + min(seconds, MAX_SAMPLE_SECONDS)
+            samples = 0
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident != me:
+                        counts[_folded_stack(frame, names.get(ident, f"thread-{ident}"))] += 1
+                samples += 1
+                time.sleep(interval)
+            metrics.inc("profiling_samples", samples)
+            return _folded_text(counts)
+        finally:
+            self._lock.release()
+
+
+sampler = Sampler()
+
+
+# --- per-request cProfile ---
+
+def _function_label(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name  # built-in
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def folded_from_stats(stats: pstats.Stats) -> str:
+    """
+    Folded stacks (microseconds) rebuilt from cProfile's caller graph:
+    each call edge gets its share of the caller's time on that path.
+    """
+    entries = stats.stats
+    children = {}
+    for callee, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((callee, edge[3]))
+    roots = [func for func, entry in entries.items() if not entry[4]]
+    counts = Counter()
+
+    def walk(func, path: list, seconds: float):
+        _, _, own, total, _ = entries[func]
+        if total <= 0 or seconds < 1e-6:
+            return
+        path = path + [_function_label(func)]
+        counts[";".join(path)] += int(seconds * own / total * 1e6)
+        if len(path) >= MAX_DEPTH:
+            return
+        for child, edge_seconds in children.get(func, ()):
+            if child != func and _function_label(child) not in path:
+                walk(child, path, seconds * edge_seconds / total)
+
+    for root in roots:
+        walk(root, [], entries[root][3])
+    return _folded_text(counts)
+
+
+class RequestProfiles:
+    def __init__(self):
+        self._lock = threading.Lock()  # one cProfile at a time per process
+        self._profiles = OrderedDict()  # id -> (label, pstats.Stats)
+
+    def begin(self) -> cProfile.Profile | None:
+        if not self._lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (sys.setprofile user) is active
+            self._lock.release()
+            return None
+        return profiler
+
+    def end(self, profiler: cProfile.Profile, profile_id: str, label: str):
+        profiler.disable()
+        self._lock.release()
+        self._profiles[profile_id] = (label, pstats.Stats(profiler))
+        while len(self._profiles) > KEEP_PROFILES:
+            self._profiles.popitem(last=False)
+        metrics.inc("profiling_requests_profiled")
+
+    def recent(self) -> list:
+        return [{"id": profile_id, "request": label} for profile_id, (label, _) in self._profiles.items()]
+
+    def render(self, profile_id: str, format: str = "folded") -> str | bytes | None:
+        """'folded' (flamegraph), 'text' (top functions) or 'pstats' (marshal dump for snakeviz etc.)."""
+        entry = self._profiles.get(profile_id)
+        if entry is None:
+            return None
+        stats = entry[1]
+        if format == "pstats":
+            return marshal.dumps(stats.stats)
+        if format == "text":
+            out = io.StringIO()
+            report = pstats.Stats(stream=out)
+            report.add(stats)
+            report.sort_stats("cumulative").print_stats(40)
+            return out.getvalue()
+        return folded_from_stats(stats)
+
+
+request_profiles = RequestProfiles()
+
+
+class ProfileMiddleware:
+    """
+    ASGI middleware: requests with a valid X-Profile-Token run under
+    cProfile. Every other request passes straight through.
+    """
+
+    def __init__(self, app, token):
+        self.app = app
+        self.token = token  # callable returning the admin token (None = off)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = dict(scope["headers"]).get(b"x-profile-token")
+        token = self.token()
+        if header is None or not token or not _same(header.decode("latin-1"), token):
+            return await self.app(scope, receive, send)
+
+        profiler = request_profiles.begin()
+        if profiler is None:
+            return await self.app(scope, receive, _with_header(send, b"x-profile-id", b"busy"))
+        profile_id = uuid.uuid4().hex[:12]
+        label = f"{scope['method']} {scope['path']}"
+        try:
+            await self.app(scope, receive, _with_header(send, b"x-profile-id", profile_id.encode()))
+        finally:
+            request_profiles.end(profiler, profile_id, label)
+
+
+def _with_header(send, name: bytes, value: bytes):
+    async def wrapped(message):
+        if message["type"] == "http.response.start":
+            message = {**message, "headers": [*message.get("headers", []), (name, value)]}
+        await send(message)
+    return wrapped
+
+
+def _same(given: str, expected: str) -> bool:
+    return hmac.compare_digest(given.encode(), expected.encode())
+
+
+# --- event loop lag / slow callbacks ---
+
+class LoopMonitor:
+    def __init__(self):
+        self.slow_seconds = SLOW_CALLBACK_SECONDS
+        self._beat_at = None  # monotonic time of the loop's last heartbeat
+        self._loop_thread = None
+        self._stalled_since = None  # heartbeat a report was taken for
+        self._lags = deque(maxlen=LAG_WINDOW)
+        self.slow_callbacks = deque(maxlen=KEEP_SLOW_CALLBACKS)
+        self._task = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    async def _beat(self):
+        while True:
+            start = time.monotonic()
+            self._beat_at = start
+            await asyncio.sleep(WATCH_INTERVAL)
+            lag = max(0.0, time.monotonic() - start - WATCH_INTERVAL)
+            self._lags.append(lag)
+            stalled = self._stalled_since
+            if stalled is not None:
+                # The watchdog caught this stall; now we know how long it was
+                self._stalled_since = None
+                if self.slow_callbacks and self.slow_callbacks[-1]["_beat"] == stalled:
+                    self.slow_callbacks[-1]["blocked_seconds"] = round(time.monotonic() - stalled - WATCH_INTERVAL, 4)
+
+    def _watch(self):
+        while not self._stopping.wait(WATCH_INTERVAL):
+            beat_at = self._beat_at
+            if beat_at is None or self._stalled_since == beat_at:
+                continue
+            blocked = time.monotonic() - beat_at - WATCH_INTERVAL
+            if blocked < self.slow_seconds:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._stalled_since = beat_at
+            self.slow_callbacks.append({
+                "_beat": beat_at,
+                "at": time.time(),
+                "blocked_seconds": round(blocked, 4),
+                "stack": _folded_stack(frame, "event-loop"),
+            })
+            metrics.inc("event_loop_slow_callbacks")
+
+    def snapshot(self) -> dict:
+        lags = sorted(self._lags)
+
+        def pct(q):
+            return round(lags[min(len(lags) - 1, int(q * len(lags)))], 4) if lags else 0.0
+
+        return {
+            "lag_seconds": {"p50": pct(0.5), "p99": pct(0.99), "max": round(lags[-1], 4) if lags else 0.0, "samples": len(lags)},
+            "slow_callback_seconds": self.slow_seconds,
+            "slow_callbacks": [
+                {key: value for key, value in report.items() if not key.startswith("_")}
+                for report in reversed(self.slow_callbacks)
+            ],
+        }
+
+    def start(self, slow_seconds: float | None = None):
+        """Starts the heartbeat on the running loop and its watchdog thread (app startup)."""
+        if slow_seconds is not None:
+            self.slow_seconds = slow_seconds
+        self._loop_thread = threading.get_ident()
+        self._beat_at = None
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+
+loop_monitor = LoopMonitor()
+
+
+# --- named sections ---
+
+_sections = contextvars.ContextVar("profiling_sections", default=())
+_section_lock = threading.Lock()
+_section_micros = Counter()  # folded section path -> self time (us)
+
+
+class section:
+    """
+    Times a named part of the code:
+
+        with section("vapi_http"):
+            ...
+
+        @section("trigger_vapi_call")
+        def trigger_vapi_call(payload): ...
+
+    Nested sections (also across asyncio.to_thread) build a path, kept as
+    self time per path for section_folded(); each one is also observed as
+    metrics summary section_seconds{section=name}.
+    """
+
+    __slots__ = ("name", "_frame", "_token", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._frame = [self.name, 0.0]  # name, time spent in child sections
+        self._token = _sections.set(_sections.get() + (self._frame,))
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        stack = _sections.get()
+        _sections.reset(self._token)
+        if len(stack) > 1:
+            stack[-2][1] += elapsed
+        path = ";".join(frame[0] for frame in stack)
+        with _section_lock:
+            if path in _section_micros or len(_section_micros) < MAX_SECTION_PATHS:
+                _section_micros[path] += int((elapsed - self._frame[1]) * 1e6)
+        metrics.observe("section_seconds", elapsed, section=self.name)
+        return False
+
+    def __call__(self, func):
+        name = self.name
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_async(*args, **kwargs):
+                with section(name):
+                    return await func(*args, **kwargs)
+            return timed_async
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with section(name):
+                return func(*args, **kwargs)
+        return timed
+
+
+def section_folded(reset: bool = False) -> str:
+    """Self time (us) per nested section path, folded."""
+    with _section_lock:
+        text = _folded_text(_section_micros)
+        if reset:
+            _section_micros.clear()
+    return text
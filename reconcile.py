@@ -0,0 +1,304 @@
+# reconcile.py - Repairs calls whose end-of-call-report never arrived
+#
+# If the report is lost (Vapi gave up, forward_to_webhook failed) the call
+# stays queued/ringing/in_progress in call_logs and its lead stays
+# 'calling' - which also keeps the lead out of every campaign and retry.
+# The CallReconciler finds call_logs rows in a live status that haven't
+# changed for `stale_seconds`, asks Vapi (GET /call/{id}) for their real
+# state and writes the outcome the frontend would have written:
+#   - call_logs: final status, duration, transcript, summary, recording
+#     (one upsert per page),
+#   - leads: calling/calling_inbound -> called/no_answer/callback/voicemail
+#     (one conditional update per outcome), back in line if the call failed,
+#   - call_retries: a retry for unanswered calls, like the webhook creates,
+#   - caller-ID slot, buffered live state and answer-rate history.
+# Calls Vapi still reports live just get their updated_at bumped.
+#
+# Lookups run on a small thread pool sharing one pooled HTTP session, under
+# a token bucket (requests_per_second) that also honors Vapi's Retry-After,
+# so a backlog of thousands of calls drains in minutes without tripping
+# Vapi's rate limits. Runs every `interval_seconds` and on demand
+# (POST /calls/reconcile). Tests point VAPI_BASE_URL at benchmarks.fakes.VapiStub.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import lead_state
+from admission import TokenBucket
+from call_events import LIVE_STATUSES, call_events
+from db import supabase
+from metrics import metrics
+from number_pool import number_pool
+from retry_timing import ANSWERED_REASONS, retry_timer
+from vapi_limiter import parse_retry_after
+
+PAGE_SIZE = 500
+MAX_ATTEMPTS = 3
+REQUEST_TIMEOUT_SECONDS = 15
+FIRST_RETRY_HOURS = 2  # same delay as the webhook's first retry
+
+# call_logs statuses of a call that hasn't ended
+LIVE_LOG_STATUSES = sorted(set(LIVE_STATUSES.values()))
+
+# Vapi endedReason -> (call_logs.status, lead status); None leaves the lead
+# to be re-queued. Anything else (pipeline/provider errors) counts as failed.
+ENDED_OUTCOMES = {
+    'customer-did-not-answer': ('no_answer', 'no_answer'),
+    'customer-busy': ('busy', 'callback'),
+    'voicemail': ('completed', 'voicemail'),
+    **{reason: ('completed', 'called') for reason in ANSWERED_REASONS},
+}
+FAILED_OUTCOME = ('failed', None)
+# A failed dial goes back where a claim would have taken it from
+REQUEUE = {lead_state.CALLING: lead_state.NEW, lead_state.CALLING_INBOUND: lead_state.QUEUED_NIGHT}
+
+
+def _seconds_between(start, end) -> int | None:
+    try:
+        started = datetime.fromisoformat(start.replace('Z', '+00:00'))
+        ended = datetime.fromisoformat(end.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    return max(0, round((ended - started).total_seconds()))
+
+
+class CallReconciler:
+    def __init__(self, stale_seconds: float = 1800.0, concurrency: int = 16, requests_per_second: float = 20.0,
+                 interval_seconds: float = 300.0):
+        self.stale_seconds = stale_seconds
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
+        self.interval_seconds = interval_seconds
+        self.base_url = "https://api.vapi.ai"
+        self.keys = []  # (name, value), tried in order on 401
+        self._key_index = 0
+        self._session = None
+        self._bucket = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        self._bucket_lock = threading.Lock()
+        self._blocked_until = 0.0  # Retry-After from Vapi
+        self._run_lock = threading.Lock()  # one pass at a time
+        self._stopping = threading.Event()
+        self._thread = None
+        self.last_report = None
+
+    def configure(self, settings):
+        self.base_url = settings.vapi_base_url
+        self.keys = settings.vapi_keys
+        self._key_index = 0
+        self.stale_seconds = settings.vapi_reconcile_stale_seconds
+        self.concurrency = settings.vapi_reconcile_concurrency
+        self.requests_per_second = settings.vapi_reconcile_requests_per_second
+        self.interval_seconds = settings.vapi_reconcile_interval_seconds
+        self._bucket = TokenBucket(self.requests_per_second, max(1.0, self.requests_per_second))
+        # Keep-alive connections for every lookup thread
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    # --- Vapi ---
+
+    def _wait_turn(self):
+        while True:
+            with self._bucket_lock:
+                now = time.monotonic()
+                delay = max(self._blocked_until - now, 0.0) or self._bucket.take(now)
+            if delay <= 0:
+                return
+            metrics.observe("reconcile_throttle_seconds", delay)
+            time.sleep(delay)
+
+    def fetch(self, call_id: str) -> dict | None:
+        """
+        Vapi's call object; {} if Vapi doesn't know the call, None if it
+        couldn't be looked up (retried next pass).
+        """
+        for attempt in range(MAX_ATTEMPTS):
+            if self._stopping.is_set() or self._key_index >= len(self.keys):
+                return None
+            self._wait_turn()
+            index = self._key_index
+            key_name, key_value = self.keys[index]
+            start = time.monotonic()
+            try:
+                response = self._session.get(
+                    f"{self.base_url}/call/{call_id}",
+                    headers={"Authorization": f"Bearer {key_value}"},
+                    timeout=REQUEST_TIMEOUT_SECONDS,
+                )
+            except requests.exceptions.RequestException as e:
+                metrics.inc("reconcile_lookup_errors", status="connection")
+                if attempt == MAX_ATTEMPTS - 1:
+                    print(f"❌ Vapi lookup failed for call {call_id}: {e}")
+                continue
+            metrics.observe("reconcile_lookup_seconds", time.monotonic() - start)
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code == 404:
+                return {}
+            metrics.inc("reconcile_lookup_errors", status=response.status_code)
+            if response.status_code == 401 and index + 1 < len(self.keys):
+                # Public key can't read calls - use the next key from now on
+                with self._bucket_lock:
+                    if self._key_index == index:
+                        print(f"   -> {key_name} can't read Vapi calls (401), trying the next key")
+                        self._key_index += 1
+                continue
+            if response.status_code == 429:
+                wait = parse_retry_after(response.headers.get("Retry-After")) or 2.0 ** attempt
+                with self._bucket_lock:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + wait)
+                continue
+            if response.status_code < 500:
+                return None
+        return None
+
+    # --- reconciliation ---
+
+    def _stale_page(self, agency_id: str | None, cutoff: str, after: str | None) -> list:
+        query = supabase.table('call_logs').select('id, vapi_call_id, agency_id, lead_id, status').in_(
+            'status', LIVE_LOG_STATUSES).lt('updated_at', cutoff)
+        if agency_id:
+            query = query.eq('agency_id', agency_id)
+        if after is not None:
+            query = query.gt('id', after)
+        return query.order('id').limit(PAGE_SIZE).execute().data or []
+
+    def run(self, agency_id: str | None = None) -> dict:
+        """One pass over every stale live call (optionally of one agency). Returns a report."""
+        report = {"checked": 0, "repaired": 0, "still_live": 0, "not_found": 0, "errors": 0,
+                  "leads_updated": 0, "retries_created": 0, "outcomes": {}}
+        if not self.keys:
+            report["skipped"] = "no Vapi API key configured"
+            return report
+        if not self._run_lock.acquire(blocking=False):
+            report["skipped"] = "a reconciliation pass is already running"
+            return report
+        start = time.monotonic()
+        try:
+            cutoff = (datetime.now(timezone.utc) - timedelta(seconds=self.stale_seconds)).isoformat()
+            after = None
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="reconcile") as pool:
+                while not self._stopping.is_set():
+                    rows = self._stale_page(agency_id, cutoff, after)
+                    rows = [row for row in rows if row.get('vapi_call_id')]
+                    if not rows:
+                        break
+                    after = rows[-1]['id']
+                    calls = list(pool.map(self.fetch, [row['vapi_call_id'] for row in rows]))
+                    self._apply(rows, calls, report)
+        finally:
+            self._run_lock.release()
+        report["seconds"] = round(time.monotonic() - start, 2)
+        self.last_report = report
+        metrics.inc("reconcile_runs")
+        if report["repaired"]:
+            metrics.inc("reconcile_repaired", report["repaired"])
+        return report
+
+    def _apply(self, rows: list, calls: list, report: dict):
+        """Writes one page of lookups back: one upsert, a few grouped updates."""
+        now = datetime.now(timezone.utc)
+        stamp = now.isoformat()
+        finished, live, lead_moves = [], [], {}
+        for row, call in zip(rows, calls):
+            report["checked"] += 1
+            if call is None:
+                report["errors"] += 1
+                continue
+            if call and call.get('status') != 'ended':
+                live.append(row['vapi_call_id'])
+                continue
+            if not call:
+                report["not_found"] += 1
+            log_status, lead_status = ENDED_OUTCOMES.get(call.get('endedReason'), FAILED_OUTCOME)
+            artifact = call.get('artifact') or {}
+            # Drops the call's buffered live state; its transcript so far is
+            # the fallback when Vapi has none
+            buffered = call_events.end_call(row['vapi_call_id'])
+            finished.append({
+                'vapi_call_id': row['vapi_call_id'],
+                'agency_id': row['agency_id'],
+                'lead_id': row.get('lead_id'),
+                'status': log_status,
+                'duration_seconds': _seconds_between(call.get('startedAt'), call.get('endedAt')),
+                'transcript': artifact.get('transcript') or call.get('transcript') or buffered,
+                'summary': (call.get('analysis') or {}).get('summary') or call.get('summary'),
+                'recording_url': artifact.get('recordingUrl') or call.get('recordingUrl'),
+                'updated_at': stamp,
+            })
+            if row.get('lead_id'):
+                lead_moves.setdefault(lead_status, []).append(row['lead_id'])
+            report["outcomes"][log_status] = report["outcomes"].get(log_status, 0) + 1
+            number_pool.release_call(row['vapi_call_id'])
+            if call:
+                retry_timer.record(row['agency_id'], call.get('endedReason'), call.get('startedAt'))
+
+        if live:
+            # Still running on Vapi's side - check again once stale again
+            supabase.table('call_logs').update({'updated_at': stamp}).in_('vapi_call_id', live).in_(
+                'status', LIVE_LOG_STATUSES).execute()
+            report["still_live"] += len(live)
+        if not finished:
+            return
+
+        logged = supabase.table('call_logs').upsert(finished, on_conflict='vapi_call_id').execute().data or []
+        report["repaired"] += len(finished)
+        for lead_status, lead_ids in lead_moves.items():
+            for dialing, requeue in REQUEUE.items():
+                moved = lead_state.transition(lead_ids, dialing, lead_status or requeue)
+                report["leads_updated"] += len(moved)
+                if lead_status == 'no_answer' and moved:
+                    report["retries_created"] += self._schedule_retries(logged, moved, now)
+
+    def _schedule_retries(self, logged: list, lead_ids: list, now: datetime) -> int:
+        # Only for leads this pass moved, so concurrent passes can't double up
+        lead_ids = set(lead_ids)
+        scheduled_at = (now + timedelta(hours=FIRST_RETRY_HOURS)).isoformat()
+        retries = [{
+            'call_id': log['id'],
+            'lead_id': log['lead_id'],
+            'agency_id': log['agency_id'],
+            'retry_count': 1,
+            'scheduled_at': scheduled_at,
+            'status': 'pending',
+        } for log in logged if log.get('lead_id') in lead_ids and log.get('status') == 'no_answer']
+        if retries:
+            supabase.table('call_retries').insert(retries).execute()
+        return len(retries)
+
+    # --- lifecycle ---
+
+    def _run(self):
+        while not self._stopping.wait(self.interval_seconds):
+            try:
+                report = self.run()
+            except Exception as e:
+                print(f"❌ Call reconciliation failed: {e}")
+                metrics.inc("reconcile_errors")
+                continue
+            if report.get("repaired"):
+                print(f"   -> 🔧 Reconciled {report['repaired']} stale calls with Vapi "
+                      f"({report['checked']} checked, {report['seconds']}s)")
+
+    def start(self):
+        if self.interval_seconds <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="reconcile", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the periodic pass; a pass in progress finishes its current page."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+call_reconciler = CallReconciler()
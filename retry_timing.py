@@ -0,0 +1,256 @@
+# retry_timing.py - Answer-rate-aware timing for call retries
+#
+# The frontend inserts call_retries rows at a fixed delay (2h, then 24h),
+# so retries used to land whenever that happened to be - often at hours
+# when this agency's leads rarely pick up. The RetryTimer keeps, per agency
+# and timezone, an hour-of-week histogram of answered/attempted calls
+# (seeded from recent call_logs, then updated from every end-of-call-report)
+# and moves each pending retry to the office hour with the best connect
+# odds in the RETRY_WINDOW_HOURS after its original time.
+#
+# Scoring: answer rate per hour-of-week, smoothed toward the agency's
+# overall rate (hours with few calls don't swing it), discounted by
+# WAIT_DISCOUNT per hour of waiting so a slightly better hour tomorrow
+# doesn't beat a good one this afternoon. With no history every hour
+# scores the same and a retry goes to the first office hour.
+#
+# The best offset for each of the 168 possible starting hours is
+# precomputed per histogram (rebuilt only after new outcomes), so slotting
+# a retry is a table lookup plus one timezone conversion - 100k pending
+# retries take well under a second.
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo  # Python 3.9+
+except ImportError:
+    from backports.zoneinfo import ZoneInfo  # Fallback for older Python
+
+from db import supabase
+from metrics import metrics
+
+HOURS_PER_WEEK = 168
+# Office hours in the agency's timezone: 8:00 AM (8) to 9:00 PM (21)
+OFFICE_OPEN_HOUR = 8
+OFFICE_CLOSE_HOUR = 21
+
+RETRY_WINDOW_HOURS = 48  # how far past its original time a retry may move
+WAIT_DISCOUNT = 0.995  # score multiplier per hour of waiting (~11%/day)
+PRIOR_CALLS = 5.0  # weight of the agency-wide rate in each hour's estimate
+DEFAULT_ANSWER_RATE = 0.3  # agencies without history
+DEFAULT_TIMEZONE = 'Europe/Luxembourg'
+SEED_DAYS = 90
+SEED_ROWS = 20000
+TIMEZONE_TTL_SECONDS = 3600.0
+SLOT_PAGE_SIZE = 1000
+UPDATE_CHUNK = 200  # ids per conditional update (URL length)
+
+# Vapi endedReason -> did the lead pick up? Others (errors) aren't counted.
+ANSWERED_REASONS = frozenset([
+    'customer-ended-call', 'assistant-ended-call', 'assistant-said-end-call-phrase',
+    'assistant-forwarded-call', 'exceeded-max-duration', 'silence-timed-out',
+])
+UNANSWERED_REASONS = frozenset(['customer-did-not-answer', 'customer-busy', 'voicemail'])
+# call_logs.status -> answered (seeding)
+LOGGED_OUTCOMES = {'completed': True, 'no_answer': False, 'busy': False}
+
+
+def is_office_hour(hour: int) -> bool:
+    return OFFICE_OPEN_HOUR <= hour < OFFICE_CLOSE_HOUR
+
+
+def hour_of_week(moment: datetime) -> int:
+    """0 = Monday 00:00-01:00 in `moment`'s timezone."""
+    return moment.weekday() * 24 + moment.hour
+
+
+def outcome(ended_reason: str | None) -> bool | None:
+    """True if the lead answered, False if not, None if the call says nothing about it."""
+    if ended_reason in ANSWERED_REASONS:
+        return True
+    if ended_reason in UNANSWERED_REASONS:
+        return False
+    return None
+
+
+def _parse_time(value) -> datetime | None:
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+class AnswerHistogram:
+    """Answered/attempted calls per local hour-of-week for one agency + timezone."""
+
+    __slots__ = ("tz", "answered", "attempts", "_best", "_lock")
+
+    def __init__(self, tz: ZoneInfo):
+        self.tz = tz
+        self.answered = [0] * HOURS_PER_WEEK
+        self.attempts = [0] * HOURS_PER_WEEK
+        self._best = None  # start hour-of-week -> offset of the best slot
+        self._lock = threading.Lock()
+
+    def record(self, moment: datetime, answered: bool):
+        hour = hour_of_week(moment.astimezone(self.tz))
+        with self._lock:
+            self.attempts[hour] += 1
+            self.answered[hour] += answered
+            self._best = None
+
+    def rates(self) -> list:
+        total = sum(self.attempts)
+        prior = sum(self.answered) / total if total else DEFAULT_ANSWER_RATE
+        return [
+            (answered + prior * PRIOR_CALLS) / (attempts + PRIOR_CALLS)
+            for answered, attempts in zip(self.answered, self.attempts)
+        ]
+
+    def _build(self) -> list:
+        rates = self.rates()
+        weights = [WAIT_DISCOUNT ** k for k in range(RETRY_WINDOW_HOURS)]
+        best = []
+        for start in range(HOURS_PER_WEEK):
+            best_offset, best_score = None, -1.0
+            for offset, weight in enumerate(weights):
+                hour = (start + offset) % HOURS_PER_WEEK
+                if not is_office_hour(hour % 24):
+                    continue
+                score = rates[hour] * weight
+                if score > best_score:
+                    best_offset, best_score = offset, score
+            best.append(best_offset)
+        return best
+
+    def best_offsets(self) -> list:
+        with self._lock:
+            if self._best is None:
+                self._best = self._build()
+                metrics.inc("retry_timing_rebuilds")
+            return self._best
+
+    def slot(self, earliest: datetime, best: list | None = None) -> datetime:
+        """Start of the best office hour at or after `earliest` (or `earliest` itself)."""
+        local = earliest.astimezone(self.tz)
+        offset = (best or self.best_offsets())[hour_of_week(local)]
+        if not offset:
+            return earliest
+        # Wall-clock arithmetic: "14:00 tomorrow" stays 14:00 across DST
+        start = local.replace(minute=0, second=0, microsecond=0) + timedelta(hours=offset)
+        return start.astimezone(timezone.utc)
+
+
+class RetryTimer:
+    def __init__(self):
+        self.timezone_of = None  # agency id -> IANA timezone name (set by main)
+        self._histograms = {}  # (agency id, timezone) -> AnswerHistogram
+        self._timezones = {}  # agency id -> (timezone, looked up at)
+        self._lock = threading.Lock()
+
+    def _timezone(self, agency_id: str) -> str:
+        cached = self._timezones.get(agency_id)
+        if cached is not None and time.monotonic() - cached[1] < TIMEZONE_TTL_SECONDS:
+            return cached[0]
+        name = self.timezone_of(agency_id) if self.timezone_of else DEFAULT_TIMEZONE
+        try:
+            ZoneInfo(name)
+        except Exception:
+            print(f"⚠️ Unknown timezone {name!r} for agency {agency_id}, using {DEFAULT_TIMEZONE}")
+            name = DEFAULT_TIMEZONE
+        self._timezones[agency_id] = (name, time.monotonic())
+        return name
+
+    def histogram(self, agency_id: str) -> AnswerHistogram:
+        """The agency's histogram, seeded from its recent call_logs on first use."""
+        name = self._timezone(agency_id)
+        key = (agency_id, name)
+        histogram = self._histograms.get(key)
+        if histogram is not None:
+            return histogram
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._seed(agency_id, ZoneInfo(name))
+                self._histograms[key] = histogram
+        return histogram
+
+    def _seed(self, agency_id: str, tz: ZoneInfo) -> AnswerHistogram:
+        histogram = AnswerHistogram(tz)
+        since = (datetime.now(timezone.utc) - timedelta(days=SEED_DAYS)).isoformat()
+        try:
+            response = supabase.table('call_logs').select('status, created_at').eq('agency_id', agency_id).in_(
+                'status', list(LOGGED_OUTCOMES)).gte('created_at', since).order('created_at', desc=True).limit(SEED_ROWS).execute()
+        except Exception as e:
+            print(f"⚠️ Could not load answer history for agency {agency_id}: {e}")
+            return histogram
+        for row in response.data or []:
+            moment = _parse_time(row.get('created_at'))
+            if moment is not None:
+                histogram.record(moment, LOGGED_OUTCOMES[row['status']])
+        metrics.inc("retry_timing_seeded_calls", len(response.data or []))
+        return histogram
+
+    def record(self, agency_id: str | None, ended_reason: str | None, started_at=None):
+        """Counts one finished call in its agency's histogram (end-of-call-report)."""
+        answered = outcome(ended_reason)
+        if not agency_id or answered is None:
+            return
+        moment = _parse_time(started_at) or datetime.now(timezone.utc)
+        self.histogram(agency_id).record(moment, answered)
+        metrics.inc("retry_timing_outcomes", answered=answered)
+
+    def slot(self, agency_id: str, earliest: datetime) -> datetime:
+        return self.histogram(agency_id).slot(earliest)
+
+    def slot_pending(self, agency_id: str) -> int:
+        """
+        Moves the agency's not-yet-slotted pending retries to their best
+        hour and marks them slotted (each retry is moved once). Returns how
+        many were slotted.
+        """
+        start = time.perf_counter()
+        histogram = self.histogram(agency_id)
+        best = histogram.best_offsets()
+        now = datetime.now(timezone.utc)
+        stamp = now.isoformat()
+        slotted, last_id = 0, None
+        while True:
+            query = supabase.table('call_retries').select('id, scheduled_at').eq('agency_id', agency_id).eq(
+                'status', 'pending').is_('slotted_at', 'null')
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            rows = query.order('id').limit(SLOT_PAGE_SIZE).execute().data or []
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+
+            # Group by new time so a page costs a handful of updates
+            moves = {}
+            for row in rows:
+                earliest = max(_parse_time(row.get('scheduled_at')) or now, now)
+                slot = histogram.slot(earliest, best)
+                moves.setdefault(None if slot == earliest else slot.isoformat(), []).append(row['id'])
+            for scheduled_at, ids in moves.items():
+                values = {'slotted_at': stamp}
+                if scheduled_at is not None:
+                    values['scheduled_at'] = scheduled_at
+                for i in range(0, len(ids), UPDATE_CHUNK):
+                    # A retry dialed or cancelled meanwhile keeps its state
+                    supabase.table('call_retries').update(values).in_('id', ids[i:i + UPDATE_CHUNK]).eq(
+                        'status', 'pending').execute()
+                metrics.inc("retry_slots", len(ids), result="kept" if scheduled_at is None else "moved")
+            slotted += len(rows)
+            if len(rows) < SLOT_PAGE_SIZE:
+                break
+        if slotted:
+            metrics.observe("retry_slotting_seconds", time.perf_counter() - start)
+        return slotted
+
+
+retry_timer = RetryTimer()
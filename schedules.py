@@ -0,0 +1,376 @@
+# schedules.py - Recurring campaign schedules per agency
+#
+# Campaigns used to start only when the frontend POSTed /start-campaign,
+# five leads at a time. An agency can now store schedules in
+# campaign_schedules: days of the week, a daily window (local time in the
+# agency's timezone, inside office hours) and a daily cap of dials. While a
+# window is open the CampaignScheduler keeps the agency's dial queue topped
+# up - about two dials per in-flight slot (dialer.py) - every `feed_seconds`
+# until the window closes, the daily cap is reached or no leads are left.
+#
+# All schedules sit in one min-heap keyed by their next fire time (epoch
+# seconds). The scheduler thread sleeps until the earliest entry is due (or
+# the next reload), pops what is due, feeds those agencies and pushes each
+# schedule back with its next fire time - so thousands of schedules cost
+# nothing between fires and O(log n) per fire. Next fire times are computed
+# from the schedule's days and window in its timezone (at most a week of
+# calendar arithmetic, DST-safe). A changed or deleted schedule gets a new
+# version; its old heap entries are skipped when they come up.
+#
+# Schedules are reloaded from the database every `refresh_seconds` (and at
+# once when this node's API changes one). Dials count toward the cap when
+# queued; the count is kept per schedule and local date, and written back
+# so a restart or the agency's next owner (shards.py) carries on from it.
+# Only the node that owns the agency feeds it.
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo  # Python 3.9+
+except ImportError:
+    from backports.zoneinfo import ZoneInfo  # Fallback for older Python
+
+from db import supabase
+from metrics import metrics
+from retry_timing import DEFAULT_TIMEZONE, OFFICE_CLOSE_HOUR, OFFICE_OPEN_HOUR
+
+FEED_SECONDS = 30.0
+REFRESH_SECONDS = 60.0
+IDLE_SECONDS = 600.0  # no leads left: look again this much later in the window
+NOT_OWNER_SECONDS = 30.0  # another node feeds the agency: check ownership again
+FEED_DEPTH = 2  # queued + in-flight dials kept per in-flight slot
+MAX_FEED = 100  # leads claimed per fire
+CHUNK = 200  # agency ids per timezone lookup
+WEEKDAYS = range(1, 8)  # ISO: 1 = Monday ... 7 = Sunday
+
+
+def parse_time(value) -> int:
+    """'HH:MM' or 'HH:MM:SS' -> minutes after midnight."""
+    try:
+        hours, minutes = (int(part) for part in str(value).split(':')[:2])
+    except ValueError:
+        raise ValueError(f"Invalid time {value!r} (expected HH:MM)")
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time {value!r} (expected HH:MM)")
+    return hours * 60 + minutes
+
+
+def validate(days, start_time, end_time, daily_cap, timezone_name=None) -> dict:
+    """
+    The columns of a campaign_schedules row, checked. Raises ValueError
+    with a message fit for the API caller.
+    """
+    days = sorted(set(days or ()))
+    if not days or any(day not in WEEKDAYS for day in days):
+        raise ValueError("days must list weekdays 1 (Monday) to 7 (Sunday)")
+    start, end = parse_time(start_time), parse_time(end_time)
+    if start >= end:
+        raise ValueError("start_time must be before end_time")
+    if start < OFFICE_OPEN_HOUR * 60 or end > OFFICE_CLOSE_HOUR * 60:
+        raise ValueError(f"Schedules must stay within office hours ({OFFICE_OPEN_HOUR:02d}:00-{OFFICE_CLOSE_HOUR:02d}:00)")
+    if daily_cap is None or daily_cap < 1:
+        raise ValueError("daily_cap must be at least 1")
+    if timezone_name:
+        try:
+            ZoneInfo(timezone_name)
+        except Exception:
+            raise ValueError(f"Unknown timezone {timezone_name!r}")
+    return {
+        'days': days,
+        'start_time': f"{start // 60:02d}:{start % 60:02d}",
+        'end_time': f"{end // 60:02d}:{end % 60:02d}",
+        'daily_cap': int(daily_cap),
+        'timezone': timezone_name or None,
+    }
+
+
+class Schedule:
+    """One campaign_schedules row, ready for next-fire arithmetic."""
+
+    __slots__ = ("id", "agency_id", "days", "start", "end", "daily_cap", "tz", "key", "version",
+                 "dialed_on", "dialed_count", "window_end")
+
+    def __init__(self, row: dict, tz_name: str):
+        self.id = str(row['id'])
+        self.agency_id = str(row['agency_id'])
+        self.days = frozenset(int(day) for day in row.get('days') or ())
+        self.start = parse_time(row['start_time'])
+        self.end = parse_time(row['end_time'])
+        self.daily_cap = int(row.get('daily_cap') or 0)
+        self.tz = ZoneInfo(tz_name)
+        # What a reload compares to decide whether the schedule changed
+        self.key = (self.days, self.start, self.end, self.daily_cap, tz_name)
+        self.version = 0
+        self.dialed_on = date.fromisoformat(row['dialed_on']) if row.get('dialed_on') else None
+        self.dialed_count = int(row.get('dialed_count') or 0)
+        self.window_end = None  # end of the window last fed (epoch), to spot a new one
+
+    def _at(self, day: date, minutes: int) -> float:
+        # Wall-clock time in the schedule's timezone ("09:00" stays 09:00 across DST)
+        return datetime(day.year, day.month, day.day, minutes // 60, minutes % 60, tzinfo=self.tz).timestamp()
+
+    def window(self, after: float) -> tuple | None:
+        """(start, end, local date) of the first window ending after `after` (epoch)."""
+        today = datetime.fromtimestamp(after, self.tz).date()
+        for offset in range(8):
+            day = today + timedelta(days=offset)
+            if day.isoweekday() not in self.days:
+                continue
+            end = self._at(day, self.end)
+            if end > after:
+                return self._at(day, self.start), end, day
+        return None
+
+    def remaining(self, day: date) -> int:
+        """Dials left under the cap on a local date."""
+        return self.daily_cap - (self.dialed_count if self.dialed_on == day else 0)
+
+    def merge_count(self, other: "Schedule"):
+        """Keeps the later of two daily counts (this node's or the database's)."""
+        if (other.dialed_on or date.min, other.dialed_count) > (self.dialed_on or date.min, self.dialed_count):
+            self.dialed_on, self.dialed_count = other.dialed_on, other.dialed_count
+
+
+class CampaignScheduler:
+    def __init__(self):
+        self.feed_seconds = FEED_SECONDS
+        self.refresh_seconds = REFRESH_SECONDS
+        self.clock = time.time
+        # Hooks (set by main)
+        self.feed = None  # callable(agency_id, limit, window_opened) -> dials queued
+        self.pending = lambda agency_id: 0  # agency's queued + in-flight dials
+        self.slots = lambda agency_id: 1  # agency's in-flight cap (tier)
+        self.owns = lambda agency_id: True
+
+        self._schedules = {}  # schedule id -> Schedule
+        self._heap = []  # (fire at, seq, schedule id, version)
+        self._seq = itertools.count()
+        self._versions = itertools.count(1)
+        self._cond = threading.Condition()
+        self._reload = False
+        self._loaded_at = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+        metrics.gauge("campaign_schedules", lambda: len(self._schedules))
+
+    def configure(self, settings):
+        self.feed_seconds = settings.campaign_schedule_feed_seconds
+        self.refresh_seconds = settings.campaign_schedule_refresh_seconds
+
+    # --- heap ---
+
+    def _push(self, schedule: Schedule, after: float):
+        window = schedule.window(after)
+        if window is None:
+            return
+        start, end, day = window
+        fire_at = max(start, after)
+        if schedule.remaining(day) <= 0:
+            # Capped for today: the next window on another day
+            window = schedule.window(end)
+            if window is None:
+                return
+            fire_at = window[0]
+        heapq.heappush(self._heap, (fire_at, next(self._seq), schedule.id, schedule.version))
+
+    def set_schedules(self, schedules: list, now: float | None = None):
+        """
+        Replaces the schedule set. Unchanged schedules keep their place (and
+        cap count); new or changed ones are keyed by their next fire time.
+        """
+        now = self.clock() if now is None else now
+        with self._cond:
+            incoming = {schedule.id: schedule for schedule in schedules}
+            for schedule_id in set(self._schedules) - set(incoming):
+                del self._schedules[schedule_id]
+            for schedule_id, schedule in incoming.items():
+                current = self._schedules.get(schedule_id)
+                if current is not None and current.key == schedule.key:
+                    # Another node may have dialed for it meanwhile
+                    current.merge_count(schedule)
+                    continue
+                schedule.version = next(self._versions)
+                if current is not None:
+                    schedule.window_end = current.window_end
+                    schedule.merge_count(current)
+                self._schedules[schedule_id] = schedule
+                self._push(schedule, now)
+            if len(self._heap) > 2 * len(self._schedules) + 64:
+                # Mostly superseded entries - rebuild
+                self._heap = [entry for entry in self._heap if self._live(entry)]
+                heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def _live(self, entry) -> bool:
+        schedule = self._schedules.get(entry[2])
+        return schedule is not None and schedule.version == entry[3]
+
+    def next_fire(self) -> float | None:
+        """Epoch time of the earliest live heap entry."""
+        with self._cond:
+            while self._heap and not self._live(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def due(self, now: float) -> list:
+        """Pops the schedules due at `now`."""
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if self._live(entry):
+                    due.append(self._schedules[entry[2]])
+        return due
+
+    # --- firing ---
+
+    def fire(self, schedule: Schedule, now: float) -> int:
+        """Feeds one due schedule's agency and re-queues it. Returns dials queued."""
+        window = schedule.window(now)
+        queued = 0
+        next_at = None
+        if window is not None and window[0] <= now:
+            start, end, day = window
+            if not self.owns(schedule.agency_id):
+                metrics.inc("schedule_fires", result="not_owner")
+                next_at = now + NOT_OWNER_SECONDS
+            else:
+                opened = schedule.window_end != end
+                schedule.window_end = end
+                remaining = schedule.remaining(day)
+                want = self.slots(schedule.agency_id) * FEED_DEPTH - self.pending(schedule.agency_id)
+                limit = min(remaining, max(0, want), MAX_FEED)
+                if limit > 0 or opened:
+                    queued = self.feed(schedule.agency_id, limit, opened) if self.feed else 0
+                if queued:
+                    self._count(schedule, day, queued)
+                    metrics.inc("scheduled_dials", queued)
+                if limit > 0 and not queued:
+                    # Nothing left to dial - new leads may still come in
+                    metrics.inc("schedule_fires", result="no_leads")
+                    next_at = now + IDLE_SECONDS
+                else:
+                    metrics.inc("schedule_fires", result="fed" if queued else "full")
+                    next_at = now + self.feed_seconds
+        with self._cond:
+            if self._schedules.get(schedule.id) is not schedule:
+                return queued  # changed or deleted while feeding
+            if next_at is not None and window is not None and next_at < window[1] and schedule.remaining(window[2]) > 0:
+                heapq.heappush(self._heap, (next_at, next(self._seq), schedule.id, schedule.version))
+            else:
+                # Window over, capped or never opened: the next window
+                self._push(schedule, window[1] if window is not None and window[0] <= now else now)
+        return queued
+
+    def _count(self, schedule: Schedule, day: date, queued: int):
+        if schedule.dialed_on != day:
+            schedule.dialed_on, schedule.dialed_count = day, 0
+        schedule.dialed_count += queued
+        try:
+            supabase.table('campaign_schedules').update({
+                'dialed_on': day.isoformat(), 'dialed_count': schedule.dialed_count,
+            }).eq('id', schedule.id).execute()
+        except Exception as e:
+            print(f"⚠️ Could not save the daily dial count of schedule {schedule.id}: {e}")
+
+    def run_due(self, now: float | None = None) -> int:
+        """Fires every due schedule. Returns how many fired."""
+        now = self.clock() if now is None else now
+        fired = 0
+        for schedule in self.due(now):
+            try:
+                self.fire(schedule, now)
+            except Exception as e:
+                print(f"❌ Campaign schedule {schedule.id} (Agency {schedule.agency_id}) failed: {e}")
+                metrics.inc("schedule_errors")
+                with self._cond:
+                    if self._schedules.get(schedule.id) is schedule:
+                        heapq.heappush(self._heap, (now + self.feed_seconds, next(self._seq), schedule.id, schedule.version))
+            fired += 1
+        return fired
+
+    # --- loading ---
+
+    def load(self) -> list:
+        """Every enabled schedule, with the agency's timezone where none is set."""
+        rows = supabase.table('campaign_schedules').select(
+            'id, agency_id, days, start_time, end_time, daily_cap, timezone, dialed_on, dialed_count').eq(
+            'enabled', True).execute().data or []
+        missing = sorted({str(row['agency_id']) for row in rows if not row.get('timezone')})
+        timezones = {}
+        for i in range(0, len(missing), CHUNK):
+            agencies = supabase.table('agencies').select('id, timezone').in_('id', missing[i:i + CHUNK]).execute().data or []
+            timezones.update({str(agency['id']): agency.get('timezone') for agency in agencies})
+        schedules = []
+        for row in rows:
+            name = row.get('timezone') or timezones.get(str(row['agency_id'])) or DEFAULT_TIMEZONE
+            try:
+                schedules.append(Schedule(row, name))
+            except Exception as e:
+                print(f"⚠️ Skipping campaign schedule {row.get('id')}: {e}")
+        return schedules
+
+    def reload(self):
+        """Re-reads the schedules on the scheduler thread's next turn."""
+        with self._cond:
+            self._reload = True
+            self._cond.notify()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if self._reload or self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_seconds:
+                self._reload = False
+                try:
+                    self.set_schedules(self.load())
+                except Exception as e:
+                    print(f"❌ Loading campaign schedules failed: {e}")
+                    metrics.inc("schedule_errors")
+                self._loaded_at = time.monotonic()
+            self.run_due()
+            next_fire = self.next_fire()
+            wait = self.refresh_seconds - (time.monotonic() - self._loaded_at)
+            if next_fire is not None:
+                wait = min(wait, next_fire - self.clock())
+            with self._cond:
+                if not self._reload and not self._stopping.is_set():
+                    # Woken early by reload(), set_schedules() or stop()
+                    self._cond.wait(max(0.0, wait))
+
+    def start(self):
+        if self.refresh_seconds <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._loaded_at = None
+        self._thread = threading.Thread(target=self._run, name="campaign-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        with self._cond:
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def snapshot(self, agency_id: str) -> list:
+        """An agency's loaded schedules with their next fire time and today's count."""
+        with self._cond:
+            live = {}
+            for fire_at, _, schedule_id, version in self._heap:
+                schedule = self._schedules.get(schedule_id)
+                if schedule is not None and schedule.agency_id == agency_id and schedule.version == version:
+                    live[schedule_id] = min(fire_at, live.get(schedule_id, fire_at))
+            return [{
+                'id': schedule_id,
+                'next_fire_at': datetime.fromtimestamp(fire_at, timezone.utc).isoformat(),
+                'dialed_on': self._schedules[schedule_id].dialed_on.isoformat() if self._schedules[schedule_id].dialed_on else None,
+                'dialed_count': self._schedules[schedule_id].dialed_count,
+            } for schedule_id, fire_at in sorted(live.items(), key=lambda item: item[1])]
+
+
+campaign_scheduler = CampaignScheduler()
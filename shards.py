@@ -0,0 +1,303 @@
+# shards.py - Agency ownership across backend replicas (leases in Postgres)
+#
+# Every replica used to dial for whichever agency's /start-campaign or
+# inbound webhook it happened to receive, so replicas added no capacity
+# they could coordinate: two of them could run the same agency's campaign,
+# and each kept its own caller-ID slot counts for the same numbers. With
+# SHARDING_ENABLED each agency is dialed by exactly one node:
+#   - every node heartbeats into dialer_nodes; the live nodes split the
+#     agencies by rendezvous hashing (a node joining or leaving only moves
+#     the agencies it gains or loses),
+#   - ownership is an agency_leases row (node_id, expires_at) renewed by
+#     its owner every heartbeat with one conditional update; a node takes
+#     an agency only if its lease is free or expired, so a crashed node's
+#     agencies fail over after LEASE_SECONDS,
+#   - a node stops trusting its leases (owns() -> False, queued dials for
+#     them are dropped, not dialed) once it hasn't renewed for
+#     LEASE_SECONDS - SAFETY_SECONDS, before anyone else can take them,
+#   - on rebalance an agency is drained first: no new work, queued dials
+#     keep running for up to DRAIN_SECONDS (the rest are handed back and
+#     the campaign is re-requested for the new owner), and the lease is
+#     released once nothing of the agency is in flight here.
+# Work that arrives at a non-owner is handed over through the database:
+# /start-campaign flags agency_leases.campaign_requested_at and inbound
+# leads are saved as 'queued_inbound'; the owner picks both up on its next
+# heartbeat. Lead claims (lead_state) still guard every dial, so even an
+# overlap during failover can't dial a lead twice.
+#
+# Without SHARDING_ENABLED the node owns every agency and nothing is stored.
+
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from db import supabase
+from metrics import metrics
+
+HEARTBEAT_SECONDS = 3.0
+LEASE_SECONDS = 15.0
+SAFETY_SECONDS = 3.0  # stop dialing this long before our lease can expire
+DRAIN_SECONDS = 60.0
+AGENCY_REFRESH_SECONDS = 60.0
+CHUNK = 500  # agency ids per conditional update
+
+
+def default_node_id() -> str:
+    replica = os.environ.get("RAILWAY_REPLICA_ID")
+    if replica:
+        return replica
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def _score(agency_id: str, node_id: str) -> int:
+    digest = hashlib.blake2b(f"{agency_id}\0{node_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def rendezvous_owner(agency_id: str, nodes: list) -> str | None:
+    """The node an agency belongs to among `nodes` (highest random weight)."""
+    if not nodes:
+        return None
+    return max(nodes, key=lambda node_id: _score(str(agency_id), node_id))
+
+
+def _chunks(ids) -> list:
+    ids = sorted(ids)
+    return [ids[i:i + CHUNK] for i in range(0, len(ids), CHUNK)]
+
+
+class ShardManager:
+    def __init__(self):
+        self.enabled = False
+        self.node_id = default_node_id()
+        self.heartbeat_seconds = HEARTBEAT_SECONDS
+        self.lease_seconds = LEASE_SECONDS
+        # Hooks (set by main)
+        self.on_campaign = None  # callable(agency_id): run a handed-over campaign
+        self.on_tick = None  # callable(owned agency ids) every heartbeat
+        self.pending = lambda agency_id: 0  # local queued + in-flight dials of an agency
+        self.drop = lambda agency_id: 0  # hands back an agency's queued dials, returns how many
+
+        self._owned = set()  # leases held, taking new work
+        self._draining = {}  # agency id -> monotonic drain deadline (lease held, no new work)
+        self._valid_until = 0.0  # monotonic; our leases are trusted until then
+        self._nodes = []  # live node ids, sorted
+        self._agencies = set()
+        self._agencies_at = None
+        self._ensured = set()  # agency ids known to have a lease row
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        metrics.gauge("shard_agencies_owned", lambda: len(self._owned))
+        metrics.gauge("shard_nodes_live", lambda: len(self._nodes))
+
+    def configure(self, settings):
+        self.enabled = settings.sharding_enabled
+        self.node_id = settings.node_id or self.node_id
+        self.heartbeat_seconds = settings.shard_heartbeat_seconds
+        self.lease_seconds = settings.shard_lease_seconds
+
+    # --- ownership ---
+
+    def _valid(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    def owns(self, agency_id) -> bool:
+        """True if this node takes new work for the agency."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            return str(agency_id) in self._owned and self._valid()
+
+    def may_dial(self, agency_id) -> bool:
+        """True if this node may still dial for the agency (owned or draining)."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            agency_id = str(agency_id)
+            return (agency_id in self._owned or agency_id in self._draining) and self._valid()
+
+    def owner_of(self, agency_id) -> str | None:
+        if not self.enabled:
+            return self.node_id
+        with self._lock:
+            return rendezvous_owner(str(agency_id), self._nodes)
+
+    def owned(self) -> set:
+        with self._lock:
+            return set(self._owned) if self._valid() else set()
+
+    def request_campaign(self, agency_id: str):
+        """Hands a /start-campaign to the agency's owner (runs on its next heartbeat)."""
+        supabase.table('agency_leases').upsert({
+            'agency_id': agency_id,
+            'campaign_requested_at': datetime.now(timezone.utc).isoformat(),
+        }, on_conflict='agency_id').execute()
+        metrics.inc("shard_handoffs", kind="campaign")
+
+    # --- heartbeat ---
+
+    def _live_nodes(self, now: datetime) -> list:
+        stamp = now.isoformat()
+        supabase.table('dialer_nodes').upsert({'node_id': self.node_id, 'heartbeat_at': stamp}, on_conflict='node_id').execute()
+        cutoff = (now - timedelta(seconds=self.lease_seconds)).isoformat()
+        rows = supabase.table('dialer_nodes').select('node_id').gte('heartbeat_at', cutoff).execute().data or []
+        return sorted({row['node_id'] for row in rows} | {self.node_id})
+
+    def _all_agencies(self) -> set:
+        if self._agencies_at is None or time.monotonic() - self._agencies_at > AGENCY_REFRESH_SECONDS:
+            rows = supabase.table('agencies').select('id').execute().data or []
+            self._agencies = {str(row['id']) for row in rows}
+            self._agencies_at = time.monotonic()
+        return self._agencies
+
+    def tick(self):
+        """One heartbeat: renew, rebalance, acquire, pick up handoffs."""
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
+        stamp = now.isoformat()
+        expires = (now + timedelta(seconds=self.lease_seconds)).isoformat()
+
+        nodes = self._live_nodes(now)
+        agencies = self._all_agencies()
+        desired = {agency_id for agency_id in agencies if rendezvous_owner(agency_id, nodes) == self.node_id}
+
+        # Renew everything we hold in one statement; what comes back is ours
+        renewed = supabase.table('agency_leases').update({'expires_at': expires}).eq(
+            'node_id', self.node_id).execute().data or []
+        held = {str(row['agency_id']) for row in renewed}
+        valid_until = started + self.lease_seconds - SAFETY_SECONDS
+
+        # Agencies that belong elsewhere now: drain, then release
+        with self._lock:
+            draining = {a: d for a, d in self._draining.items() if a in held and a not in desired}
+            for agency_id in held - desired:
+                draining.setdefault(agency_id, started + DRAIN_SECONDS)
+            # No new work for them from here on
+            self._owned -= set(draining)
+            self._draining = dict(draining)
+        released, requeued = [], []
+        for agency_id, deadline in draining.items():
+            if self.pending(agency_id) and time.monotonic() > deadline:
+                if self.drop(agency_id):
+                    requeued.append(agency_id)
+            if not self.pending(agency_id):
+                released.append(agency_id)
+        with self._lock:
+            # Fence locally before the lease is up for grabs
+            for agency_id in released:
+                self._draining.pop(agency_id, None)
+        self._release(released, requeued, stamp)
+        for agency_id in released:
+            draining.pop(agency_id, None)
+            held.discard(agency_id)
+
+        # Take free or expired leases of agencies that belong here
+        wanted = desired - held
+        if wanted:
+            self._ensure_rows(wanted)
+            for chunk in _chunks(wanted):
+                for claim in (
+                    supabase.table('agency_leases').update({'node_id': self.node_id, 'expires_at': expires}).in_(
+                        'agency_id', chunk).is_('node_id', 'null'),
+                    supabase.table('agency_leases').update({'node_id': self.node_id, 'expires_at': expires}).in_(
+                        'agency_id', chunk).lt('expires_at', stamp),
+                ):
+                    got = claim.execute().data or []
+                    held |= {str(row['agency_id']) for row in got}
+                    renewed += got
+            metrics.inc("shard_leases_acquired", len(held & wanted))
+
+        with self._lock:
+            gained = (held - set(draining)) - self._owned
+            lost = self._owned - held
+            self._owned = held - set(draining)
+            self._draining = draining
+            self._nodes = nodes
+            self._valid_until = valid_until
+        if gained or lost or released:
+            print(f"   -> 🧭 Node {self.node_id}: owns {len(self._owned)} agencies "
+                  f"(+{len(gained)} -{len(lost) + len(released)}, {len(draining)} draining, {len(nodes)} nodes)")
+
+        self._pick_up_campaigns(renewed)
+        if self.on_tick is not None:
+            self.on_tick(self.owned())
+        metrics.observe("shard_heartbeat_seconds", time.monotonic() - started)
+
+    def _ensure_rows(self, agency_ids: set):
+        missing = agency_ids - self._ensured
+        if not missing:
+            return
+        for chunk in _chunks(missing):
+            # ON CONFLICT DO NOTHING: existing leases keep their owner
+            supabase.table('agency_leases').upsert(
+                [{'agency_id': agency_id} for agency_id in chunk], on_conflict='agency_id', ignore_duplicates=True,
+            ).execute()
+        self._ensured |= missing
+
+    def _release(self, agency_ids: list, requeued: list, stamp: str):
+        for chunk in _chunks(agency_ids):
+            values = {'node_id': None, 'expires_at': stamp}
+            handover = [agency_id for agency_id in chunk if agency_id in requeued]
+            rest = [agency_id for agency_id in chunk if agency_id not in requeued]
+            for ids, extra in ((handover, {'campaign_requested_at': stamp}), (rest, {})):
+                if ids:
+                    supabase.table('agency_leases').update({**values, **extra}).in_('agency_id', ids).eq(
+                        'node_id', self.node_id).execute()
+        if agency_ids:
+            metrics.inc("shard_leases_released", len(agency_ids))
+
+    def _pick_up_campaigns(self, leases: list):
+        for lease in leases:
+            requested_at = lease.get('campaign_requested_at')
+            agency_id = str(lease['agency_id'])
+            if not requested_at or not self.owns(agency_id):
+                continue
+            # Clear it only if nobody re-requested meanwhile (then it runs again)
+            cleared = supabase.table('agency_leases').update({'campaign_requested_at': None}).eq(
+                'agency_id', agency_id).eq('node_id', self.node_id).eq('campaign_requested_at', requested_at).execute()
+            if cleared.data and self.on_campaign is not None:
+                metrics.inc("shard_handoffs_run", kind="campaign")
+                self.on_campaign(agency_id)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                # Leases lapse on their own if this keeps failing (owns() -> False)
+                print(f"❌ Shard heartbeat failed on node {self.node_id}: {e}")
+                metrics.inc("shard_heartbeat_errors")
+            self._stopping.wait(self.heartbeat_seconds)
+
+    def start(self):
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="shards", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Leaves the cluster: releases every lease so other nodes take over at once."""
+        if not self.enabled:
+            return
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            mine = self._owned | set(self._draining)
+            self._owned, self._draining, self._valid_until = set(), {}, 0.0
+        try:
+            self._release(sorted(mine), [], datetime.now(timezone.utc).isoformat())
+            supabase.table('dialer_nodes').delete().eq('node_id', self.node_id).execute()
+        except Exception as e:
+            print(f"⚠️ Could not release leases of node {self.node_id}: {e}")
+
+
+shards = ShardManager()
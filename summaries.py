@@ -0,0 +1,299 @@
+# summaries.py - AI call summaries, off the dialing path
+#
+# Each end-of-call-report hands the call's transcript to the SummaryWorker.
+# submit() never waits, and the worker runs as a task on the event loop, so
+# dialing is never held up by OpenAI:
+#   - summaries are cached by a hash of the transcript, and identical
+#     transcripts in flight share one request (a repeated report or the
+#     same voicemail greeting costs nothing),
+#   - transcripts over the token budget keep their opening and their end
+#     (where the outcome is) and drop the middle,
+#   - short calls (voicemails, no answers) are summarized together, up to
+#     BATCH_SIZE per request, returned as one JSON array,
+#   - at most `max_concurrency` requests are in flight; rate limits, 5xx
+#     and connection errors are retried with exponential backoff + jitter.
+# Without OPENAI_API_KEY the summary is the opening of the transcript.
+# The openai SDK (most of the app's import time) is only imported when the
+# first summary is requested, in a thread so the event loop never waits on it.
+# Tests point OPENAI_BASE_URL at benchmarks.fakes.OpenAIStub.
+
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from metrics import metrics
+
+CHARS_PER_TOKEN = 4  # rough estimate for English/French speech
+SHORT_CALL_TOKENS = 300  # calls up to this size are batched
+BATCH_SIZE = 8
+BATCH_WAIT_SECONDS = 2.0
+MAX_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 1.0
+CACHE_SIZE = 5000
+QUEUE_SIZE = 2000
+FALLBACK_CHARS = 500
+
+SYSTEM_PROMPT = (
+    "You write CRM notes for a real estate agency. Summarize the phone call "
+    "between the AI agent and the lead in 1-3 sentences: who they are, what "
+    "they want (buy/sell/valuation), objections, and any appointment booked. "
+    "If nobody answered or it reached voicemail, say so in one sentence."
+)
+BATCH_PROMPT = SYSTEM_PROMPT + (
+    " You will get several numbered calls. Reply with JSON only: "
+    '{"summaries": ["<summary of call 1>", "<summary of call 2>", ...]} '
+    "with exactly one summary per call, in order."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_transcript(text: str, max_tokens: int) -> str:
+    """Keeps the opening quarter and the closing three quarters of the budget."""
+    budget = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= budget:
+        return text
+    head = budget // 4
+    tail = budget - head
+    return f"{text[:head]}\n[... middle of the call omitted ...]\n{text[-tail:]}"
+
+
+def fallback_summary(transcript: str) -> str:
+    text = transcript[:FALLBACK_CHARS]
+    return text + ("..." if len(transcript) > FALLBACK_CHARS else "")
+
+
+@dataclass
+class SummaryJob:
+    call_id: str
+    transcript: str
+    on_done: object  # callable(summary), run in a worker thread
+    key: str = ""
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class SummaryWorker:
+    def __init__(self, model: str = "gpt-4o-mini", max_concurrency: int = 4, max_input_tokens: int = 3000):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_input_tokens = max_input_tokens
+        self.client = None
+        self._client_options = None  # AsyncOpenAI kwargs; None = no API key, fallback summaries
+        self._client_lock = threading.Lock()
+        self._retry_errors = ()
+        self._cache = OrderedDict()  # transcript hash -> summary
+        self._queue = None
+        self._semaphore = None
+        self._dispatcher = None
+        self._batch = []  # short calls waiting to be summarized together
+        self._waiting = {}  # hash being summarized -> later jobs with the same transcript
+        self._tasks = set()
+
+        metrics.gauge("summary_queue_depth", lambda: self._queue.qsize() if self._queue else 0)
+        metrics.gauge("summary_in_flight", lambda: len(self._tasks))
+
+    def configure(self, settings):
+        self.model = settings.summary_model
+        self.max_concurrency = settings.summary_max_concurrency
+        self.max_input_tokens = settings.summary_max_input_tokens
+        self.client = None
+        self._client_options = None
+        if settings.openai_api_key:
+            # Retries are ours (backoff shared with batching), not the SDK's
+            self._client_options = dict(
+                api_key=settings.openai_api_key,
+                base_url=settings.openai_base_url or None,
+                max_retries=0,
+                timeout=30.0,
+            )
+
+    def _create_client(self):
+        """Imports the SDK and builds the client on first use (run in a thread)."""
+        with self._client_lock:
+            if self.client is None:
+                from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+                self._retry_errors = (APIConnectionError, APIStatusError)
+                self.client = AsyncOpenAI(**self._client_options)
+        return self.client
+
+    # --- queueing ---
+
+    def submit(self, job: SummaryJob) -> bool:
+        """Queues a summary (call from the event loop). Never waits."""
+        if self._queue is None:
+            return False
+        job.transcript = truncate_transcript(job.transcript, self.max_input_tokens)
+        job.key = hashlib.sha256(f"{self.model}\0{job.transcript}".encode()).hexdigest()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.inc("summaries", result="dropped")
+            self._spawn(self._finish([job], [fallback_summary(job.transcript)], "fallback"))
+            return False
+        return True
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self):
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                job = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                job = None
+
+            if job is not None:
+                cached = self._cache.get(job.key)
+                if cached is not None:
+                    self._cache.move_to_end(job.key)
+                    metrics.inc("summaries", result="cached")
+                    self._spawn(self._finish([job], [cached], "cache"))
+                elif self._client_options is None:
+                    self._spawn(self._finish([job], [fallback_summary(job.transcript)], "fallback"))
+                elif job.key in self._waiting:
+                    # Same transcript already being summarized - share the answer
+                    metrics.inc("summaries", result="coalesced")
+                    self._waiting[job.key].append(job)
+                elif estimate_tokens(job.transcript) > SHORT_CALL_TOKENS:
+                    self._waiting[job.key] = []
+                    self._spawn(self._summarize([job]))
+                else:
+                    self._waiting[job.key] = []
+                    self._batch.append(job)
+                    if deadline is None:
+                        deadline = time.monotonic() + BATCH_WAIT_SECONDS
+
+            if self._batch and (len(self._batch) >= BATCH_SIZE or job is None):
+                self._spawn(self._summarize(self._batch))
+                self._batch, deadline = [], None
+
+    # --- OpenAI ---
+
+    async def _summarize(self, jobs: list):
+        try:
+            async with self._semaphore:
+                if len(jobs) == 1:
+                    summaries = [await self._complete_one(jobs[0].transcript)]
+                else:
+                    summaries = await self._complete_batch([job.transcript for job in jobs])
+        except Exception as e:
+            print(f"❌ Summary failed for {len(jobs)} calls: {e}")
+            metrics.inc("summaries", len(jobs), result="failed")
+            summaries = [fallback_summary(job.transcript) for job in jobs]
+            await self._finish(jobs, summaries, "fallback")
+            return
+
+        if summaries is None:
+            # Batch answer didn't line up with the calls - do them one by one
+            metrics.inc("summary_batches_split")
+            for job in jobs:
+                self._spawn(self._summarize([job]))
+            return
+        for job, summary in zip(jobs, summaries):
+            self._cache[job.key] = summary
+        while len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+        metrics.inc("summaries", len(jobs), result="summarized")
+        await self._finish(jobs, summaries, "openai")
+
+    async def _complete_one(self, transcript: str) -> str:
+        content = await self._complete([
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": transcript},
+        ])
+        return content.strip()
+
+    async def _complete_batch(self, transcripts: list) -> list | None:
+        numbered = "\n\n".join(f"### Call {i}\n{text}" for i, text in enumerate(transcripts, 1))
+        content = await self._complete([
+            {"role": "system", "content": BATCH_PROMPT},
+            {"role": "user", "content": numbered},
+        ], json_mode=True)
+        try:
+            summaries = json.loads(content).get("summaries")
+        except (ValueError, AttributeError):
+            return None
+        if not isinstance(summaries, list) or len(summaries) != len(transcripts):
+            return None
+        return [str(summary).strip() for summary in summaries]
+
+    async def _complete(self, messages: list, json_mode: bool = False) -> str:
+        kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+        client = self.client or await asyncio.to_thread(self._create_client)
+        for attempt in range(MAX_ATTEMPTS):
+            start = time.perf_counter()
+            try:
+                response = await client.chat.completions.create(
+                    model=self.model, messages=messages, temperature=0.2, **kwargs,
+                )
+                metrics.observe("summary_request_seconds", time.perf_counter() - start)
+                return response.choices[0].message.content or ""
+            except self._retry_errors as e:
+                status = getattr(e, "status_code", None)
+                retryable = status is None or status == 429 or status >= 500
+                metrics.inc("summary_request_errors", status=status or "connection")
+                if not retryable or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                delay = BACKOFF_BASE_SECONDS * 2 ** attempt
+                await asyncio.sleep(delay + random.uniform(0, delay))
+        raise RuntimeError("unreachable")
+
+    async def _finish(self, jobs: list, summaries: list, source: str):
+        pairs = []
+        for job, summary in zip(jobs, summaries):
+            pairs.append((job, summary))
+            pairs += [(follower, summary) for follower in self._waiting.pop(job.key, ())]
+        for job, summary in pairs:
+            metrics.observe("summary_latency_seconds", time.monotonic() - job.enqueued_at, source=source)
+            try:
+                await asyncio.to_thread(job.on_done, summary)
+            except Exception as e:
+                print(f"❌ Error delivering summary for call {job.call_id}: {e}")
+
+    # --- lifecycle ---
+
+    def start(self):
+        """Starts the dispatcher on the running loop (app startup)."""
+        self._queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def stop(self, timeout: float):
+        """
+        Finishes queued and in-flight summaries within `timeout` seconds;
+        whatever is left is delivered with the fallback summary.
+        """
+        if self._dispatcher is None:
+            return
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._dispatcher.cancel()
+        if self._batch:
+            self._spawn(self._summarize(self._batch))
+            self._batch = []
+        leftover = []
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+        if leftover:
+            self._spawn(self._finish(leftover, [fallback_summary(j.transcript) for j in leftover], "fallback"))
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=max(0.1, deadline - time.monotonic()))
+        for task in list(self._tasks):
+            task.cancel()
+        self._dispatcher = None
+        self._queue = None
+
+
+summary_worker = SummaryWorker()
@@ -0,0 +1,487 @@
+# suppression.py - Do-not-call and opt-out suppression lists
+#
+# Numbers nobody may dial live in suppressed_numbers: a global list
+# (agency_id NULL - national DNC registries, numbers that opted out of
+# everyone) and per-agency lists (a lead who asked that agency to stop).
+# Every dial checks the number against both, in memory:
+#   - a list is a NumberSet: the E.164 digits as an integer, split into
+#     buckets by their high 32 bits, each bucket a sorted array of the low
+#     32 bits (4 bytes per number - tens of millions of numbers fit in a
+#     few hundred MB, where a Python set of strings would take gigabytes).
+#     A lookup is a dict get plus a binary search: about a microsecond,
+#   - changes since the last compaction sit in small added/removed sets;
+#     past COMPACT_AT they are merged into the arrays (slice copies, only
+#     the buckets they touch). Readers never lock: a list's state is one
+#     tuple swapped atomically by its writer.
+# On startup the lists are loaded in keyset pages ordered by number, so
+# they are built by appending - no sort, no intermediate set. After that
+# rows changed since the last sync (updated_at) are applied every
+# `sync_seconds`, so numbers added through another replica show up within
+# a sync; a change set bigger than RELOAD_ABOVE (a registry upload) is
+# picked up by reloading instead. Removals are soft (removed_at) for the
+# same reason. Until the first load completes, checks query the table.
+#
+# Bulk uploads (one number per line, or the first column of a CSV) are
+# spooled to disk and written in the background like lead imports.
+
+import csv
+import os
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from db import supabase
+from lifecycle import tracker
+from metrics import metrics
+from phone import DEFAULT_REGION, normalize_many
+
+LOW_BITS = 32
+LOW_MASK = (1 << LOW_BITS) - 1
+COMPACT_AT = 1024  # pending changes per list before they are merged
+PAGE_SIZE = 10000
+UPSERT_CHUNK = 1000
+BULK_CHUNK = 5000  # lines normalized at a time
+RELOAD_ABOVE = 100000  # changes applied by reloading rather than merging
+SYNC_SECONDS = 30.0
+SYNC_OVERLAP_SECONDS = 10.0  # re-read this much before the cursor (clock skew between writers)
+MAX_JOBS_KEPT = 100
+COLUMNS = 'id, agency_id, number, removed_at, updated_at'
+
+
+def number_key(phone) -> int | None:
+    """E.164 ('+352621123456') -> 352621123456; None if it isn't E.164."""
+    if not isinstance(phone, str) or len(phone) < 2 or phone[0] != '+' or not phone[1:].isdigit():
+        return None
+    return int(phone[1:])
+
+
+def _merge(lows: array, adds: list, removes: set) -> array:
+    """A sorted bucket with `adds` (sorted) inserted and `removes` taken out."""
+    size = len(lows)
+    cuts = []
+    for low in adds:
+        i = bisect_left(lows, low)
+        if i == size or lows[i] != low:
+            cuts.append((i, 0, low))
+    for low in removes:
+        i = bisect_left(lows, low)
+        if i < size and lows[i] == low:
+            cuts.append((i, 1, low))
+    if not cuts:
+        return lows
+    cuts.sort()
+    out = array('I')
+    pos = 0
+    for i, removal, low in cuts:
+        out.extend(lows[pos:i])
+        if removal:
+            pos = i + 1
+        else:
+            out.append(low)
+            pos = i
+    out.extend(lows[pos:])
+    return out
+
+
+def _in_buckets(buckets: dict, number: int) -> bool:
+    lows = buckets.get(number >> LOW_BITS)
+    if lows is None:
+        return False
+    low = number & LOW_MASK
+    i = bisect_left(lows, low)
+    return i < len(lows) and lows[i] == low
+
+
+class NumberSet:
+    """Exact set of phone numbers (integer E.164 digits), compact and lock-free to read."""
+
+    def __init__(self, buckets: dict | None = None):
+        # (high bits -> sorted array('I') of low bits, added, removed)
+        self._state = (buckets or {}, frozenset(), frozenset())
+        self._lock = threading.Lock()
+
+    def __contains__(self, number: int) -> bool:
+        buckets, added, removed = self._state
+        if number in added:
+            return True
+        if number in removed:
+            return False
+        return _in_buckets(buckets, number)
+
+    def __len__(self) -> int:
+        buckets, added, removed = self._state
+        return sum(len(lows) for lows in buckets.values()) + len(added) - len(removed)
+
+    @property
+    def nbytes(self) -> int:
+        buckets, added, removed = self._state
+        return sum(lows.buffer_info()[1] * lows.itemsize for lows in buckets.values()) + 64 * (len(added) + len(removed))
+
+    def apply(self, adds=(), removes=()):
+        """Adds and removes numbers (a number in both is added)."""
+        adds, removes = set(adds), set(removes) - set(adds)
+        if not adds and not removes:
+            return
+        with self._lock:
+            buckets, added, removed = self._state
+            # Pending sets only hold differences from the arrays
+            added = (added - removes) | {number for number in adds if not _in_buckets(buckets, number)}
+            removed = (removed - adds) | {number for number in removes if _in_buckets(buckets, number)}
+            if len(added) + len(removed) > COMPACT_AT:
+                buckets, added, removed = self._compacted(buckets, added, removed), (), ()
+            self._state = (buckets, frozenset(added), frozenset(removed))
+
+    @staticmethod
+    def _compacted(buckets: dict, added, removed) -> dict:
+        changes = {}
+        for number in added:
+            changes.setdefault(number >> LOW_BITS, ([], set()))[0].append(number & LOW_MASK)
+        for number in removed:
+            changes.setdefault(number >> LOW_BITS, ([], set()))[1].add(number & LOW_MASK)
+        merged = dict(buckets)
+        for high, (adds, removes) in changes.items():
+            lows = _merge(buckets.get(high, array('I')), sorted(adds), removes)
+            if lows:
+                merged[high] = lows
+            else:
+                merged.pop(high, None)
+        metrics.inc("suppression_compactions")
+        return merged
+
+
+class SortedNumbers:
+    """Builds a NumberSet from numbers arriving in ascending order (appends only)."""
+
+    def __init__(self):
+        self.buckets = {}
+        self._high = None
+        self._lows = None
+        self._last = -1
+        self._unsorted = set()  # buckets that got a number out of order
+
+    def append(self, number: int):
+        high = number >> LOW_BITS
+        if high != self._high:
+            self._high = high
+            self._lows = self.buckets.setdefault(high, array('I'))
+        if number <= self._last:
+            self._unsorted.add(high)
+        self._last = number
+        self._lows.append(number & LOW_MASK)
+
+    def build(self) -> NumberSet:
+        for high in self._unsorted:
+            self.buckets[high] = array('I', sorted(set(self.buckets[high])))
+        return NumberSet(self.buckets)
+
+
+@dataclass
+class BulkLoad:
+    id: str
+    agency_id: str | None  # None = global list
+    region: str | None = DEFAULT_REGION  # country used to read national numbers (None: unknown)
+    source: str = "upload"
+    status: str = "queued"  # queued, running, completed, failed, interrupted
+    bytes_received: int = 0
+    lines_read: int = 0
+    added: int = 0
+    invalid: int = 0
+    error: str | None = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    finished_at: str | None = None
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _stamp() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Suppression:
+    def __init__(self):
+        self.lists = {}  # None (global) or agency id -> NumberSet
+        self.ready = False
+        self.sync_seconds = SYNC_SECONDS
+        self._cursor = None  # updated_at of the newest change applied
+        self._sync_lock = threading.Lock()  # one load/sync at a time
+        self._lists_lock = threading.Lock()
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        metrics.gauge("suppression", self.snapshot)
+
+    def configure(self, settings):
+        self.sync_seconds = settings.suppression_sync_seconds
+
+    # --- checks ---
+
+    def is_suppressed(self, phone: str, agency_id=None) -> bool:
+        """True if an E.164 number is on the global list or the agency's."""
+        number = number_key(phone)
+        if number is None:
+            return False
+        if not self.ready:
+            return self._lookup(number, agency_id)
+        lists = self.lists
+        everyone = lists.get(None)
+        if everyone is not None and number in everyone:
+            return True
+        mine = lists.get(str(agency_id)) if agency_id else None
+        return mine is not None and number in mine
+
+    def _lookup(self, number: int, agency_id) -> bool:
+        # Before the first load: ask the database (errors propagate - no dial)
+        rows = supabase.table('suppressed_numbers').select('agency_id').eq('number', number).is_(
+            'removed_at', 'null').limit(100).execute().data or []
+        return any(row.get('agency_id') is None or str(row['agency_id']) == str(agency_id) for row in rows)
+
+    # --- loading ---
+
+    def _scan(self, column: str, after=None, live_only: bool = False):
+        """Pages of rows ordered by (column, id), after `after` in column."""
+        def query():
+            q = supabase.table('suppressed_numbers').select(COLUMNS)
+            return q.is_('removed_at', 'null') if live_only else q
+
+        value, last_id, tie_left = after, None, False
+        while True:
+            if tie_left:
+                # Rest of the rows sharing the last page's final value
+                rows = query().eq(column, value).gt('id', last_id).order('id').limit(PAGE_SIZE).execute().data or []
+                tie_left = len(rows) == PAGE_SIZE
+                if rows:
+                    last_id = rows[-1]['id']
+                    yield rows
+                    continue
+            q = query()
+            if value is not None:
+                q = q.gt(column, value)
+            rows = q.order(column).order('id').limit(PAGE_SIZE).execute().data or []
+            if rows:
+                yield rows
+            if len(rows) < PAGE_SIZE:
+                return
+            value, last_id, tie_left = rows[-1][column], rows[-1]['id'], True
+
+    def load(self):
+        """Rebuilds every list from the table (keyset pages ordered by number)."""
+        with self._sync_lock:
+            start = time.perf_counter()
+            newest = supabase.table('suppressed_numbers').select('updated_at').order(
+                'updated_at', desc=True).limit(1).execute().data or []
+            builders = {}
+            rows_read = 0
+            for rows in self._scan('number', live_only=True):
+                for row in rows:
+                    key = str(row['agency_id']) if row.get('agency_id') else None
+                    builder = builders.get(key)
+                    if builder is None:
+                        builder = builders[key] = SortedNumbers()
+                    builder.append(int(row['number']))
+                rows_read += len(rows)
+            lists = {key: builder.build() for key, builder in builders.items()}
+            with self._lists_lock:
+                self.lists = lists
+            # Changes made while loading are re-read by the next sync
+            self._cursor = newest[0]['updated_at'] if newest else None
+            self.ready = True
+            seconds = time.perf_counter() - start
+            metrics.observe("suppression_load_seconds", seconds)
+            print(f"🚫 Loaded {rows_read} suppressed numbers ({len(lists)} lists) in {seconds:.1f}s")
+
+    def sync(self) -> int:
+        """Applies rows changed since the last sync. Returns how many."""
+        if not self.ready:
+            self.load()
+            return 0
+        with self._sync_lock:
+            after = self._cursor
+            if after is not None:
+                after = (datetime.fromisoformat(after.replace('Z', '+00:00')) - timedelta(seconds=SYNC_OVERLAP_SECONDS)).isoformat()
+            changes = {}  # list key -> {number: removed}
+            seen = 0
+            cursor = self._cursor
+            for rows in self._scan('updated_at', after):
+                for row in rows:
+                    key = str(row['agency_id']) if row.get('agency_id') else None
+                    changes.setdefault(key, {})[int(row['number'])] = row.get('removed_at') is not None
+                seen += len(rows)
+                cursor = max(cursor or '', rows[-1]['updated_at'])
+                if seen > RELOAD_ABOVE:
+                    break
+        if seen > RELOAD_ABOVE:
+            # A bulk upload elsewhere - cheaper to rebuild than to merge
+            self.load()
+            return seen
+        for key, numbers in changes.items():
+            self._list(key).apply(
+                adds=[number for number, removed in numbers.items() if not removed],
+                removes=[number for number, removed in numbers.items() if removed],
+            )
+        self._cursor = cursor
+        return seen
+
+    def _list(self, key) -> NumberSet:
+        numbers = self.lists.get(key)
+        if numbers is None:
+            with self._lists_lock:
+                numbers = self.lists.get(key)
+                if numbers is None:
+                    numbers = NumberSet()
+                    # Copy-on-write: readers keep iterating the dict they got
+                    self.lists = {**self.lists, key: numbers}
+        return numbers
+
+    # --- changes ---
+
+    def add(self, phones: list, agency_id=None, source: str = "manual", reason: str | None = None,
+            apply: bool = True) -> int:
+        """
+        Suppresses E.164 numbers (globally when agency_id is None). Returns
+        how many rows were written.
+        """
+        stamp = _stamp()
+        rows = []
+        for phone in dict.fromkeys(phones):
+            number = number_key(phone)
+            if number is not None:
+                rows.append({
+                    'agency_id': agency_id, 'phone_number': phone, 'number': number,
+                    'source': source, 'reason': reason, 'removed_at': None, 'updated_at': stamp,
+                })
+        for i in range(0, len(rows), UPSERT_CHUNK):
+            supabase.table('suppressed_numbers').upsert(rows[i:i + UPSERT_CHUNK], on_conflict='agency_id,number').execute()
+        if apply and rows:
+            self._list(str(agency_id) if agency_id else None).apply(adds=[row['number'] for row in rows])
+        metrics.inc("suppressed_numbers_added", len(rows), list="agency" if agency_id else "global")
+        return len(rows)
+
+    def remove(self, phone: str, agency_id=None) -> bool:
+        """Lifts a suppression. Leads already marked do_not_call stay so."""
+        number = number_key(phone)
+        if number is None:
+            return False
+        stamp = _stamp()
+        query = supabase.table('suppressed_numbers').update({'removed_at': stamp, 'updated_at': stamp}).eq(
+            'number', number).is_('removed_at', 'null')
+        query = query.eq('agency_id', agency_id) if agency_id else query.is_('agency_id', 'null')
+        removed = bool(query.execute().data)
+        self._list(str(agency_id) if agency_id else None).apply(removes=[number])
+        return removed
+
+    # --- bulk uploads ---
+
+    def create_job(self, agency_id: str | None, region: str | None = DEFAULT_REGION, source: str = "upload") -> BulkLoad:
+        job = BulkLoad(id=str(uuid.uuid4()), agency_id=agency_id, region=region, source=source)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > MAX_JOBS_KEPT:
+                oldest = next((k for k, j in self._jobs.items() if j.finished_at), None)
+                if oldest is None:
+                    break
+                del self._jobs[oldest]
+        return job
+
+    def get_job(self, job_id: str) -> BulkLoad | None:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def run_bulk_load(self, job: BulkLoad, path: str):
+        """Suppresses every number in a spooled upload. Runs in a worker thread."""
+        job.status = "running"
+        collected = set()  # applied in one merge at the end (or by reloading)
+        chunk = []
+
+        def flush():
+            phones = [phone for phone in normalize_many(chunk, job.region) if phone]
+            job.invalid += len(chunk) - len(phones)
+            job.added += self.add(phones, job.agency_id, source=job.source, apply=False)
+            if len(collected) <= RELOAD_ABOVE:
+                collected.update(number_key(phone) for phone in phones)
+            chunk.clear()
+
+        try:
+            with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+                for values in csv.reader(f):
+                    if not values or not values[0].strip():
+                        continue
+                    job.lines_read += 1
+                    if job.lines_read == 1 and not any(c.isdigit() for c in values[0]):
+                        continue  # header
+                    chunk.append(values[0])
+                    if len(chunk) >= BULK_CHUNK:
+                        flush()
+                        if tracker.stopping.is_set():
+                            job.status = "interrupted"
+                            job.error = "Server shut down during upload - re-upload the file to finish"
+                            return
+                if chunk:
+                    flush()
+            job.status = "completed"
+            print(f"✅ Suppression upload {job.id} complete: {job.added} numbers, {job.invalid} invalid")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)[:500]
+            print(f"❌ Suppression upload {job.id} failed: {e}")
+        finally:
+            # What was written is suppressed even if the upload stopped early
+            try:
+                if len(collected) > RELOAD_ABOVE:
+                    self.load()
+                elif collected:
+                    self._list(str(job.agency_id) if job.agency_id else None).apply(adds=collected)
+            except Exception as e:
+                print(f"⚠️ Suppression upload {job.id}: lists not refreshed ({e}), next sync picks the numbers up")
+            job.finished_at = datetime.now().isoformat()
+            metrics.inc("suppression_uploads", status=job.status)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    # --- lifecycle ---
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                changed = self.sync()
+                if changed:
+                    metrics.inc("suppression_synced", changed)
+            except Exception as e:
+                print(f"❌ Suppression list sync failed: {e}")
+                metrics.inc("suppression_sync_errors")
+            self._stopping.wait(self.sync_seconds)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="suppression", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def snapshot(self) -> dict:
+        lists = self.lists
+        everyone = lists.get(None)
+        return {
+            "ready": self.ready,
+            "lists": len(lists),
+            "global_numbers": len(everyone) if everyone is not None else 0,
+            "numbers": sum(len(numbers) for numbers in lists.values()),
+            "bytes": sum(numbers.nbytes for numbers in lists.values()),
+        }
+
+
+suppression = Suppression()
@@ -0,0 +1,40 @@
+# tests/conftest.py - Shared fixtures
+#
+# Tests run against the same local fakes as the benchmarks: FakeSupabase is
+# installed as the process-wide client (db.set_supabase) and settings are
+# built in code, so no environment or network is needed.
+#
+#   python -m pytest -q
+
+import pytest
+
+import config
+import db
+from benchmarks.fakes import FakeSupabase
+from lifecycle import tracker
+
+ADMIN_TOKEN = "test-admin-token"
+
+
+@pytest.fixture(autouse=True)
+def accepting_work():
+    # An app shut down by an earlier test leaves the tracker stopping
+    tracker.reset()
+    yield
+    tracker.reset()
+
+
+@pytest.fixture
+def settings():
+    settings = config.Settings(supabase_url="http://fake-supabase", supabase_key="fake", admin_token=ADMIN_TOKEN)
+    config.configure(settings)
+    yield settings
+    config.configure(None)
+
+
+@pytest.fixture
+def fake_db(settings):
+    fake = FakeSupabase()
+    db.set_supabase(fake)
+    yield fake
+    db.set_supabase(None)
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, Rejected, TokenBucket
+
+
+def rejection(controller, agency_id="agency-1") -> Rejected:
+    with pytest.raises(Rejected) as info:
+        controller.admit(agency_id)
+    return info.value
+
+
+def test_token_bucket_allows_a_burst_then_the_steady_rate():
+    bucket = TokenBucket(rate=2.0, burst=3.0)
+    now = bucket.updated
+    assert [bucket.take(now) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(now) == pytest.approx(0.5)
+    assert bucket.take(now + 0.5) == 0.0
+
+
+def test_agency_over_its_rate_is_rejected_without_affecting_others():
+    controller = AdmissionController(agency_rate=1.0, agency_burst=2.0)
+    controller.admit("agency-1")
+    controller.admit("agency-1")
+    rejected = rejection(controller)
+    assert rejected.reason == "agency_rate"
+    assert rejected.retry_after_header == "1"
+    controller.admit("agency-2")
+
+
+def test_in_flight_limit_and_leave():
+    controller = AdmissionController(max_in_flight=2)
+    controller.admit("agency-1")
+    controller.admit("agency-2")
+    assert rejection(controller, "agency-3").reason == "in_flight"
+    controller.leave()
+    controller.admit("agency-3")
+
+
+def test_dial_backlog_rejects():
+    controller = AdmissionController(max_dial_backlog=10)
+    controller.backlog = lambda: 10
+    rejected = rejection(controller)
+    assert rejected.reason == "dial_backlog"
+    assert rejected.retry_after_header == "30"
+
+
+def test_loop_lag_rejects():
+    controller = AdmissionController(max_loop_lag=0.25)
+    controller.loop_lag = 0.5
+    assert rejection(controller).reason == "loop_lag"
+
+
+def test_rejected_requests_do_not_take_a_slot():
+    controller = AdmissionController(agency_rate=1.0, agency_burst=1.0)
+    controller.admit("agency-1")
+    rejection(controller)
+    assert controller.in_flight == 1
+
+
+def test_retry_after_header_rounds_up():
+    assert Rejected("agency_rate", 0.2).retry_after_header == "1"
+    assert Rejected("agency_rate", 2.1).retry_after_header == "3"
+
+
+def test_lag_ticker_sees_a_blocked_loop():
+    async def scenario():
+        controller = AdmissionController()
+        controller.start()
+        await asyncio.sleep(0)
+        time.sleep(0.5)  # blocks the loop
+        await asyncio.sleep(0.15)
+        lag = controller.loop_lag
+        await controller.stop()
+        return lag
+
+    assert asyncio.run(scenario()) > 0.25
+
+
+def test_run_uses_the_inbound_pool():
+    async def scenario():
+        controller = AdmissionController()
+        name = await controller.run(lambda: threading.current_thread().name)
+        await controller.stop()
+        return name
+
+    assert asyncio.run(scenario()).startswith("inbound")
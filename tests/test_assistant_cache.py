@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+from assistant_cache import AssistantConfigCache
+
+
+class Builder:
+    """build() for get_or_build that counts calls and can be held open."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, phone_number):
+        self.calls += 1
+        await self.release.wait()
+        return {"phone": phone_number, "build": self.calls}
+
+
+def test_hits_are_served_per_call_id():
+    async def scenario():
+        cache = AssistantConfigCache()
+        build = Builder()
+        build.release.set()
+        first = await cache.get_or_build("call-1", "+15555550100", build)
+        again = await cache.get_or_build("call-1", "+15555550100", build)
+        other = await cache.get_or_build("call-2", "+15555550100", build)
+        return first, again, other, build.calls
+
+    first, again, other, calls = asyncio.run(scenario())
+    assert first is again
+    assert other["build"] == 2
+    assert calls == 2
+
+
+def test_expired_and_evicted_entries_are_rebuilt():
+    async def scenario():
+        build = Builder()
+        build.release.set()
+        expiring = AssistantConfigCache(ttl_seconds=0)
+        await expiring.get_or_build("call-1", "+1", build)
+        await expiring.get_or_build("call-1", "+1", build)
+        small = AssistantConfigCache(max_entries=1)
+        await small.get_or_build("call-1", "+1", build)
+        await small.get_or_build("call-2", "+2", build)
+        await small.get_or_build("call-1", "+1", build)
+        return build.calls
+
+    assert asyncio.run(scenario()) == 5
+
+
+def test_concurrent_misses_share_one_build():
+    async def scenario():
+        cache = AssistantConfigCache()
+        build = Builder()
+        tasks = [asyncio.create_task(cache.get_or_build(f"call-{i}", "+15555550100", build)) for i in range(5)]
+        await asyncio.sleep(0)
+        build.release.set()
+        return await asyncio.gather(*tasks), build.calls
+
+    configs, calls = asyncio.run(scenario())
+    assert calls == 1
+    assert all(config is configs[0] for config in configs)
+
+
+def test_build_errors_reach_every_waiter_and_are_not_cached():
+    async def scenario():
+        cache = AssistantConfigCache()
+        calls = 0
+
+        async def failing(phone_number):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise RuntimeError("db down")
+
+        results = await asyncio.gather(
+            cache.get_or_build("call-1", "+1", failing),
+            cache.get_or_build("call-2", "+1", failing),
+            return_exceptions=True,
+        )
+        with pytest.raises(RuntimeError):
+            await cache.get_or_build("call-1", "+1", failing)
+        return results, calls
+
+    results, calls = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert calls == 2
+
+
+def test_waiter_takes_over_when_the_leader_is_cancelled():
+    async def scenario():
+        cache = AssistantConfigCache()
+        build = Builder()
+        leader = asyncio.create_task(cache.get_or_build("call-1", "+15555550100", build))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_build("call-2", "+15555550100", build))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        build.release.set()
+        config = await waiter
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return config, build.calls
+
+    config, calls = asyncio.run(scenario())
+    assert config["build"] == 2
+    assert calls == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_leader():
+    async def scenario():
+        cache = AssistantConfigCache()
+        build = Builder()
+        leader = asyncio.create_task(cache.get_or_build("call-1", "+15555550100", build))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_build("call-2", "+15555550100", build))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        build.release.set()
+        return await leader, build.calls
+
+    config, calls = asyncio.run(scenario())
+    assert config["build"] == 1
+    assert calls == 1
+
+
+def test_waiter_cancelled_together_with_the_leader_stays_cancelled():
+    async def scenario():
+        cache = AssistantConfigCache()
+        build = Builder()
+        leader = asyncio.create_task(cache.get_or_build("call-1", "+15555550100", build))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_build("call-2", "+15555550100", build))
+        await asyncio.sleep(0)
+        leader.cancel()
+        waiter.cancel()
+        results = await asyncio.gather(leader, waiter, return_exceptions=True)
+        return results, build.calls
+
+    results, calls = asyncio.run(scenario())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert calls == 1
@@ -0,0 +1,83 @@
+from call_events import CallEventBuffer
+
+
+def event(call_id="call-1", agency_id="agency-1", **message):
+    return {"message": {"call": {"id": call_id, "metadata": {"agency_id": agency_id, "lead_id": "lead-1"}}, **message}}
+
+
+def logs(fake_db) -> dict:
+    return {row["vapi_call_id"]: row for row in fake_db.tables.get("call_logs", [])}
+
+
+def test_events_without_call_or_agency_are_not_buffered(fake_db):
+    buffer = CallEventBuffer()
+    assert not buffer.record({"message": {"type": "status-update", "status": "ringing"}})
+    assert not buffer.record(event(agency_id=None, status="ringing"))
+    assert buffer.flush() == 0
+
+
+def test_events_of_a_call_are_merged_into_one_row(fake_db):
+    buffer = CallEventBuffer()
+    buffer.record(event(type="status-update", status="ringing"))
+    buffer.record(event(type="status-update", status="in-progress"))
+    buffer.record(event(type="transcript", role="assistant", transcript="Hello there", transcriptType="final"))
+    buffer.record(event(call_id="call-2", type="status-update", status="queued"))
+    assert buffer.flush() == 2
+    row = logs(fake_db)["call-1"]
+    assert row["status"] == "in_progress"
+    assert "Hello there" in row["transcript"]
+    assert logs(fake_db)["call-2"]["status"] == "queued"
+    # Nothing changed since
+    buffer.record(event(type="status-update", status="in-progress"))
+    assert buffer.flush() == 0
+
+
+def test_ended_status_is_left_to_the_end_of_call_report(fake_db):
+    buffer = CallEventBuffer()
+    buffer.record(event(type="status-update", status="ringing"))
+    buffer.flush()
+    buffer.record(event(type="status-update", status="ended"))
+    assert buffer.flush() == 0
+    assert logs(fake_db)["call-1"]["status"] == "ringing"
+
+
+def test_flush_never_overwrites_a_final_row(fake_db):
+    buffer = CallEventBuffer()
+    buffer.record(event(type="status-update", status="ringing"))
+    buffer.flush()
+    # The end-of-call-report landed (e.g. via another replica)
+    logs(fake_db)["call-1"]["status"] = "completed"
+    buffer.record(event(type="status-update", status="in-progress"))
+    buffer.flush()
+    assert logs(fake_db)["call-1"]["status"] == "completed"
+
+
+def test_end_call_drops_buffered_state_and_ignores_late_events(fake_db):
+    buffer = CallEventBuffer()
+    buffer.record(event(type="transcript", role="user", transcript="Yes please", transcriptType="final"))
+    assert "Yes please" in buffer.end_call("call-1")
+    assert buffer.record(event(type="status-update", status="in-progress"))
+    assert buffer.flush() == 0
+    assert "call-1" not in logs(fake_db)
+
+
+def test_failed_flush_is_retried(fake_db, monkeypatch):
+    buffer = CallEventBuffer()
+    buffer.record(event(type="status-update", status="ringing"))
+
+    def down(name, params=None):
+        raise RuntimeError("db down")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(fake_db, "rpc", down)
+        assert buffer.flush() == 0
+    assert buffer.flush() == 1
+    assert logs(fake_db)["call-1"]["status"] == "ringing"
+
+
+def test_full_buffer_wakes_the_flusher(fake_db):
+    buffer = CallEventBuffer(flush_size=2)
+    buffer.record(event(call_id="call-1", type="status-update", status="ringing"))
+    assert not buffer._wake.is_set()
+    buffer.record(event(call_id="call-2", type="status-update", status="ringing"))
+    assert buffer._wake.is_set()
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import config
+import db
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_settings_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.delenv("NEXT_PUBLIC_SUPABASE_URL", raising=False)
+    monkeypatch.setenv("VAPI_BASE_URL", "https://vapi.example/")
+    monkeypatch.setenv("DIALER_WORKERS", "4")
+    monkeypatch.setenv("INBOUND_RATE_PER_AGENCY", "not a number")
+    monkeypatch.setenv("SHARDING_ENABLED", "Yes")
+    settings = config.Settings.from_env()
+    assert settings.supabase_url == "https://example.supabase.co"
+    assert settings.vapi_base_url == "https://vapi.example"
+    assert settings.dialer_workers == 4
+    assert settings.inbound_rate_per_agency == 5.0
+    assert settings.sharding_enabled is True
+
+
+def test_settings_are_read_lazily_and_can_be_overridden(monkeypatch):
+    monkeypatch.setenv("ENVIRONMENT", "production")
+    config.configure(None)
+    try:
+        assert config.get_settings().environment == "production"
+        assert "*" not in config.get_settings().cors_origins
+        config.configure(config.Settings(environment="staging"))
+        assert config.get_settings().environment == "staging"
+        assert "*" in config.get_settings().cors_origins
+    finally:
+        config.configure(None)
+
+
+def test_vapi_keys_try_the_public_key_first():
+    settings = config.Settings(vapi_public_key="pub", vapi_api_key="secret")
+    assert settings.vapi_keys == [("VAPI_PUBLIC_KEY", "pub"), ("VAPI_API_KEY", "secret")]
+    assert config.Settings(vapi_public_key="same", vapi_api_key="same").vapi_keys == [("VAPI_PUBLIC_KEY", "same")]
+
+
+def test_supabase_client_needs_url_and_key():
+    config.configure(config.Settings(supabase_key="key"))
+    db.set_supabase(None)
+    try:
+        with pytest.raises(ValueError, match="SUPABASE_URL"):
+            db.supabase.table("leads")
+        config.configure(config.Settings(supabase_url="https://example.supabase.co"))
+        with pytest.raises(ValueError, match="SUPABASE_SERVICE_ROLE_KEY"):
+            db.supabase.table("leads")
+    finally:
+        config.configure(None)
+
+
+def test_installed_client_is_used(fake_db):
+    fake_db.seed("leads", [{"id": "lead-1"}])
+    assert db.supabase.table("leads").select("*").execute().data == [{"id": "lead-1"}]
+
+
+def test_importing_main_has_no_side_effects():
+    # No environment, no network: importing must neither fail nor build a client
+    env = {key: value for key, value in os.environ.items() if "SUPABASE" not in key}
+    code = "import sys, main, db; assert db._client is None; assert 'supabase' not in sys.modules"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
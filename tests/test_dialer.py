@@ -0,0 +1,123 @@
+import time
+
+import dialer
+from dialer import DialJob, DialQueue
+
+
+def job(key, priority="new", agency_id="a"):
+    return DialJob(priority=priority, agency_id=agency_id, key=key, run=lambda: None)
+
+
+def drain(queue, n):
+    jobs = []
+    for _ in range(n):
+        got = queue.get(timeout=0)
+        if got is None:
+            break
+        jobs.append(got)
+        queue.done(got)
+    return [got.key for got in jobs]
+
+
+def test_higher_class_is_served_first():
+    queue = DialQueue()
+    for key, priority in [("new", "new"), ("night", "queued_night"), ("retry", "retry"), ("inbound", "inbound")]:
+        queue.put(job(key, priority))
+    assert drain(queue, 4) == ["inbound", "retry", "night", "new"]
+
+
+def test_waiting_jobs_age_past_newer_higher_classes():
+    queue = DialQueue(headstart={"high": 0.0, "low": 0.05}, expedited=frozenset())
+    queue.put(job("old-low", "low"))
+    time.sleep(0.08)
+    queue.put(job("new-high", "high"))
+    # old-low's deadline (t0 + 0.05) is before new-high's (t0 + 0.08)
+    assert drain(queue, 2) == ["old-low", "new-high"]
+
+
+def test_duplicate_keys_are_queued_once():
+    queue = DialQueue()
+    assert queue.put(job("lead:1"))
+    assert not queue.put(job("lead:1"))
+    assert len(queue) == 1
+    drain(queue, 1)
+    assert queue.put(job("lead:1"))  # free again once taken
+
+
+def test_delayed_jobs_wait():
+    queue = DialQueue()
+    queue.put(job("later", "inbound"), delay=0.05)
+    assert queue.get(timeout=0) is None
+    assert queue.pending("a") == 1
+    got = queue.get(timeout=1.0)
+    assert got.key == "later"
+
+
+def test_close_returns_everything_still_queued():
+    queue = DialQueue()
+    queue.put(job("a1"))
+    queue.put(job("b1", agency_id="b"))
+    queue.put(job("delayed", "inbound"), delay=60)
+    assert sorted(j.key for j in queue.close()) == ["a1", "b1", "delayed"]
+    assert queue.get(timeout=0) is None
+    assert not queue.put(job("after"))
+
+
+def test_remove_agency():
+    queue = DialQueue()
+    queue.put(job("a1"))
+    queue.put(job("a2", "inbound"), delay=60)
+    queue.put(job("b1", agency_id="b"))
+    assert sorted(j.key for j in queue.remove_agency("a")) == ["a1", "a2"]
+    assert drain(queue, 5) == ["b1"]
+
+
+def test_backlogged_agencies_are_served_by_weight():
+    queue = DialQueue()
+    for i in range(40):
+        queue.put(job(f"a{i}"), weight=1.0)
+        queue.put(job(f"b{i}", agency_id="b"), weight=3.0)
+    served = drain(queue, 40)
+    assert sum(key.startswith("b") for key in served) == 30
+
+
+def test_cap_limits_calls_in_flight():
+    queue = DialQueue()
+    for i in range(3):
+        queue.put(job(f"a{i}"), cap=2)
+    first, second = queue.get(timeout=0), queue.get(timeout=0)
+    assert queue.get(timeout=0) is None
+    queue.done(first)
+    assert queue.get(timeout=0).key == "a2"
+    queue.done(second)
+
+
+def test_inbound_skips_the_fair_share_rotation():
+    queue = DialQueue()
+    for i in range(3):
+        queue.put(job(f"b{i}", agency_id="b"), weight=8.0)
+    queue.put(job("inbound", "inbound"))
+    assert drain(queue, 1) == ["inbound"]
+
+
+def test_remembered_tier_is_used_without_a_db_read(monkeypatch):
+    class Unreachable:
+        def table(self, name):
+            raise AssertionError("agency_shares hit the database")
+
+    monkeypatch.setattr(dialer, "supabase", Unreachable())
+    monkeypatch.setattr(dialer, "_tier_cache", {})
+    assert dialer.remember_tier("agency-1", "pro") == dialer.TIER_SHARES["pro"]
+    assert dialer.agency_shares("agency-1") == dialer.TIER_SHARES["pro"]
+
+
+def test_unknown_tier_and_db_errors_fall_back_to_the_default(monkeypatch):
+    class Broken:
+        def table(self, name):
+            raise RuntimeError("db down")
+
+    monkeypatch.setattr(dialer, "supabase", Broken())
+    monkeypatch.setattr(dialer, "_tier_cache", {})
+    default = dialer.TIER_SHARES[dialer.DEFAULT_TIER]
+    assert dialer.remember_tier("agency-1", "platinum") == default
+    assert dialer.agency_shares("agency-2") == default
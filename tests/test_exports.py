@@ -0,0 +1,81 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import exports
+from exports import stream_export
+from tests.conftest import ADMIN_TOKEN
+
+ADMIN = {"X-Admin-Token": ADMIN_TOKEN}
+
+
+@pytest.fixture
+def leads(fake_db, monkeypatch):
+    # Small pages so the export spans several keyset pages
+    monkeypatch.setitem(exports.EXPORTS, "leads", (exports.EXPORTS["leads"][0], 3))
+    fake_db.seed("agencies", [
+        {"id": "agency-1", "subscription_status": "active"},
+        {"id": "agency-2", "subscription_status": "canceled"},
+    ])
+    fake_db.seed("leads", [
+        {"id": f"lead-{i:02d}", "agency_id": "agency-1", "name": f"Lead, {i}", "phone_number": f"+3526210000{i:02d}", "status": "new"}
+        for i in range(10)
+    ] + [{"id": "lead-other", "agency_id": "agency-2", "name": "Other", "phone_number": "+352621999999"}])
+    return fake_db
+
+
+def collect(*args, **kwargs) -> bytes:
+    async def run():
+        return b"".join([chunk async for chunk in stream_export(*args, **kwargs)])
+
+    return asyncio.run(run())
+
+
+def test_csv_export_streams_every_page(leads):
+    rows = list(csv.DictReader(io.StringIO(collect("leads", "agency-1").decode())))
+    assert [row["id"] for row in rows] == [f"lead-{i:02d}" for i in range(10)]
+    assert rows[1]["name"] == "Lead, 1"
+    assert rows[0]["address"] == ""
+
+
+def test_ndjson_export(leads):
+    lines = collect("leads", "agency-1", "ndjson").decode().splitlines()
+    assert len(lines) == 10
+    first = json.loads(lines[0])
+    assert list(first) == list(exports.EXPORTS["leads"][0])
+    assert first["address"] is None
+
+
+def test_gzip_export_matches_the_plain_one(leads):
+    assert gzip.decompress(collect("leads", "agency-1", gzip=True)) == collect("leads", "agency-1")
+
+
+def test_nested_values_are_json_in_csv(fake_db):
+    fake_db.seed("call_logs", [{"id": "log-1", "agency_id": "agency-1", "metadata": {"lead_id": "lead-1"}}])
+    rows = list(csv.DictReader(io.StringIO(collect("call_logs", "agency-1").decode())))
+    assert rows[0]["metadata"] == '{"lead_id":"lead-1"}'
+
+
+def test_empty_export_is_just_the_header(fake_db):
+    assert collect("leads", "agency-1").decode().strip() == ",".join(exports.EXPORTS["leads"][0])
+
+
+def test_export_endpoints(settings, leads):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.create_app(settings, leads)) as client:
+        assert client.get("/leads/export/agency-1").status_code == 401
+        assert client.get("/call-logs/export/agency-1", headers={"X-Admin-Token": "wrong"}).status_code == 401
+        assert client.get("/leads/export/agency-1", params={"format": "xml"}, headers=ADMIN).status_code == 400
+        assert client.get("/leads/export/agency-2", headers=ADMIN).status_code == 403
+        response = client.get("/leads/export/agency-1", params={"gzip": "true"}, headers=ADMIN)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert 'filename="leads-agency-1.csv.gz"' in response.headers["content-disposition"]
+    assert len(gzip.decompress(response.content).decode().splitlines()) == 11
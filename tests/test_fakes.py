@@ -0,0 +1,86 @@
+import random
+
+import httpx
+import pytest
+
+from benchmarks.bench_endpoints import Recorder, _percentile, summarize
+from benchmarks.fakes import FakeAPIError, FakeSupabase, StubServer
+from benchmarks.workloads import vapi_call_events, zapier_burst
+
+
+@pytest.fixture
+def db():
+    db = FakeSupabase()
+    db.seed("leads", [
+        {"id": 1, "agency_id": "a", "status": "new", "created_at": "2026-01-02"},
+        {"id": 2, "agency_id": "a", "status": "calling", "created_at": "2026-01-01"},
+        {"id": 3, "agency_id": "b", "status": "new", "created_at": None},
+    ])
+    return db
+
+
+def ids(response) -> list:
+    return [row["id"] for row in response.data]
+
+
+def test_filters_order_and_limit(db):
+    leads = db.table("leads")
+    assert ids(leads.select("*").eq("status", "new").execute()) == [1, 3]
+    assert ids(db.table("leads").select("*").in_("agency_id", ["a"]).order("created_at").execute()) == [2, 1]
+    # NULLs sort last, like Postgres ascending order
+    assert ids(db.table("leads").select("*").order("created_at").limit(2).execute()) == [2, 1]
+    assert ids(db.table("leads").select("*").is_("created_at", "null").execute()) == [3]
+    assert ids(db.table("leads").select("*").range(1, 2).execute()) == [2, 3]
+
+
+def test_single_rows(db):
+    assert db.table("leads").select("*").eq("id", 2).single().execute().data["status"] == "calling"
+    with pytest.raises(Exception):
+        db.table("leads").select("*").eq("status", "new").single().execute()
+    assert db.table("leads").select("*").eq("id", 9).maybe_single().execute().data is None
+
+
+def test_writes_return_the_affected_rows(db):
+    updated = db.table("leads").update({"status": "queued_night"}).eq("agency_id", "a").eq("status", "new").execute()
+    assert ids(updated) == [1]
+    assert ids(db.table("leads").delete().eq("agency_id", "b").execute()) == [3]
+    upserted = db.table("leads").upsert({"id": 1, "status": "new"}, on_conflict="id").execute()
+    assert upserted.data[0]["agency_id"] == "a"
+    assert len(db.tables["leads"]) == 2
+
+
+def test_unique_partial_index(db):
+    db.add_unique_index("leads", ["agency_id"], where=lambda row: row["status"] == "calling")
+    with pytest.raises(FakeAPIError) as info:
+        db.table("leads").update({"status": "calling"}).eq("id", 1).execute()
+    assert info.value.code == "23505"
+    assert db.tables["leads"][0]["status"] == "new"
+    db.table("leads").update({"status": "calling"}).eq("id", 3).execute()
+
+
+def test_stub_server_answers_and_counts_requests():
+    with StubServer(body=lambda path: {"path": path}, status=201) as stub:
+        response = httpx.post(f"{stub.url}/call/phone", json={"x": 1})
+    assert response.status_code == 201
+    assert response.json() == {"path": "/call/phone"}
+    assert stub.requests == {"/call/phone": 1}
+
+
+def test_workloads_are_reproducible():
+    assert zapier_burst(random.Random(1), 5) == zapier_burst(random.Random(1), 5)
+    events = vapi_call_events(random.Random(1), "+15555550100", "agency-1", turns=3)
+    assert events[0][0] == "assistant-request"
+    assert events[-1][0] == "end-of-call-report"
+
+
+def test_summary_percentiles():
+    values = [i / 1000 for i in range(1, 101)]
+    assert _percentile(values, 50) == 0.05
+    assert _percentile(values, 99) == 0.099
+    assert _percentile([], 99) == 0.0
+    recorder = Recorder()
+    for latency in values:
+        recorder.add("POST /start-campaign", latency, 200 if latency < 0.1 else 500)
+    result = summarize(recorder, {"campaign": 2.0})["POST /start-campaign"]
+    assert result["count"] == 100 and result["errors"] == 1
+    assert result["throughput_rps"] == 50.0
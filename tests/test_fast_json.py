@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+import fast_json
+from fast_json import FastJSONResponse
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def backend(request, monkeypatch):
+    if request.param == "stdlib":
+        monkeypatch.setattr(fast_json, "orjson", None)
+    elif fast_json.orjson is None:
+        pytest.skip("orjson not installed")
+    return request.param
+
+
+def test_round_trip(backend):
+    content = {"results": [{"toolCallId": "t1", "result": "Booked for 9:00 – Tuesday"}], "n": 1.5, "ok": True, "x": None}
+    encoded = fast_json.dumps(content)
+    assert isinstance(encoded, bytes)
+    assert fast_json.loads(encoded) == content
+    assert json.loads(encoded) == content
+
+
+def test_compact_and_utf8(backend):
+    encoded = fast_json.dumps({"a": [1, 2], "name": "Zoë"})
+    assert encoded == '{"a":[1,2],"name":"Zoë"}'.encode()
+
+
+def test_loads_accepts_str_and_bytes(backend):
+    assert fast_json.loads('{"a":1}') == fast_json.loads(b'{"a":1}') == {"a": 1}
+
+
+def test_nan_never_reaches_the_wire(backend):
+    if backend == "stdlib":
+        with pytest.raises(ValueError):
+            fast_json.dumps({"x": float("nan")})
+    else:
+        # orjson writes non-finite floats as null instead of raising
+        assert fast_json.dumps({"x": float("nan")}) == b'{"x":null}'
+
+
+def test_response_renders_with_dumps(backend):
+    response = FastJSONResponse({"assistant": {"name": "Ava"}})
+    assert response.body == b'{"assistant":{"name":"Ava"}}'
+    assert response.media_type == "application/json"
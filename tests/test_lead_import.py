@@ -0,0 +1,107 @@
+import asyncio
+import os
+
+import pytest
+
+import lead_import
+from lead_fields import InboundLead, extract_lead_fields, normalize_header
+from lead_import import create_job, run_import, spool_upload
+
+
+def write_csv(tmp_path, text: str) -> str:
+    path = tmp_path / "leads.csv"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def imported(fake_db) -> list:
+    return sorted(row["phone_number"] for row in fake_db.tables.get("leads", []))
+
+
+def test_lead_fields_are_mapped_from_loose_keys():
+    assert extract_lead_fields({"first_name": " Ann ", "Phone": 621123456, "language": "FR"}) == {
+        "name": "Ann", "phone": "621123456", "address": "your inquiry", "language": "fr",
+    }
+    assert extract_lead_fields({})["phone"] is None
+    assert InboundLead(Name="Bo", phone_number=352621123456, extra="x").fields()["phone"] == "352621123456"
+    assert normalize_header("  Phone  Number ") == "phone_number"
+
+
+def test_csv_import_normalizes_and_dedupes(fake_db, tmp_path):
+    path = write_csv(tmp_path, "Name;Phone Number;Price\n"
+                               "Ann;+352 621 123 456;100000\n"
+                               "Ann again;00352621123456;\n"
+                               "Bo;not a phone;\n"
+                               ";;\n"
+                               "Cy;621 654 321;\n")
+    job = create_job("agency-1", "csv", region="LU")
+    run_import(job, path)
+    assert job.status == "completed"
+    assert (job.rows_read, job.inserted, job.duplicates_in_file, job.invalid) == (4, 2, 1, 1)
+    assert imported(fake_db) == ["+352621123456", "+352621654321"]
+    assert fake_db.tables["leads"][0]["asking_price"] == "100000"
+    assert not (tmp_path / "leads.csv").exists()
+
+
+def test_existing_leads_and_earlier_batches_are_skipped(fake_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(lead_import, "BATCH_SIZE", 2)
+    fake_db.seed("leads", [{"agency_id": "agency-1", "phone_number": "+352621000001"}])
+    numbers = ["621000001", "621000002", "621000003", "621000002", "621000004", "621000003"]
+    path = write_csv(tmp_path, "phone\n" + "\n".join(numbers) + "\n")
+    job = create_job("agency-1", "csv", region="LU")
+    run_import(job, path)
+    assert job.status == "completed"
+    assert job.inserted == 3
+    # Repeats across batches are found in the DB, not kept in memory
+    assert job.duplicates_existing + job.duplicates_in_file == 3
+    assert imported(fake_db) == [f"+35262100000{i}" for i in range(1, 5)]
+
+
+def test_existing_phones_are_looked_up_in_chunks(fake_db, monkeypatch):
+    from benchmarks.fakes import FakeQuery
+
+    monkeypatch.setattr(lead_import, "LOOKUP_CHUNK", 2)
+    lookups = []
+    in_ = FakeQuery.in_
+    monkeypatch.setattr(FakeQuery, "in_", lambda self, column, values: lookups.append(len(values)) or in_(self, column, values))
+    fake_db.seed("leads", [
+        {"agency_id": "agency-1", "phone_number": "+352621000001"},
+        {"agency_id": "agency-1", "phone_number": "+352621000005"},
+        {"agency_id": "agency-2", "phone_number": "+352621000002"},
+    ])
+    phones = [f"+35262100000{i}" for i in range(1, 6)]
+    assert lead_import._existing_phones("agency-1", phones) == {"+352621000001", "+352621000005"}
+    assert lookups == [2, 2, 1]
+
+
+def test_failed_import_is_reported(fake_db, tmp_path, monkeypatch):
+    def broken(*args):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(lead_import, "_existing_phones", broken)
+    job = create_job("agency-1", "csv")
+    run_import(job, write_csv(tmp_path, "phone\n+352621123456\n"))
+    assert job.status == "failed"
+    assert job.error == "db down"
+    assert job.finished_at is not None
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_spool_upload_detects_the_format(tmp_path):
+    path, size, file_format = asyncio.run(spool_upload(chunks(b"PK", b"\x03\x04rest"), max_bytes=100))
+    os.unlink(path)
+    assert (size, file_format) == (8, "xlsx")
+    path, size, file_format = asyncio.run(spool_upload(chunks(b"phone\n", b"", b"+352\n"), max_bytes=100))
+    assert (size, file_format) == (11, "csv")
+    with open(path, "rb") as f:
+        assert f.read() == b"phone\n+352\n"
+    os.unlink(path)
+
+
+def test_spool_upload_enforces_the_size_limit():
+    with pytest.raises(ValueError, match="limit"):
+        asyncio.run(spool_upload(chunks(b"x" * 60, b"x" * 60), max_bytes=100))
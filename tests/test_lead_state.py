@@ -0,0 +1,159 @@
+import pytest
+
+import lead_state
+from benchmarks.fakes import FakeAPIError
+
+
+def seed(fake_db, *rows):
+    fake_db.seed("leads", [{"agency_id": "agency", "phone_number": f"+35262100000{i}", **row} for i, row in enumerate(rows)])
+
+
+def statuses(fake_db):
+    return {row["id"]: row["status"] for row in fake_db.tables["leads"]}
+
+
+@pytest.fixture
+def active_dial_index(fake_db):
+    fake_db.add_unique_index("leads", ("agency_id", "phone_number"), where=lambda row: row.get("status") in lead_state.DIALING)
+    return fake_db
+
+
+def test_transition_moves_only_leads_still_in_from_status(fake_db):
+    seed(fake_db, {"id": "a", "status": "new"}, {"id": "b", "status": "calling"})
+    assert lead_state.transition(["a", "b"], "new", "calling") == ["a"]
+    assert statuses(fake_db) == {"a": "calling", "b": "calling"}
+
+
+@pytest.mark.parametrize("from_status, to_status", [
+    ("new", "called"),
+    ("called", "calling"),
+    ("do_not_call", "calling"),
+    ("invalid_number", "new"),
+    ("calling_inbound", "calling"),
+])
+def test_transition_rejects_edges_outside_the_state_machine(fake_db, from_status, to_status):
+    with pytest.raises(ValueError):
+        lead_state.transition(["a"], from_status, to_status)
+
+
+def test_terminal_statuses_have_no_way_out():
+    for status in (lead_state.DO_NOT_CALL, lead_state.INVALID_NUMBER):
+        assert status not in lead_state.TRANSITIONS
+
+
+def test_transition_applies_extra_conditions(fake_db):
+    seed(fake_db, {"id": "a", "status": "new"})
+    assert lead_state.transition(["a"], "new", "calling", agency_id="other") == []
+    assert lead_state.transition(["a"], "new", "calling", agency_id="agency") == ["a"]
+
+
+def test_only_one_of_two_claims_wins(fake_db):
+    seed(fake_db, {"id": "a", "status": "new"}, {"id": "b", "status": "queued_night"})
+    leads = [dict(row) for row in fake_db.tables["leads"]]
+    first = lead_state.claim(leads)
+    second = lead_state.claim(leads)
+    assert sorted(lead["id"] for lead in first) == ["a", "b"]
+    assert second == []
+    assert {lead["id"]: lead["claimed_from"] for lead in first} == {"a": "new", "b": "queued_night"}
+
+
+def test_claim_skips_statuses_that_cannot_be_dialed(fake_db):
+    seed(fake_db, {"id": "a", "status": "called"}, {"id": "b", "status": "no_answer"})
+    claimed = lead_state.claim([dict(row) for row in fake_db.tables["leads"]])
+    assert [lead["id"] for lead in claimed] == ["b"]
+
+
+def test_release_returns_leads_to_where_they_were_claimed_from(fake_db):
+    seed(fake_db, {"id": "a", "status": "new"}, {"id": "b", "status": "queued_night"})
+    claimed = lead_state.claim([dict(row) for row in fake_db.tables["leads"]])
+    assert sorted(lead_state.release(claimed)) == ["a", "b"]
+    assert statuses(fake_db) == {"a": "new", "b": "queued_night"}
+
+
+def test_recover_stale_only_touches_old_claims(fake_db):
+    seed(fake_db,
+         {"id": "old", "status": "calling", "updated_at": "2000-01-01T00:00:00+00:00"},
+         {"id": "fresh", "status": "calling", "updated_at": "2999-01-01T00:00:00+00:00"})
+    assert lead_state.recover_stale("agency") == 1
+    assert statuses(fake_db) == {"old": "new", "fresh": "calling"}
+
+
+def test_recover_stale_requeues_stuck_inbound_leads(fake_db):
+    old = "2000-01-01T00:00:00+00:00"
+    seed(fake_db,
+         {"id": "dialing", "status": "calling_inbound", "updated_at": old},
+         {"id": "handed_over", "status": "queued_inbound", "updated_at": old},
+         {"id": "live", "status": "calling_inbound", "updated_at": "2999-01-01T00:00:00+00:00"})
+    assert lead_state.recover_stale("agency") == 2
+    assert statuses(fake_db) == {"dialing": "queued_night", "handed_over": "queued_night", "live": "calling_inbound"}
+
+
+@pytest.mark.parametrize("dialed", [None, False])
+def test_inbound_lead_that_was_not_dialed_is_requeued(fake_db, settings, monkeypatch, dialed):
+    import main
+
+    seed(fake_db, {"id": "lead", "status": "calling_inbound"})
+    jobs = []
+    monkeypatch.setattr(main.dialer, "submit", lambda job, delay=0: jobs.append(job) or True)
+    monkeypatch.setattr(main, "do_not_call", lambda *args: False)
+    monkeypatch.setattr(main, "place_call", lambda *args, **kwargs: dialed)
+
+    assert main.schedule_inbound_call("agency", "lead", {"customer": {"number": "+352621000000"}}, delay=0)
+    jobs[0].run()
+    assert statuses(fake_db) == {"lead": "queued_night"}
+
+
+def test_claim_loses_lead_whose_number_is_being_dialed(active_dial_index):
+    fake_db = active_dial_index
+    fake_db.seed("leads", [
+        {"id": "inbound", "agency_id": "agency", "phone_number": "+352621000001", "status": "calling_inbound"},
+        {"id": "same", "agency_id": "agency", "phone_number": "+352621000001", "status": "new"},
+        {"id": "other", "agency_id": "agency", "phone_number": "+352621000002", "status": "new"},
+    ])
+    claimed = lead_state.claim([dict(row) for row in fake_db.tables["leads"][1:]])
+    # The batch update fails on 'same'; the others are moved one by one
+    assert [lead["id"] for lead in claimed] == ["other"]
+    assert statuses(fake_db) == {"inbound": "calling_inbound", "same": "new", "other": "calling"}
+
+
+def test_transition_reraises_other_database_errors(fake_db, monkeypatch):
+    seed(fake_db, {"id": "a", "status": "new"})
+
+    def broken(*args):
+        raise FakeAPIError("42P01", "relation does not exist")
+
+    monkeypatch.setattr(lead_state, "_update", broken)
+    with pytest.raises(FakeAPIError):
+        lead_state.transition(["a"], "new", "calling")
+
+
+def test_is_unique_violation():
+    assert lead_state.is_unique_violation(FakeAPIError("23505", "duplicate key"))
+    assert not lead_state.is_unique_violation(FakeAPIError("42P01", "missing"))
+    assert not lead_state.is_unique_violation(ValueError("23505"))
+
+
+def test_active_dial(fake_db):
+    seed(fake_db, {"id": "a", "status": "queued_inbound"})
+    assert lead_state.active_dial("agency", "+352621000000")
+    assert not lead_state.active_dial("agency", "+352621000009")
+    assert not lead_state.active_dial("other", "+352621000000")
+
+
+def test_inbound_resubmission_losing_the_insert_race_is_ignored(active_dial_index, settings, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    fake_db = active_dial_index
+    fake_db.seed("agencies", [{"id": "agency", "subscription_status": "active", "timezone": "Europe/Luxembourg"}])
+    fake_db.seed("leads", [{"id": "first", "agency_id": "agency", "phone_number": "+352621000001", "status": "calling_inbound"}])
+    monkeypatch.setattr(main, "is_within_office_hours", lambda agency_id: True)
+    # Both requests passed the early check before either inserted
+    monkeypatch.setattr(lead_state, "active_dial", lambda agency_id, phone: False)
+
+    with TestClient(main.create_app(settings, fake_db)) as client:
+        response = client.post("/webhooks/inbound/agency", json={"name": "A", "phone": "621 000 001", "address": "x"})
+
+    assert response.json() == {"status": "ignored", "reason": "Call already in progress for this number"}
+    assert len(fake_db.tables["leads"]) == 1
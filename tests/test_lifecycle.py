@@ -0,0 +1,76 @@
+import threading
+import time
+
+from lifecycle import TaskTracker
+
+
+def test_tracked_task_counts_as_in_flight_while_it_runs():
+    tracker = TaskTracker()
+    started, release = threading.Event(), threading.Event()
+
+    def work(value):
+        started.set()
+        release.wait()
+        return value * 2
+
+    result = []
+    run = tracker.track("dial", work, 21)
+    thread = threading.Thread(target=lambda: result.append(run()))
+    thread.start()
+    started.wait()
+    assert tracker.snapshot() == {"dial": 1}
+    assert not tracker.wait_idle(0.01)
+    release.set()
+    assert tracker.wait_idle(1.0)
+    thread.join()
+    assert result == [42]
+    assert tracker.snapshot() == {}
+
+
+def test_failed_task_still_leaves_the_in_flight_count():
+    tracker = TaskTracker()
+
+    def boom():
+        raise RuntimeError("dial failed")
+
+    run = tracker.track("dial", boom)
+    try:
+        run()
+    except RuntimeError:
+        pass
+    assert tracker.snapshot() == {}
+
+
+def test_no_new_work_after_shutdown_begins():
+    tracker = TaskTracker()
+    tracker.begin_shutdown()
+    tracker.begin_shutdown()  # idempotent
+    assert tracker.track("dial", lambda: None) is None
+    tracker.reset()
+    assert tracker.track("dial", lambda: None) is not None
+
+
+def test_shutdown_wakes_sleeping_tasks():
+    tracker = TaskTracker()
+    assert tracker.sleep(0)
+    threading.Timer(0.05, tracker.begin_shutdown).start()
+    started = time.monotonic()
+    assert not tracker.sleep(5)
+    assert time.monotonic() - started < 1
+
+
+def test_failed_campaign_start_leaves_nothing_in_flight(settings, fake_db, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import lead_state
+    import main
+    from lifecycle import tracker
+
+    def db_down(agency_id):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(lead_state, "recover_stale", db_down)
+    with TestClient(main.create_app(settings, fake_db), raise_server_exceptions=False) as client:
+        response = client.post("/start-campaign", json={"agency_id": "agency"})
+        assert response.status_code == 500
+        assert tracker.snapshot() == {}
@@ -0,0 +1,89 @@
+import dataclasses
+
+import pytest
+
+import notifications
+from benchmarks.fakes import TwilioStub
+from notifications import NotificationWorker
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(notifications, "RETRY_BASE_SECONDS", 0.01)
+
+
+def worker_for(settings, stub, **twilio) -> NotificationWorker:
+    settings = dataclasses.replace(
+        settings, **{
+            "twilio_account_sid": "AC123", "twilio_auth_token": "token", "twilio_base_url": stub.url,
+            "twilio_sms_number": "+15555550000", "twilio_messages_per_second": 100.0, **twilio,
+        },
+    )
+    worker = NotificationWorker()
+    worker.configure(settings)
+    return worker
+
+
+def test_without_twilio_credentials_nothing_is_sent(settings):
+    worker = NotificationWorker()
+    worker.configure(settings)
+    assert not worker.notify("no_answer", "lead-1", "+352621000001")
+
+
+def test_follow_ups_are_sent_once_per_lead(settings):
+    with TwilioStub() as stub:
+        worker = worker_for(settings, stub)
+        worker.start()
+        assert worker.notify("no_answer", "lead-1", "+352621000001", name="Ann")
+        assert not worker.notify("no_answer", "lead-1", "+352621000001", name="Ann")
+        assert worker.notify("no_answer", "lead-2", "+352621000002")
+        assert not worker.notify("no_answer", "lead-3", None)
+        assert not worker.notify("unknown_kind", "lead-3", "+352621000003")
+        assert worker.stop(timeout=5.0) == 0
+    assert sorted(stub.messages) == [
+        ("+352621000001", "+15555550000", notifications.TEMPLATES["no_answer"].format(name="Ann")),
+        ("+352621000002", "+15555550000", notifications.TEMPLATES["no_answer"].format(name="there")),
+    ]
+
+
+def test_confirmations_prefer_whatsapp(settings):
+    with TwilioStub() as stub:
+        worker = worker_for(settings, stub, twilio_whatsapp_number="+15555550001")
+        worker.start()
+        worker.notify("appointment_booked", "lead-1", "+352621000001", name="Ann", time="Tue 10:00")
+        worker.stop(timeout=5.0)
+    ((to, sender, body),) = stub.messages
+    assert (to, sender) == ("whatsapp:+352621000001", "whatsapp:+15555550001")
+    assert "Tue 10:00" in body
+
+
+def test_rate_limited_sends_are_retried(settings):
+    with TwilioStub(fail_first=1) as stub:
+        worker = worker_for(settings, stub)
+        worker.start()
+        worker.notify("no_answer", "lead-1", "+352621000001")
+        assert worker.stop(timeout=5.0) == 0
+    assert len(stub.messages) == 1
+
+
+def test_each_sender_is_throttled(settings):
+    with TwilioStub() as stub:
+        worker = worker_for(settings, stub, twilio_messages_per_second=10.0)
+        worker.start()
+        for i in range(12):
+            worker.notify("no_answer", f"lead-{i}", f"+3526210000{i:02d}")
+        worker.stop(timeout=5.0)
+    sent_at = stub.sent_at["+15555550000"]
+    assert len(sent_at) == 12
+    # A second's worth at once, then 10/s: the last two wait about 0.2s
+    assert sent_at[-1] - sent_at[0] >= 0.15
+
+
+def test_messages_left_at_the_deadline_are_dropped(settings):
+    with TwilioStub() as stub:
+        worker = worker_for(settings, stub, twilio_messages_per_second=0.01)
+        worker.start()
+        for i in range(3):
+            worker.notify("no_answer", f"lead-{i}", f"+35262100000{i}")
+        assert worker.stop(timeout=0.2) == 2
+    assert len(stub.messages) == 1
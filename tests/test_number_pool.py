@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from tests.conftest import ADMIN_TOKEN
+from number_pool import NumberPool
+
+
+def row(number_id, number, agency_id=None, max_concurrent=1):
+    return {"vapi_phone_number_id": number_id, "number": number, "agency_id": agency_id, "max_concurrent": max_concurrent}
+
+
+@pytest.fixture
+def pool(settings):
+    pool = NumberPool()
+    pool.load([
+        row("shared-us", "+14155550100", max_concurrent=2),
+        row("shared-lu", "+352621000000", max_concurrent=2),
+        row("own", "+352621999999", agency_id="agency-own"),
+    ])
+    return pool
+
+
+def test_local_presence_prefers_the_closest_number(pool):
+    assert pool.acquire("agency-1", "+352621123456").phone_number_id == "shared-lu"
+    assert pool.acquire("agency-1", "+352621123457").phone_number_id == "shared-lu"
+    # Closest number full: the next best free one
+    assert pool.acquire("agency-1", "+352621123458").phone_number_id == "shared-us"
+
+
+def test_without_local_presence_the_least_busy_number_is_used(pool):
+    pool.acquire("agency-1", "+352621123456")
+    assert pool.acquire("agency-1", "+352621123456", local_presence=False).phone_number_id == "shared-us"
+
+
+def test_agency_numbers_are_used_before_shared_ones(pool):
+    assert pool.acquire("agency-own", "+14155551234").phone_number_id == "own"
+    # Its own numbers are full: it waits for them, not for shared ones
+    assert pool.acquire("agency-own", timeout=0) is None
+
+
+def test_agency_without_pool_numbers_uses_the_configured_number(settings):
+    pool = NumberPool()
+    pool.load([])
+    lease = pool.acquire("agency-1")
+    assert not lease.pooled
+    assert lease.phone_number_id == settings.phone_number_id
+
+
+def test_slots_are_released_by_call_id(pool):
+    leases = [pool.acquire("agency-1", "+352621123456") for _ in range(4)]
+    assert all(leases)
+    assert pool.acquire("agency-1", timeout=0) is None
+    pool.bind(leases[0], "call-1")
+    assert pool.bound_calls() == ["call-1"]
+    assert pool.release_call("call-1")
+    assert not pool.release_call("call-1")
+    pool.release(leases[1])
+    assert pool.snapshot()["slots_in_use"] == 2
+
+
+def test_waiting_dial_gets_a_freed_slot(pool):
+    lease = pool.acquire("agency-own")
+    threading.Timer(0.05, pool.release, [lease]).start()
+    assert pool.acquire("agency-own", timeout=2.0).phone_number_id == "own"
+
+
+def test_unreleased_slots_are_reclaimed_after_the_timeout(pool):
+    pool.slot_timeout_seconds = 0.0
+    pool.bind(pool.acquire("agency-own"), "call-lost")
+    assert pool.acquire("agency-own").phone_number_id == "own"
+    assert "call-lost" not in pool.bound_calls()
+
+
+def test_reload_keeps_slots_in_use(pool):
+    lease = pool.acquire("agency-1", "+352621123456")
+    pool.load([row("shared-lu", "+352621000000", max_concurrent=5)])
+    assert pool.snapshot()["slots_in_use"] == 1
+    pool.release(lease)
+    assert pool.snapshot() == {
+        "slots_total": 5, "slots_in_use": 0, "utilization": 0.0, "active_calls": 0,
+        "numbers": [{"phone_number_id": "shared-l***", "number": "+352621000000", "agency_id": None, "in_use": 0, "max_concurrent": 5}],
+    }
+
+
+def test_utilization_endpoint_is_admin_only(settings, fake_db):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.create_app(settings, fake_db)) as client:
+        assert client.get("/phone-numbers/utilization").status_code == 401
+        response = client.get("/phone-numbers/utilization", headers={"X-Admin-Token": ADMIN_TOKEN})
+    assert response.status_code == 200
+    assert "slots_total" in response.json()
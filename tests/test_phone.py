@@ -0,0 +1,102 @@
+import pytest
+
+import lead_state
+from phone import lookup_variants, normalize_many, normalize_phone, region_for_timezone
+
+
+@pytest.mark.parametrize("raw, region, expected", [
+    ("+352 621 123 456", "LU", "+352621123456"),
+    ("621 123 456", "LU", "+352621123456"),
+    ("(415) 555-0134", "US", "+14155550134"),
+    ("1-415-555-0134", "US", "+14155550134"),
+    ("011 33 6 12 34 56 78", "US", "+33612345678"),
+    ("06 12 34 56 78", "FR", "+33612345678"),
+    ("0033 6 12 34 56 78", "LU", "+33612345678"),
+    ("+33 (0)6 12 34 56 78", "LU", "+33612345678"),
+    ("07911 123456", "GB", "+447911123456"),
+    ("+352 621 123 456 ext. 12", "LU", "+352621123456"),
+])
+def test_normalize_reads_national_numbers_in_region(raw, region, expected):
+    assert normalize_phone(raw, region) == expected
+
+
+@pytest.mark.parametrize("raw, region", [
+    ("0612345678", "LU"),  # French mobile read as a Luxembourg number
+    ("555-0134", "US"),
+    ("12", "FR"),
+    ("", "LU"),
+    (None, "LU"),
+    ("call me", "LU"),
+    ("0612345678", "XX"),  # unknown region
+])
+def test_normalize_rejects_numbers_invalid_in_region(raw, region):
+    assert normalize_phone(raw, region) is None
+
+
+def test_default_region_misreads_foreign_national_numbers():
+    # Why every dial path passes the agency's region
+    assert normalize_phone("(415) 555-0134") == "+3524155550134"
+    assert normalize_phone("(415) 555-0134", "US") == "+14155550134"
+
+
+@pytest.mark.parametrize("timezone, region", [
+    ("Europe/Paris", "FR"),
+    ("America/Chicago", "US"),
+    ("America/Indiana/Indianapolis", "US"),
+    ("Pacific/Honolulu", "US"),
+    ("America/Toronto", "CA"),
+    ("Australia/Perth", "AU"),
+    (None, "LU"),  # agencies without a timezone are Luxembourg ones
+    ("Europe/Warsaw", None),
+    ("Asia/Tokyo", None),
+    ("America/Sao_Paulo", None),  # not every America/* zone dials +1
+    ("America/Mexico_City", None),
+])
+def test_region_for_timezone(timezone, region):
+    assert region_for_timezone(timezone) == region
+
+
+def test_unknown_region_only_reads_international_numbers():
+    assert normalize_phone("512 345 678", None) is None
+    assert normalize_phone("14155550134", None) is None
+    assert normalize_phone("+48 512 345 678", None) == "+48512345678"
+    assert normalize_phone("0048 512 345 678", None) == "+48512345678"
+    assert normalize_many(["512 345 678", "+48512345678"], None) == [None, "+48512345678"]
+
+
+def test_normalize_many_matches_normalize_phone():
+    raws = ["(415) 555-0134", "+1 415 555 0134", None, "bogus", 4155550134]
+    assert normalize_many(raws, "US") == [normalize_phone(raw, "US") for raw in raws]
+
+
+def test_lookup_variants_uses_region_and_keeps_raw():
+    assert lookup_variants("(415) 555-0134", "US") == ["+14155550134", "(415) 555-0134"]
+    assert lookup_variants("+14155550134") == ["+14155550134"]
+    assert lookup_variants("bogus") == ["bogus"]
+
+
+def test_screen_dial_leads_uses_agency_region(fake_db):
+    import main
+
+    fake_db.seed("agencies", [{"id": "agency", "timezone": "America/New_York"}])
+    fake_db.seed("leads", [
+        {"id": "us", "agency_id": "agency", "phone_number": "(415) 555-0134", "status": "new"},
+        {"id": "fr", "agency_id": "agency", "phone_number": "0612345678", "status": "queued_night"},
+    ])
+    dialable = main.screen_dial_leads([dict(row) for row in fake_db.tables["leads"]], "agency")
+
+    assert [(lead["id"], lead["phone_number"], lead["region"]) for lead in dialable] == [("us", "+14155550134", "US")]
+    statuses = {row["id"]: row["status"] for row in fake_db.tables["leads"]}
+    assert statuses == {"us": "new", "fr": lead_state.INVALID_NUMBER}
+
+
+def test_invalid_numbers_leave_the_campaign_batch(fake_db):
+    import main
+
+    fake_db.seed("agencies", [{"id": "agency", "timezone": "Europe/Luxembourg"}])
+    fake_db.seed("leads", [{"id": f"bad{i}", "agency_id": "agency", "phone_number": "12", "status": "new"} for i in range(5)])
+    fake_db.seed("leads", [{"id": "good", "agency_id": "agency", "phone_number": "+352621000001", "status": "new"}])
+
+    assert main.claim_campaign_leads("agency", 5) == []
+    # The invalid ones are terminal, so the next batch reaches the valid lead
+    assert [lead["id"] for lead in main.claim_campaign_leads("agency", 5)] == ["good"]
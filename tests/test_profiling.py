@@ -0,0 +1,139 @@
+import asyncio
+import cProfile
+import dataclasses
+import pstats
+import threading
+import time
+
+import pytest
+
+from profiling import Busy, LoopMonitor, Sampler, folded_from_stats, section, section_folded
+from tests.conftest import ADMIN_TOKEN
+
+
+def spin(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sections_record_self_time_per_nested_path():
+    section_folded(reset=True)
+
+    @section("outer")
+    def outer():
+        spin(0.02)
+        with section("inner"):
+            spin(0.03)
+
+    outer()
+    folded = dict(line.rsplit(" ", 1) for line in section_folded(reset=True).splitlines())
+    assert set(folded) == {"outer", "outer;inner"}
+    assert 15000 <= int(folded["outer"]) < 30000
+    assert int(folded["outer;inner"]) >= 25000
+    assert section_folded() == ""
+
+
+def test_sections_nest_across_threads():
+    section_folded(reset=True)
+
+    async def handler():
+        with section("request"):
+            await asyncio.to_thread(section("db")(spin), 0.01)
+
+    asyncio.run(handler())
+    assert "request;db " in section_folded(reset=True)
+
+
+def test_sampler_sees_other_threads():
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            spin(0.001)
+
+    thread = threading.Thread(target=busy_worker, name="busy-worker")
+    thread.start()
+    try:
+        folded = Sampler().sample(0.1, interval=0.005)
+    finally:
+        stop.set()
+        thread.join()
+    assert any(line.startswith("busy-worker;") and "busy_worker (test_profiling.py" in line for line in folded.splitlines())
+
+
+def test_only_one_sample_runs_at_a_time():
+    sampler = Sampler()
+    started = threading.Thread(target=sampler.sample, args=(0.2,))
+    started.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(Busy):
+            sampler.sample(0.1)
+    finally:
+        started.join()
+
+
+def test_folded_stacks_from_cprofile():
+    def child():
+        spin(0.02)
+
+    def parent():
+        child()
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    parent()
+    profiler.disable()
+    folded = folded_from_stats(pstats.Stats(profiler))
+    spin_label = f"spin (test_profiling.py:{spin.__code__.co_firstlineno})"
+    under_spin = [line.rsplit(" ", 1) for line in folded.splitlines() if spin_label in line]
+    assert all("parent (test_profiling.py" in stack and "child (test_profiling.py" in stack for stack, _ in under_spin)
+    # Time inside spin, its own and its callees' (perf_counter)
+    assert sum(int(micros) for _, micros in under_spin) >= 15000
+
+
+def test_loop_monitor_reports_blocking_callbacks():
+    async def scenario():
+        monitor = LoopMonitor()
+        monitor.start(slow_seconds=0.1)
+        await asyncio.sleep(0.1)
+        spin(0.3)  # blocks the loop
+        await asyncio.sleep(0.15)
+        await monitor.stop()
+        return monitor.snapshot()
+
+    report = asyncio.run(scenario())
+    (slow,) = report["slow_callbacks"]
+    assert slow["blocked_seconds"] >= 0.2
+    assert "scenario (test_profiling.py" in slow["stack"]
+    assert report["lag_seconds"]["max"] >= 0.2
+
+
+def test_profile_token_profiles_the_request(settings, fake_db):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.create_app(settings, fake_db)) as client:
+        assert "x-profile-id" not in client.get("/").headers
+        assert "x-profile-id" not in client.get("/", headers={"X-Profile-Token": "wrong"}).headers
+        profile_id = client.get("/", headers={"X-Profile-Token": ADMIN_TOKEN}).headers["x-profile-id"]
+        admin = {"X-Admin-Token": ADMIN_TOKEN}
+        assert {"id": profile_id, "request": "GET /"} in client.get("/debug/profiles", headers=admin).json()
+        assert client.get(f"/debug/profiles/{profile_id}", params={"format": "text"}, headers=admin).status_code == 200
+        assert client.get("/debug/profiles/unknown", headers=admin).status_code == 404
+
+
+def test_debug_endpoints_need_the_admin_token(settings, fake_db):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.create_app(settings, fake_db)) as client:
+        for path in ("/debug/profiles", "/debug/loop", "/debug/sections"):
+            assert client.get(path).status_code == 401
+            assert client.get(path, headers={"X-Admin-Token": "wrong"}).status_code == 401
+    # Without an admin token configured the endpoints don't exist
+    with TestClient(main.create_app(dataclasses.replace(settings, admin_token=None), fake_db)) as client:
+        assert client.get("/debug/loop", headers={"X-Admin-Token": ADMIN_TOKEN}).status_code == 404
@@ -0,0 +1,103 @@
+import dataclasses
+
+import pytest
+
+from benchmarks.fakes import VapiStub
+from reconcile import CallReconciler
+from tests.conftest import ADMIN_TOKEN
+
+STALE = "2000-01-01T00:00:00+00:00"
+
+
+def log(n, status="in_progress"):
+    return {"id": f"log-{n}", "vapi_call_id": f"call-{n}", "agency_id": "agency-1", "lead_id": f"lead-{n}",
+            "status": status, "updated_at": STALE}
+
+
+def ended(reason, **call):
+    return {"status": "ended", "endedReason": reason, **call}
+
+
+@pytest.fixture
+def stale_calls(fake_db):
+    fake_db.seed("call_logs", [log(n) for n in range(1, 6)] + [
+        {**log(6), "updated_at": "2999-01-01T00:00:00+00:00"},  # not stale yet
+        log(7, status="completed"),
+    ])
+    fake_db.seed("leads", [{"id": f"lead-{n}", "agency_id": "agency-1", "status": "calling"} for n in range(1, 8)])
+    return fake_db
+
+
+def reconciler_for(settings, stub) -> CallReconciler:
+    reconciler = CallReconciler()
+    reconciler.configure(dataclasses.replace(
+        settings, vapi_api_key="key", vapi_base_url=stub.url, vapi_reconcile_requests_per_second=1000.0,
+    ))
+    return reconciler
+
+
+def rows(fake_db, table) -> dict:
+    return {row["id"]: row for row in fake_db.tables.get(table, [])}
+
+
+def test_lost_reports_are_repaired_from_vapi(settings, stale_calls):
+    calls = {
+        "call-1": ended("customer-did-not-answer"),
+        "call-2": ended("customer-ended-call", startedAt="2026-03-09T10:00:00Z", endedAt="2026-03-09T10:02:30Z",
+                        artifact={"transcript": "AI: Hi", "recordingUrl": "https://rec"}, analysis={"summary": "Booked"}),
+        "call-3": ended("pipeline-error-openai-llm-failed"),
+        "call-4": {"status": "in-progress"},
+        # call-5: unknown to Vapi
+    }
+    with VapiStub(calls=calls) as stub:
+        report = reconciler_for(settings, stub).run()
+        lookups = stub.lookups
+    assert lookups == 5
+    assert (report["checked"], report["repaired"], report["still_live"], report["not_found"]) == (5, 4, 1, 1)
+    assert report["retries_created"] == 1
+
+    logs = rows(stale_calls, "call_logs")
+    assert logs["log-1"]["status"] == "no_answer"
+    assert (logs["log-2"]["status"], logs["log-2"]["duration_seconds"]) == ("completed", 150)
+    assert (logs["log-2"]["transcript"], logs["log-2"]["summary"]) == ("AI: Hi", "Booked")
+    assert logs["log-3"]["status"] == logs["log-5"]["status"] == "failed"
+    assert logs["log-4"]["status"] == "in_progress" and logs["log-4"]["updated_at"] != STALE
+    assert logs["log-6"]["status"] == "in_progress"
+
+    leads = {lead_id: row["status"] for lead_id, row in rows(stale_calls, "leads").items()}
+    assert leads == {"lead-1": "no_answer", "lead-2": "called", "lead-3": "new", "lead-4": "calling",
+                     "lead-5": "new", "lead-6": "calling", "lead-7": "calling"}
+    (retry,) = stale_calls.tables["call_retries"]
+    assert (retry["lead_id"], retry["call_id"], retry["status"]) == ("lead-1", "log-1", "pending")
+
+
+def test_failed_lookups_are_left_for_the_next_pass(settings, stale_calls):
+    with VapiStub() as stub:
+        stub.respond = lambda path, raw: (500, {"message": "boom"}, {})
+        report = reconciler_for(settings, stub).run(agency_id="agency-1")
+    assert (report["checked"], report["errors"], report["repaired"]) == (5, 5, 0)
+    assert all(row["status"] == "calling" for row in stale_calls.tables["leads"])
+
+
+def test_rate_limits_are_waited_out(settings, stale_calls):
+    with VapiStub(calls={f"call-{n}": ended("voicemail") for n in range(1, 6)}, fail_first=1) as stub:
+        report = reconciler_for(settings, stub).run()
+    assert report["repaired"] == 5
+    assert report["errors"] == 0
+
+
+def test_without_a_vapi_key_nothing_runs(settings, fake_db):
+    report = CallReconciler().run()
+    assert report["skipped"] == "no Vapi API key configured"
+
+
+def test_reconcile_endpoint_is_admin_only(settings, fake_db):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.create_app(settings, fake_db)) as client:
+        assert client.post("/calls/reconcile").status_code == 401
+        response = client.post("/calls/reconcile", headers={"X-Admin-Token": ADMIN_TOKEN})
+    assert response.status_code == 200
+    assert response.json()["skipped"] == "no Vapi API key configured"
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from retry_timing import AnswerHistogram, RetryTimer, outcome
+
+LUXEMBOURG = ZoneInfo("Europe/Luxembourg")
+
+
+def local(*args) -> datetime:
+    return datetime(*args, tzinfo=LUXEMBOURG)
+
+
+@pytest.mark.parametrize("reason, answered", [
+    ("customer-ended-call", True),
+    ("voicemail", False),
+    ("customer-did-not-answer", False),
+    ("pipeline-error-openai-llm-failed", None),
+    (None, None),
+])
+def test_outcome(reason, answered):
+    assert outcome(reason) is answered
+
+
+def test_without_history_a_retry_goes_to_the_first_office_hour():
+    histogram = AnswerHistogram(LUXEMBOURG)
+    # Monday 10:30 is in office hours: unchanged
+    earliest = local(2026, 3, 9, 10, 30)
+    assert histogram.slot(earliest) == earliest
+    # 22:15 -> 08:00 next morning
+    assert histogram.slot(local(2026, 3, 9, 22, 15)) == local(2026, 3, 10, 8, 0)
+
+
+def test_retry_moves_to_the_hour_leads_answer():
+    histogram = AnswerHistogram(LUXEMBOURG)
+    for day in (2, 9):  # two Mondays of history
+        for hour in range(8, 21):
+            for _ in range(10):
+                histogram.record(local(2026, 3, day, hour, 5), answered=hour == 18)
+    assert histogram.slot(local(2026, 3, 16, 9, 40)) == local(2026, 3, 16, 18, 0)
+
+
+def record_rate(histogram, moment, answered, attempts=100):
+    for i in range(attempts):
+        histogram.record(moment, answered=i < answered)
+
+
+@pytest.mark.parametrize("tuesday_answered, expected", [
+    (55, local(2026, 3, 16, 9, 0)),  # a day's wait isn't worth 5 points
+    (90, local(2026, 3, 17, 10, 0)),
+])
+def test_waiting_a_day_needs_a_clearly_better_hour(tuesday_answered, expected):
+    histogram = AnswerHistogram(LUXEMBOURG)
+    for hour in range(8, 21):
+        record_rate(histogram, local(2026, 3, 9, hour), 50)
+    record_rate(histogram, local(2026, 3, 10, 10), tuesday_answered)
+    assert histogram.slot(local(2026, 3, 16, 9, 0)) == expected
+
+
+def test_slots_keep_wall_clock_time_across_dst():
+    histogram = AnswerHistogram(LUXEMBOURG)
+    # Saturday 28 March 2026, 23:00 -> Sunday 08:00 (clocks go forward at 02:00)
+    assert histogram.slot(local(2026, 3, 28, 23, 0)) == local(2026, 3, 29, 8, 0)
+
+
+def test_history_is_seeded_from_call_logs(fake_db):
+    recent = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+    fake_db.seed("call_logs", [
+        {"agency_id": "agency-1", "status": "completed", "created_at": recent},
+        {"agency_id": "agency-1", "status": "no_answer", "created_at": recent},
+        {"agency_id": "agency-1", "status": "failed", "created_at": recent},
+        {"agency_id": "agency-2", "status": "completed", "created_at": recent},
+    ])
+    timer = RetryTimer()
+    histogram = timer.histogram("agency-1")
+    assert (sum(histogram.attempts), sum(histogram.answered)) == (2, 1)
+    timer.record("agency-1", "customer-busy", recent)
+    timer.record("agency-1", "unknown-error", recent)
+    assert sum(histogram.attempts) == 3
+
+
+def test_unknown_timezone_falls_back_to_the_default(fake_db):
+    timer = RetryTimer()
+    timer.timezone_of = lambda agency_id: "Not/AZone"
+    assert timer.histogram("agency-1").tz == LUXEMBOURG
+
+
+def test_pending_retries_are_slotted_once(fake_db):
+    timer = RetryTimer()
+    night = local(2030, 3, 11, 23, 0).astimezone(timezone.utc).isoformat()
+    day = local(2030, 3, 11, 11, 30).astimezone(timezone.utc).isoformat()
+    fake_db.seed("call_retries", [
+        {"id": 1, "agency_id": "agency-1", "status": "pending", "scheduled_at": night, "slotted_at": None},
+        {"id": 2, "agency_id": "agency-1", "status": "pending", "scheduled_at": day, "slotted_at": None},
+        {"id": 3, "agency_id": "agency-1", "status": "completed", "scheduled_at": night, "slotted_at": None},
+    ])
+    assert timer.slot_pending("agency-1") == 2
+    rows = {row["id"]: row for row in fake_db.tables["call_retries"]}
+    moved = datetime.fromisoformat(rows[1]["scheduled_at"])
+    assert moved == local(2030, 3, 12, 8, 0)
+    assert rows[2]["scheduled_at"] == day
+    assert rows[1]["slotted_at"] and rows[2]["slotted_at"]
+    assert rows[3]["slotted_at"] is None
+    assert timer.slot_pending("agency-1") == 0
@@ -0,0 +1,141 @@
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import schedules
+from schedules import CampaignScheduler, Schedule, validate
+
+NEW_YORK = ZoneInfo("America/New_York")
+
+
+def at(*args) -> float:
+    """Epoch seconds of a New York wall-clock time."""
+    return datetime(*args, tzinfo=NEW_YORK).timestamp()
+
+
+def schedule(schedule_id="s1", days=(1, 2, 3, 4, 5), start="09:00", end="17:00", cap=10, **row) -> Schedule:
+    return Schedule({
+        "id": schedule_id, "agency_id": row.pop("agency_id", "agency-1"), "days": list(days),
+        "start_time": start, "end_time": end, "daily_cap": cap, **row,
+    }, "America/New_York")
+
+
+def scheduler(fed=None, leads=100, slots=5, owns=True) -> CampaignScheduler:
+    scheduler = CampaignScheduler()
+    fed = [] if fed is None else fed
+
+    def feed(agency_id, limit, opened):
+        fed.append((agency_id, limit, opened))
+        return min(limit, leads)
+
+    scheduler.feed = feed
+    scheduler.slots = lambda agency_id: slots
+    scheduler.owns = lambda agency_id: owns
+    return scheduler
+
+
+def test_validate_normalizes_a_schedule():
+    assert validate([5, 1, 1], "9:00", "17:30:00", 40, "America/New_York") == {
+        "days": [1, 5], "start_time": "09:00", "end_time": "17:30", "daily_cap": 40, "timezone": "America/New_York",
+    }
+
+
+@pytest.mark.parametrize("days, start, end, cap, tz, message", [
+    ([], "09:00", "17:00", 10, None, "days"),
+    ([8], "09:00", "17:00", 10, None, "days"),
+    ([1], "nine", "17:00", 10, None, "Invalid time"),
+    ([1], "17:00", "09:00", 10, None, "before end_time"),
+    ([1], "07:00", "17:00", 10, None, "office hours"),
+    ([1], "09:00", "22:00", 10, None, "office hours"),
+    ([1], "09:00", "17:00", 0, None, "daily_cap"),
+    ([1], "09:00", "17:00", 10, "Mars/Olympus", "Unknown timezone"),
+])
+def test_validate_rejects_bad_schedules(days, start, end, cap, tz, message):
+    with pytest.raises(ValueError, match=message):
+        validate(days, start, end, cap, tz)
+
+
+def test_window_skips_to_the_next_scheduled_day_across_dst():
+    weekdays = schedule()
+    # Friday evening -> Monday, after the switch to daylight saving time
+    start, end, day = weekdays.window(at(2026, 3, 6, 18, 0))
+    assert day == date(2026, 3, 9)
+    assert datetime.fromtimestamp(start, timezone.utc).hour == 13  # 09:00 EDT
+    assert end == at(2026, 3, 9, 17, 0)
+    # During a window, that window
+    assert weekdays.window(at(2026, 3, 9, 12, 0))[2] == date(2026, 3, 9)
+
+
+def test_remaining_resets_on_a_new_day():
+    capped = schedule(cap=10, dialed_on="2026-03-09", dialed_count=7)
+    assert capped.remaining(date(2026, 3, 9)) == 3
+    assert capped.remaining(date(2026, 3, 10)) == 10
+
+
+def test_heap_fires_schedules_in_time_order():
+    cs = scheduler()
+    cs.set_schedules([schedule("late", start="11:00"), schedule("early", start="09:00")], now=at(2026, 3, 9, 8, 0))
+    assert cs.next_fire() == at(2026, 3, 9, 9, 0)
+    assert cs.due(at(2026, 3, 9, 8, 59)) == []
+    assert [s.id for s in cs.due(at(2026, 3, 9, 12, 0))] == ["early", "late"]
+
+
+def test_changed_schedule_replaces_its_heap_entry():
+    cs = scheduler()
+    cs.set_schedules([schedule(start="09:00")], now=at(2026, 3, 9, 8, 0))
+    cs.set_schedules([schedule(start="10:00")], now=at(2026, 3, 9, 8, 0))
+    assert cs.next_fire() == at(2026, 3, 9, 10, 0)
+    assert len(cs.due(at(2026, 3, 9, 12, 0))) == 1
+    cs.set_schedules([], now=at(2026, 3, 9, 8, 0))
+    assert cs.next_fire() is None
+
+
+def test_fire_feeds_up_to_the_daily_cap_then_waits_for_the_next_day(fake_db):
+    fake_db.seed("campaign_schedules", [{"id": "s1"}])
+    fed = []
+    cs = scheduler(fed, slots=5)
+    capped = schedule(cap=3)
+    cs.set_schedules([capped], now=at(2026, 3, 9, 9, 0))
+    assert cs.run_due(at(2026, 3, 9, 9, 0)) == 1
+    assert fed == [("agency-1", 3, True)]
+    assert fake_db.tables["campaign_schedules"][0]["dialed_count"] == 3
+    # Capped: next fire is Tuesday's window
+    assert cs.next_fire() == at(2026, 3, 10, 9, 0)
+
+
+def test_fire_keeps_the_queue_topped_up(fake_db):
+    fed = []
+    cs = scheduler(fed, slots=5)
+    cs.pending = lambda agency_id: 4
+    cs.set_schedules([schedule(cap=100)], now=at(2026, 3, 9, 9, 0))
+    cs.run_due(at(2026, 3, 9, 9, 0))
+    assert fed == [("agency-1", 5 * schedules.FEED_DEPTH - 4, True)]
+    assert cs.next_fire() == at(2026, 3, 9, 9, 0) + cs.feed_seconds
+    cs.run_due(at(2026, 3, 9, 9, 1))
+    assert fed[-1][2] is False  # same window
+
+
+def test_fire_backs_off_when_no_leads_are_left(fake_db):
+    cs = scheduler(leads=0)
+    cs.set_schedules([schedule()], now=at(2026, 3, 9, 9, 0))
+    cs.run_due(at(2026, 3, 9, 9, 0))
+    assert cs.next_fire() == at(2026, 3, 9, 9, 0) + schedules.IDLE_SECONDS
+
+
+def test_fire_skips_agencies_owned_by_another_node():
+    fed = []
+    cs = scheduler(fed, owns=False)
+    cs.set_schedules([schedule()], now=at(2026, 3, 9, 9, 0))
+    cs.run_due(at(2026, 3, 9, 9, 0))
+    assert fed == []
+    assert cs.next_fire() == at(2026, 3, 9, 9, 0) + schedules.NOT_OWNER_SECONDS
+
+
+def test_reload_keeps_the_higher_daily_count():
+    cs = scheduler()
+    cs.set_schedules([schedule(dialed_on="2026-03-09", dialed_count=2)], now=at(2026, 3, 9, 8, 0))
+    cs.set_schedules([schedule(dialed_on="2026-03-09", dialed_count=6)], now=at(2026, 3, 9, 8, 0))
+    assert cs.snapshot("agency-1")[0]["dialed_count"] == 6
+    cs.set_schedules([schedule(dialed_on="2026-03-08", dialed_count=9)], now=at(2026, 3, 9, 8, 0))
+    assert cs.snapshot("agency-1")[0]["dialed_count"] == 6
@@ -0,0 +1,133 @@
+import time
+
+import pytest
+
+import shards
+from shards import ShardManager, rendezvous_owner
+
+AGENCIES = [f"agency-{i}" for i in range(20)]
+
+
+def node(node_id: str) -> ShardManager:
+    manager = ShardManager()
+    manager.enabled = True
+    manager.node_id = node_id
+    return manager
+
+
+@pytest.fixture
+def agencies(fake_db):
+    fake_db.seed("agencies", [{"id": agency_id} for agency_id in AGENCIES])
+    return fake_db
+
+
+def test_rendezvous_moves_only_the_leaving_nodes_agencies():
+    before = {a: rendezvous_owner(a, ["n1", "n2", "n3"]) for a in AGENCIES}
+    after = {a: rendezvous_owner(a, ["n1", "n2"]) for a in AGENCIES}
+    assert {a for a in AGENCIES if before[a] != after[a]} == {a for a in AGENCIES if before[a] == "n3"}
+    assert rendezvous_owner("agency-1", []) is None
+
+
+def test_disabled_node_owns_everything():
+    manager = ShardManager()
+    assert manager.owns("anything") and manager.may_dial("anything")
+
+
+def test_live_nodes_split_the_agencies(agencies):
+    n1, n2 = node("n1"), node("n2")
+    n1.tick()
+    n2.tick()
+    n1.tick()  # now sees n2 and drains what moved there
+    n2.tick()
+    assert n1.owned().isdisjoint(n2.owned())
+    for agency_id in AGENCIES:
+        owner = rendezvous_owner(agency_id, ["n1", "n2"])
+        assert (n1 if owner == "n1" else n2).owns(agency_id)
+
+
+def test_held_lease_is_not_taken_until_it_expires(agencies):
+    n1 = node("n1")
+    n1.tick()
+    assert n1.owned() == set(AGENCIES)
+
+    # n1 stops heartbeating but its leases are still valid: n2 can't take them
+    n2 = node("n2")
+    for row in agencies.tables["dialer_nodes"]:
+        row["heartbeat_at"] = "2000-01-01T00:00:00+00:00"
+    n2.tick()
+    assert n2.owned() == set()
+
+    for row in agencies.tables["agency_leases"]:
+        row["expires_at"] = "2000-01-01T00:00:00+00:00"
+    n2.tick()
+    assert n2.owned() == set(AGENCIES)
+
+
+def test_node_stops_trusting_leases_it_failed_to_renew(agencies, monkeypatch):
+    n1 = node("n1")
+    n1.tick()
+    assert n1.owns("agency-1")
+    monkeypatch.setattr(shards, "SAFETY_SECONDS", n1.lease_seconds)
+    n1.tick()  # leases now count only until the time they were renewed
+    time.sleep(0.01)
+    assert not n1.owns("agency-1")
+    assert n1.owned() == set()
+
+
+def test_moved_agency_drains_before_its_lease_is_released(agencies):
+    n1 = node("n1")
+    pending = {}
+    n1.pending = lambda agency_id: pending.get(agency_id, 0)
+    n1.tick()
+
+    n2 = node("n2")
+    n2.tick()
+    moved = {a for a in AGENCIES if rendezvous_owner(a, ["n1", "n2"]) == "n2"}
+    busy = sorted(moved)[0]
+    pending[busy] = 1
+    n1.tick()
+    assert not n1.owns(busy) and n1.may_dial(busy)
+    leases = {row["agency_id"]: row["node_id"] for row in agencies.tables["agency_leases"]}
+    assert leases[busy] == "n1"
+    assert all(leases[a] is None for a in moved - {busy})
+
+    pending.clear()
+    n1.tick()
+    assert not n1.may_dial(busy)
+    n2.tick()
+    assert n2.owned() == moved
+
+
+def test_handed_over_campaign_runs_once_on_the_owner(agencies):
+    n1 = node("n1")
+    started = []
+    n1.on_campaign = started.append
+    n1.tick()
+    n1.request_campaign("agency-3")
+    n1.tick()
+    n1.tick()
+    assert started == ["agency-3"]
+
+
+def test_stop_releases_every_lease(agencies):
+    n1 = node("n1")
+    n1.tick()
+    n1.stop()
+    assert all(row["node_id"] is None for row in agencies.tables["agency_leases"])
+    assert agencies.tables["dialer_nodes"] == []
+    assert not n1.owns("agency-1")
+
+
+def test_pick_up_inbound_leads_only_takes_owned_agencies(fake_db, monkeypatch):
+    import main
+
+    scheduled = []
+    monkeypatch.setattr(main, "schedule_inbound_call", lambda agency_id, lead_id, payload, delay: scheduled.append(lead_id) or True)
+    fake_db.seed("leads", [
+        {"id": "mine", "agency_id": "a", "status": "queued_inbound", "phone_number": "+15555550100", "created_at": "2026-01-01T00:00:00+00:00"},
+        {"id": "theirs", "agency_id": "b", "status": "queued_inbound", "phone_number": "+15555550101", "created_at": "2025-01-01T00:00:00+00:00"},
+    ])
+    main.pick_up_inbound_leads({"a"})
+    assert scheduled == ["mine"]
+    status = {row["id"]: row["status"] for row in fake_db.tables["leads"]}
+    assert status == {"mine": "calling_inbound", "theirs": "queued_inbound"}
@@ -0,0 +1,89 @@
+import asyncio
+import dataclasses
+
+import pytest
+
+import summaries
+from benchmarks.fakes import OpenAIStub
+from summaries import SummaryJob, SummaryWorker, estimate_tokens, fallback_summary, truncate_transcript
+
+LONG_CALL = "AI: Hello, I'm calling about your listing.\n" * 100  # over SHORT_CALL_TOKENS
+
+
+@pytest.fixture(autouse=True)
+def fast(monkeypatch):
+    monkeypatch.setattr(summaries, "BATCH_WAIT_SECONDS", 0.05)
+    monkeypatch.setattr(summaries, "BACKOFF_BASE_SECONDS", 0.01)
+
+
+@pytest.fixture
+def openai():
+    with OpenAIStub() as stub:
+        yield stub
+
+
+def worker_for(settings, stub=None) -> SummaryWorker:
+    worker = SummaryWorker()
+    if stub is not None:
+        settings = dataclasses.replace(settings, openai_api_key="sk-test", openai_base_url=f"{stub.url}/v1")
+    worker.configure(settings)
+    return worker
+
+
+def summarize(worker: SummaryWorker, transcripts: list) -> list:
+    """Submits one job per transcript and returns their summaries in order."""
+    async def scenario():
+        worker.start()
+        done = {}
+        for i, transcript in enumerate(transcripts):
+            worker.submit(SummaryJob(f"call-{i}", transcript, lambda summary, i=i: done.__setitem__(i, summary)))
+        await worker.stop(timeout=5.0)
+        return [done.get(i) for i in range(len(transcripts))]
+
+    return asyncio.run(scenario())
+
+
+def test_truncation_keeps_the_opening_and_the_end():
+    text = "a" * 100 + "b" * 1000 + "c" * 300
+    kept = truncate_transcript(text, max_tokens=100)  # 400 chars
+    assert kept.startswith("a" * 100) and kept.endswith("c" * 300)
+    assert "middle of the call omitted" in kept
+    assert truncate_transcript("short", 100) == "short"
+    assert estimate_tokens("x" * 40) == 11
+
+
+def test_without_an_api_key_the_transcript_opening_is_used(settings):
+    results = summarize(worker_for(settings), ["User: hi", "x" * 600])
+    assert results == ["User: hi", fallback_summary("x" * 600)]
+    assert results[1].endswith("...")
+
+
+def test_long_calls_are_summarized_one_by_one(settings, openai):
+    results = summarize(worker_for(settings, openai), [LONG_CALL, LONG_CALL + "User: no thanks"])
+    assert all(result.startswith("Stub summary of") for result in results)
+    assert openai.completions == 2
+
+
+def test_short_calls_are_batched(settings, openai):
+    results = summarize(worker_for(settings, openai), [f"AI: Hello?\nUser: wrong number {i}" for i in range(3)])
+    assert results == ["Stub summary 1.", "Stub summary 2.", "Stub summary 3."]
+    assert openai.completions == 1
+
+
+def test_identical_transcripts_share_one_request(settings, openai):
+    results = summarize(worker_for(settings, openai), [LONG_CALL] * 3)
+    assert len(set(results)) == 1 and results[0] is not None
+    assert openai.completions == 1
+
+
+def test_rate_limits_are_retried(settings):
+    with OpenAIStub(fail_first=2) as stub:
+        results = summarize(worker_for(settings, stub), [LONG_CALL])
+    assert results[0].startswith("Stub summary of")
+    assert stub.completions == 1
+
+
+def test_persistent_failures_fall_back(settings):
+    with OpenAIStub(fail_first=10) as stub:
+        results = summarize(worker_for(settings, stub), [LONG_CALL])
+    assert results == [fallback_summary(LONG_CALL)]
@@ -0,0 +1,191 @@
+import random
+
+import pytest
+
+import lead_state
+import suppression as suppression_module
+from suppression import NumberSet, SortedNumbers, Suppression, _merge, number_key
+from tests.conftest import ADMIN_TOKEN
+
+AGENCY = "11111111-1111-1111-1111-111111111111"
+
+
+def test_number_key():
+    assert number_key("+352621123456") == 352621123456
+    assert number_key("352621123456") is None
+    assert number_key("+35262x") is None
+    assert number_key(None) is None
+
+
+def test_number_set_apply_and_contains():
+    numbers = NumberSet()
+    numbers.apply(adds=[352621000001, 14155550134])
+    assert 352621000001 in numbers and 14155550134 in numbers
+    assert 352621000002 not in numbers
+    numbers.apply(removes=[352621000001, 999])
+    assert 352621000001 not in numbers
+    assert len(numbers) == 1
+
+
+def test_number_set_add_wins_over_remove_in_one_apply():
+    numbers = NumberSet()
+    numbers.apply(adds=[5], removes=[5])
+    assert 5 in numbers
+
+
+def test_number_set_compaction_keeps_contents(monkeypatch):
+    monkeypatch.setattr(suppression_module, "COMPACT_AT", 8)
+    rng = random.Random(1)
+    numbers, expected = NumberSet(), set()
+    for _ in range(200):
+        number = rng.randrange(1, 1 << 40)  # several high-bit buckets
+        if expected and rng.random() < 0.3:
+            number = rng.choice(sorted(expected))
+            numbers.apply(removes=[number])
+            expected.discard(number)
+        else:
+            numbers.apply(adds=[number])
+            expected.add(number)
+        assert len(numbers) == len(expected)
+    buckets, added, removed = numbers._state
+    assert len(added) + len(removed) <= 8
+    assert all(number in numbers for number in expected)
+    assert all(list(lows) == sorted(set(lows)) for lows in buckets.values())
+
+
+def test_merge_matches_set_semantics():
+    rng = random.Random(2)
+    from array import array
+    base = sorted(rng.sample(range(10000), 500))
+    adds = sorted(rng.sample(range(10000), 200))
+    removes = set(rng.sample(base, 100)) | {10001}
+    merged = _merge(array('I', base), adds, removes)
+    assert list(merged) == sorted((set(base) | set(adds)) - removes)
+
+
+def test_sorted_numbers_tolerates_unsorted_input_and_duplicates():
+    builder = SortedNumbers()
+    for number in [3, 1, 2, 2, (1 << 33) + 5, (1 << 33) + 1]:
+        builder.append(number)
+    numbers = builder.build()
+    assert len(numbers) == 5
+    assert all(n in numbers for n in [1, 2, 3, (1 << 33) + 1, (1 << 33) + 5])
+
+
+def suppressed_row(row_id, phone, agency_id=None, removed_at=None, updated_at="2026-01-01T00:00:00+00:00"):
+    return {"id": row_id, "agency_id": agency_id, "phone_number": phone, "number": number_key(phone),
+            "source": "test", "removed_at": removed_at, "updated_at": updated_at}
+
+
+@pytest.fixture
+def lists(fake_db):
+    fake_db.seed("suppressed_numbers", [
+        suppressed_row(1, "+352621000001"),
+        suppressed_row(2, "+352621000002", AGENCY),
+        suppressed_row(3, "+352621000003", AGENCY, removed_at="2026-01-01T00:00:00+00:00"),
+    ])
+    return Suppression()
+
+
+def test_lookup_before_first_load(lists):
+    assert not lists.ready
+    assert lists.is_suppressed("+352621000001", AGENCY)
+    assert lists.is_suppressed("+352621000002", AGENCY)
+    assert not lists.is_suppressed("+352621000002", "other-agency")
+    assert not lists.is_suppressed("+352621000003", AGENCY)
+
+
+def test_global_and_agency_lists_after_load(lists):
+    lists.load()
+    assert lists.ready
+    assert lists.is_suppressed("+352621000001", AGENCY)
+    assert lists.is_suppressed("+352621000001", None)
+    assert lists.is_suppressed("+352621000002", AGENCY)
+    assert not lists.is_suppressed("+352621000002", "other-agency")
+    assert not lists.is_suppressed("+352621000003", AGENCY)
+    assert not lists.is_suppressed("not a number", AGENCY)
+
+
+def test_add_and_remove(lists, fake_db):
+    lists.load()
+    assert lists.add(["+33612345678", "+33612345678", "bogus"], AGENCY, reason="asked") == 1
+    assert lists.is_suppressed("+33612345678", AGENCY)
+    assert lists.remove("+33612345678", AGENCY)
+    assert not lists.is_suppressed("+33612345678", AGENCY)
+    assert not lists.remove("+33612345678", AGENCY)
+    row = next(row for row in fake_db.tables["suppressed_numbers"] if row["phone_number"] == "+33612345678")
+    assert row["removed_at"] is not None  # soft delete, other replicas sync it
+
+
+def test_sync_applies_changes_from_other_replicas(lists, fake_db):
+    lists.load()
+    later = "2026-06-01T00:00:00+00:00"
+    fake_db.seed("suppressed_numbers", [suppressed_row(4, "+352621000004", AGENCY, updated_at=later)])
+    global_row = fake_db.tables["suppressed_numbers"][0]
+    global_row.update(removed_at=later, updated_at=later)
+
+    assert lists.sync() >= 2  # plus rows re-read in the overlap before the cursor
+    assert lists.is_suppressed("+352621000004", AGENCY)
+    assert not lists.is_suppressed("+352621000001", AGENCY)
+
+
+def test_bulk_load(lists, tmp_path):
+    lists.load()
+    upload = tmp_path / "numbers.csv"
+    upload.write_text("phone,name\n621 000 010,A\n+352621000011\nnot a phone\n\n621000010\n")
+    job = lists.create_job(AGENCY, "LU")
+    lists.run_bulk_load(job, str(upload))
+    assert (job.status, job.added, job.invalid) == ("completed", 2, 1)
+    assert lists.is_suppressed("+352621000010", AGENCY)
+    assert lists.is_suppressed("+352621000011", AGENCY)
+    assert not lists.is_suppressed("+352621000011", "other-agency")
+
+
+def test_campaign_claim_skips_suppressed_leads(fake_db, monkeypatch):
+    import main
+
+    lists = Suppression()
+    monkeypatch.setattr(main, "suppression", lists)
+    fake_db.seed("agencies", [{"id": AGENCY, "timezone": "Europe/Luxembourg"}])
+    fake_db.seed("leads", [
+        {"id": "blocked", "agency_id": AGENCY, "phone_number": "+352621000001", "status": "new"},
+        {"id": "ok", "agency_id": AGENCY, "phone_number": "+352621000005", "status": "new"},
+    ])
+    lists.load()
+    lists.add(["+352621000001"], None)
+
+    assert [lead["id"] for lead in main.claim_campaign_leads(AGENCY, 5)] == ["ok"]
+    assert {row["id"]: row["status"] for row in fake_db.tables["leads"]} == {"blocked": lead_state.DO_NOT_CALL, "ok": "calling"}
+
+
+@pytest.mark.parametrize("method, path", [
+    ("post", f"/suppression/{AGENCY}"),
+    ("delete", f"/suppression/{AGENCY}/+352621000001"),
+    ("post", f"/suppression/{AGENCY}/bulk"),
+    ("get", "/suppression/check?phone=+352621000001"),
+    ("get", "/suppression/jobs/some-job"),
+    ("post", "/suppression/global"),
+])
+def test_suppression_endpoints_require_admin(settings, fake_db, method, path):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.create_app(settings, fake_db)) as client:
+        kwargs = {"json": {"phone_number": "+352621000001"}} if method == "post" else {}
+        assert getattr(client, method)(path, **kwargs).status_code == 401
+        assert getattr(client, method)(path, headers={"X-Admin-Token": "wrong"}, **kwargs).status_code == 401
+
+
+def test_admin_can_suppress_and_check(settings, fake_db):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    fake_db.seed("agencies", [{"id": AGENCY, "timezone": "Europe/Luxembourg"}])
+    headers = {"X-Admin-Token": ADMIN_TOKEN}
+    with TestClient(main.create_app(settings, fake_db)) as client:
+        added = client.post(f"/suppression/{AGENCY}", json={"phone_number": "621 000 001"}, headers=headers)
+        assert added.json() == {"status": "suppressed", "phone_number": "+352621000001"}
+        check = client.get("/suppression/check", params={"phone": "+352621000001", "agency_id": AGENCY}, headers=headers)
+        assert check.json()["suppressed"] is True
@@ -0,0 +1,57 @@
+from transcripts import TranscriptAssembler
+
+
+def conversation(*lines) -> list:
+    return [{"role": role, "message": text} for role, text in lines]
+
+
+def test_utterances_are_appended_in_order():
+    transcripts = TranscriptAssembler()
+    assert transcripts.add_utterance("call-1", "assistant", "Hi, this is Thavon.")
+    assert not transcripts.add_utterance("call-1", "user", "Hel", final=False)
+    assert transcripts.add_utterance("call-1", "customer", "Hello?")
+    assert not transcripts.add_utterance("call-1", "system", "prompt")
+    assert transcripts.text("call-1") == "AI: Hi, this is Thavon.\nUser: Hello?"
+
+
+def test_conversation_updates_only_store_new_messages():
+    transcripts = TranscriptAssembler()
+    lines = [("system", "You are..."), ("bot", "Hi"), ("user", "Yes")]
+    assert transcripts.add_conversation("call-1", conversation(*lines[:2])) == 1
+    assert transcripts.add_conversation("call-1", conversation(*lines)) == 1
+    assert transcripts.add_conversation("call-1", conversation(*lines)) == 0
+    assert transcripts.text("call-1") == "AI: Hi\nUser: Yes"
+
+
+def test_conversation_replaces_utterances_and_wins_afterwards():
+    transcripts = TranscriptAssembler()
+    transcripts.add_utterance("call-1", "assistant", "Hi")
+    transcripts.add_conversation("call-1", [{"role": "assistant", "content": "Hi there"}])
+    assert not transcripts.add_utterance("call-1", "user", "late utterance")
+    assert transcripts.text("call-1") == "AI: Hi there"
+
+
+def test_restarted_conversation_is_read_again():
+    transcripts = TranscriptAssembler()
+    transcripts.add_conversation("call-1", conversation(("bot", "One"), ("user", "Two")))
+    transcripts.add_conversation("call-1", conversation(("bot", "Again")))
+    assert transcripts.text("call-1") == "AI: Again"
+
+
+def test_long_transcripts_are_truncated():
+    transcripts = TranscriptAssembler(max_chars=10)
+    transcripts.add_utterance("call-1", "user", "12345")
+    assert not transcripts.add_utterance("call-1", "user", "1234567")
+    assert transcripts.text("call-1") == "User: 12345\n[transcript truncated]"
+
+
+def test_pop_and_eviction_free_memory():
+    transcripts = TranscriptAssembler()
+    transcripts.add_utterance("call-1", "user", "Hello")
+    transcripts.add_utterance("call-2", "user", "Hello")
+    assert transcripts.bytes > 0
+    assert transcripts.pop("call-1") == "User: Hello"
+    assert transcripts.pop("call-1") is None
+    assert transcripts.evict_idle(0) == 1
+    assert len(transcripts) == 0
+    assert transcripts.bytes == 0
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from vapi_events import PEEK_BYTES, peek_event_type
+
+
+@pytest.mark.parametrize("body, expected", [
+    (b'{"message": {"type": "status-update", "status": "ringing"}}', "status-update"),
+    # Nested call.type comes first but isn't an event name
+    (b'{"message": {"call": {"type": "outboundPhoneCall"}, "type": "end-of-call-report"}}', "end-of-call-report"),
+    (b'{"message":{"type" : "assistant-request"}}', "assistant-request"),
+    (b'{"event": "hang"}', "hang"),
+    # Quotes inside a transcript are escaped, so they never match
+    (b'{"message": {"transcript": "say \\"type\\": \\"hang\\"", "type": "transcript"}}', "transcript"),
+    (b'{"message": {"type": "brand-new-event"}}', None),
+    (b'not json', None),
+])
+def test_peek_event_type(body, expected):
+    assert peek_event_type(body) == expected
+
+
+def test_peek_only_reads_the_start_of_the_body():
+    body = b'{"padding": "' + b"x" * PEEK_BYTES + b'", "type": "hang"}'
+    assert peek_event_type(body) is None
+
+
+class Accepted:
+    status_code = 200
+    text = ""
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Requests forward_to_webhook would send to the frontend."""
+    import main
+
+    sent = []
+
+    def post(url, body, headers):
+        sent.append((url, body, headers))
+        return Accepted()
+
+    monkeypatch.setattr(main, "_post_to_webhook", post)
+    return sent
+
+
+def test_forwarded_events_are_relayed_byte_for_byte(settings, fake_db, sent):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    body = json.dumps({"message": {"type": "speech-update", "status": "started", "role": "assistant"}}, indent=2).encode()
+    with TestClient(main.create_app(settings, fake_db)) as client:
+        response = client.post("/assistant-request", content=body, headers={"x-vapi-signature": "sig"})
+    assert response.json() == {"status": "forwarded", "event_type": "speech-update"}
+    ((url, forwarded, headers),) = sent
+    assert url == settings.frontend_webhook_url
+    assert forwarded == body
+    assert headers["x-vapi-signature"] == "sig"
+
+
+def test_events_without_a_peekable_type_are_parsed(settings, fake_db, sent):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    body = b'{"message": {"padding": "' + b"x" * PEEK_BYTES + b'", "type": "hang"}}'
+    with TestClient(main.create_app(settings, fake_db)) as client:
+        response = client.post("/assistant-request", content=body)
+        assert response.json() == {"status": "forwarded", "event_type": "hang"}
+        assert client.post("/assistant-request", content=b'{"message": {"type": "model-output"}}').json() == {"status": "acknowledged"}
+    assert [forwarded for _, forwarded, _ in sent] == [body]
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+import vapi_limiter
+from vapi_limiter import AdaptiveLimiter, parse_retry_after
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    # Every failure counts, not just one per cooldown
+    monkeypatch.setattr(vapi_limiter, "DECREASE_COOLDOWN_SECONDS", 0.0)
+    return AdaptiveLimiter(initial=4.0, min_limit=1.0, max_limit=8.0)
+
+
+def test_fast_successes_grow_the_limit_additively(limiter):
+    for _ in range(4):
+        assert limiter.acquire(timeout=0)
+        limiter.release(0.1, 200)
+    # About +1 per round of `limit` requests
+    assert 4.9 < limiter.limit < 5.0
+
+
+def test_limit_stays_within_bounds(limiter):
+    for _ in range(200):
+        limiter.acquire(timeout=0)
+        limiter.release(0.1, 200)
+    assert limiter.limit == 8.0
+    for _ in range(10):
+        limiter.acquire(timeout=0)
+        limiter.release(0.1, 503)
+    assert limiter.limit == 1.0
+
+
+def test_rate_limits_and_errors_halve_the_limit(limiter):
+    for status in (429, 500, None):
+        before = limiter.limit
+        limiter.acquire(timeout=0)
+        limiter.release(0.1, status)
+        assert limiter.limit == pytest.approx(max(1.0, before / 2))
+
+
+def test_client_errors_leave_the_limit_alone(limiter):
+    limiter.acquire(timeout=0)
+    limiter.release(0.1, 400)
+    assert limiter.limit == 4.0
+
+
+def test_slow_successes_shrink_the_limit(limiter):
+    limiter.acquire(timeout=0)
+    limiter.release(0.1, 200)
+    before = limiter.limit
+    limiter.acquire(timeout=0)
+    limiter.release(2.0, 200)
+    assert limiter.limit == pytest.approx(before * 0.9)
+
+
+def test_concurrent_failures_count_once_per_cooldown():
+    limiter = AdaptiveLimiter(initial=8.0)
+    for _ in range(4):
+        limiter.acquire(timeout=0)
+    for _ in range(4):
+        limiter.release(0.1, 429)
+    assert limiter.limit == 4.0
+
+
+def test_acquire_waits_for_a_free_slot(limiter):
+    for _ in range(4):
+        assert limiter.acquire(timeout=0)
+    assert not limiter.acquire(timeout=0.01)
+    limiter.release(0.1, 400)
+    assert limiter.acquire(timeout=0)
+
+
+def test_retry_after_blocks_new_requests(limiter):
+    limiter.acquire(timeout=0)
+    limiter.release(0.1, 429, retry_after=0.1)
+    assert not limiter.acquire(timeout=0.01)
+    started = time.monotonic()
+    assert limiter.acquire(timeout=1.0)
+    assert time.monotonic() - started >= 0.05
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None),
+    ("", None),
+    ("soon", None),
+    ("2.5", 2.5),
+    ("-3", 0.0),
+    ("99999", vapi_limiter.MAX_RETRY_AFTER_SECONDS),
+    ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),
+])
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
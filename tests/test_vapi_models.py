@@ -0,0 +1,112 @@
+import dataclasses
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from vapi_models import (
+    AssistantRequest, EndOfCallReport, Envelope, FunctionCallMessage, parse_message,
+)
+
+
+def body(message: dict, wrapped: bool = True) -> bytes:
+    return json.dumps({"message": message} if wrapped else message).encode()
+
+
+def test_assistant_request_reads_nested_fields():
+    message = parse_message(body({
+        "type": "assistant-request",
+        "call": {"id": "call-1", "customer": {"number": "+352621000001", "name": "Anna"},
+                 "metadata": {"agency_id": "agency", "lead_id": "lead", "is_inbound": True}},
+        "unknownField": {"deep": [1, 2, 3]},
+    }), AssistantRequest)
+    assert message.call.id == "call-1"
+    assert message.call.customer.number == "+352621000001"
+    assert message.call.metadata.agency_id == "agency"
+    assert message.call.metadata.is_inbound is True
+
+
+@pytest.mark.parametrize("call", [None, {}, {"customer": None, "metadata": None}])
+def test_missing_or_null_nested_objects_read_as_empty(call):
+    message = parse_message(body({"type": "assistant-request", "call": call}), AssistantRequest)
+    assert message.call.customer.number is None
+    assert message.call.metadata.lead_id is None
+    assert message.call.metadata.is_inbound is False
+
+
+def test_legacy_bodies_without_message_wrapper():
+    message = parse_message(body({"type": "end-of-call-report", "endedReason": "customer-ended-call",
+                                  "call": {"id": "call-1"}}, wrapped=False), EndOfCallReport)
+    assert message.ended_reason == "customer-ended-call"
+    assert message.call.id == "call-1"
+
+
+def test_end_of_call_report_transcript_fallbacks():
+    message = parse_message(body({"artifact": {"transcript": "AI: hi"}, "startedAt": "2026-01-01T10:00:00Z"}), EndOfCallReport)
+    assert message.transcript is None
+    assert message.artifact.transcript == "AI: hi"
+    assert message.started_at == "2026-01-01T10:00:00Z"
+
+
+def test_numbers_are_coerced_to_strings():
+    message = parse_message(body({"call": {"customer": {"number": 352621000001}, "metadata": {"lead_id": 42}}}), AssistantRequest)
+    assert message.call.customer.number == "352621000001"
+    assert message.call.metadata.lead_id == "42"
+
+
+@pytest.mark.parametrize("parameters, expected", [
+    ({"time": "2pm"}, {"time": "2pm"}),
+    ('{"time": "2pm"}', {"time": "2pm"}),
+    ("not json", {}),
+    ('["a list"]', {}),
+    (None, {}),
+    (7, {}),
+])
+def test_function_call_parameters_are_lenient(parameters, expected):
+    message = parse_message(body({"functionCall": {"name": "bookAppointment", "parameters": parameters}}), FunctionCallMessage)
+    assert message.function_call.name == "bookAppointment"
+    assert message.function_call.parameters == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    (True, True), (False, False), ("true", True), ("False", False), ("1", True),
+    (1, True), (0, False), (None, False), ("maybe", False), ([1], False),
+])
+def test_is_inbound_flag_is_lenient(value, expected):
+    message = parse_message(body({"call": {"metadata": {"is_inbound": value}}}), FunctionCallMessage)
+    assert message.call.metadata.is_inbound is expected
+
+
+def test_wrong_shapes_still_raise():
+    with pytest.raises(ValidationError):
+        parse_message(body({"call": "not an object"}), FunctionCallMessage)
+    with pytest.raises(ValidationError):
+        parse_message(b"not json", AssistantRequest)
+
+
+@pytest.mark.parametrize("payload, expected", [
+    ({"message": {"type": "status-update", "call": {"type": "outboundPhoneCall"}}}, "status-update"),
+    ({"type": "hang"}, "hang"),
+    ({"event": "end-of-call-report"}, "end-of-call-report"),
+    ({"message": {"type": "something-new"}}, "something-new"),
+    ({}, None),
+])
+def test_envelope_event_type(payload, expected):
+    assert Envelope.model_validate_json(json.dumps(payload)).event_type == expected
+
+
+def test_unreadable_function_call_is_still_forwarded(settings, fake_db):
+    from fastapi.testclient import TestClient
+
+    import main
+    from benchmarks.fakes import StubServer
+
+    with StubServer(body={"status": "ok"}) as frontend:
+        app_settings = dataclasses.replace(settings, frontend_base_url=frontend.url)
+        with TestClient(main.create_app(app_settings, fake_db)) as client:
+            response = client.post("/assistant-request", content=body({
+                "type": "function-call", "call": "not an object",
+                "functionCall": {"name": "bookAppointment", "parameters": "{}"},
+            }))
+        assert response.json() == {"status": "forwarded", "event_type": "function-call"}
+        assert frontend.requests == {"/api/webhooks/vapi": 1}
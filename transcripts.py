@@ -0,0 +1,173 @@
+# transcripts.py - Incremental transcript assembly per call
+#
+# transcript-update events carry one utterance each; conversation-update
+# events resend the whole conversation so far, so a 10-minute call sends the
+# same early lines hundreds of times. The assembler keeps one compact copy:
+# it consumes only the messages past the ones it has already stored, keeps
+# each utterance as a small __slots__ segment with an interned speaker
+# label, and renders the final transcript from those segments without
+# reparsing any event. Per-call memory is capped (MAX_CHARS_PER_CALL) and
+# calls that go quiet are evicted.
+
+import sys
+import threading
+import time
+
+from metrics import metrics
+
+MAX_CHARS_PER_CALL = 100_000  # text beyond this is dropped (marked truncated)
+IDLE_EVICT_SECONDS = 3600.0
+
+# Vapi speaker names -> label used in the transcript
+_ROLES = {
+    'assistant': 'AI',
+    'bot': 'AI',
+    'user': 'User',
+    'customer': 'User',
+}
+_SKIPPED_ROLES = frozenset(['system', 'tool', 'tool_calls', 'tool_call_result', 'function'])
+
+
+def _label(role) -> str | None:
+    role = (role or '').lower()
+    if role in _SKIPPED_ROLES:
+        return None
+    return sys.intern(_ROLES.get(role) or role or 'Unknown')
+
+
+class Segment:
+    __slots__ = ("role", "text")
+
+    def __init__(self, role: str, text: str):
+        self.role = role
+        self.text = text
+
+
+class _Transcript:
+    __slots__ = ("segments", "consumed", "source", "chars", "size", "truncated", "seen_at")
+
+    def __init__(self):
+        self.segments = []
+        self.consumed = 0  # conversation-update messages already stored
+        self.source = None  # 'transcript' or 'conversation'
+        self.chars = 0
+        self.size = sys.getsizeof(self) + sys.getsizeof(self.segments)
+        self.truncated = False
+        self.seen_at = time.monotonic()
+
+
+_SEGMENT_SIZE = sys.getsizeof(Segment('', ''))
+
+
+class TranscriptAssembler:
+    def __init__(self, max_chars: int = MAX_CHARS_PER_CALL):
+        self.max_chars = max_chars
+        self._calls = {}  # vapi call id -> _Transcript
+        self._lock = threading.Lock()
+        self.bytes = 0  # approximate memory held by all transcripts
+
+        metrics.gauge("transcripts_active", lambda: len(self._calls))
+        metrics.gauge("transcripts_bytes", lambda: self.bytes)
+
+    def _get(self, call_id: str) -> _Transcript:
+        transcript = self._calls.get(call_id)
+        if transcript is None:
+            transcript = self._calls[call_id] = _Transcript()
+            self.bytes += transcript.size
+        transcript.seen_at = time.monotonic()
+        return transcript
+
+    def _append(self, transcript: _Transcript, role, text) -> bool:
+        label = _label(role)
+        if label is None or not text or not isinstance(text, str):
+            return False
+        if transcript.chars + len(text) > self.max_chars:
+            transcript.truncated = True
+            return False
+        transcript.segments.append(Segment(label, text))
+        added = _SEGMENT_SIZE + sys.getsizeof(text) + 8  # + list slot
+        transcript.chars += len(text)
+        transcript.size += added
+        self.bytes += added
+        return True
+
+    def _reset(self, transcript: _Transcript, source: str):
+        self.bytes -= transcript.size
+        transcript.segments = []
+        transcript.consumed = 0
+        transcript.chars = 0
+        transcript.truncated = False
+        transcript.size = sys.getsizeof(transcript) + sys.getsizeof(transcript.segments)
+        transcript.source = source
+        self.bytes += transcript.size
+
+    def add_utterance(self, call_id: str, role, text, final: bool = True) -> bool:
+        """transcript-update: appends one final utterance. True if stored."""
+        if not final or not call_id:
+            return False
+        with self._lock:
+            transcript = self._get(call_id)
+            if transcript.source == 'conversation':
+                # The conversation array is authoritative once we have it
+                return False
+            transcript.source = 'transcript'
+            return self._append(transcript, role, text)
+
+    def add_conversation(self, call_id: str, messages: list) -> int:
+        """
+        conversation-update: stores only the messages not seen yet (the
+        array grows with every event). Returns how many were added.
+        """
+        if not call_id or not isinstance(messages, list):
+            return 0
+        with self._lock:
+            transcript = self._get(call_id)
+            if transcript.source != 'conversation' or len(messages) < transcript.consumed:
+                # First conversation-update (replaces utterances collected
+                # from transcript-updates) or Vapi restarted the array
+                self._reset(transcript, 'conversation')
+            added = 0
+            for message in messages[transcript.consumed:]:
+                if not isinstance(message, dict):
+                    continue
+                text = message.get('message') if 'message' in message else message.get('content')
+                added += self._append(transcript, message.get('role'), text)
+            transcript.consumed = len(messages)
+            return added
+
+    def text(self, call_id: str) -> str | None:
+        """The transcript so far as "Speaker: text" lines, or None."""
+        with self._lock:
+            transcript = self._calls.get(call_id)
+            if transcript is None or not transcript.segments:
+                return None
+            return _render(transcript)
+
+    def pop(self, call_id: str) -> str | None:
+        """Final transcript of an ended call; forgets the call."""
+        with self._lock:
+            transcript = self._calls.pop(call_id, None)
+            if transcript is None:
+                return None
+            self.bytes -= transcript.size
+            return _render(transcript) if transcript.segments else None
+
+    def evict_idle(self, idle_seconds: float = IDLE_EVICT_SECONDS) -> int:
+        cutoff = time.monotonic() - idle_seconds
+        with self._lock:
+            idle = [call_id for call_id, t in self._calls.items() if t.seen_at < cutoff]
+            for call_id in idle:
+                self.bytes -= self._calls.pop(call_id).size
+        if idle:
+            metrics.inc("transcripts_evicted", len(idle))
+        return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+def _render(transcript: _Transcript) -> str:
+    text = "\n".join(f"{segment.role}: {segment.text}" for segment in transcript.segments)
+    if transcript.truncated:
+        text += "\n[transcript truncated]"
+    return text
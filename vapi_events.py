@@ -0,0 +1,46 @@
+# vapi_events.py - Cheap routing for Vapi Server URL events
+#
+# Most Server URL traffic (status, speech, transcript, conversation updates,
+# end-of-call reports with full transcripts) is only relayed to the frontend
+# webhook. Parsing and re-encoding those bodies is wasted work, so we peek at
+# the event type in the raw bytes and forward the original body unchanged.
+# Only events the backend handles itself get a full json.loads().
+
+import re
+
+# Events relayed to the frontend webhook (/api/webhooks/vapi)
+FORWARDED_EVENTS = frozenset([
+    'status-update', 'call-status-update', 'end-of-call-report', 'transcript-update',
+    'function-call', 'hang', 'speech-update', 'conversation-update', 'assistant.started',
+])
+
+# Live call events merged into call_logs by the write-behind buffer
+# (call_events.py) instead of being forwarded one by one
+BUFFERED_EVENTS = frozenset(['status-update', 'transcript-update', 'conversation-update'])
+
+# Events the backend answers or processes itself (need the parsed payload)
+HANDLED_EVENTS = frozenset(['assistant-request'])
+
+KNOWN_EVENTS = FORWARDED_EVENTS | HANDLED_EVENTS | frozenset([
+    'transcript', 'tool-calls', 'model-output', 'voice-input', 'user-interrupted',
+    'phone-call-control', 'transfer-destination-request', 'transfer-update',
+])
+
+# Vapi puts message.type near the start of the body. Nested objects (e.g.
+# call.type = "outboundPhoneCall") can come first, so only accept values that
+# are known event names. Escaped quotes inside transcripts never match.
+_TYPE_PATTERN = re.compile(rb'"(?:type|event)"\s*:\s*"([A-Za-z0-9_.\-]{1,64})"')
+PEEK_BYTES = 4096
+
+
+def peek_event_type(body: bytes) -> str | None:
+    """
+    Returns the event type from the first PEEK_BYTES of the raw body, or None
+    if it can't be determined cheaply (caller should fully parse instead).
+    """
+    for match in _TYPE_PATTERN.finditer(body, 0, PEEK_BYTES):
+        value = match.group(1).decode('ascii')
+        if value in KNOWN_EVENTS:
+            return value
+    return None
+
@@ -0,0 +1,134 @@
+# vapi_limiter.py - Adaptive concurrency for Vapi create-call requests
+#
+# How many POST /call/phone requests api.vapi.ai accepts at once isn't
+# published and changes with their load. Instead of a hand-tuned constant,
+# the limit adapts (AIMD with a latency check):
+#   - a fast, successful request grows the limit by 1/limit (about +1 per
+#     round of `limit` requests),
+#   - a successful but slow request (latency well above the recent best)
+#     shrinks it slightly, before Vapi starts failing,
+#   - a 429 or 5xx halves it (at most once per cooldown, so a burst of
+#     concurrent failures counts as one signal) and, if Vapi sent
+#     Retry-After, nobody starts a new request until it has passed.
+
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from lifecycle import tracker
+from metrics import metrics
+
+# Latency counts as healthy up to TOLERANCE x the recent minimum (+ slack)
+LATENCY_TOLERANCE = 2.0
+LATENCY_SLACK_SECONDS = 0.05
+BASELINE_WINDOW_SECONDS = 60.0
+DECREASE_COOLDOWN_SECONDS = 1.0
+MAX_RETRY_AFTER_SECONDS = 120.0
+
+
+def parse_retry_after(value) -> float | None:
+    """Retry-After header (seconds or HTTP date) -> seconds from now."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return max(0.0, min(seconds, MAX_RETRY_AFTER_SECONDS))
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial: float = 4.0, min_limit: float = 1.0, max_limit: float = 32.0):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._baseline = None  # best latency seen in the current window
+        self._window_min = None
+        self._window_started = time.monotonic()
+
+        metrics.gauge("vapi_concurrency_limit", lambda: round(self.limit, 2))
+        metrics.gauge("vapi_concurrency_in_flight", lambda: self.in_flight)
+
+    def configure(self, max_limit: float):
+        with self._cond:
+            self.max_limit = max(self.min_limit, max_limit)
+            self.limit = min(self.limit, self.max_limit)
+            self._cond.notify_all()
+
+    def acquire(self, timeout: float) -> bool:
+        """
+        Waits for a request slot (and for any Retry-After to pass). Returns
+        False on timeout or shutdown; the caller must then not send.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.in_flight < int(self.limit) and now >= self._blocked_until:
+                    self.in_flight += 1
+                    return True
+                if now >= deadline or tracker.stopping.is_set():
+                    metrics.inc("vapi_limiter_timeouts")
+                    return False
+                wake = deadline
+                if self._blocked_until > now:
+                    wake = min(wake, self._blocked_until)
+                self._cond.wait(min(wake - now, 1.0))
+
+    def release(self, latency: float, status: int | None, retry_after: float | None = None):
+        """
+        Records the outcome of a request started with acquire().
+        `status` is the HTTP status, or None if the request didn't complete.
+        """
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            now = time.monotonic()
+            if status == 429 or status is None or status >= 500:
+                self._decrease(now, 0.5)
+                if retry_after:
+                    self._blocked_until = max(self._blocked_until, now + retry_after)
+                metrics.inc("vapi_limiter_backoffs", status=status or "error")
+            elif status < 400:
+                if self._healthy(latency, now):
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                else:
+                    self._decrease(now, 0.9)
+            # Other 4xx (bad payload, auth) say nothing about Vapi's capacity
+            self._cond.notify_all()
+
+    def _healthy(self, latency: float, now: float) -> bool:
+        if now - self._window_started > BASELINE_WINDOW_SECONDS:
+            # Let the baseline drift with Vapi's normal latency
+            self._baseline = self._window_min
+            self._window_min = None
+            self._window_started = now
+        if self._window_min is None or latency < self._window_min:
+            self._window_min = latency
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        return latency <= self._baseline * LATENCY_TOLERANCE + LATENCY_SLACK_SECONDS
+
+    def _decrease(self, now: float, factor: float):
+        if now - self._last_decrease < DECREASE_COOLDOWN_SECONDS:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "retry_after_remaining": round(max(0.0, self._blocked_until - time.monotonic()), 2),
+                "latency_baseline": self._baseline,
+            }
+
+
+vapi_limiter = AdaptiveLimiter()
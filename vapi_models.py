@@ -0,0 +1,142 @@
+# vapi_models.py - Typed Vapi Server URL events (the ones we handle)
+#
+# Pydantic v2 models validated straight from the raw body
+# (model_validate_json: pydantic-core parses the bytes in Rust and skips
+# building Python objects for everything not declared here - an
+# end-of-call-report's message array, analysis, costs...). Missing or null
+# nested objects become empty models, so handlers read report.call.customer.number
+# instead of chaining .get('...', {}).
+#
+# Routing uses the cheapest thing that works: peek_event_type() on the
+# bytes, and Envelope (message.type / type / event only) when the type
+# isn't near the start of the body.
+
+import json
+from typing import Annotated
+
+from pydantic import AfterValidator, BaseModel, BeforeValidator, ConfigDict, Field
+from pydantic.alias_generators import to_camel
+
+from vapi_events import KNOWN_EVENTS
+
+
+def _present(model):
+    """`model` field that reads as an empty model when missing or null."""
+    return Annotated[model | None, AfterValidator(lambda value: model() if value is None else value)]
+
+
+def _flag(value) -> bool:
+    """Truthy metadata flag, as the dict handlers read it ('true', 1, ...); anything else is False."""
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes', 'on')
+    return isinstance(value, (bool, int, float)) and bool(value)
+
+
+def _arguments(value) -> dict:
+    """Function-call parameters: an object, or that object JSON-encoded in a string."""
+    if isinstance(value, (str, bytes)):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+class VapiModel(BaseModel):
+    # Vapi sends camelCase; attributes are snake_case. Unknown keys are ignored.
+    model_config = ConfigDict(
+        alias_generator=to_camel, validate_by_name=True, validate_by_alias=True,
+        extra='ignore', coerce_numbers_to_str=True,
+    )
+
+
+class Customer(VapiModel):
+    number: str | None = None
+    name: str | None = None
+
+
+class CallMetadata(BaseModel):
+    # Set by us when placing the call (snake_case keys)
+    model_config = ConfigDict(extra='ignore', coerce_numbers_to_str=True)
+
+    agency_id: str | None = None
+    lead_id: str | None = None
+    is_inbound: Annotated[bool, BeforeValidator(_flag)] = False
+
+
+class Call(VapiModel):
+    id: str | None = None
+    customer: _present(Customer) = Field(default_factory=Customer)
+    metadata: _present(CallMetadata) = Field(default_factory=CallMetadata)
+
+
+class Artifact(VapiModel):
+    transcript: str | None = None
+
+
+class AssistantRequest(VapiModel):
+    call: _present(Call) = Field(default_factory=Call)
+
+
+class EndOfCallReport(VapiModel):
+    call: _present(Call) = Field(default_factory=Call)
+    ended_reason: str | None = None
+    started_at: str | None = None
+    transcript: str | None = None
+    artifact: _present(Artifact) = Field(default_factory=Artifact)
+
+
+class FunctionCall(VapiModel):
+    name: str | None = None
+    parameters: Annotated[dict, BeforeValidator(_arguments)] = Field(default_factory=dict)
+
+
+class FunctionCallMessage(VapiModel):
+    call: _present(Call) = Field(default_factory=Call)
+    function_call: _present(FunctionCall) = Field(default_factory=FunctionCall)
+
+
+class AssistantRequestEvent(VapiModel):
+    message: AssistantRequest | None = None
+
+
+class EndOfCallEvent(VapiModel):
+    message: EndOfCallReport | None = None
+
+
+class FunctionCallEvent(VapiModel):
+    message: FunctionCallMessage | None = None
+
+
+# message model -> its {"message": ...} wrapper
+_EVENTS = {
+    AssistantRequest: AssistantRequestEvent,
+    EndOfCallReport: EndOfCallEvent,
+    FunctionCallMessage: FunctionCallEvent,
+}
+
+
+def parse_message(body: bytes, model):
+    """
+    The message of a raw event body as `model`. Legacy bodies are the
+    message itself, without the {"message": ...} wrapper.
+    """
+    message = _EVENTS[model].model_validate_json(body).message
+    return message if message is not None else model.model_validate_json(body)
+
+
+class EnvelopeMessage(VapiModel):
+    type: str | None = None
+
+
+class Envelope(VapiModel):
+    """Just enough of a body to route it."""
+    type: str | None = None
+    event: str | None = None
+    message: _present(EnvelopeMessage) = Field(default_factory=EnvelopeMessage)
+
+    @property
+    def event_type(self) -> str | None:
+        candidates = [self.message.type, self.type, self.event]
+        known = [value for value in candidates if value in KNOWN_EVENTS]
+        return known[0] if known else next((value for value in candidates if value), None)